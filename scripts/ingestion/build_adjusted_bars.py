@@ -0,0 +1,266 @@
+"""
+Adjusted Bars Builder
+
+Derives the split-adjusted bar variants (bars/1d, bars/1h, bars/1m) from the raw ones
+(bars/1d_raw, 1h_raw, 1m_raw) and the corporate actions tables, instead of downloading every
+series twice from Polygon (see scripts/utils/bar_adjustment.py for the factor math).
+
+- Layouts: per-symbol files ({symbol}.parquet, upserted through the BarStore) and the 1m
+  partitions (symbol=SYM/date=YYYY-MM-DD.parquet, whole partitions rewritten)
+- Incremental: every derivation is recorded in a progress log (bars/_adjustment.jsonl) with the
+  actions fingerprint and the raw state it saw (rows / partitions, last bar). A rerun:
+  - nothing new and same actions → skipped without reading bars
+  - new raw bars only → adjusts from the last derived bar on
+  - a new or corrected split/dividend → re-adjusts only the bars before its ex-date
+  - raw rows changed behind the last derived bar (backfill) → full re-derivation
+- Actions: the splits (and dividends) tables are topped up from Polygon before every run
+  (only actions since the table was saved), so a new split is never silently left out
+- Config (ingestion.adjustment): local (fetchers download *_raw only and call this builder),
+  dividends (total-return factors on top of splits), max_workers, refresh_actions
+
+Usage:
+    # Re-adjust everything that changed (new splits, new raw bars)
+    python scripts/ingestion/build_adjusted_bars.py --variants 1d 1h 1m
+
+    # A few symbols
+    python scripts/ingestion/build_adjusted_bars.py --variants 1m --symbols AAA BBB
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+from datetime import date, datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import polars as pl
+from loguru import logger
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from ingest_polygon import PolygonIngester
+from scripts.utils.bar_adjustment import BarAdjuster
+from scripts.utils.circuit_breaker import RequestFailed
+from scripts.utils.progress_wal import ProgressWAL
+
+# Variants derived from their *_raw counterpart (1m is partitioned by date)
+DERIVED = ("1d", "1h", "1m")
+PARTITIONED = {"1m"}
+
+
+def local_adjustment(cfg: Dict) -> bool:
+    """ingestion.adjustment.local"""
+    return bool(cfg.get("ingestion", {}).get("adjustment", {}).get("local", False))
+
+
+def split_variants(variants: Sequence[str]) -> Tuple[List[str], List[str]]:
+    """
+    Requested variants → (variants to download, variants to derive locally).
+
+    Adjusted variants are replaced by their raw counterpart (downloaded once).
+    """
+    derive = [v for v in variants if v in DERIVED]
+    fetch = list(dict.fromkeys(v if v.endswith("_raw") or v not in DERIVED else f"{v}_raw" for v in variants))
+    return fetch, derive
+
+
+class AdjustedBarsBuilder:
+    """Raw bars + corporate actions → adjusted bar files, incrementally"""
+
+    def __init__(self, ingester: PolygonIngester, adjuster: Optional[BarAdjuster] = None,
+                 max_workers: Optional[int] = None):
+        """
+        Args:
+            ingester: PolygonIngester (paths, BarStore, writer, coverage index)
+            adjuster: BarAdjuster (default: latest corporate actions tables on disk)
+            max_workers: Symbols derived in parallel (default ingestion.adjustment.max_workers)
+        """
+        self.ingester = ingester
+        adj_cfg = ingester.config["ingestion"].get("adjustment", {})
+        self.max_workers = int(max_workers or adj_cfg.get("max_workers", 8))
+        if adjuster is None and adj_cfg.get("refresh_actions", True):
+            self.refresh_actions(["splits", "dividends"] if adj_cfg.get("dividends", False) else ["splits"])
+        self.adjuster = adjuster or BarAdjuster.from_store(
+            ingester.raw_dir, ingester.base_dir / ingester.config["paths"]["processed"],
+            dividends=bool(adj_cfg.get("dividends", False)))
+        self.bars_root = ingester.raw_dir / "market_data" / "bars"
+        self.wal = ProgressWAL(self.bars_root / "_adjustment.jsonl")
+
+    def refresh_actions(self, action_types: Sequence[str]):
+        """
+        Fetch the splits (dividends) published since the tables on disk were saved.
+
+        A failed refresh is logged loudly: actions after the table's date are missing from the
+        adjusted bars until the next successful refresh.
+        """
+        for action_type in action_types:
+            try:
+                self.ingester.refresh_corporate_actions(action_type)
+            except RequestFailed as e:
+                files = sorted((self.ingester.raw_dir / "corporate_actions").glob(f"{action_type}_*.parquet"),
+                               key=lambda p: p.stat().st_mtime)
+                saved = datetime.fromtimestamp(files[-1].stat().st_mtime).date() if files else None
+                logger.error(f"{action_type} refresh failed ({e}): adjusted bars use the table saved on {saved}; "
+                             f"{action_type} after that date are NOT applied")
+
+    # ----------------------------- raw state ------------------------------
+
+    def _partitions(self, variant: str, symbol: str) -> List[Tuple[str, Path]]:
+        """(date, path) of the raw partitions of a partitioned variant, by date"""
+        sym_dir = self.bars_root / f"{variant}_raw" / f"symbol={symbol}"
+        return sorted((p.stem.removeprefix("date="), p) for p in sym_dir.glob("date=*.parquet"))
+
+    def raw_state(self, variant: str, symbol: str) -> Optional[Tuple[int, str]]:
+        """(rows or partitions, last bar ISO timestamp / last partition date) without reading bars"""
+        if variant in PARTITIONED:
+            parts = self._partitions(variant, symbol)
+            return (len(parts), parts[-1][0]) if parts else None
+        cov = self.ingester.bar_store(f"{variant}_raw").coverage(symbol)
+        return (cov[2], cov[1].isoformat()) if cov else None
+
+    def _closes(self, symbol: str) -> Optional[pl.DataFrame]:
+        """Raw daily closes of a symbol (dividend factors only)"""
+        path = self.bars_root / "1d_raw" / f"{symbol}.parquet"
+        if not self.adjuster.dividends or not path.exists():
+            return None
+        return pl.read_parquet(path, columns=["timestamp", "close"]).select(
+            pl.lit(symbol).alias("symbol"), pl.col("timestamp").dt.date().alias("date"), "close")
+
+    # ----------------------------- derive ---------------------------------
+
+    def derive(self, symbol: str, variant: str) -> Dict:
+        """
+        Bring bars/{variant}/ of one symbol up to date with its raw bars and actions.
+
+        Returns:
+            Dict with mode (skipped / incremental / readjust / full / empty) and rows written
+        """
+        state = self.raw_state(variant, symbol)
+        if state is None:
+            return {"mode": "empty", "rows": 0}
+
+        sig = self.adjuster.signature(symbol)
+        rec = self.wal.get(symbol, variant)
+        changed = None
+        if rec is None:
+            mode = "full"
+        elif rec["signature"] == sig and rec["rows"] == state[0] and rec["last"] == state[1]:
+            return {"mode": "skipped", "rows": 0}
+        else:
+            changed = self.adjuster.changed_before(symbol, rec["actions"]) if rec["signature"] != sig else None
+            mode = "readjust" if changed is not None else "incremental"
+            if self._count_until(variant, symbol, rec["last"]) != rec["rows"]:
+                mode, changed = "full", None
+
+        partitioned = variant in PARTITIONED
+        if partitioned:
+            parts = self._partitions(variant, symbol)
+            if mode != "full":
+                # Whole partitions: dates before the changed ex-date (UTC vs ET date: inclusive) + new dates
+                parts = [(d, p) for d, p in parts
+                         if d >= rec["last"] or (changed is not None and d <= changed.isoformat())]
+            df = pl.read_parquet([p for _, p in parts]) if parts else pl.DataFrame()
+        else:
+            lf = pl.scan_parquet(self.bars_root / f"{variant}_raw" / f"{symbol}.parquet")
+            if mode != "full":
+                since = datetime.fromisoformat(rec["last"])
+                cond = pl.col("timestamp") >= since
+                if changed is not None:
+                    cond = cond | (pl.col("timestamp").dt.convert_time_zone("America/New_York").dt.date() < changed)
+                lf = lf.filter(cond)
+            df = lf.collect()
+
+        rows = 0
+        if df.height:
+            adjusted = self.adjuster.adjust(df, symbol=symbol, closes=self._closes(symbol))
+            if "symbol" not in adjusted.columns:
+                adjusted = adjusted.with_columns(pl.lit(symbol).alias("symbol"))
+            if "date" not in adjusted.columns:
+                adjusted = adjusted.with_columns(pl.col("timestamp").dt.date().alias("date"))
+            if self.ingester.save_aggregates(adjusted, variant, partition_by_date=partitioned, adjusted=True) is None:
+                raise ValueError(f"{symbol} {variant}: DQ check failed, nothing saved")
+            rows = adjusted.height
+
+        self.wal.record(symbol, variant, state[0], 0, signature=sig, last=state[1], mode=mode,
+                        actions=self.adjuster.action_list(symbol))
+        return {"mode": mode, "rows": rows}
+
+    def _count_until(self, variant: str, symbol: str, last: str) -> int:
+        """Raw rows (partitions) up to the last one seen by the previous derivation"""
+        if variant in PARTITIONED:
+            return sum(d <= last for d, _ in self._partitions(variant, symbol))
+        return (
+            pl.scan_parquet(self.bars_root / f"{variant}_raw" / f"{symbol}.parquet")
+            .filter(pl.col("timestamp") <= datetime.fromisoformat(last))
+            .select(pl.len()).collect().item()
+        )
+
+    def run(self, variants: Sequence[str] = DERIVED, symbols: Optional[Sequence[str]] = None) -> Dict:
+        """
+        Derive `variants` for `symbols` (default: every symbol with raw bars of the variant).
+
+        Returns:
+            Dict with counts per mode, rows and failed ("symbol:variant")
+        """
+        summary = {"full": 0, "incremental": 0, "readjust": 0, "skipped": 0, "empty": 0, "rows": 0, "failed": []}
+        t0 = time.time()
+        for variant in variants:
+            if variant not in DERIVED:
+                raise ValueError(f"Unknown variant {variant}; expected one of {DERIVED}")
+            syms = symbols
+            if syms is None:
+                raw_dir = self.bars_root / f"{variant}_raw"
+                syms = sorted(p.name.removeprefix("symbol=") if p.is_dir() else p.stem
+                              for p in raw_dir.glob("*") if p.suffix == ".parquet" or p.name.startswith("symbol=")) \
+                    if raw_dir.exists() else []
+
+            def work(sym: str) -> Tuple[str, Optional[Dict], Optional[str]]:
+                try:
+                    return sym, self.derive(sym, variant), None
+                except Exception as e:
+                    return sym, None, str(e)
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+                for sym, res, err in ex.map(work, syms):
+                    if err is not None:
+                        logger.error(f"Adjust {sym} {variant}: {err}")
+                        summary["failed"].append(f"{sym}:{variant}")
+                    else:
+                        summary[res["mode"]] += 1
+                        summary["rows"] += res["rows"]
+            logger.info(f"bars/{variant}: {len(syms):,} symbols checked against {variant}_raw")
+
+        logger.info(f"Adjusted bars done in {(time.time() - t0) / 60:.1f} min: {summary['full']:,} full, "
+                    f"{summary['incremental']:,} incremental, {summary['readjust']:,} re-adjusted (new actions), "
+                    f"{summary['skipped']:,} unchanged, {len(summary['failed']):,} failed")
+        return summary
+
+    def close(self):
+        self.wal.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Derive adjusted bars from *_raw bars + corporate actions")
+    parser.add_argument("--config", type=str, default=str(PROJECT_ROOT / "config" / "config.yaml"))
+    parser.add_argument("--variants", nargs="+", choices=list(DERIVED), default=list(DERIVED))
+    parser.add_argument("--symbols", nargs="+", help="Symbols to derive (default: every symbol with raw bars)")
+    parser.add_argument("--workers", type=int, help="Thread cap (default ingestion.adjustment.max_workers)")
+    args = parser.parse_args()
+
+    ingester = PolygonIngester(args.config, job="adjust_bars")
+    builder = AdjustedBarsBuilder(ingester, max_workers=args.workers)
+    summary = builder.run(args.variants, symbols=args.symbols)
+    builder.close()
+
+    if summary["failed"]:
+        failed_file = ingester.base_dir / "logs" / f"failed_adjust_{date.today().strftime('%Y%m%d')}.txt"
+        failed_file.parent.mkdir(exist_ok=True)
+        failed_file.write_text("\n".join(summary["failed"]))
+        logger.warning(f"Failed adjustments ({len(summary['failed'])}): saved to {failed_file}")
+
+
+if __name__ == "__main__":
+    main()
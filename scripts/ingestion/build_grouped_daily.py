@@ -0,0 +1,329 @@
+"""
+Grouped Daily Builder
+
+Daily bars for the whole market from Polygon's grouped daily endpoint
+(/v2/aggs/grouped/locale/us/market/stocks/{date}): one request per date returns every ticker,
+instead of one request per ticker, window and variant.
+
+Outputs (only 1d_raw = unadjusted is requested):
+- Cross-sectional store: raw/market_data/grouped_daily/1d_raw/date=YYYY-MM-DD.parquet
+  (all tickers of one date, sorted by symbol)
+- Per-symbol files: raw/market_data/bars/1d_raw/{symbol}.parquet, the same layout
+  download_aggregates / fetch_aggregates write; new dates are upserted into existing files
+  through the BarStore (dedupe on timestamp, only the touched row groups are merged)
+- bars/1d (split-adjusted) is always derived from 1d_raw + corporate actions
+  (AdjustedBarsBuilder: only symbols with new bars or new splits are rewritten). Merging
+  adjusted=true dates instead would leave the stored history on the pre-split basis after
+  every new split
+
+Dates are fetched concurrently (shared rate budget, circuit breaker parking). Every date is
+recorded in a progress WAL (<store>/_progress.jsonl), including market holidays that return
+no rows, so a rerun never re-requests a date:
+- update (default): dates after the last recorded one, up to yesterday (US/Eastern)
+- backfill: every weekday in [--from, --to] not yet recorded (fills gaps, any order)
+
+New 1d_raw sessions also top up the point-in-time universe snapshots
+(scripts/utils/universe_snapshots.py) when ingestion.universe_snapshots.auto_update is set.
+
+Config (ingestion.grouped_daily): max_workers, symbol_chunk. Backfill start default from
+ingestion.daily_bars_years.
+
+Usage:
+    # Only new dates (daily cron)
+    python scripts/ingestion/build_grouped_daily.py
+
+    # Backfill a range, small-cap universe only in bars/1d
+    python scripts/ingestion/build_grouped_daily.py --backfill --from 2021-01-01 --to 2025-10-17 --universe
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+from zoneinfo import ZoneInfo
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import polars as pl
+from loguru import logger
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from ingest_polygon import PolygonIngester, aggregates_frame
+from build_adjusted_bars import AdjustedBarsBuilder, split_variants
+from scripts.utils.circuit_breaker import RetryLater
+from scripts.utils.partition_writer import write_parquet_atomic
+from scripts.utils.progress_wal import ProgressWAL
+from scripts.utils.request_metrics import ConcurrencyController
+from scripts.utils.universe_snapshots import UniverseSnapshots
+
+ET = ZoneInfo("America/New_York")
+ENDPOINT = "/v2/aggs/grouped/locale/us/market/stocks/{date}"
+
+# variant → adjusted
+VARIANTS = {"1d": True, "1d_raw": False}
+
+
+def weekdays(start: date, end: date) -> List[date]:
+    """Mon-Fri dates in [start, end] (holidays are discovered from empty responses)"""
+    out, d = [], start
+    while d <= end:
+        if d.weekday() < 5:
+            out.append(d)
+        d += timedelta(days=1)
+    return out
+
+
+class GroupedDailyBuilder:
+    """Grouped daily fetch → cross-sectional per-date store + per-symbol bars/1d files"""
+
+    def __init__(self, ingester: PolygonIngester, max_workers: Optional[int] = None,
+                 symbol_chunk: Optional[int] = None):
+        """
+        Args:
+            ingester: PolygonIngester (HTTP session, rate limiter, circuit breaker)
+            max_workers: Thread cap for date requests and per-symbol merges
+            symbol_chunk: Symbols merged per pass over the new date files (bounds memory)
+        """
+        self.ingester = ingester
+        gd_cfg = ingester.config["ingestion"].get("grouped_daily", {})
+        self.max_workers = int(max_workers or gd_cfg.get("max_workers", 8))
+        self.symbol_chunk = int(symbol_chunk or gd_cfg.get("symbol_chunk", 1000))
+        self.store_root = ingester.raw_dir / "market_data" / "grouped_daily"
+        self.wal = ProgressWAL(self.store_root / "_progress.jsonl")
+
+    def date_path(self, variant: str, d: date) -> Path:
+        return self.store_root / variant / f"date={d.isoformat()}.parquet"
+
+    def done_dates(self, variant: str) -> List[date]:
+        """Dates recorded for a variant (with or without rows), sorted"""
+        with self.wal.lock:
+            keys = [k for k, kinds in self.wal.records.items() if variant in kinds]
+        return sorted(date.fromisoformat(k) for k in keys)
+
+    # ----------------------------- fetch ----------------------------------
+
+    def fetch_date(self, d: date, variant: str) -> int:
+        """
+        One grouped daily request → date file; returns rows (0 = market closed).
+
+        Raises:
+            RetryLater: transient failure / open circuit (the caller parks the date)
+        """
+        data = self.ingester._make_request(ENDPOINT.format(date=d.isoformat()),
+                                           {"adjusted": str(VARIANTS[variant]).lower()}, park=True)
+        if data is None:
+            raise ValueError(f"grouped daily {d} ({variant}): request failed")
+
+        results = data.get("results") or []
+        rows, nbytes = 0, 0
+        if results:
+            df = aggregates_frame(results).sort("symbol")
+            path = self.date_path(variant, d)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            nbytes = write_parquet_atomic(df, path)
+            rows = df.height
+        self.wal.record(d.isoformat(), variant, rows, nbytes)
+        return rows
+
+    def fetch_dates(self, tasks: List[Tuple[date, str]]) -> Dict:
+        """Fetch (date, variant) tasks concurrently; returns {fetched, empty, failed}"""
+        controller = ConcurrencyController.from_config(self.ingester.config, self.ingester.metrics,
+                                                       max_workers=self.max_workers)
+        retry_queue = self.ingester.retry_queue()
+        out = {"fetched": [], "empty": 0, "failed": []}
+
+        def work(task):
+            with controller.slot():
+                return self.fetch_date(*task)
+
+        def run_batch(batch):
+            with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+                futs = {ex.submit(work, t): t for t in batch}
+                for fut in as_completed(futs):
+                    task = futs[fut]
+                    try:
+                        rows = fut.result()
+                    except RetryLater as e:
+                        reason, url = e.reason, e.url
+                    except Exception as e:
+                        reason, url = f"error: {e}", None
+                    else:
+                        if rows:
+                            out["fetched"].append(task)
+                        else:
+                            out["empty"] += 1
+                        continue
+                    if not retry_queue.park(task, reason, url=url):
+                        logger.warning(f"Grouped daily {task[0]} {task[1]}: giving up ({reason})")
+                        out["failed"].append(f"{task[0]}:{task[1]}")
+
+        batch_size = self.max_workers * 25
+        for i in range(0, len(tasks), batch_size):
+            run_batch(tasks[i:i + batch_size] + retry_queue.pop_due())
+            logger.info(f"Grouped daily progress: {min(i + batch_size, len(tasks)):,}/{len(tasks):,} dates "
+                        f"(concurrency {controller.limit}, parked {len(retry_queue)})")
+        while len(retry_queue):
+            time.sleep(retry_queue.next_due_in() or 0.0)
+            run_batch(retry_queue.pop_due(batch_size))
+        return out
+
+    # ----------------------------- per-symbol -----------------------------
+
+    def update_symbol_files(self, variant: str, dates: Sequence[date], symbols: Optional[Sequence[str]] = None) -> int:
+        """
+        Merge the date files of `dates` into per-symbol files.
+
+        Args:
+            symbols: Only these symbols (e.g. the small-cap universe); None = every ticker
+
+        Returns:
+            Symbol files written
+        """
+        files = [self.date_path(variant, d) for d in sorted(dates) if self.date_path(variant, d).exists()]
+        if not files:
+            return 0
+        store = self.ingester.bar_store(variant)
+
+        scan = pl.scan_parquet(files)
+        if symbols is None:
+            symbols = scan.select(pl.col("symbol").unique()).collect()["symbol"].sort().to_list()
+        symbols = list(symbols)
+
+        written = 0
+        for i in range(0, len(symbols), self.symbol_chunk):
+            chunk = symbols[i:i + self.symbol_chunk]
+            df = scan.filter(pl.col("symbol").is_in(chunk)).collect()
+            if df.height == 0:
+                continue
+            written += store.upsert_many(df, max_workers=self.max_workers)["files"]
+            self.ingester.coverage.record_frame(variant, df)
+            logger.info(f"bars/{variant}: merged {min(i + self.symbol_chunk, len(symbols)):,}/{len(symbols):,} symbols")
+        return written
+
+    # ----------------------------- plans ----------------------------------
+
+    def run(
+        self,
+        variants: Sequence[str] = tuple(VARIANTS),
+        from_date: Optional[date] = None,
+        to_date: Optional[date] = None,
+        backfill: bool = False,
+        symbols: Optional[Sequence[str]] = None,
+    ) -> Dict:
+        """
+        Fetch missing dates and merge them into the per-symbol files.
+
+        Args:
+            from_date: Backfill start (default: daily_bars_years before to_date); in update mode
+                       only used when nothing is recorded yet
+            to_date: Last date (default: yesterday, US/Eastern)
+            backfill: Every unrecorded weekday in [from_date, to_date]; otherwise only dates after
+                      the last recorded one
+
+        Returns:
+            Dict with dates requested, fetched, empty (holidays), failed, symbol_files,
+            adjust_failed ("symbol:variant" derivations that failed), universe_dates (snapshots built)
+        """
+        to_date = to_date or (datetime.now(ET).date() - timedelta(days=1))
+        if from_date is None:
+            years = int(self.ingester.config["ingestion"]["daily_bars_years"])
+            from_date = to_date - timedelta(days=years * 365)
+
+        derive: List[str] = []
+        adjust = None
+        if "1d" in variants:
+            # bars/1d only from 1d_raw + splits (refreshed by the builder), never from adjusted=true dates
+            adjust = AdjustedBarsBuilder(self.ingester)
+            variants, derive = split_variants(variants)
+            if not adjust.adjuster.has_actions:
+                logger.warning("No corporate actions on disk: bars/1d = 1d_raw until splits are available "
+                               "(re-adjusted automatically once they are)")
+
+        tasks = []
+        for variant in variants:
+            done = self.done_dates(variant)
+            start = from_date if backfill or not done else max(from_date, done[-1] + timedelta(days=1))
+            recorded = set(done)
+            tasks += [(d, variant) for d in weekdays(start, to_date) if d not in recorded]
+
+        logger.info(f"Grouped daily {'backfill' if backfill else 'update'} → {to_date}: {len(tasks):,} "
+                    f"(date, variant) requests for {', '.join(variants)}")
+        t0 = time.time()
+        res = self.fetch_dates(tasks)
+
+        symbol_files = 0
+        for variant in variants:
+            dates = [d for d, v in res["fetched"] if v == variant]
+            symbol_files += self.update_symbol_files(variant, dates, symbols)
+        adjust_failed = []
+        if derive:
+            adjust_failed = adjust.run(derive, symbols=symbols)["failed"]
+        if adjust is not None:
+            adjust.close()
+        universe_dates = 0
+        if any(v == "1d_raw" for _, v in res["fetched"]) and \
+                self.ingester.config["ingestion"].get("universe_snapshots", {}).get("auto_update", False):
+            # New raw closes → membership / market cap snapshots of those sessions
+            snaps = UniverseSnapshots.from_config(self.ingester.config, self.ingester.base_dir)
+            try:
+                universe_dates = snaps.update()["dates"]
+            except FileNotFoundError as e:
+                logger.warning(f"Universe snapshots not updated: {e}")
+            snaps.close()
+
+        summary = {"requested": len(tasks), "fetched": len(res["fetched"]), "empty": res["empty"],
+                   "failed": res["failed"], "symbol_files": symbol_files, "adjust_failed": adjust_failed,
+                   "universe_dates": universe_dates}
+        logger.info(f"Grouped daily done in {(time.time() - t0) / 60:.1f} min: {summary['fetched']:,} dates, "
+                    f"{summary['empty']:,} closed, {len(summary['failed']):,} failed, "
+                    f"{symbol_files:,} symbol files updated")
+        return summary
+
+    def close(self):
+        self.wal.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grouped daily bars: per-date store + per-symbol bars/1d")
+    parser.add_argument("--config", type=str, default=str(PROJECT_ROOT / "config" / "config.yaml"))
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--backfill", action="store_true", help="Fill every missing date in [--from, --to]")
+    parser.add_argument("--from", dest="from_date", type=str, help="Start date YYYY-MM-DD")
+    parser.add_argument("--to", dest="to_date", type=str, help="End date YYYY-MM-DD (default: yesterday ET)")
+    parser.add_argument("--universe", action="store_true",
+                        help="Per-symbol files only for the small-cap universe (default: every ticker)")
+    parser.add_argument("--workers", type=int, help="Thread cap (default ingestion.grouped_daily.max_workers)")
+    args = parser.parse_args()
+
+    symbols = None
+    if args.universe:
+        from download_all import HistoricalDownloader
+        downloader = HistoricalDownloader(args.config)
+        ingester = downloader.ingester
+        symbols = downloader.get_small_caps_universe()["ticker"].to_list()
+    else:
+        ingester = PolygonIngester(args.config, job="grouped_daily")
+
+    builder = GroupedDailyBuilder(ingester, max_workers=args.workers)
+    summary = builder.run(
+        args.variants,
+        from_date=date.fromisoformat(args.from_date) if args.from_date else None,
+        to_date=date.fromisoformat(args.to_date) if args.to_date else None,
+        backfill=args.backfill,
+        symbols=symbols,
+    )
+    builder.close()
+
+    if summary["failed"]:
+        logger.warning(f"Failed dates ({len(summary['failed'])}): {', '.join(summary['failed'][:20])}")
+    ingester.metrics.log_summary()
+    if ingester.cache is not None:
+        ingester.cache.log_stats()
+
+
+if __name__ == "__main__":
+    main()
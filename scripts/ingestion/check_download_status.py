@@ -6,6 +6,7 @@ Shows current progress of all download stages.
 Usage:
     python scripts/ingestion/check_download_status.py
     python scripts/ingestion/check_download_status.py --verbose
+    python scripts/ingestion/check_download_status.py --event-windows --validate
 """
 
 import sys
@@ -19,6 +20,10 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.utils.event_catalog import EventCatalog
+from scripts.utils.parquet_validation import validate_tree
 
 
 def human_size(bytes_size: float) -> str:
@@ -75,85 +80,75 @@ def check_stage(stage_name: str, path: Path, pattern: str = "*.parquet",
     }
 
 
-def check_event_windows():
-    """Check status of event_windows downloads (FASE 3.2 - trades/quotes)"""
+def check_event_windows(validate: bool = False):
+    """
+    Check status of event_windows downloads (FASE 3.2 - trades/quotes) from the event catalog
+
+    Args:
+        validate: Also check every file from its Parquet footer + sidecar (no data pages read)
+    """
     event_windows_dir = PROJECT_ROOT / "raw" / "market_data" / "event_windows"
 
     if not event_windows_dir.exists():
         print(f"⚠️  Event windows directory not found: {event_windows_dir}")
         return
 
-    # Find all event files
-    all_files = list(event_windows_dir.glob("**/*.parquet"))
-
-    if not all_files:
-        print("⚠️  No event window files found")
+    catalog = EventCatalog.for_root(event_windows_dir)
+    if len(catalog) == 0:
+        print("⚠️  Event catalog is empty. Bootstrap it once with:")
+        print("     python scripts/utils/event_catalog.py --rebuild")
+        catalog.close()
         return
 
-    # Parse files
-    trades_files = [f for f in all_files if "_trades.parquet" in f.name]
-    quotes_files = [f for f in all_files if "_quotes.parquet" in f.name]
-
-    # Group by event (symbol + date_time prefix)
-    events_trades = set()
-    events_quotes = set()
-
-    for f in trades_files:
-        symbol = f.parent.name
-        event_key = f.stem.replace("_trades", "")
-        events_trades.add(f"{symbol}_{event_key}")
+    summary = catalog.summary()
+    per_symbol = catalog.symbol_counts()
+    incomplete = catalog.to_polars(f"NOT {catalog.complete_clause()}").sort("event_id")
+    expected_rows = catalog.expected_rows() if validate else None
+    catalog.close()
 
-    for f in quotes_files:
-        symbol = f.parent.name
-        event_key = f.stem.replace("_quotes", "")
-        events_quotes.add(f"{symbol}_{event_key}")
-
-    all_events = events_trades | events_quotes
-
-    # Calculate storage
-    total_size = sum(f.stat().st_size for f in all_files)
-    trades_size = sum(f.stat().st_size for f in trades_files)
-    quotes_size = sum(f.stat().st_size for f in quotes_files)
+    total_size = summary["trades_bytes"] + summary["quotes_bytes"]
 
     # Print summary
     print("=" * 70)
     print("EVENT WINDOWS DOWNLOAD STATUS (FASE 3.2)")
     print("=" * 70)
-    print(f"Total events: {len(all_events):,}")
-    print(f"  - With trades: {len(events_trades):,}")
-    print(f"  - With quotes: {len(events_quotes):,}")
-    print(f"  - Complete (trades + quotes): {len(events_trades & events_quotes):,}")
-    print(f"  - Incomplete: {len(all_events - (events_trades & events_quotes)):,}")
+    print(f"Total events: {summary['events']:,}")
+    print(f"  - With trades: {summary['with_trades']:,}")
+    print(f"  - With quotes: {summary['with_quotes']:,}")
+    print(f"  - Complete (trades + quotes): {summary['complete']:,}")
+    print(f"  - Incomplete: {summary['partial']:,}")
+    print(f"  - Failed: {summary['failed']:,}")
+    print(f"  - Last written: {summary['last_written']}")
 
     print(f"\nStorage:")
     print(f"  - Total: {human_size(total_size)}")
-    print(f"  - Trades: {human_size(trades_size)}")
-    print(f"  - Quotes: {human_size(quotes_size)}")
+    print(f"  - Trades: {human_size(summary['trades_bytes'])}")
+    print(f"  - Quotes: {human_size(summary['quotes_bytes'])}")
 
     # Symbols coverage
-    symbols_trades = set(f.parent.name for f in trades_files)
-    symbols_quotes = set(f.parent.name for f in quotes_files)
-    all_symbols = symbols_trades | symbols_quotes
-
-    print(f"\nSymbols: {len(all_symbols):,}")
-    for symbol in sorted(all_symbols):
-        symbol_trades = len([e for e in events_trades if e.startswith(f"{symbol}_")])
-        symbol_quotes = len([e for e in events_quotes if e.startswith(f"{symbol}_")])
-        symbol_complete = len([e for e in (events_trades & events_quotes) if e.startswith(f"{symbol}_")])
-        print(f"  {symbol:<10} trades: {symbol_trades:>3}  quotes: {symbol_quotes:>3}  complete: {symbol_complete:>3}")
-
-    # Find incomplete events
-    incomplete = all_events - (events_trades & events_quotes)
-    if incomplete:
+    print(f"\nSymbols: {summary['symbols']:,}")
+    for row in per_symbol.iter_rows(named=True):
+        print(f"  {row['symbol']:<10} trades: {row['with_trades']:>3}  quotes: {row['with_quotes']:>3}  complete: {row['complete']:>3}")
+
+    # Incomplete events
+    if len(incomplete):
         print(f"\n⚠️  Incomplete events ({len(incomplete)}):")
-        for event in sorted(list(incomplete)[:10]):  # Show first 10
-            has_trades = event in events_trades
-            has_quotes = event in events_quotes
-            status = "trades only" if has_trades else "quotes only"
-            print(f"  {event:<40} {status}")
+        for row in incomplete.head(10).iter_rows(named=True):  # Show first 10
+            status = row["status"] if row["status"] == "failed" else f"{row['kinds'] or 'nothing'} only"
+            print(f"  {row['event_id']:<40} {status}")
         if len(incomplete) > 10:
             print(f"  ... and {len(incomplete) - 10} more")
 
+    # Footer-only integrity check (rows vs catalog, sidecar checksum, timestamp range)
+    if validate:
+        checks = validate_tree(event_windows_dir, expected_rows=expected_rows)
+        invalid = checks.filter(~checks["ok"])
+        print(f"\nFile validation (footer-only): {len(checks):,} files, {len(invalid):,} invalid")
+        for row in invalid.head(10).iter_rows(named=True):
+            print(f"  ❌ {row['event_id']:<40} {row['kind']}: {row['reason']}")
+        if len(invalid) > 10:
+            print(f"  ... and {len(invalid) - 10} more")
+
     print("=" * 70)
 
 
@@ -162,11 +157,13 @@ def main():
     parser.add_argument("--verbose", "-v", action="store_true", help="Show detailed information")
     parser.add_argument("--expected-tickers", type=int, default=5005, help="Expected small caps count")
     parser.add_argument("--event-windows", action="store_true", help="Check event windows (FASE 3.2) status")
+    parser.add_argument("--validate", action="store_true",
+                        help="With --event-windows: footer-only integrity check of every file")
     args = parser.parse_args()
 
     # Special mode: event windows only
     if args.event_windows:
-        check_event_windows()
+        check_event_windows(validate=args.validate)
         return
 
     print("=" * 70)
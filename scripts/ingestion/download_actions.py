@@ -8,13 +8,13 @@ from pathlib import Path
 from datetime import datetime
 
 API_KEY = os.environ.get("POLYGON_API_KEY")
-SPLITS_URL = "https://api.polygon.io/v3/reference/splits"
-DIVS_URL   = "https://api.polygon.io/v3/reference/dividends"
+BASE_URL = os.environ.get("POLYGON_BASE_URL", "https://api.polygon.io").rstrip("/")
+SPLITS_URL = f"{BASE_URL}/v3/reference/splits"
+DIVS_URL   = f"{BASE_URL}/v3/reference/dividends"
 
 BASE = Path(__file__).resolve().parents[2]
 EVENTS = BASE / "processed" / "events" / "events_daily_20251009.parquet"
 OUT = BASE / "processed" / "reference" / f"corporate_actions_{datetime.utcnow().strftime('%Y%m%d')}.parquet"
-OUT.parent.mkdir(parents=True, exist_ok=True)
 
 def fetch_paginated(url, params):
     """Fetch all pages from paginated endpoint"""
@@ -30,9 +30,9 @@ def fetch_paginated(url, params):
             if not nxt:
                 break
 
-            # Polygon "next_url" ya incluye apiKey; si no, añádelo:
+            # Polygon "next_url" trae cursor pero NO apiKey: hay que añadirlo
             url = nxt
-            params = {}
+            params = {"apiKey": API_KEY}
             time.sleep(0.2)
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 404:
@@ -47,6 +47,7 @@ def fetch_paginated(url, params):
     return results
 
 def main():
+    OUT.parent.mkdir(parents=True, exist_ok=True)
     print("[OK] Cargando eventos: {}".format(EVENTS))
     ev = pl.read_parquet(EVENTS).select("symbol").unique()
     syms = ev["symbol"].to_list()
@@ -16,12 +16,19 @@ import time
 import glob
 import subprocess
 from pathlib import Path
+from typing import Optional
 from datetime import datetime, timedelta
 from loguru import logger
 
 # Add parent directory to path to import ingest_polygon
 sys.path.insert(0, str(Path(__file__).parent))
 from ingest_polygon import PolygonIngester
+from fetch_aggregates import AggregatesFetcher, VARIANTS
+from build_adjusted_bars import AdjustedBarsBuilder, local_adjustment
+
+from scripts.utils.circuit_breaker import RetryLater
+from scripts.utils.coverage_index import GapPlanner, TradingCalendar
+from scripts.utils.universe_snapshots import UniverseSnapshots, static_filter
 
 import polars as pl
 
@@ -45,77 +52,113 @@ class HistoricalDownloader:
     """Orchestrate historical data download following Month 1 plan"""
 
     def __init__(self, config_path: str = "config/config.yaml"):
-        self.ingester = PolygonIngester(config_path)
+        self.ingester = PolygonIngester(config_path, job="download_all")
         self.config = self.ingester.config
         self._override_top_volatile = None
+        # Missing sessions per symbol from the coverage index (restarts / top-ups only request gaps)
+        self.planner = GapPlanner(self.ingester.coverage, TradingCalendar.from_store(self.ingester.raw_dir))
+        # Point-in-time universe membership (processed/reference/universe)
+        self.universe = UniverseSnapshots.from_config(self.config, self.ingester.base_dir)
         logger.info("Historical Downloader initialized")
 
-    def _date_windows(self, from_date: str, to_date: str, window_days: int):
-        """Yield (from,to) date strings in windows to reduce timeout risk."""
-        start = datetime.strptime(from_date, "%Y-%m-%d")
-        end = datetime.strptime(to_date, "%Y-%m-%d")
-        cur = start
-        while cur < end:
-            nxt = min(cur + timedelta(days=window_days), end)
-            yield cur.strftime("%Y-%m-%d"), nxt.strftime("%Y-%m-%d")
-            cur = nxt
-
-    def get_small_caps_universe(self, force_refresh: bool = False, letters: list = None):
+    def _bootstrap_coverage(self, variant: str):
+        """Index bars written before the coverage log existed (one directory scan, first run only)"""
+        if not self.ingester.coverage.has_log(variant):
+            self.ingester.coverage.bootstrap(variant, self.ingester.raw_dir / "market_data" / "bars" / variant)
+
+    def _minute_adjuster(self) -> Optional[AdjustedBarsBuilder]:
+        """Builder deriving bars/1m from bars/1m_raw when local adjustment is on (None: download adjusted)"""
+        if not hasattr(self, "_adjust_1m"):
+            self._adjust_1m = None
+            if local_adjustment(self.config):
+                builder = AdjustedBarsBuilder(self.ingester)
+                if builder.adjuster.has_actions:
+                    self._adjust_1m = builder
+                else:
+                    logger.warning("Local adjustment enabled but no corporate actions on disk: downloading adjusted 1m")
+        return self._adjust_1m
+
+    def _download_minute_gaps(self, symbol: str, from_date: str, to_date: str) -> int:
+        """
+        Download the 1-min sessions of `symbol` missing from the coverage index; returns requests planned.
+
+        Every fully paginated range is recorded, including ranges without bars (before listing,
+        halts), so they are not requested again. A failed request (permanent 4xx, invalid JSON)
+        or a range still failing after max_parks retries raises and is never recorded.
+        With local adjustment, raw bars are downloaded (bars/1m_raw) and bars/1m is derived.
+        """
+        adjust = self._minute_adjuster()
+        variant = "1m_raw" if adjust is not None else "1m"
+        plan = self.planner.plan_symbol(variant, symbol, from_date, to_date, max_days=30)
+        retry = self.ingester.retry_queue()  # park delays only: the range is retried in place
+        for f_date, t_date in plan:
+            logger.debug(f"{symbol}: {f_date} -> {t_date}")
+            for attempt in range(self.ingester.max_parks + 1):
+                try:
+                    df = self.ingester.download_aggregates(symbol, 1, "minute", f_date, t_date,
+                                                           adjusted=adjust is None, park=True, strict=True)
+                    break
+                except RetryLater as e:
+                    if attempt == self.ingester.max_parks:
+                        raise
+                    time.sleep(retry.delay(attempt, e.url))
+            rows = 0
+            if df is not None and df.height > 0:
+                if self.ingester.save_aggregates(df, "1m", partition_by_date=True, adjusted=adjust is None) is None:
+                    raise ValueError(f"{symbol} {f_date} -> {t_date}: DQ check failed, nothing saved")
+                rows = df.height
+            self.ingester.coverage.record(variant, symbol, f_date, t_date, rows=rows)
+        if adjust is not None:
+            # --- OPTIMIZATION: Adjusted 1m computed from raw + splits, no second download ---
+            # Every time, not only after a download: a derivation that failed or was interrupted
+            # is caught up (nothing new → footer-only skip)
+            adjust.derive(symbol, "1m")
+        return len(plan)
+
+    def get_small_caps_universe(self, force_refresh: bool = False, letters: list = None,
+                                as_of: Optional[str] = None, since: Optional[str] = None):
         """Get or filter small caps universe from downloaded tickers
 
         Args:
             force_refresh: Re-download tickers instead of using cached
             letters: Filter tickers starting with these letters (e.g. ['A', 'B'])
+            as_of: Only tickers that were members below universe.market_cap_max on this date
+                   (point-in-time snapshots, delisted names included)
+            since: Only tickers that were members below the threshold on any session since this date
         """
-        active_tickers_path = self.ingester.raw_dir / "reference" / "tickers_active_*.parquet"
-        delisted_tickers_path = self.ingester.raw_dir / "reference" / "tickers_delisted_*.parquet"
-
-        # Find latest ticker files
-        import glob
-        active_files = glob.glob(str(active_tickers_path))
-        delisted_files = glob.glob(str(delisted_tickers_path))
-
-        if not active_files or not delisted_files or force_refresh:
+        if force_refresh:
             logger.info("Downloading fresh ticker universe (active + delisted)")
-            df_active = self.ingester.download_tickers(active=True)
-            df_delisted = self.ingester.download_tickers(active=False)
-            # Align schemas: add delisted_utc to active with nulls
-            df_active = df_active.with_columns(pl.lit(None).cast(pl.Utf8).alias("delisted_utc"))
-            df = pl.concat([df_active, df_delisted])
-            logger.info(f"Combined universe: {len(df_active)} active + {len(df_delisted)} delisted = {len(df)} total")
-        else:
-            latest_active = max(active_files, key=lambda x: Path(x).stat().st_mtime)
-            latest_delisted = max(delisted_files, key=lambda x: Path(x).stat().st_mtime)
-            logger.info(f"Loading tickers from {latest_active} and {latest_delisted}")
-            df_active = pl.read_parquet(latest_active)
-            df_delisted = pl.read_parquet(latest_delisted)
-            # Align schemas: add delisted_utc to active with nulls
-            if "delisted_utc" not in df_active.columns and "delisted_utc" in df_delisted.columns:
-                df_active = df_active.with_columns(pl.lit(None).cast(pl.Utf8).alias("delisted_utc"))
-            df = pl.concat([df_active, df_delisted])
-            logger.info(f"Loaded universe: {len(df_active)} active + {len(df_delisted)} delisted = {len(df)} total")
+            self.ingester.download_tickers(active=True)
+            self.ingester.download_tickers(active=False)
+        try:
+            # Combined active + delisted table, cached until a newer tickers_* file appears
+            df = self.universe.tickers()
+        except FileNotFoundError:
+            logger.info("Downloading fresh ticker universe (active + delisted)")
+            self.ingester.download_tickers(active=True)
+            self.ingester.download_tickers(active=False)
+            df = self.universe.tickers()
+        logger.info(f"Loaded universe: {len(df)} tickers (active + delisted)")
 
         # Filter small caps based on config
         universe_cfg = self.config["universe"]
 
         logger.info(f"Filtering small caps: price ${universe_cfg['price_min']}-${universe_cfg['price_max']}")
 
-        # Filter by type (Common Stock)
-        small_caps = df.filter(pl.col("type") == "CS")
-
-        # Exclude ETFs
-        if universe_cfg.get("exclude_etfs", True):
-            small_caps = small_caps.filter(pl.col("type") != "ETF")
+        # Type CS, no ETFs / OTC, optional ADRs
+        small_caps = static_filter(df, universe_cfg)
 
-        # Exclude OTC
-        if universe_cfg.get("exclude_otc", True):
-            if "market" in small_caps.columns:
-                small_caps = small_caps.filter(pl.col("market") != "otc")
-
-        # Exclude ADRs (optional)
-        if universe_cfg.get("exclude_adrs", False):
-            if "name" in small_caps.columns:
-                small_caps = small_caps.filter(~pl.col("name").str.contains("ADR", literal=True))
+        if as_of or since:
+            # --- OPTIMIZATION: Point-in-time membership from the date-partitioned snapshots ---
+            self.universe.update()
+            cap = universe_cfg["market_cap_max"]
+            if as_of:
+                members = self.universe.as_of(as_of, market_cap_max=cap)["symbol"]
+                logger.info(f"Members as of {as_of} (< ${cap:,.0f}): {members.n_unique()} tickers")
+            else:
+                members = self.universe.members_since(since, market_cap_max=cap)
+                logger.info(f"Members since {since} (< ${cap:,.0f}): {members.n_unique()} tickers")
+            small_caps = small_caps.filter(pl.col("ticker").is_in(members.implode()))
 
         # Filter by starting letter (for parallelization/batching)
         if letters:
@@ -128,6 +171,11 @@ class HistoricalDownloader:
         logger.info(f"Small caps universe: {len(small_caps)} tickers")
         return small_caps
 
+    def _run_universe(self):
+        """Universe of this run (CLI --letters / --as-of / --since overrides)"""
+        return self.get_small_caps_universe(letters=getattr(self, "_letters", None),
+                                            as_of=getattr(self, "_as_of", None), since=getattr(self, "_since", None))
+
     def download_week1_foundation(self):
         """Week 1: Reference data + daily bars + hourly bars + corporate actions"""
         logger.info("=== WEEK 1: Foundation Data ===")
@@ -144,112 +192,29 @@ class HistoricalDownloader:
 
         # 3. Get small caps
         logger.info("Step 3/5: Filtering small caps universe")
-        small_caps = self.get_small_caps_universe(letters=getattr(self, "_letters", None))
-
-        # 4. Download 5 years daily for all small caps
-        logger.info(f"Step 4/5: Downloading 5 years daily bars for {len(small_caps)} tickers")
-        years = self.config["ingestion"]["daily_bars_years"]
-        to_date = datetime.utcnow().strftime("%Y-%m-%d")
-        from_date = (datetime.utcnow() - timedelta(days=years*365)).strftime("%Y-%m-%d")
-
-        failed = []
-        skipped = 0
-        for i, row in enumerate(small_caps.iter_rows(named=True)):
-            ticker = row["ticker"]
-            if (i + 1) % 100 == 0:
-                logger.info(f"Progress: {i+1}/{len(small_caps)} tickers (skipped: {skipped}, failed: {len(failed)})")
-
-            # Check if already downloaded (resume capability) - check BOTH adjusted and raw
-            out_adj = self.ingester.raw_dir / "market_data" / "bars" / "1d" / f"{ticker}.parquet"
-            out_raw = self.ingester.raw_dir / "market_data" / "bars" / "1d_raw" / f"{ticker}.parquet"
-            if out_adj.exists() and out_raw.exists():
-                skipped += 1
-                continue
-
-            try:
-                # Download ADJUSTED prices (for technical analysis)
-                for f_date, t_date in self._date_windows(from_date, to_date, window_days=365):
-                    logger.debug(f"{ticker} [ADJ]: {f_date} -> {t_date}")
-                    df = self.ingester.download_aggregates(ticker, 1, "day", f_date, t_date, adjusted=True)
-                    if df is not None and df.height > 0:
-                        self.ingester.save_aggregates(df, "1d", partition_by_date=False, adjusted=True)
-
-                # Download RAW prices (for price filters and capitalization)
-                for f_date, t_date in self._date_windows(from_date, to_date, window_days=365):
-                    logger.debug(f"{ticker} [RAW]: {f_date} -> {t_date}")
-                    df = self.ingester.download_aggregates(ticker, 1, "day", f_date, t_date, adjusted=False)
-                    if df is not None and df.height > 0:
-                        self.ingester.save_aggregates(df, "1d", partition_by_date=False, adjusted=False)
-            except Exception as e:
-                logger.error(f"Failed {ticker}: {e}")
-                failed.append(ticker)
-
-            # Rate limiting breather
-            time.sleep(0.2)
-
-        if failed:
-            failed_file = self.ingester.base_dir / "logs" / f"failed_week1_daily_{datetime.utcnow().strftime('%Y%m%d')}.txt"
-            failed_file.parent.mkdir(exist_ok=True)
-            failed_file.write_text("\n".join(failed))
-            logger.warning(f"Failed daily tickers ({len(failed)}): saved to {failed_file}")
-
-        logger.info(f"=== Step 4/5 complete: {len(small_caps) - skipped - len(failed)} daily downloaded, {skipped} skipped, {len(failed)} failed ===")
-
-        # 5. Download 5 years hourly for all small caps
-        logger.info(f"Step 5/5: Downloading 5 years hourly bars for {len(small_caps)} tickers")
-        years = self.config["ingestion"].get("hourly_bars_years", self.config["ingestion"]["daily_bars_years"])
-        to_date = datetime.utcnow().strftime("%Y-%m-%d")
-        from_date = (datetime.utcnow() - timedelta(days=years*365)).strftime("%Y-%m-%d")
-
-        failed_hourly = []
-        skipped_hourly = 0
-        for i, row in enumerate(small_caps.iter_rows(named=True)):
-            ticker = row["ticker"]
-            if (i + 1) % 100 == 0:
-                logger.info(f"Hourly progress: {i+1}/{len(small_caps)} tickers (skipped: {skipped_hourly}, failed: {len(failed_hourly)})")
-
-            # Check if already downloaded (resume capability) - check BOTH adjusted and raw
-            out_adj = self.ingester.raw_dir / "market_data" / "bars" / "1h" / f"{ticker}.parquet"
-            out_raw = self.ingester.raw_dir / "market_data" / "bars" / "1h_raw" / f"{ticker}.parquet"
-            if out_adj.exists() and out_raw.exists():
-                skipped_hourly += 1
-                continue
-
-            try:
-                # Download ADJUSTED prices (for technical analysis)
-                for f_date, t_date in self._date_windows(from_date, to_date, window_days=90):
-                    logger.debug(f"{ticker} hourly [ADJ]: {f_date} -> {t_date}")
-                    df = self.ingester.download_aggregates(ticker, 1, "hour", f_date, t_date, adjusted=True)
-                    if df is not None and df.height > 0:
-                        self.ingester.save_aggregates(df, "1h", partition_by_date=False, adjusted=True)
-
-                # Download RAW prices (for price filters and capitalization)
-                for f_date, t_date in self._date_windows(from_date, to_date, window_days=90):
-                    logger.debug(f"{ticker} hourly [RAW]: {f_date} -> {t_date}")
-                    df = self.ingester.download_aggregates(ticker, 1, "hour", f_date, t_date, adjusted=False)
-                    if df is not None and df.height > 0:
-                        self.ingester.save_aggregates(df, "1h", partition_by_date=False, adjusted=False)
-            except Exception as e:
-                logger.error(f"Failed hourly {ticker}: {e}")
-                failed_hourly.append(ticker)
+        small_caps = self._run_universe()
 
-            # Rate limiting breather
-            time.sleep(0.2)
+        # 4-5. Daily + hourly bars (adjusted + raw), one concurrent job
+        # --- OPTIMIZATION: (ticker, variant) tasks on a worker pool, shared rate budget, WAL progress ---
+        logger.info(f"Step 4-5/5: Downloading daily + hourly bars (adjusted + raw) for {len(small_caps)} tickers")
+        tickers = small_caps["ticker"].to_list()
+        summary = AggregatesFetcher(self.ingester).run(tickers, list(VARIANTS), skip_existing=True)
 
-        if failed_hourly:
-            failed_file = self.ingester.base_dir / "logs" / f"failed_week1_hourly_{datetime.utcnow().strftime('%Y%m%d')}.txt"
+        if summary["failed"]:
+            failed_file = self.ingester.base_dir / "logs" / f"failed_week1_aggregates_{datetime.utcnow().strftime('%Y%m%d')}.txt"
             failed_file.parent.mkdir(exist_ok=True)
-            failed_file.write_text("\n".join(failed_hourly))
-            logger.warning(f"Failed hourly tickers ({len(failed_hourly)}): saved to {failed_file}")
+            failed_file.write_text("\n".join(summary["failed"]))
+            logger.warning(f"Failed daily/hourly tasks ({len(summary['failed'])}): saved to {failed_file}")
 
-        logger.info(f"=== Week 1 complete: Daily({len(small_caps) - skipped - len(failed)}) + Hourly({len(small_caps) - skipped_hourly - len(failed_hourly)}) downloaded ===")
+        logger.info(f"=== Week 1 complete: {summary['done']} daily/hourly files written, "
+                    f"{summary['skipped']} skipped, {len(summary['failed'])} failed ===")
 
     def download_week2_3_intraday(self, top_n: int = 500):
         """Week 2-3: 1-min bars for top volatile tickers"""
         logger.info(f"=== WEEK 2-3: Intraday Data (Top {top_n}) ===")
 
         # Get small caps and rank by volatility
-        small_caps = self.get_small_caps_universe(letters=getattr(self, "_letters", None))
+        small_caps = self._run_universe()
 
         # Take top N (in production, rank by gap%, rvol, halt_count from processed daily data)
         # For now, use first N
@@ -260,25 +225,27 @@ class HistoricalDownloader:
         to_date = datetime.utcnow().strftime("%Y-%m-%d")
         from_date = (datetime.utcnow() - timedelta(days=years*365)).strftime("%Y-%m-%d")
 
+        self._bootstrap_coverage("1m_raw" if self._minute_adjuster() is not None else "1m")
         failed = []
+        skipped = 0
         for i, row in enumerate(top_tickers.iter_rows(named=True)):
             ticker = row["ticker"]
             if (i + 1) % 50 == 0:
-                logger.info(f"Progress: {i+1}/{len(top_tickers)} tickers (failed: {len(failed)})")
+                logger.info(f"Progress: {i+1}/{len(top_tickers)} tickers (skipped: {skipped}, failed: {len(failed)})")
 
+            # --- OPTIMIZATION: Only the gaps in the coverage index, not fixed 30-day windows ---
             try:
-                # Download ADJUSTED prices only (1m optimization: reconstruct raw from splits if needed)
-                for f_date, t_date in self._date_windows(from_date, to_date, window_days=30):
-                    logger.debug(f"{ticker}: {f_date} -> {t_date}")
-                    df = self.ingester.download_aggregates(ticker, 1, "minute", f_date, t_date, adjusted=True)
-                    if df is not None and df.height > 0:
-                        self.ingester.save_aggregates(df, "1m", partition_by_date=True, adjusted=True)
+                requests = self._download_minute_gaps(ticker, from_date, to_date)
             except Exception as e:
                 logger.error(f"Failed {ticker}: {e}")
                 failed.append(ticker)
+                continue
 
-            # Gentle rate limiting for high-volume data
-            time.sleep(0.3)
+            if requests == 0:
+                skipped += 1
+            else:
+                # Gentle rate limiting for high-volume data
+                time.sleep(0.3)
 
         if failed:
             failed_file = self.ingester.base_dir / "logs" / f"failed_week23_{datetime.utcnow().strftime('%Y%m%d')}.txt"
@@ -286,7 +253,8 @@ class HistoricalDownloader:
             failed_file.write_text("\n".join(failed))
             logger.warning(f"Failed tickers ({len(failed)}): saved to {failed_file}")
 
-        logger.info(f"=== Week 2-3 complete: {len(top_tickers) - len(failed)} downloaded, {len(failed)} failed ===")
+        logger.info(f"=== Week 2-3 complete: {len(top_tickers) - skipped - len(failed)} downloaded, "
+                    f"{skipped} already complete, {len(failed)} failed ===")
 
     def download_week4_complementary(self):
         """Week 4: Short Interest & Short Volume"""
@@ -332,34 +300,25 @@ class HistoricalDownloader:
         from_date = (datetime.utcnow() - timedelta(days=years*365)).strftime("%Y-%m-%d")
 
         logger.info(f"=== WEEK 2-3: 1-min for Top-{len(symbols)} ===")
+        self._bootstrap_coverage("1m_raw" if self._minute_adjuster() is not None else "1m")
         failed = []
         skipped = 0
         batch = 0
 
         for i, sym in enumerate(symbols, start=1):
-            # Resume check - check BOTH adjusted and raw
-            out_dir_adj = self.ingester.raw_dir / "market_data" / "bars" / "1m" / sym
-            out_dir_raw = self.ingester.raw_dir / "market_data" / "bars" / "1m_raw" / sym
-            if (out_dir_adj.exists() and any(out_dir_adj.glob("*.parquet"))) and \
-               (out_dir_raw.exists() and any(out_dir_raw.glob("*.parquet"))):
-                skipped += 1
-                if i % 100 == 0:
-                    logger.info(f"Progress: {i}/{len(symbols)} (skipped: {skipped}, failed: {len(failed)})")
-                continue
-
+            # Resume check: coverage index gaps (a restart or a top-up only requests missing sessions)
             try:
-                # Download ADJUSTED prices only (1m optimization: reconstruct raw from splits if needed)
-                for f_date, t_date in self._date_windows(from_date, to_date, window_days=30):
-                    logger.debug(f"{sym}: {f_date} -> {t_date}")
-                    df = self.ingester.download_aggregates(sym, 1, "minute", f_date, t_date, adjusted=True)
-                    if df is not None and df.height > 0:
-                        self.ingester.save_aggregates(df, "1m", partition_by_date=True, adjusted=True)
+                requests = self._download_minute_gaps(sym, from_date, to_date)
             except Exception as e:
                 logger.error(f"Failed 1m {sym}: {e}")
                 failed.append(sym)
+                requests = -1
 
-            # Rate limiting
-            time.sleep(0.25)
+            if requests == 0:
+                skipped += 1
+            else:
+                # Rate limiting
+                time.sleep(0.25)
 
             if i % 100 == 0:
                 logger.info(f"Progress: {i}/{len(symbols)} (skipped: {skipped}, failed: {len(failed)})")
@@ -383,7 +342,7 @@ class HistoricalDownloader:
                                         max_symbols: int = None):
         """Download 1-min event windows (D-2 to D+2) for symbols outside Top-N."""
         # 1) Get small caps universe from Week 1
-        small_caps = self.get_small_caps_universe(letters=getattr(self, "_letters", None))
+        small_caps = self._run_universe()
         universe = set(small_caps["ticker"].to_list() if "ticker" in small_caps.columns else
                       small_caps["symbol"].to_list())
 
@@ -531,6 +490,8 @@ def main():
                         help="Event window preset (default: compact)")
     parser.add_argument("--max-rest-symbols", type=int, help="Limit number of 'rest' symbols for event windows (testing)")
     parser.add_argument("--letters", nargs="+", help="Limit tickers by first letter(s), e.g. A B C")
+    parser.add_argument("--as-of", type=str, help="Universe as of this date YYYY-MM-DD (point-in-time market cap)")
+    parser.add_argument("--since", type=str, help="Tickers that were small caps on any session since YYYY-MM-DD")
     parser.add_argument("--retry-failed", action="store_true", help="Retry failed tickers from previous runs")
     parser.add_argument("--dry-run", action="store_true", help="Print plan without executing")
 
@@ -567,7 +528,7 @@ def main():
             logger.info(f"Filter: Tickers starting with {args.letters}")
 
         if 1 in args.weeks:
-            small_caps = downloader.get_small_caps_universe(letters=args.letters)
+            small_caps = downloader.get_small_caps_universe(letters=args.letters, as_of=args.as_of, since=args.since)
             years = downloader.config["ingestion"]["daily_bars_years"]
             logger.info(f"Week 1: {len(small_caps)} tickers, {years} years daily + hourly bars")
 
@@ -584,6 +545,8 @@ def main():
     # Apply overrides
     if args.letters:
         downloader._letters = args.letters
+    downloader._as_of = args.as_of
+    downloader._since = args.since
 
     # Handle legacy --top-volatile arg
     top_n = args.top_n
@@ -597,6 +560,8 @@ def main():
         events_preset=args.events_preset,
         max_rest_symbols=args.max_rest_symbols
     )
+    if downloader.ingester.cache is not None:
+        downloader.ingester.cache.log_stats()
 
 
 if __name__ == "__main__":
@@ -3,41 +3,76 @@
 Descarga noticias ±1 día alrededor de cada evento (solo títulos/tiempo/sentimiento).
 Usa POLYGON_API_KEY del entorno y crea un parquet por lotes.
 """
-import os, time, math, json, gzip
+import os, sys, time, math, json, gzip
 import polars as pl
 import requests
+import yaml
 from datetime import datetime, timedelta
 from pathlib import Path
 
 BASE = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(BASE))
+
+from scripts.utils.shared_rate_limiter import SharedRateLimiter
+from scripts.utils.response_cache import ResponseCache
 EVENTS = BASE / "processed" / "events" / "events_daily_20251009.parquet"  # o el anotated si prefieres
 OUT_DIR = BASE / "processed" / "news"
-OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 API_KEY = os.environ.get("POLYGON_API_KEY")
-BASE_URL = "https://api.polygon.io/v2/reference/news"
+BASE_URL = os.environ.get("POLYGON_BASE_URL", "https://api.polygon.io").rstrip("/") + "/v2/reference/news"
 
 PER_PAGE = 50
 SLEEP = 0.25
+MAX_RETRIES_429 = 5     # reintentos por página ante 429; después se propaga el HTTPError
+BACKOFF_429 = 2.0       # s, se duplica en cada reintento (2, 4, 8, 16, 32)
+
+# Cupo compartido con el resto de descargas (polygon.shared_rate_limit); None = SLEEP fijo
+LIMITER = None
+
+# Caché en disco de respuestas (polygon.response_cache): noticias de días pasados no cambian
+CACHE = None
+
+def throttle():
+    """Esperar turno antes de cada request"""
+    if LIMITER is not None:
+        LIMITER.wait()
+    else:
+        time.sleep(SLEEP)
 
 def fetch_news(symbol, from_dt, to_dt):
     """Fetch news for symbol in date range"""
     page = 1
     rows = []
+    url = BASE_URL
+    params = {
+        "ticker": symbol,
+        "published_utc.gte": from_dt.isoformat(timespec="seconds")+"Z",
+        "published_utc.lte": to_dt.isoformat(timespec="seconds")+"Z",
+        "order": "asc",
+        "limit": PER_PAGE,
+        "apiKey": API_KEY,
+    }
+    retries = 0
     while True:
-        params = {
-            "ticker": symbol,
-            "published_utc.gte": from_dt.isoformat(timespec="seconds")+"Z",
-            "published_utc.lte": to_dt.isoformat(timespec="seconds")+"Z",
-            "order": "asc",
-            "limit": PER_PAGE,
-            "apiKey": API_KEY,
-        }
-
         try:
-            r = requests.get(BASE_URL, params=params, timeout=30)
-            r.raise_for_status()
-            data = r.json()
+            data = CACHE.get(url, params) if CACHE is not None else None
+            if data is None:
+                throttle()
+                r = requests.get(url, params=params, timeout=30)
+                if r.status_code == 429 and retries < MAX_RETRIES_429:
+                    # Reintenta la misma página con backoff; con LIMITER se pausa el cupo de todos los procesos
+                    delay = BACKOFF_429 * (2 ** retries)
+                    retries += 1
+                    if LIMITER is not None:
+                        LIMITER.penalize(delay)
+                    else:
+                        time.sleep(delay)
+                    continue
+                r.raise_for_status()
+                retries = 0
+                data = r.json()
+                if CACHE is not None:
+                    CACHE.put(url, params, data)
 
             results = data.get("results", [])
             for x in results:
@@ -53,11 +88,14 @@ def fetch_news(symbol, from_dt, to_dt):
                     "sentiment": x.get("insights", [{}])[0].get("sentiment") if x.get("insights") else None,
                 })
 
-            if len(results) < PER_PAGE:
+            # Seguir next_url (cursor); sin él se repetía la misma página indefinidamente
+            nxt = data.get("next_url")
+            if not nxt or not results:
                 break
 
+            url = nxt
+            params = {"apiKey": API_KEY}  # next_url no incluye apiKey
             page += 1
-            time.sleep(SLEEP)
 
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 404:
@@ -72,6 +110,12 @@ def fetch_news(symbol, from_dt, to_dt):
     return pl.DataFrame(rows) if rows else None
 
 def main():
+    global LIMITER, CACHE
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    with open(BASE / "config" / "config.yaml", "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    LIMITER = SharedRateLimiter.from_config(cfg, job="event_news")
+    CACHE = ResponseCache.from_config(cfg)
     print("[OK] Cargando eventos: {}".format(EVENTS))
     ev = pl.read_parquet(EVENTS).select(["symbol","timestamp"]).unique()
     print("[OK] Eventos unicos: {}".format(ev.height))
@@ -108,8 +152,6 @@ def main():
         except Exception as e:
             print("  Fallo {} {}: {}".format(sym, dt.date(), e))
 
-        time.sleep(SLEEP)
-
     if chunks:
         final = pl.concat(chunks)
         final.write_parquet(out_path)
@@ -120,6 +162,11 @@ def main():
     else:
         print("No se descargaron noticias.")
 
+    if CACHE is not None:
+        CACHE.log_stats()
+    if LIMITER is not None:
+        LIMITER.close()
+
 if __name__ == "__main__":
     assert API_KEY, "Falta POLYGON_API_KEY en el entorno"
     main()
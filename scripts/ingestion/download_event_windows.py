@@ -199,6 +199,7 @@ def download_windows_for_event(
     """
     stats = {"windows_saved": 0, "windows_failed": 0}
     timezone = cfg["processing"]["timezone"]
+    pending = []  # (output_file, df_window), written together at the end
 
     # Download each day once and slice into windows
     for day_offset, time_ranges in windows.items():
@@ -228,12 +229,15 @@ def download_windows_for_event(
             output_file = output_dir / window_name
 
             if not dry_run:
-                output_file.parent.mkdir(parents=True, exist_ok=True)
-                df_window.write_parquet(output_file, compression="zstd")
+                pending.append((output_file, df_window))
 
             logger.debug(f"{symbol}: Saved {df_window.height} bars to {window_name}")
             stats["windows_saved"] += 1
 
+    # --- OPTIMIZATION: Write all windows of the event concurrently (atomic renames) ---
+    if pending:
+        ingester.writer.write_many(pending)
+
     return stats
 
 
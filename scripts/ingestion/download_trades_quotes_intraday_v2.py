@@ -6,15 +6,22 @@ FASE 3.2 Production version with:
 - Manifest CORE support with metadata validation
 - Wave-based execution (PM → AH → RTH)
 - Checkpoint system (resume from interruptions)
-- Heartbeat monitoring (progress tracking)
-- Budget cut logic (trim quotes if size exceeds limit)
+- Progress WAL (per-event, per-kind completions; crash-exact resume)
+- Footer-only resume validation (row counts, schema, timestamp stats + .chk sidecar checksum)
+- Optional packed storage (per-symbol-month parts, row group per event)
+- Priority scheduler (score tiers, large/small interleaving, bounded submission)
+- Heartbeat monitoring (progress tracking, cost-weighted ETA, live status file)
+- Per-endpoint latency/size/status histograms and adaptive concurrency (--workers auto)
+- Two-phase windows: core window first, extended only if its tape activity triggers
+- Per-event byte budget (coarser quotes Hz, then narrower window, enforced while paginating)
+- 1-second trade bars / NBBO snapshots materialized per page alongside the raw files
 - Enhanced logging and KPI tracking
 
 Usage:
     # Full manifest CORE download
     python scripts/ingestion/download_trades_quotes_intraday_v2.py \
       --manifest processed/events/manifest_core_20251014.parquet \
-      --workers 2 \
+      --workers auto \
       --rate-limit 12 \
       --resume
 
@@ -42,21 +49,39 @@ from pathlib import Path
 from datetime import datetime, timedelta, timezone
 import argparse
 import time
-from typing import Optional, Dict, List
+from typing import Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from zoneinfo import ZoneInfo
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import polars as pl
 import yaml
 from loguru import logger
 import requests
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
 # Add project root to path
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 sys.path.insert(0, str(PROJECT_ROOT))
 
+from scripts.utils.quote_downsampling import QuoteDownsampler
+from scripts.utils.progress_wal import ProgressWAL, file_sha1
+from scripts.utils.event_catalog import EventCatalog
+from scripts.utils.packed_event_store import PackedEventStore
+from scripts.utils.window_budget import WindowBudget
+from scripts.utils.window_activity import ExtensionPolicy, window_activity
+from scripts.utils.download_scheduler import expected_event_mb, schedule_events
+from scripts.utils.cost_model import CostModel, VOLUME_COLUMN, model_path
+from scripts.utils.tape_schema import TapeProjection
+from scripts.utils.tape_bars import SecondBars, bars_enabled, finalize_bars
+from scripts.utils.request_metrics import RequestMetrics, ConcurrencyController
+from scripts.utils.parquet_validation import validate_parquet, write_sidecar
+from scripts.utils.shared_rate_limiter import SharedRateLimiter
+from scripts.utils.page_spool import PageSpool, discard_kind, spooled_pages
+from scripts.utils.circuit_breaker import CircuitBreaker, RetryLater, RetryQueue, classify
+
 # Load .env file if exists
 env_file = PROJECT_ROOT / ".env"
 if env_file.exists():
@@ -201,19 +226,54 @@ class CheckpointManager:
 class HeartbeatMonitor:
     """Track and log progress heartbeats (thread-safe)"""
 
-    def __init__(self, total_events: int, heartbeat_interval: int = 100):
+    def __init__(
+        self,
+        total_events: int,
+        heartbeat_interval: int = 100,
+        expected_total_mb: float = 0.0,
+        heartbeat_seconds: float = 300,
+        status_file: Optional[Path] = None,
+        metrics: Optional[RequestMetrics] = None,
+        controller: Optional[ConcurrencyController] = None
+    ):
+        """
+        Args:
+            total_events: Events in the queue
+            heartbeat_interval: Log a heartbeat every N finished events ...
+            heartbeat_seconds: ... or at least this often
+            expected_total_mb: Sum of expected MB of the queue (scheduler cost model);
+                               enables the cost-weighted ETA
+            status_file: Optional JSON file rewritten at each heartbeat (live progress/ETA)
+            metrics: Per-endpoint request histograms reported with each heartbeat
+            controller: Adaptive concurrency controller (current limit reported)
+        """
         self.total_events = total_events
         self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_seconds = heartbeat_seconds
+        self.expected_total_mb = expected_total_mb
+        self.status_file = status_file
+        self.metrics = metrics
+        self.controller = controller
         self.processed = 0
         self.failed = 0
         self.skipped = 0
         self.total_trades = 0
         self.total_quotes = 0
         self.total_size_mb = 0.0
+        self.done_expected_mb = 0.0
         self.start_time = time.time()
+        self.last_heartbeat = self.start_time
         self.lock = threading.Lock()
 
-    def update(self, trades_count: int, quotes_count: int, size_mb: float, success: bool, skipped: bool = False):
+    def update(
+        self,
+        trades_count: int,
+        quotes_count: int,
+        size_mb: float,
+        success: bool,
+        skipped: bool = False,
+        expected_mb: float = 0.0
+    ):
         """Update stats (thread-safe)"""
         with self.lock:
             if skipped:
@@ -225,19 +285,47 @@ class HeartbeatMonitor:
                 self.total_size_mb += size_mb
             else:
                 self.failed += 1
+            self.done_expected_mb += expected_mb
 
-            # Heartbeat every N events
+            # Heartbeat every N events (or every heartbeat_seconds)
             total_done = self.processed + self.failed + self.skipped
-            if total_done > 0 and total_done % self.heartbeat_interval == 0:
+            if total_done > 0 and (total_done % self.heartbeat_interval == 0 or
+                                   time.time() - self.last_heartbeat >= self.heartbeat_seconds):
                 self._log_heartbeat()
 
+    def eta_hours(self) -> float:
+        """
+        Remaining hours. Cost-weighted when the scheduler's expected MB are known (the queue is
+        not uniform: priority tiers interleave large and small events), else by event count.
+        """
+        total_done = self.processed + self.failed + self.skipped
+        elapsed_h = (time.time() - self.start_time) / 3600
+        if elapsed_h <= 0 or total_done == 0:
+            return 0.0
+        if self.expected_total_mb > 0 and self.done_expected_mb > 0:
+            return (self.expected_total_mb - self.done_expected_mb) / (self.done_expected_mb / elapsed_h)
+        return (self.total_events - total_done) / (total_done / elapsed_h)
+
+    def _write_status(self, status: Dict):
+        """Atomically rewrite the status file"""
+        tmp = self.status_file.with_suffix(self.status_file.suffix + ".tmp")
+        try:
+            self.status_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(status, f, indent=2)
+            os.replace(str(tmp), str(self.status_file))
+        except OSError as e:
+            logger.debug(f"Could not write status file: {e}")
+
     def _log_heartbeat(self):
         """Log heartbeat stats"""
+        self.last_heartbeat = time.time()
         total_done = self.processed + self.failed + self.skipped
         elapsed = time.time() - self.start_time
         pct = (total_done / self.total_events) * 100
         rate = total_done / (elapsed / 3600) if elapsed > 0 else 0
-        eta_hours = (self.total_events - total_done) / rate if rate > 0 else 0
+        eta_hours = self.eta_hours()
+        mb_per_s = self.total_size_mb / elapsed if elapsed > 0 else 0
 
         avg_trades = self.total_trades / self.processed if self.processed > 0 else 0
         avg_quotes = self.total_quotes / self.processed if self.processed > 0 else 0
@@ -249,9 +337,36 @@ class HeartbeatMonitor:
         logger.info(f"  Trades: {self.total_trades:,} (avg {avg_trades:.0f}/event)")
         logger.info(f"  Quotes: {self.total_quotes:,} (avg {avg_quotes:.0f}/event)")
         logger.info(f"  Size: {self.total_size_mb:.1f} MB (avg {avg_size_mb:.1f} MB/event)")
-        logger.info(f"  Rate: {rate:.1f} events/hour | ETA: {eta_hours:.1f} hours ({eta_hours/24:.1f} days)")
+        logger.info(f"  Rate: {rate:.1f} events/hour | {mb_per_s:.2f} MB/s | ETA: {eta_hours:.1f} hours ({eta_hours/24:.1f} days)")
+        if self.expected_total_mb > 0:
+            logger.info(f"  Expected work done: {self.done_expected_mb:.0f}/{self.expected_total_mb:.0f} MB "
+                        f"({self.done_expected_mb / self.expected_total_mb * 100:.1f}%)")
+        if self.controller is not None:
+            c = self.controller.state()
+            logger.info(f"  Concurrency: {c['limit']} (range {c['min']}-{c['max']}, last: {c['last_action']})")
+        if self.metrics is not None:
+            self.metrics.log_summary()
         logger.info("="*80)
 
+        if self.status_file is not None:
+            self._write_status({
+                "updated_at": datetime.now().isoformat(timespec="seconds"),
+                "total_events": self.total_events,
+                "done": total_done,
+                "success": self.processed,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "size_mb": round(self.total_size_mb, 1),
+                "expected_total_mb": round(self.expected_total_mb, 1),
+                "expected_done_mb": round(self.done_expected_mb, 1),
+                "events_per_hour": round(rate, 1),
+                "mb_per_s": round(mb_per_s, 3),
+                "eta_hours": round(eta_hours, 2),
+                "eta_at": (datetime.now() + timedelta(hours=eta_hours)).isoformat(timespec="seconds"),
+                "concurrency": self.controller.state() if self.controller is not None else None,
+                "requests": self.metrics.summary() if self.metrics is not None else None,
+            })
+
     def final_summary(self):
         """Log final summary"""
         elapsed = time.time() - self.start_time
@@ -271,6 +386,10 @@ class HeartbeatMonitor:
         logger.info(f"")
         logger.info(f"Time elapsed: {elapsed/3600:.2f} hours ({elapsed/3600/24:.2f} days)")
         logger.info(f"Rate: {total_done/(elapsed/3600):.1f} events/hour")
+        if self.metrics is not None:
+            logger.info(f"")
+            logger.info(f"Requests by endpoint:")
+            self.metrics.log_summary()
         logger.info("="*80)
 
 
@@ -311,6 +430,38 @@ def generate_canonical_event_id(event_row: Dict) -> str:
     return event_id
 
 
+def canonical_event_ids(df: pl.DataFrame) -> pl.Series:
+    """
+    generate_canonical_event_id for a whole manifest, vectorized (same IDs, byte for byte).
+
+    UTC normalization and string building run in Polars; only the SHA-1 of the seed is computed
+    per row (IDs name directories, WAL and catalog entries, so the hash itself cannot change).
+    String timestamps keep the row-wise path (naive strings are read in local time there).
+    """
+    ts_dtype = df.schema["timestamp"]
+    if not isinstance(ts_dtype, pl.Datetime):
+        rows = df.select(["symbol", "event_type", "timestamp"]).iter_rows(named=True)
+        return pl.Series("event_id", [generate_canonical_event_id(r) for r in rows], dtype=pl.Utf8)
+
+    ts = pl.col("timestamp")
+    ts = ts.dt.convert_time_zone("UTC") if ts_dtype.time_zone else ts.dt.replace_time_zone("UTC")
+    us = ts.dt.microsecond()
+    # datetime.isoformat(): fractional part only when microseconds != 0
+    iso = pl.concat_str([
+        ts.dt.strftime("%Y-%m-%dT%H:%M:%S"),
+        pl.when(us > 0).then(pl.lit(".") + us.cast(pl.Utf8).str.zfill(6)).otherwise(pl.lit("")),
+        pl.lit("+00:00"),
+    ])
+    parts = df.select(
+        pl.concat_str([pl.col("symbol"), pl.col("event_type"), iso], separator="|").alias("seed"),
+        pl.concat_str([pl.col("symbol"), pl.col("event_type"), ts.dt.strftime("%Y%m%d_%H%M%S")],
+                      separator="_").alias("prefix"),
+    )
+    sha1 = hashlib.sha1
+    hashes = pl.Series([sha1(seed.encode()).hexdigest()[:8] for seed in parts["seed"]], dtype=pl.Utf8)
+    return (parts["prefix"] + "_" + hashes).alias("event_id")
+
+
 class PolygonTradesQuotesDownloader:
     """Download trades and quotes from Polygon.io for FASE 3.2"""
 
@@ -344,19 +495,46 @@ class PolygonTradesQuotesDownloader:
         if not self.api_key:
             raise ValueError("Polygon API key not found in POLYGON_API_KEY env var or config.yaml")
 
-        self.base_url = "https://api.polygon.io"
+        self.base_url = (
+            os.getenv("POLYGON_BASE_URL")
+            or self.cfg.get("polygon", {}).get("base_url")
+            or "https://api.polygon.io"
+        ).rstrip("/")
         self.dry_run = dry_run
         self.quotes_hz = quotes_hz
 
+        # NBBO by-change-only filter (applied per page while streaming quotes)
+        quotes_cfg = self.cfg.get("processing", {}).get("micro_download", {}).get("quotes", {})
+        self.quotes_by_change_only = bool(quotes_cfg.get("downsample", {}).get("by_change_only", True))
+
+        # Column projection + dtype narrowing (columns_keep), applied per page
+        self.projections = {kind: TapeProjection.from_config(self.cfg, kind) for kind in ("trades", "quotes")}
+
+        # 1-second bars ({kind}_1s.parquet), aggregated per page in the same streaming pass
+        self.bars_1s = bars_enabled(self.cfg)
+
+        # Page spool (resumable pagination); spool_root is set from main() once the output dir is known
+        spool_cfg = self.cfg.get("processing", {}).get("micro_download", {}).get("page_spool", {})
+        self.page_spool = bool(spool_cfg.get("enable", False))
+        self.spool_compression = spool_cfg.get("compression", "lz4")
+        self.spool_root: Optional[Path] = None
+
         # Rate limiting
         self.rate_limit_delay = self.cfg.get("polygon", {}).get("rate_limit_delay_seconds", 12)
         self.retry_max_attempts = 5  # Increased from 3 for better resilience
         self.retry_delay_base = 5
 
+        # Per-endpoint circuit breaker (None = disabled): an open circuit parks the event instead of sleeping
+        self.breaker = CircuitBreaker.from_config(self.cfg)
+        self.max_parks = int(self.cfg.get("polygon", {}).get("circuit_breaker", {}).get("max_parks", 5))
+
         # Event window config (from manifest or default)
         self.window_before_minutes = 3
         self.window_after_minutes = 7
 
+        # Dynamic extension (None = disabled): core window first, extended if its activity triggers
+        self.extension = ExtensionPolicy.from_config(self.cfg)
+
         # Timezone
         self.ny_tz = ZoneInfo("America/New_York")
         self.utc_tz = ZoneInfo("UTC")
@@ -369,18 +547,28 @@ class PolygonTradesQuotesDownloader:
             adapter = HTTPAdapter(
                 pool_connections=64,
                 pool_maxsize=64,
-                max_retries=Retry(total=3, backoff_factor=0.2)
+                max_retries=0  # no silent urllib3 retries: every failed attempt reaches the metrics / AIMD
             )
             self.session.mount("https://", adapter)
             self.session.mount("http://", adapter)
 
-        # Rate limiter injected externally from main()
+        # Per-endpoint request metrics (always on); concurrency controller injected from main()
+        self.metrics = RequestMetrics()
+        self.concurrency: Optional[ConcurrencyController] = None
+
+        # Rate limiter, progress WAL, event catalog and packed store injected externally from main()
         self.rate_limiter = None
+        self.wal: Optional[ProgressWAL] = None
+        self.catalog: Optional[EventCatalog] = None
+        self.store: Optional[PackedEventStore] = None
 
         logger.info("Initialized PolygonTradesQuotesDownloader (FASE 3.2)")
         logger.info(f"  Window: [-{self.window_before_minutes}min, +{self.window_after_minutes}min]")
+        if self.extension is not None:
+            logger.info(f"  Dynamic extension: up to [-{self.extension.before_minutes:g}min, +{self.extension.after_minutes:g}min]")
         logger.info(f"  Rate limit: {self.rate_limit_delay}s")
         logger.info(f"  Quotes Hz: {quotes_hz if quotes_hz else 'all'}")
+        logger.info(f"  Quotes by-change-only: {self.quotes_by_change_only}")
         logger.info(f"  Dry run: {dry_run}")
 
     def _ensure_utc_timestamp_ns(self, dt: datetime) -> int:
@@ -396,41 +584,62 @@ class PolygonTradesQuotesDownloader:
         return int(dt_utc.timestamp() * 1_000_000_000)
 
     def _make_request_with_retry(self, url: str, params: Optional[Dict] = None) -> Optional[requests.Response]:
-        """Make HTTP request with exponential backoff retry"""
+        """
+        Make HTTP request with exponential backoff retry.
+
+        Transient failures (429, 5xx, timeout, network) are retried; permanent ones (other 4xx)
+        return None at once. With the circuit breaker enabled, an open circuit or the first
+        transient failure raises RetryLater: the event is parked and resumed later from its
+        page spool instead of holding a worker in backoff (no sleep in worker threads).
+        """
         if self.dry_run:
             return None
 
+        failure = None
         for attempt in range(self.retry_max_attempts):
-            try:
-                # Apply rate-limit BEFORE each request (includes pagination)
+            if self.breaker is not None:
+                wait_s = self.breaker.before_request(url)
+                if wait_s > 0:
+                    raise RetryLater(url, "circuit_open")
+
+            # Concurrency slot (adaptive limit), then rate-limit BEFORE each request (includes pagination)
+            response, error = None, None
+            with self.concurrency.slot() if self.concurrency else nullcontext():
                 if self.rate_limiter:
                     self.rate_limiter.wait()
 
-                response = self.session.get(url, params=params, timeout=30)
-
-                if response.status_code == 200:
-                    return response
+                t0 = time.perf_counter()
+                try:
+                    response = self.session.get(url, params=params, timeout=30)
+                except requests.exceptions.RequestException as e:
+                    error = e
+                self.metrics.record(url, time.perf_counter() - t0,
+                                    len(response.content) if response is not None else 0,
+                                    response.status_code if response is not None else 0)
 
-                if response.status_code == 429:
-                    delay = self.retry_delay_base * (2 ** attempt)
-                    logger.warning(f"429 Rate limit, retrying in {delay}s (attempt {attempt+1}/{self.retry_max_attempts})")
-                    time.sleep(delay)
-                    continue
+            failure = classify(response.status_code if response is not None else None, error)
+            if self.breaker is not None:
+                self.breaker.record(url, failure)
 
-                if response.status_code >= 500:
-                    delay = self.retry_delay_base * (2 ** attempt)
-                    logger.warning(f"5xx error {response.status_code}, retrying in {delay}s")
-                    time.sleep(delay)
-                    continue
+            if failure == "ok":
+                return response
 
+            if failure == "permanent":
                 logger.error(f"HTTP {response.status_code}: {response.text[:200]}")
                 return None
 
-            except Exception as e:
-                logger.error(f"Request failed: {e}")
-                if attempt < self.retry_max_attempts - 1:
-                    time.sleep(self.retry_delay_base)
-
+            delay = self.retry_delay_base * (2 ** attempt)
+            detail = f"{response.status_code}" if response is not None else f"{error}"
+            if failure == "rate_limit" and hasattr(self.rate_limiter, "penalize"):
+                self.rate_limiter.penalize(delay)  # shared bucket: every job backs off, not just this one
+            if self.breaker is not None:
+                # Park the event (RetryQueue: delay grows with its park count) instead of sleeping here
+                raise RetryLater(url, failure)
+            if attempt < self.retry_max_attempts - 1:
+                logger.warning(f"{failure} ({detail}), retrying in {delay}s (attempt {attempt+1}/{self.retry_max_attempts})")
+                time.sleep(delay)
+
+        logger.error(f"Request failed after {self.retry_max_attempts} attempts ({failure})")
         return None
 
     def _ensure_api_key_in_url(self, url: str) -> str:
@@ -440,101 +649,99 @@ class PolygonTradesQuotesDownloader:
             url = f"{url}{separator}apiKey={self.api_key}"
         return url
 
-    def download_trades(
+    @staticmethod
+    def _strip_api_key(url: Optional[str]) -> Optional[str]:
+        """Remove apiKey from a URL before persisting it (WAL, logs)"""
+        if not url:
+            return url
+        parts = urlsplit(url)
+        query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "apiKey"]
+        return urlunsplit(parts._replace(query=urlencode(query)))
+
+    # Polygon field → local column name, per tape kind
+    TRADES_COLUMN_MAP = {
+        "sip_timestamp": "timestamp_ns",
+        "participant_timestamp": "exchange_timestamp_ns",
+        "price": "price",
+        "size": "size",
+        "exchange": "exchange",
+        "conditions": "conditions",
+        "sequence_number": "sequence_number",
+        "trf_timestamp": "trf_timestamp"
+    }
+
+    QUOTES_COLUMN_MAP = {
+        "sip_timestamp": "timestamp_ns",
+        "participant_timestamp": "exchange_timestamp_ns",
+        "ask_price": "ask_price",
+        "bid_price": "bid_price",
+        "ask_size": "ask_size",
+        "bid_size": "bid_size",
+        "ask_exchange": "ask_exchange",
+        "bid_exchange": "bid_exchange",
+        "conditions": "conditions",
+        "indicators": "indicators"
+    }
+
+    def _page_to_frame(
         self,
-        ticker: str,
-        timestamp_gte: int,
-        timestamp_lte: int,
-        limit: int = 50000
-    ) -> Optional[pl.DataFrame]:
-        """Download trades from Polygon API"""
-        if self.dry_run:
-            return pl.DataFrame()
-
-        url = f"{self.base_url}/v3/trades/{ticker}"
-        params = {
-            "timestamp.gte": timestamp_gte,
-            "timestamp.lte": timestamp_lte,
-            "limit": limit,
-            "apiKey": self.api_key,
-            "order": "asc",
-            "sort": "timestamp"
-        }
-
-        all_results = []
-        next_url = None
-        page = 0
-
-        while True:
-            page += 1
-
-            if next_url:
-                next_url = self._ensure_api_key_in_url(next_url)
-                response = self._make_request_with_retry(next_url, params=None)
-            else:
-                response = self._make_request_with_retry(url, params=params)
-
-            if response is None:
-                logger.error(f"{ticker}: Failed to download trades")
-                return None if not all_results else pl.DataFrame(all_results)
-
-            try:
-                data = response.json()
-            except Exception as e:
-                logger.error(f"{ticker}: Failed to parse JSON: {e}")
-                return None if not all_results else pl.DataFrame(all_results)
-
-            results = data.get("results", [])
-            if results:
-                all_results.extend(results)
-
-            next_url = data.get("next_url")
-            if not next_url:
-                break
-
-            time.sleep(0.5)  # Pagination delay
-
-        if not all_results:
-            return pl.DataFrame()
-
-        df = pl.DataFrame(all_results)
-
-        # Rename columns
-        column_map = {
-            "sip_timestamp": "timestamp_ns",
-            "participant_timestamp": "exchange_timestamp_ns",
-            "price": "price",
-            "size": "size",
-            "exchange": "exchange",
-            "conditions": "conditions",
-            "sequence_number": "sequence_number",
-            "trf_timestamp": "trf_timestamp"
-        }
-
-        existing_cols = {k: v for k, v in column_map.items() if k in df.columns}
+        results: List[Dict],
+        column_map: Dict[str, str],
+        projection: Optional[TapeProjection] = None
+    ) -> pl.DataFrame:
+        """Decode one page of results: rename Polygon fields, add UTC `timestamp`, project/narrow columns"""
+        df = pl.DataFrame(results, infer_schema_length=None)
+
+        existing_cols = {k: v for k, v in column_map.items() if k in df.columns and k != v}
         if existing_cols:
             df = df.rename(existing_cols)
 
-        # Convert timestamp
         if "timestamp_ns" in df.columns:
             df = df.with_columns([
                 pl.from_epoch(pl.col("timestamp_ns"), time_unit="ns").alias("timestamp")
             ])
 
+        if projection is not None:
+            df = projection.project(df)
+
         return df
 
-    def download_quotes(
+    def _download_paginated(
         self,
+        kind: str,
         ticker: str,
         timestamp_gte: int,
         timestamp_lte: int,
-        limit: int = 50000
+        limit: int,
+        column_map: Dict[str, str],
+        sampler: Optional[QuoteDownsampler] = None,
+        progress: Optional[Dict] = None,
+        budget: Optional[WindowBudget] = None,
+        spool_dir: Optional[Path] = None
     ) -> Optional[pl.DataFrame]:
-        """Download quotes (NBBO) from Polygon API"""
-        if self.dry_run:
-            return pl.DataFrame()
+        """
+        Download a /v3/{kind} window page by page.
+
+        Each page is decoded (and downsampled, if a sampler is given) as soon as it
+        arrives, so only the kept rows are held in memory. With bars_1s enabled, the raw page
+        is also aggregated into 1-second bars before downsampling.
 
-        url = f"{self.base_url}/v3/quotes/{ticker}"
+        Args:
+            progress: Optional dict filled with {"pages", "cursor", "complete", "trim"}
+                      (cursor = last next_url followed, apiKey stripped;
+                      trim = byte-budget policy applied, None if untrimmed), plus "bars"
+                      (1-second bars of the final window) when bars_1s is enabled
+            budget: Optional byte budget; when the projected size exceeds it the quotes Hz is
+                    coarsened, then the window narrowed around the event, then paging stopped
+            spool_dir: Optional page spool; every page is committed there (kept rows, cursor,
+                       sampler/budget state) and a later attempt continues after the last
+                       committed page instead of page one
+
+        Returns:
+            DataFrame (empty if no results), partial DataFrame if pagination failed
+            midway, or None if nothing could be downloaded
+        """
+        url = f"{self.base_url}/v3/{kind}/{ticker}"
         params = {
             "timestamp.gte": timestamp_gte,
             "timestamp.lte": timestamp_lte,
@@ -544,9 +751,103 @@ class PolygonTradesQuotesDownloader:
             "sort": "timestamp"
         }
 
-        all_results = []
+        frames: List[pl.DataFrame] = []
+        got_results = False
         next_url = None
         page = 0
+        if progress is None:
+            progress = {}
+        progress.update({"pages": 0, "cursor": None, "complete": False, "trim": None})
+        bars = SecondBars(kind) if self.bars_1s else None
+
+        spool = None
+        if spool_dir is not None:
+            projection = self.projections.get(kind)
+            spool = PageSpool(spool_dir, {
+                "kind": kind, "ticker": ticker, "gte": timestamp_gte, "lte": timestamp_lte, "limit": limit,
+                "hz": sampler.max_rate_hz if sampler is not None else None,
+                "by_change_only": sampler.by_change_only if sampler is not None else None,
+                "budget_mb": budget.budget_mb if budget is not None else None,
+                "columns_keep": projection.keep if projection is not None else None,
+                "bars_1s": bars is not None,
+            }, compression=self.spool_compression)
+
+        def _held() -> pl.DataFrame:
+            return pl.concat(frames, how="diagonal_relaxed") if frames else pl.DataFrame()
+
+        def _bounds() -> tuple:
+            end_ns = budget.lte_ns if budget.truncated_at_ns is None else min(budget.lte_ns, budget.truncated_at_ns)
+            return budget.gte_ns, end_ns
+
+        def _in_window(df: pl.DataFrame) -> pl.DataFrame:
+            if budget is None or not budget.trimmed or len(df) == 0 or "timestamp_ns" not in df.columns:
+                return df
+            return df.filter(pl.col("timestamp_ns").is_between(*_bounds()))
+
+        def _enforce_budget(cursor_ns: int) -> bool:
+            """Apply trim steps until the projection fits; returns True if paging must stop"""
+            nonlocal frames
+            while budget.over():
+                projected_mb = budget.projected_mb
+                hz = budget.next_hz(sampler.max_rate_hz) if sampler is not None else None
+                if hz is not None:
+                    budget.coarsen(hz)
+                    frames = [sampler.coarsen(hz, _held())]
+                elif budget.can_narrow():
+                    budget.narrow()
+                    frames = [_in_window(_held())]
+                else:
+                    budget.truncate(cursor_ns)
+                budget.reset_held(sum(f.estimated_size() for f in frames))
+                logger.warning(
+                    f"{ticker}: {kind} over budget ({projected_mb:.1f} MB projected "
+                    f"> {budget.budget_mb:.1f} MB) → {budget.steps[-1]}"
+                )
+            if spool is not None:
+                spool.rewrite()
+            return budget.truncated_at_ns is not None or cursor_ns >= budget.lte_ns
+
+        def _commit(cursor: Optional[str], complete: bool = False):
+            sampler_meta, sampler_frames = sampler.get_state() if sampler is not None else (None, None)
+            spool.commit(frames, page, cursor, got_results, complete=complete,
+                         sampler=sampler_meta, sampler_frames=sampler_frames,
+                         budget=budget.get_state() if budget is not None else None,
+                         bars=bars.get_state() if bars is not None else None)
+
+        def _finish() -> pl.DataFrame:
+            if sampler is not None:
+                tail = sampler.flush()
+                if len(tail) > 0:
+                    frames.append(tail)
+                if sampler.rows_in:
+                    logger.debug(f"{ticker}: Downsampled {kind} {sampler.rows_in} → {sampler.rows_out}")
+            if budget is not None and budget.trimmed:
+                progress["trim"] = budget.policy()
+            if bars is not None:
+                progress["bars"] = bars.result(*_bounds()) if budget is not None and budget.trimmed else bars.result()
+            if not frames:
+                return pl.DataFrame()
+            return _in_window(_held())
+
+        # --- Resume after the last committed page of a previous attempt ---
+        resumed = spool.load() if spool is not None else None
+        if resumed is not None:
+            frames = resumed["frames"]
+            got_results = resumed["got_results"]
+            next_url = resumed["next_url"]
+            page = resumed["pages"]
+            if sampler is not None and resumed["sampler"] is not None:
+                sampler.set_state(resumed["sampler"], resumed["sampler_frames"])
+            if budget is not None and resumed["budget"] is not None:
+                budget.set_state(resumed["budget"])
+            if bars is not None:
+                bars.set_state(resumed["bars"])
+            progress.update({"pages": page, "cursor": next_url, "resumed_pages": page})
+            logger.info(f"{ticker}: {kind} resumed from spool after page {page} "
+                        f"({sum(len(f) for f in frames):,} rows{', complete' if resumed['complete'] else ''})")
+            if resumed["complete"]:
+                progress["complete"] = True
+                return _finish()
 
         while True:
             page += 1
@@ -558,81 +859,134 @@ class PolygonTradesQuotesDownloader:
                 response = self._make_request_with_retry(url, params=params)
 
             if response is None:
-                logger.error(f"{ticker}: Failed to download quotes")
-                return None if not all_results else pl.DataFrame(all_results)
+                logger.error(f"{ticker}: Failed to download {kind}")
+                return _finish() if got_results else None
 
             try:
                 data = response.json()
             except Exception as e:
                 logger.error(f"{ticker}: Failed to parse JSON: {e}")
-                return None if not all_results else pl.DataFrame(all_results)
+                return _finish() if got_results else None
+
+            progress["pages"] = page
+            progress["cursor"] = self._strip_api_key(next_url)
 
             results = data.get("results", [])
+            stop = False
+            cursor_ns = None
             if results:
-                all_results.extend(results)
+                got_results = True
+                page_df = _in_window(self._page_to_frame(results, column_map, self.projections.get(kind)))
+                if bars is not None:
+                    bars.push(page_df)
+                if sampler is not None:
+                    page_df = sampler.push(page_df)
+                if len(page_df) > 0:
+                    frames.append(page_df)
+
+                # --- Byte budget: project the window size from the span paginated so far ---
+                if budget is not None:
+                    cursor_ns = results[-1].get("sip_timestamp") or budget.cursor_ns
+                    budget.observe(page_df.estimated_size(), cursor_ns)
+                    stop = _enforce_budget(cursor_ns)
 
             next_url = data.get("next_url")
-            if not next_url:
+            if not next_url or stop:
                 break
 
-            time.sleep(0.5)
-
-        if not all_results:
-            return pl.DataFrame()
-
-        df = pl.DataFrame(all_results)
-
-        # Rename columns
-        column_map = {
-            "sip_timestamp": "timestamp_ns",
-            "participant_timestamp": "exchange_timestamp_ns",
-            "ask_price": "ask_price",
-            "bid_price": "bid_price",
-            "ask_size": "ask_size",
-            "bid_size": "bid_size",
-            "ask_exchange": "ask_exchange",
-            "bid_exchange": "bid_exchange",
-            "conditions": "conditions",
-            "indicators": "indicators"
-        }
-
-        existing_cols = {k: v for k, v in column_map.items() if k in df.columns}
-        if existing_cols:
-            df = df.rename(existing_cols)
+            if budget is not None and cursor_ns is not None and budget.gte_ns > cursor_ns:
+                # Narrowed past the cursor: restart at the new start instead of paging through
+                # rows _in_window would drop (the restart URL is spooled like any cursor)
+                restart = {**params, "timestamp.gte": budget.gte_ns, "timestamp.lte": budget.lte_ns}
+                next_url = self._strip_api_key(f"{url}?{urlencode(restart)}")
+                logger.debug(f"{ticker}: {kind} window narrowed past the cursor, restarting at {budget.gte_ns}")
 
-        # Convert timestamp
-        if "timestamp_ns" in df.columns:
-            df = df.with_columns([
-                pl.from_epoch(pl.col("timestamp_ns"), time_unit="ns").alias("timestamp")
-            ])
+            if spool is not None:
+                _commit(self._strip_api_key(next_url))
 
-        # Downsample quotes if requested
-        if self.quotes_hz and len(df) > 0:
-            df = self._downsample_quotes(df, self.quotes_hz)
+            time.sleep(0.5)  # Pagination delay
 
+        progress["complete"] = True
+        df = _finish()
+        if spool is not None:
+            _commit(None, complete=True)
         return df
 
-    def _downsample_quotes(self, df: pl.DataFrame, target_hz: float) -> pl.DataFrame:
-        """Downsample quotes to target frequency"""
-        if len(df) == 0:
-            return df
+    def download_trades(
+        self,
+        ticker: str,
+        timestamp_gte: int,
+        timestamp_lte: int,
+        limit: int = 50000,
+        progress: Optional[Dict] = None,
+        budget: Optional[WindowBudget] = None,
+        spool_dir: Optional[Path] = None
+    ) -> Optional[pl.DataFrame]:
+        """Download trades from Polygon API"""
+        if self.dry_run:
+            return pl.DataFrame()
 
-        # Calculate window duration in seconds
-        window_seconds = (self.window_before_minutes + self.window_after_minutes) * 60
+        return self._download_paginated(
+            "trades", ticker, timestamp_gte, timestamp_lte, limit, self.TRADES_COLUMN_MAP,
+            progress=progress, budget=budget, spool_dir=spool_dir
+        )
 
-        # Target number of quotes
-        target_count = int(window_seconds * target_hz)
+    def download_quotes(
+        self,
+        ticker: str,
+        timestamp_gte: int,
+        timestamp_lte: int,
+        limit: int = 50000,
+        progress: Optional[Dict] = None,
+        budget: Optional[WindowBudget] = None,
+        spool_dir: Optional[Path] = None
+    ) -> Optional[pl.DataFrame]:
+        """Download quotes (NBBO) from Polygon API, downsampled per page while streaming"""
+        if self.dry_run:
+            return pl.DataFrame()
 
-        if len(df) <= target_count:
-            return df  # Already below target
+        sampler = None
+        if self.quotes_by_change_only or self.quotes_hz or budget is not None:
+            sampler = QuoteDownsampler(
+                max_rate_hz=self.quotes_hz,
+                by_change_only=self.quotes_by_change_only
+            )
 
-        # Sample evenly
-        step = len(df) / target_count
-        indices = [int(i * step) for i in range(target_count)]
-        df_sampled = df[indices]
+        return self._download_paginated(
+            "quotes", ticker, timestamp_gte, timestamp_lte, limit, self.QUOTES_COLUMN_MAP,
+            sampler=sampler, progress=progress, budget=budget, spool_dir=spool_dir
+        )
 
-        logger.debug(f"Downsampled quotes: {len(df)} → {len(df_sampled)} ({target_hz} Hz)")
-        return df_sampled
+    def _record_completion(
+        self,
+        event_id: str,
+        symbol: str,
+        kind: str,
+        path: Path,
+        rows: int,
+        progress: Dict,
+        sha1: Optional[str] = None
+    ):
+        """Record a finished (event, kind) in the WAL and catalog (skipped if pagination did not complete)"""
+        if self.wal is None and self.catalog is None:
+            return
+        if not progress.get("complete"):
+            logger.warning(f"{event_id}: {kind} pagination incomplete, not recorded as complete")
+            return
+
+        nbytes = path.stat().st_size if rows > 0 and path.exists() else 0
+        if self.wal is not None:
+            self.wal.record(
+                event_id, kind, rows, nbytes,
+                sha1=(sha1 or file_sha1(path)) if nbytes else None,
+                cursor=progress.get("cursor"),
+                pages=progress.get("pages", 0),
+                trim=progress.get("trim"),
+                window=progress.get("window")
+            )
+        if self.catalog is not None:
+            self.catalog.upsert_kind(event_id, symbol, kind, rows, nbytes, trim=progress.get("trim"),
+                                     elapsed_s=progress.get("elapsed_s"))
 
     def download_event_window(
         self,
@@ -653,7 +1007,10 @@ class PolygonTradesQuotesDownloader:
             download_trades: Whether to download trades
             download_quotes: Whether to download quotes
             resume: If True, skip downloading existing valid files
-            budget_mb: Max size budget in MB (triggers quote trimming)
+            budget_mb: Per-event size budget in MB (default: the event's cost-model budget
+                       `budget_mb` if the manifest has one, else micro_download.budget_mb);
+                       over-budget windows are trimmed while downloading (coarser quotes Hz,
+                       then a narrower window around the event)
 
         Returns:
             Dict with stats
@@ -664,7 +1021,7 @@ class PolygonTradesQuotesDownloader:
         session = event_row.get("session", "RTH")
 
         # --- PATCH 1: Canonical event ID (shared with checkpoint) ---
-        event_id = generate_canonical_event_id(event_row)
+        event_id = event_row.get("event_id") or generate_canonical_event_id(event_row)
 
         # --- PATCH 2: Stable UTC timestamp for windows ---
         if isinstance(raw_timestamp, str):
@@ -697,25 +1054,40 @@ class PolygonTradesQuotesDownloader:
             "size_mb": 0.0
         }
 
+        # Kinds of the event (the byte budget is split between them even if one is already stored)
+        event_kinds = [k for k, enabled in (("trades", download_trades), ("quotes", download_quotes)) if enabled]
+
         # --- PATCH 4: Partial resume (check each file independently) ---
         if resume:
+            # WAL first: completions recorded at write time, no data file is touched
+            if self.wal is not None:
+                rec_t = self.wal.get(event_id, "trades") if download_trades else None
+                if rec_t is not None:
+                    stats["trades_count"] = rec_t["rows"]
+                    download_trades = False
+                rec_q = self.wal.get(event_id, "quotes") if download_quotes else None
+                if rec_q is not None:
+                    stats["quotes_count"] = rec_q["rows"]
+                    download_quotes = False
+
+            # --- OPTIMIZATION: Footer-only validation (no data pages read) ---
             if download_trades and trades_file.exists():
-                try:
-                    df_t = pl.read_parquet(trades_file)
-                    stats["trades_count"] = len(df_t)
+                check = validate_parquet(trades_file)
+                if check["ok"]:
+                    stats["trades_count"] = check["rows"]
                     download_trades = False  # Skip trades download
                     logger.debug(f"{symbol} {event_id}: Resume → trades already exist, skipping")
-                except Exception:
-                    logger.warning(f"{symbol} {event_id}: Existing trades file corrupt, will retry")
+                else:
+                    logger.warning(f"{symbol} {event_id}: Existing trades file invalid ({check['reason']}), will retry")
 
             if download_quotes and quotes_file.exists():
-                try:
-                    df_q = pl.read_parquet(quotes_file)
-                    stats["quotes_count"] = len(df_q)
+                check = validate_parquet(quotes_file)
+                if check["ok"]:
+                    stats["quotes_count"] = check["rows"]
                     download_quotes = False  # Skip quotes download
                     logger.debug(f"{symbol} {event_id}: Resume → quotes already exist, skipping")
-                except Exception:
-                    logger.warning(f"{symbol} {event_id}: Existing quotes file corrupt, will retry")
+                else:
+                    logger.warning(f"{symbol} {event_id}: Existing quotes file invalid ({check['reason']}), will retry")
 
             # Both files already exist and valid
             if not download_trades and not download_quotes:
@@ -729,92 +1101,379 @@ class PolygonTradesQuotesDownloader:
 
         timestamp_gte = self._ensure_utc_timestamp_ns(window_start)
         timestamp_lte = self._ensure_utc_timestamp_ns(window_end)
+        event_ns = self._ensure_utc_timestamp_ns(event_ts_utc)
 
-        # --- OPTIMIZATION: Parallel trades + quotes download to overlap latency ---
-        def _do_trades():
-            """Download trades in parallel"""
+        kinds = [k for k, enabled in (("trades", download_trades), ("quotes", download_quotes)) if enabled]
+        if self.dry_run:
+            kinds = []
+        out_files = {"trades": trades_file, "quotes": quotes_file}
+
+        # --- Phase 1: core window (trades + quotes in parallel, rate-limit applied per request) ---
+        budgets = {
+            k: WindowBudget.from_config(self.cfg, k, timestamp_gte, timestamp_lte, event_ns,
+                                        budget_mb=budget_mb if budget_mb is not None else event_row.get("budget_mb"),
+                                        kinds=len(event_kinds), trades_share=event_row.get("trades_share"))
+            for k in kinds
+        }
+        fetched: Dict[str, tuple] = {}
+        if kinds:
+            with ThreadPoolExecutor(max_workers=2) as ex:
+                futures = {
+                    k: ex.submit(self._fetch_range, k, symbol, timestamp_gte, timestamp_lte, budgets[k],
+                                 self._spool_dir(event_id, k, "core"))
+                    for k in kinds
+                }
+                fetched = {k: f.result() for k, f in futures.items()}
+
+        # --- Phase 2: dynamic extension, driven by the activity of the core window ---
+        window = {"before_s": window_before * 60, "after_s": window_after * 60, "triggers": []}
+        core_ok = fetched and all(df is not None and p.get("complete") and not p.get("trim")
+                                  for df, p in fetched.values())
+        # Decided once per event: a resume reuses the recorded decision (its core may lack a kind
+        # already stored, e.g. trades, whose activity drove the triggers)
+        decided = self.catalog.extension(event_id) if resume and self.extension is not None and \
+            self.catalog is not None else None
+        if decided is not None and core_ok:
+            if decided["triggers"]:
+                fetched, window = self._extend_window(
+                    symbol, event_ts_utc, timestamp_gte, timestamp_lte, fetched, budgets, window, event_id,
+                    target=decided
+                )
+                window["triggers"] = decided["triggers"]
+                logger.info(f"{symbol} {event_id}: Window extended as recorded "
+                            f"(triggers: {', '.join(decided['triggers'])})")
+        elif self.extension is not None and core_ok:
+            metrics = window_activity(
+                fetched["trades"][0] if "trades" in fetched else None,
+                fetched["quotes"][0] if "quotes" in fetched else None,
+                timestamp_gte, timestamp_lte
+            )
+            history = self.catalog.symbol_activity(symbol) if self.catalog is not None else None
+            fired = self.extension.triggers_fired(metrics, history)
+
+            if fired:
+                fetched, window = self._extend_window(
+                    symbol, event_ts_utc, timestamp_gte, timestamp_lte, fetched, budgets, window, event_id
+                )
+                window["triggers"] = fired
+                logger.info(
+                    f"{symbol} {event_id}: Window extended to [-{window['before_s'] / 60:g}min, "
+                    f"+{window['after_s'] / 60:g}min] (triggers: {', '.join(fired)})"
+                )
+
+            if self.catalog is not None:
+                self.catalog.record_activity(event_id, symbol, metrics, window)
+
+        # Event context and final window (cost-model features; already recorded with the decision)
+        if self.catalog is not None and kinds and decided is None:
+            self.catalog.record_context(event_id, symbol, session, event_type, event_row.get(VOLUME_COLUMN), window,
+                                        requested={"before_s": window_before * 60, "after_s": window_after * 60})
+
+        # --- Persist each kind (tree file or packed row group) ---
+        def _persist_bars(kind: str, progress: Dict):
+            """1-second bars next to the raw tape (written first: a valid raw file implies its bars)"""
+            bars = progress.get("bars")
+            if bars is None or len(bars) == 0:
+                return
+            if self.store is not None:
+                self.store.append(symbol, event_id, event_ts_utc, f"{kind}_1s", bars, meta={"derived": True})
+            elif not safe_write_parquet(bars, event_dir / f"{kind}_1s.parquet"):
+                logger.warning(f"{symbol} {event_id}: Failed to write {kind} 1s bars")
+
+        def _persist(kind: str, df: Optional[pl.DataFrame], progress: Dict) -> Dict:
             local = {"count": 0, "size": 0.0}
-            if not download_trades or self.dry_run:
+            out_file = out_files[kind]
+            if df is None:
+                return local
+            progress["window"] = window
+            df = self.projections[kind].finalize(df)
+            if progress.get("trim"):
+                local["trim"] = progress["trim"]
+                logger.warning(f"{symbol} {event_id}: {kind} trimmed by byte budget")
+
+            if len(df) == 0:
+                logger.info(f"{symbol} {event_id}: 0 {kind} (no file written)")
+                self._record_completion(event_id, symbol, kind, out_file, 0, progress)
+                if progress.get("complete"):
+                    self.discard_spool(event_id, kind)
                 return local
 
-            df_trades = self.download_trades(symbol, timestamp_gte, timestamp_lte)
-            if df_trades is not None:
-                event_dir.mkdir(parents=True, exist_ok=True)
-                if len(df_trades) > 0:
-                    success = safe_write_parquet(df_trades, trades_file)
-                    if success:
-                        local["count"] = len(df_trades)
-                        if trades_file.exists():
-                            local["size"] += trades_file.stat().st_size / 1024 / 1024
-                        logger.info(f"{symbol} {event_id}: Saved {len(df_trades)} trades")
-                    else:
-                        logger.warning(f"{symbol} {event_id}: Failed to finalize trades file (will retry on resume)")
-                else:
-                    logger.info(f"{symbol} {event_id}: 0 trades (no file written)")
-            return local
+            # Truncated tapes are never published (readers glob the tree / packed index): the
+            # pages stay in the spool and the next attempt continues from the last cursor
+            if not progress.get("complete"):
+                logger.warning(f"{symbol} {event_id}: {kind} pagination incomplete, not written (will retry on resume)")
+                return local
 
-        def _do_quotes():
-            """Download quotes in parallel"""
-            local = {"count": 0, "size": 0.0}
-            if not download_quotes or self.dry_run:
+            if self.store is not None:
+                # Packed layout: completion is recorded when the part commits (on_commit)
+                _persist_bars(kind, progress)
+                self.store.append(symbol, event_id, event_ts_utc, kind, df,
+                                  meta={"trim": progress.get("trim"), "window": window,
+                                        "elapsed_s": progress.get("elapsed_s")})
+                local["count"] = len(df)
+                local["size"] += df.estimated_size("mb")
+                logger.info(f"{symbol} {event_id}: Packed {len(df)} {kind}")
                 return local
 
-            df_quotes = self.download_quotes(symbol, timestamp_gte, timestamp_lte)
-            if df_quotes is not None:
-                # NBBO by-change-only downsampling
+            event_dir.mkdir(parents=True, exist_ok=True)
+            _persist_bars(kind, progress)
+            success = safe_write_parquet(df, out_file)
+            if success:
+                local["count"] = len(df)
+                if out_file.exists():
+                    local["size"] += out_file.stat().st_size / 1024 / 1024
+                logger.info(f"{symbol} {event_id}: Saved {len(df)} {kind}")
+
+                # Sidecar checksum (footer CRC, rows, window; SHA-1 while the file is still in page cache)
+                sha1 = file_sha1(out_file)
                 try:
-                    nbbo_cols = [c for c in ["bid_price", "ask_price", "bid_size", "ask_size"]
-                                if c in df_quotes.columns]
-                    if len(nbbo_cols) >= 2 and len(df_quotes) > 0:
-                        changes = None
-                        for col in nbbo_cols:
-                            cond = pl.col(col) != pl.col(col).shift(1)
-                            changes = cond if changes is None else (changes | cond)
-                        changes = changes.fill_null(True)
-                        df_quotes = df_quotes.filter(changes)
-                except Exception as e:
-                    logger.warning(f"{symbol} {event_id}: NBBO by-change downsampling skipped: {e}")
-
-                event_dir.mkdir(parents=True, exist_ok=True)
-                if len(df_quotes) > 0:
-                    success = safe_write_parquet(df_quotes, quotes_file)
-                    if success:
-                        local["count"] = len(df_quotes)
-                        if quotes_file.exists():
-                            local["size"] += quotes_file.stat().st_size / 1024 / 1024
-                        logger.info(f"{symbol} {event_id}: Saved {len(df_quotes)} quotes")
-                    else:
-                        logger.warning(f"{symbol} {event_id}: Failed to finalize quotes file (will retry on resume)")
-                else:
-                    logger.info(f"{symbol} {event_id}: 0 quotes (no file written)")
+                    write_sidecar(out_file, sha1=sha1, complete=True, window={
+                        "gte_ns": event_ns - window["before_s"] * 1_000_000_000,
+                        "lte_ns": event_ns + window["after_s"] * 1_000_000_000,
+                    })
+                except OSError as e:
+                    logger.warning(f"{symbol} {event_id}: Could not write {kind} sidecar: {e}")
+                self._record_completion(event_id, symbol, kind, out_file, len(df), progress, sha1=sha1)
+                self.discard_spool(event_id, kind)
+            else:
+                logger.warning(f"{symbol} {event_id}: Failed to finalize {kind} file (will retry on resume)")
             return local
 
-        # Execute trades and quotes in parallel (rate-limit applied per request)
-        tr = qt = {"count": 0, "size": 0.0}
-        with ThreadPoolExecutor(max_workers=2) as ex:
-            ftr = ex.submit(_do_trades)
-            fqt = ex.submit(_do_quotes)
-            tr = ftr.result()
-            qt = fqt.result()
+        results = {k: _persist(k, *fetched[k]) for k in fetched}
+        tr = results.get("trades", {"count": 0, "size": 0.0})
+        qt = results.get("quotes", {"count": 0, "size": 0.0})
 
         stats["trades_count"] = tr["count"]
         stats["quotes_count"] = qt["count"]
         stats["size_mb"] += tr["size"] + qt["size"]
+        stats["window"] = window
+
+        # Budget cut logic (trimming happens while paginating; recorded per kind in WAL/catalog)
+        trim = {k: r["trim"] for k, r in (("trades", tr), ("quotes", qt)) if r.get("trim")}
+        if trim:
+            stats["trim"] = trim
 
-        # Budget cut logic
-        if budget_mb and stats["size_mb"] > budget_mb:
-            logger.warning(f"{symbol} {event_id}: Size {stats['size_mb']:.1f} MB exceeds budget {budget_mb} MB")
-            # TODO: Implement quote trimming if needed
+        # Pagination that did not finish is a failure, not a smaller success (spool resumes it)
+        incomplete = [k for k, (_, p) in fetched.items() if not p.get("complete")]
+        if incomplete:
+            stats["incomplete"] = incomplete
+            logger.warning(f"{symbol} {event_id}: incomplete pagination for {', '.join(incomplete)} "
+                           f"(not recorded; resumes from the last committed page)")
 
-        stats["success"] = True
+        stats["success"] = not incomplete
         return stats
 
+    def _fetch_range(
+        self,
+        kind: str,
+        ticker: str,
+        timestamp_gte: int,
+        timestamp_lte: int,
+        budget: Optional[WindowBudget] = None,
+        spool_dir: Optional[Path] = None
+    ) -> tuple:
+        """Fetch one kind over [gte, lte]; returns (df or None, progress with elapsed_s)"""
+        progress = {}
+        fetch = self.download_trades if kind == "trades" else self.download_quotes
+        t0 = time.perf_counter()
+        df = fetch(ticker, timestamp_gte, timestamp_lte, progress=progress, budget=budget, spool_dir=spool_dir)
+        progress["elapsed_s"] = time.perf_counter() - t0
+        return df, progress
+
+    def _spool_dir(self, event_id: str, kind: str, part: str) -> Optional[Path]:
+        """Page spool directory of one (event, kind, part), None if spooling is off"""
+        if self.spool_root is None or self.dry_run:
+            return None
+        return self.spool_root / event_id / f"{kind}_{part}"
+
+    def discard_spool(self, event_id: str, kind: str):
+        """Drop the spooled pages of a kind once it is persisted and recorded complete"""
+        if self.spool_root is not None:
+            discard_kind(self.spool_root, event_id, kind)
+
+    def spooled_pages(self, event_id: str) -> int:
+        """Pages committed to the event's spool so far (a parked event that got further made progress)"""
+        if self.spool_root is None:
+            return 0
+        return spooled_pages(self.spool_root, event_id)
+
+    def _extend_window(
+        self,
+        ticker: str,
+        event_ts_utc: datetime,
+        core_gte: int,
+        core_lte: int,
+        fetched: Dict[str, tuple],
+        budgets: Dict[str, Optional[WindowBudget]],
+        window: Dict,
+        event_id: Optional[str] = None,
+        target: Optional[Dict] = None
+    ) -> tuple:
+        """
+        Fetch only the missing [ext_start, core_start) and (core_end, ext_end] ranges and merge
+        them with the core window (each kind stays sorted by timestamp).
+
+        The extended window is the extension policy's, or `target` ({"before_s", "after_s"}:
+        the window recorded when an earlier attempt decided the extension).
+
+        Each extension range gets the unused part of its kind's byte budget, split by duration;
+        it is narrowed towards the core window (not the event) if it goes over. A before-range
+        cut by the hard cap can leave a gap next to the core window (recorded in its trim policy).
+
+        Returns:
+            (fetched, window) with the merged frames/progress and the final window
+        """
+        if target is not None:
+            before, after = timedelta(seconds=target["before_s"]), timedelta(seconds=target["after_s"])
+        else:
+            before, after = timedelta(minutes=self.extension.before_minutes), timedelta(minutes=self.extension.after_minutes)
+        ext_gte = self._ensure_utc_timestamp_ns(event_ts_utc - before)
+        ext_lte = self._ensure_utc_timestamp_ns(event_ts_utc + after)
+
+        # Polygon bounds are inclusive: the core edges are not fetched twice
+        ranges = []
+        if ext_gte < core_gte:
+            ranges.append(("before", ext_gte, core_gte - 1, core_gte - 1))
+        if ext_lte > core_lte:
+            ranges.append(("after", core_lte + 1, ext_lte, core_lte + 1))
+        if not ranges:
+            return fetched, window
+
+        total_ns = sum(hi - lo for _, lo, hi, _ in ranges)
+        tasks = {}
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            for kind in fetched:
+                core_budget = budgets.get(kind)
+                remaining_mb = core_budget.budget_mb - core_budget.held_mb if core_budget is not None else None
+                for name, lo, hi, anchor in ranges:
+                    budget = None
+                    if remaining_mb is not None:
+                        share_mb = max(remaining_mb, 0.0) * (hi - lo) / total_ns
+                        budget = WindowBudget.from_config(self.cfg, kind, lo, hi, anchor,
+                                                          budget_mb=share_mb or 1e-6, kinds=1)
+                    spool_dir = self._spool_dir(event_id, kind, name) if event_id else None
+                    tasks[(kind, name)] = ex.submit(self._fetch_range, kind, ticker, lo, hi, budget, spool_dir)
+
+        merged = {}
+        for kind, (core_df, core_progress) in fetched.items():
+            parts = {"core": (core_df, core_progress)}
+            for name, *_ in ranges:
+                parts[name] = tasks[(kind, name)].result()
+
+            frames = [parts[name][0] for name in ("before", "core", "after")
+                      if name in parts and parts[name][0] is not None and len(parts[name][0]) > 0]
+            df = pl.concat(frames, how="diagonal_relaxed") if frames else pl.DataFrame()
+
+            # Extended kind is complete only if the core and every extension range completed
+            trims = {name: p["trim"] for name, (_, p) in parts.items() if p.get("trim")}
+            progress = {
+                "pages": sum(p.get("pages", 0) for _, p in parts.values()),
+                "cursor": core_progress.get("cursor"),
+                "complete": all(d is not None and p.get("complete") for d, p in parts.values()),
+                "trim": trims or None,
+                "elapsed_s": sum(p.get("elapsed_s", 0.0) for _, p in parts.values()),
+            }
+            if self.bars_1s:
+                progress["bars"] = finalize_bars(
+                    kind, [parts[name][1].get("bars") for name in ("before", "core", "after") if name in parts]
+                )
+            merged[kind] = (df, progress)
+
+        # Final window: extension ranges may themselves have been narrowed by the budget
+        before_s = window["before_s"]
+        after_s = window["after_s"]
+        event_ns = self._ensure_utc_timestamp_ns(event_ts_utc)
+        for name, lo, hi, _ in ranges:
+            kept = [tasks[(k, name)].result()[1].get("trim") for k in fetched]
+            lo_kept = max([t["kept_ns"][0] for t in kept if t] + [lo])
+            hi_kept = min([t["kept_ns"][1] for t in kept if t] + [hi])
+            if name == "before":
+                before_s = round((event_ns - lo_kept) / 1e9)
+            else:
+                after_s = round((hi_kept - event_ns) / 1e9)
+
+        return merged, {**window, "before_s": before_s, "after_s": after_s}
+
     def close(self):
         """Close HTTP session"""
         if self.session:
             self.session.close()
 
 
+def run_events(
+    downloader: PolygonTradesQuotesDownloader,
+    events: Iterator[tuple],
+    process_event: Callable[[tuple], Dict],
+    on_result: Callable[[tuple, Optional[Dict]], None],
+    retry_queue: RetryQueue,
+    n_workers: int = 1,
+):
+    """
+    Run process_event over (index, event_row) tuples, parking the events that raise RetryLater.
+
+    Parked events go to retry_queue (key: event id) and are re-submitted when due, ahead of the
+    rest of the schedule; an event whose page spool gained pages in the failed attempt restarts
+    its park count. on_result(event, result) gets every final outcome (result None: given up
+    after max_parks failed attempts). With n_workers > 1 at most 2 * n_workers events are in
+    flight, in schedule order (the iterator is not materialized).
+    """
+    def attempt(event) -> Optional[tuple]:
+        _, event_row = event
+        event_id = event_row.get('event_id') or generate_canonical_event_id(event_row)
+        pages_before = downloader.spooled_pages(event_id)
+        try:
+            return event, process_event(event)
+        except RetryLater as e:
+            # Endpoint degraded: park the event (its page spool keeps the pages already fetched)
+            if downloader.spooled_pages(event_id) > pages_before:
+                retry_queue.progress(event_id)  # resumed and committed pages: not stuck
+            if retry_queue.park(event, e.reason, key=event_id, url=e.url):
+                logger.info(f"{event_id} parked ({e.reason})")
+                return None
+            logger.error(f"{event_id}: giving up after {retry_queue.max_parks} failed attempts ({e.reason})")
+            return event, None
+
+    def finish(outcome: Optional[tuple]):
+        if outcome is not None:
+            on_result(*outcome)
+
+    def next_events(n):
+        """Up to n events: parked events that are due first, then the schedule"""
+        due = retry_queue.pop_due(n)
+        return due + list(islice(events, n - len(due)))
+
+    if n_workers > 1:
+        # --- OPTIMIZATION: Bounded submission (keeps schedule order; queue not materialized) ---
+        max_in_flight = n_workers * 2
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            in_flight = {executor.submit(attempt, event) for event in next_events(max_in_flight)}
+
+            while in_flight or len(retry_queue):
+                if not in_flight:
+                    # Only parked events left: wait for the first one to be due
+                    time.sleep(retry_queue.next_due_in() or 0.0)
+                else:
+                    done, in_flight = wait(in_flight, timeout=retry_queue.next_due_in(),
+                                           return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(future.result())
+
+                # Refill up to the bound (due parked events first)
+                for event in next_events(max_in_flight - len(in_flight)):
+                    in_flight.add(executor.submit(attempt, event))
+    else:
+        for event in events:
+            finish(attempt(event))
+            for parked in retry_queue.pop_due():
+                finish(attempt(parked))
+
+        # Drain parked events
+        while len(retry_queue):
+            time.sleep(retry_queue.next_due_in() or 0.0)
+            for parked in retry_queue.pop_due():
+                finish(attempt(parked))
+
+
 def load_manifest_with_validation(manifest_path: Path) -> tuple[pl.DataFrame, dict]:
     """Load manifest and validate metadata"""
     logger.info(f"Loading manifest: {manifest_path}")
@@ -876,14 +1535,27 @@ def main():
     parser.add_argument("--manifest", type=str, required=True, help="Path to manifest CORE parquet")
     parser.add_argument("--wave", type=str, choices=['PM', 'AH', 'RTH', 'all'], default='all',
                         help="Download specific wave (default: all)")
-    parser.add_argument("--workers", type=int, default=1, help="Number of parallel workers (default: 1)")
-    parser.add_argument("--rate-limit", type=float, default=12, help="Seconds between requests (default: 12)")
+    parser.add_argument("--workers", type=str, default="1",
+                        help="Parallel workers: N (fixed) or auto = adaptive concurrency, polygon.autotune (default: 1)")
+    parser.add_argument("--rate-limit", type=float, default=None,
+                        help="Seconds between requests (default: 12; with polygon.shared_rate_limit the shared "
+                             "quota paces requests and this only adds per-process spacing)")
     parser.add_argument("--quotes-hz", type=float, help="Target quote frequency Hz (e.g., 1 for RTH)")
     parser.add_argument("--trades-only", action="store_true", help="Download only trades")
     parser.add_argument("--quotes-only", action="store_true", help="Download only quotes")
     parser.add_argument("--resume", action="store_true", help="Resume from checkpoint")
     parser.add_argument("--dry-run", action="store_true", help="Test without downloading")
     parser.add_argument("--output-dir", type=str, help="Output directory")
+    parser.add_argument("--storage", type=str, choices=['tree', 'packed'], default='tree',
+                        help="Layout: tree = symbol=/event=/{kind}.parquet, packed = per-(symbol, month) parts (default: tree)")
+    parser.add_argument("--budget-mb", type=float,
+                        help="Per-event size budget in MB (default: processing.micro_download.budget_mb)")
+    parser.add_argument("--no-extension", action="store_true",
+                        help="Disable dynamic window extension (always fixed window)")
+    parser.add_argument("--order", type=str, choices=['priority', 'manifest'], default='priority',
+                        help="Queue order: priority = score tiers + large/small interleaving, manifest = file order (default: priority)")
+    parser.add_argument("--priority-tiers", type=int, default=10,
+                        help="Number of score tiers for --order priority (default: 10)")
     parser.add_argument("--limit", type=int, help="Limit number of events (for testing)")
 
     args = parser.parse_args()
@@ -914,76 +1586,144 @@ def main():
 
     logger.info(f"Output directory: {output_dir}")
 
-    # --- OPTIMIZATION: Prefilter already-completed events (trades+quotes both exist) ---
-    logger.info("Scanning disk for already-completed events...")
-    existing = set()
-    if output_dir.exists():
-        for ev_dir in output_dir.rglob("event=*"):
-            try:
-                trades_ok = (ev_dir / "trades.parquet").exists()
-                quotes_ok = (ev_dir / "quotes.parquet").exists()
-                if trades_ok and quotes_ok:
-                    # Extract event_id from directory name "event=SYMBOL_type_DATE_hash"
-                    existing.add(ev_dir.name.split("event=")[1])
-            except Exception:
-                pass
-
-    # Filter manifest to exclude already-completed events
-    skipped_pre = 0
-    filtered_rows = []
-    for row in df_manifest.iter_rows(named=True):
-        event_id = generate_canonical_event_id(row)
-        if event_id in existing:
-            skipped_pre += 1
-            continue
-        filtered_rows.append(row)
+    # What to download
+    download_trades = not args.quotes_only
+    download_quotes = not args.trades_only
+    kinds = [k for k, enabled in (("trades", download_trades), ("quotes", download_quotes)) if enabled]
+
+    # Initialize downloader
+    downloader = PolygonTradesQuotesDownloader(
+        dry_run=args.dry_run,
+        quotes_hz=args.quotes_hz
+    )
 
+    # Progress WAL: always written, replayed on --resume (shared by all waves, event IDs are global)
+    wal = ProgressWAL(PROJECT_ROOT / "logs" / "checkpoints" / "fase3.2_wal.jsonl")
+
+    # Event catalog (updated per kind by the writer; replaces tree walks)
+    catalog = EventCatalog.for_root(output_dir, expected_kinds=kinds)
+    if len(catalog) == 0 and output_dir.exists() and any(output_dir.glob("symbol=*")):
+        logger.info("Catalog empty but tree exists → one-time bootstrap from disk")
+        catalog.rebuild_from_disk(output_dir)
+
+    # --- OPTIMIZATION: Prefilter already-completed events (catalog + WAL, no disk scan) ---
+    existing = catalog.completed_frame(kinds)
+    if args.resume:
+        existing = pl.concat([
+            existing,
+            pl.DataFrame({"event_id": list(wal.completed_events(kinds))}, schema={"event_id": pl.Utf8}),
+        ]).unique()
+
+    # Canonical event IDs, computed once and vectorized (prefilter, scheduler cost model and workers)
+    df_manifest = df_manifest.with_columns(canonical_event_ids(df_manifest))
+
+    # Expected cost per event: empirical cost model fitted on the catalog (symbol/session/type,
+    # window and daily volume), or the plain per-symbol MB history when it is disabled
+    micro_cfg = downloader.cfg.get("processing", {}).get("micro_download", {})
+    cost_cfg = micro_cfg.get("cost_model", {})
+    cost_model = None
+    if cost_cfg.get("enable", False):
+        cost_model = CostModel.from_catalog(catalog, min_events=int(cost_cfg.get("min_events", 5)))
+        cost_model.save(model_path(output_dir))
+        df_all = cost_model.predict(df_manifest)
+
+        # Per-event byte budget from the model (p90 x factor) unless --budget-mb fixes one for all
+        budget_cfg = micro_cfg.get("budget", {})
+        if args.budget_mb is None and budget_cfg.get("p90_factor"):
+            df_all = cost_model.event_budgets(df_all, float(budget_cfg["p90_factor"]),
+                                              budget_cfg.get("max_budget_mb"), budget_cfg.get("min_budget_mb"))
+    else:
+        df_all = expected_event_mb(df_manifest, catalog.to_polars(catalog.complete_clause()))
+
+    # Filter manifest to exclude already-completed events (anti-join, no Python set membership)
+    df_manifest = df_all.join(existing, on="event_id", how="anti", maintain_order="left")
+    skipped_pre = len(df_all) - len(df_manifest)
     if skipped_pre > 0:
         logger.info(f"Prefilter: {skipped_pre:,} events already complete on disk → skipped")
-        df_manifest = pl.DataFrame(filtered_rows) if filtered_rows else df_manifest.head(0)
+
+    # --- Scheduler: priority tiers first, then large/small interleaved inside each tier ---
+    if args.order == 'priority':
+        df_manifest = schedule_events(df_manifest, tiers=args.priority_tiers,
+                                      cost_col="expected_s" if cost_model is not None else "expected_mb")
+        logger.info(f"Scheduled {len(df_manifest):,} events: {args.priority_tiers} priority tiers, "
+                    f"expected {df_manifest['expected_mb'].sum():,.0f} MB")
 
     # Checkpoint
     checkpoint_file = PROJECT_ROOT / "logs" / "checkpoints" / f"fase3.2_{args.wave}_progress.json"
-    checkpoint = CheckpointManager(checkpoint_file) if args.resume else None
+    # (tree layout only: packed events are complete only once their part commits, tracked by the WAL)
+    checkpoint = CheckpointManager(checkpoint_file) if args.resume and args.storage == 'tree' else None
 
-    # Initialize downloader
-    downloader = PolygonTradesQuotesDownloader(
-        dry_run=args.dry_run,
-        quotes_hz=args.quotes_hz
-    )
+    if args.no_extension:
+        downloader.extension = None
 
     # Override rate limit
     if args.rate_limit:
         downloader.rate_limit_delay = args.rate_limit
         logger.info(f"Rate limit set to {args.rate_limit}s")
 
-    # What to download
-    download_trades = not args.quotes_only
-    download_quotes = not args.trades_only
-
     logger.info(f"Downloading: trades={download_trades}, quotes={download_quotes}")
 
-    # Heartbeat monitor
-    monitor = HeartbeatMonitor(len(df_manifest), heartbeat_interval=100)
-
-    # Global rate limiter (shared across workers)
-    rate_limiter = RateLimiter(args.rate_limit)
+    # Global rate limiter: shared across workers, and across processes when polygon.shared_rate_limit is on
+    rate_limiter = (SharedRateLimiter.from_config(downloader.cfg, "trades_quotes", min_interval_s=args.rate_limit or 0)
+                    or RateLimiter(args.rate_limit if args.rate_limit is not None else 12))
+
+    # Concurrency: fixed --workers N, or AIMD between autotune.min/max_workers driven by request metrics
+    fixed_workers = None if args.workers == 'auto' else int(args.workers)
+    controller = ConcurrencyController.from_config(downloader.cfg, downloader.metrics, fixed_workers=fixed_workers)
+    downloader.concurrency = controller
+    n_workers = controller.max_workers
+    logger.info(f"Concurrency: {'adaptive ' if controller.adaptive else ''}{controller.limit} "
+                f"(range {controller.min_workers}-{controller.max_workers})")
+
+    # Heartbeat monitor (cost-weighted ETA, live status file, request histograms)
+    monitor = HeartbeatMonitor(
+        len(df_manifest),
+        heartbeat_interval=100,
+        expected_total_mb=float(df_manifest["expected_mb"].sum() or 0.0),
+        status_file=PROJECT_ROOT / "logs" / "checkpoints" / f"fase3.2_{args.wave}_status.json",
+        metrics=downloader.metrics,
+        controller=controller
+    )
 
     # Inject rate limiter into downloader (applies to EVERY API request, including pagination)
     downloader.rate_limiter = rate_limiter
+    downloader.wal = wal
+    if downloader.page_spool:
+        downloader.spool_root = output_dir / "_spool"
+        logger.info(f"Page spool: {downloader.spool_root}")
+    downloader.catalog = catalog
+
+    # Packed layout: WAL/catalog are updated when each part file is committed
+    if args.storage == 'packed':
+        def _on_packed_commit(entries):
+            for e in entries:
+                meta = e.get("meta") or {}
+                if meta.get("derived"):
+                    continue  # 1s bars: indexed in the store, completion is tracked on the raw kind
+                trim = meta.get("trim")
+                wal.record(e["event_id"], e["kind"], e["rows"], e["bytes"],
+                           file=e["file"], row_group=e["row_group"], trim=trim, window=meta.get("window"))
+                catalog.upsert_kind(e["event_id"], e["symbol"], e["kind"], e["rows"], e["bytes"], trim=trim,
+                                    elapsed_s=meta.get("elapsed_s"))
+                downloader.discard_spool(e["event_id"], e["kind"])
+
+        downloader.store = PackedEventStore(output_dir / "packed", on_commit=_on_packed_commit)
+        logger.info(f"Storage: packed ({downloader.store.root})")
 
     # Worker function for parallel execution
     def process_event(event_tuple):
         """Process single event (worker function)"""
         i, event_row = event_tuple
 
-        # Use canonical event ID (same as file naming)
-        event_id = generate_canonical_event_id(event_row)
+        # Use canonical event ID (same as file naming; precomputed on the manifest)
+        event_id = event_row.get('event_id') or generate_canonical_event_id(event_row)
+        expected_mb = event_row.get('expected_mb') or 0.0
 
-        # Skip if completed
-        if checkpoint and checkpoint.is_completed(event_id):
+        # Skip if completed (WAL is exact; checkpoint kept for older runs)
+        if (args.resume and wal.is_complete(event_id, kinds)) or (checkpoint and checkpoint.is_completed(event_id)):
             logger.debug(f"[{i+1}/{len(df_manifest)}] Skipping {event_id} (already completed)")
-            return {'skipped': True, 'index': i, 'event_id': event_id, 'stats': {'trades_count': 0, 'quotes_count': 0, 'size_mb': 0.0}}
+            return {'skipped': True, 'index': i, 'event_id': event_id, 'expected_mb': expected_mb,
+                    'stats': {'trades_count': 0, 'quotes_count': 0, 'size_mb': 0.0}}
 
         logger.info(f"\n[{i+1}/{len(df_manifest)}] {event_row['symbol']} {event_row['event_type']} @ {event_row['timestamp']} ({event_row.get('session', 'RTH')})")
 
@@ -994,70 +1734,67 @@ def main():
                 download_trades=download_trades,
                 download_quotes=download_quotes,
                 resume=args.resume,
+                budget_mb=args.budget_mb,
                 rate_limiter=rate_limiter  # Pass global rate limiter
             )
-            return {'success': True, 'index': i, 'event_id': event_id, 'stats': stats}
+            if stats.get('incomplete'):
+                return {'success': False, 'index': i, 'event_id': event_id, 'expected_mb': expected_mb,
+                        'symbol': event_row['symbol'], 'error': f"incomplete pagination: {stats['incomplete']}"}
+            return {'success': True, 'index': i, 'event_id': event_id, 'expected_mb': expected_mb, 'stats': stats}
+
+        except RetryLater:
+            raise  # parked by run_events
 
         except Exception as e:
             logger.error(f"Failed to process event {event_id}: {e}")
-            return {'success': False, 'index': i, 'event_id': event_id, 'error': str(e)}
+            return {'success': False, 'index': i, 'event_id': event_id, 'expected_mb': expected_mb,
+                    'symbol': event_row['symbol'], 'error': str(e)}
+
+    # Events parked on an open circuit / persistent transient failures, re-submitted when due
+    retry_queue = RetryQueue(max_parks=downloader.max_parks, base_s=downloader.retry_delay_base,
+                             breaker=downloader.breaker)
+
+    events_processed = 0
+
+    def handle_result(event, result):
+        """Update monitor, checkpoint and catalog with one finished event (None: given up after parks)"""
+        nonlocal events_processed
+        if result is None:
+            i, event_row = event
+            result = {'success': False, 'index': i, 'symbol': event_row['symbol'],
+                      'event_id': event_row.get('event_id') or generate_canonical_event_id(event_row),
+                      'expected_mb': event_row.get('expected_mb') or 0.0}
+        events_processed += 1
+        expected_mb = result.get('expected_mb', 0.0)
+        if result.get('skipped'):
+            monitor.update(0, 0, 0.0, True, skipped=True, expected_mb=expected_mb)
+        elif result.get('success'):
+            stats = result['stats']
+            monitor.update(stats['trades_count'], stats['quotes_count'], stats['size_mb'], True,
+                           expected_mb=expected_mb)
+
+            # Mark as completed in checkpoint
+            if checkpoint:
+                checkpoint.mark_completed(result['event_id'])
+
+                # Save checkpoint every 100 events
+                if events_processed % 100 == 0:
+                    checkpoint.save()
+        else:
+            monitor.update(0, 0, 0.0, False, expected_mb=expected_mb)
+            catalog.mark_failed(result['event_id'], result['symbol'])
 
     # Process events (parallel or sequential)
     try:
-        events_list = list(enumerate(df_manifest.iter_rows(named=True)))
-        events_processed = 0
-
-        if args.workers > 1:
-            # Parallel processing with ThreadPoolExecutor
-            logger.info(f"Using {args.workers} parallel workers")
-
-            with ThreadPoolExecutor(max_workers=args.workers) as executor:
-                # Submit all tasks
-                future_to_event = {executor.submit(process_event, event): event for event in events_list}
-
-                # Process completed futures
-                for future in as_completed(future_to_event):
-                    result = future.result()
-                    events_processed += 1
-
-                    if result.get('skipped'):
-                        monitor.update(0, 0, 0.0, True, skipped=True)
-                    elif result.get('success'):
-                        stats = result['stats']
-                        monitor.update(stats['trades_count'], stats['quotes_count'], stats['size_mb'], True)
-
-                        # Mark as completed in checkpoint
-                        if checkpoint:
-                            checkpoint.mark_completed(result['event_id'])
-
-                            # Save checkpoint every 100 events
-                            if events_processed % 100 == 0:
-                                checkpoint.save()
-                    else:
-                        monitor.update(0, 0, 0.0, False)
-
+        if n_workers > 1:
+            # Parallel processing with ThreadPoolExecutor (pool sized to the max; the controller
+            # gates how many requests actually run)
+            logger.info(f"Using up to {n_workers} parallel workers")
         else:
             # Sequential processing (original behavior)
             logger.info("Using sequential processing (1 worker)")
-            for event in events_list:
-                result = process_event(event)
-                events_processed += 1
-
-                if result.get('skipped'):
-                    monitor.update(0, 0, 0.0, True, skipped=True)
-                elif result.get('success'):
-                    stats = result['stats']
-                    monitor.update(stats['trades_count'], stats['quotes_count'], stats['size_mb'], True)
-
-                    # Mark as completed in checkpoint
-                    if checkpoint:
-                        checkpoint.mark_completed(result['event_id'])
-
-                        # Save checkpoint every 100 events
-                        if events_processed % 100 == 0:
-                            checkpoint.save()
-                else:
-                    monitor.update(0, 0, 0.0, False)
+        run_events(downloader, enumerate(df_manifest.iter_rows(named=True)), process_event, handle_result,
+                   retry_queue, n_workers)
 
     finally:
         # Final checkpoint save
@@ -1065,11 +1802,23 @@ def main():
             checkpoint.save()
             logger.info(f"Checkpoint saved: {checkpoint_file}")
 
-        # Close downloader
+        # Commit open packed parts before closing WAL/catalog
+        if downloader.store is not None:
+            downloader.store.close()
+
+        # Close downloader, WAL and catalog; leave the shared rate-limit bucket
         downloader.close()
+        if isinstance(rate_limiter, SharedRateLimiter):
+            rate_limiter.close()
+        wal.close()
+        catalog.close()
 
         # Final summary
         monitor.final_summary()
+        if downloader.breaker is not None:
+            logger.info(f"Circuit breaker: {downloader.breaker.states()}")
+        logger.info(f"Retry queue: {retry_queue.parked_total:,} parks, {retry_queue.given_up:,} given up, "
+                    f"{len(retry_queue):,} still parked")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,327 @@
+"""
+Bulk Aggregates Fetcher (1d / 1h)
+
+Concurrent refresh of daily and hourly bars for a whole universe: the four
+(timespan x adjusted) variants 1d, 1d_raw, 1h and 1h_raw run as one scheduled job instead of
+a sequential per-ticker loop with fixed sleeps.
+
+- Tasks: one (ticker, variant) per task; its date windows are fetched, merged (window edges
+  overlap by one day) and upserted once into bars/{1d,1h}[_raw]/{ticker}.parquet as soon as
+  the task finishes (BarStore: merge-on-write, atomic renames)
+- Incremental: with --incremental a ticker that already has a file only requests the range
+  from its last stored date (read from the file footer) to to_date, usually a single request.
+  Adjusted variants downloaded from Polygon re-request the full range when the ticker has a
+  split on or after its last stored date (adjusted=true rewrites the whole history; appending
+  would mix pre- and post-split prices); the splits table is refreshed first
+- Rate: every request takes a token from the ingester's bucket (thread-safe, or the shared
+  cross-process bucket); the worker count adapts with polygon.autotune (ConcurrencyController)
+- Retries: a transient failure or an open circuit parks the task in a RetryQueue (bounded
+  number of failures without progress) instead of blocking a worker; other errors are parked
+  with backoff. The windows a parked task already fetched are kept, so it resumes at the
+  window that failed
+- Progress: completions go to a WAL per refresh (logs/checkpoints/aggregates_<to_date>.jsonl),
+  so a restarted refresh skips what it already wrote
+- Local adjustment (ingestion.adjustment.local): only the *_raw variants are downloaded; the
+  requested adjusted variants are derived from them afterwards (AdjustedBarsBuilder)
+
+Config (ingestion.aggregates): max_workers, batch_size. Date ranges from
+ingestion.daily_bars_years / hourly_bars_years.
+
+Usage:
+    # Full small-cap universe, all four variants
+    python scripts/ingestion/fetch_aggregates.py
+
+    # Daily only, a few tickers
+    python scripts/ingestion/fetch_aggregates.py --tickers AAA BBB --variants 1d 1d_raw
+
+    # Daily top-up of existing files (one small request per ticker and variant)
+    python scripts/ingestion/fetch_aggregates.py --incremental
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import polars as pl
+from loguru import logger
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from scripts.utils.bar_adjustment import BarAdjuster
+from scripts.utils.circuit_breaker import RequestFailed, RetryLater
+from scripts.utils.progress_wal import ProgressWAL
+from scripts.utils.request_metrics import ConcurrencyController
+from build_adjusted_bars import AdjustedBarsBuilder, local_adjustment, split_variants
+
+# variant → (Polygon timespan, adjusted, window days per request, years config key)
+VARIANTS = {
+    "1d": ("day", True, 365, "daily_bars_years"),
+    "1d_raw": ("day", False, 365, "daily_bars_years"),
+    "1h": ("hour", True, 90, "hourly_bars_years"),
+    "1h_raw": ("hour", False, 90, "hourly_bars_years"),
+}
+
+
+def date_windows(from_date: str, to_date: str, window_days: int) -> List[Tuple[str, str]]:
+    """(from, to) date strings covering [from_date, to_date] in window_days chunks"""
+    start = datetime.strptime(from_date, "%Y-%m-%d")
+    end = datetime.strptime(to_date, "%Y-%m-%d")
+    if start == end:
+        return [(from_date, to_date)]
+    out, cur = [], start
+    while cur < end:
+        nxt = min(cur + timedelta(days=window_days), end)
+        out.append((cur.strftime("%Y-%m-%d"), nxt.strftime("%Y-%m-%d")))
+        cur = nxt
+    return out
+
+
+class AggregatesFetcher:
+    """Concurrent (ticker, variant) aggregates refresh on top of a PolygonIngester"""
+
+    def __init__(self, ingester, max_workers: Optional[int] = None, batch_size: Optional[int] = None):
+        """
+        Args:
+            ingester: PolygonIngester (HTTP session, rate limiter, circuit breaker, writer)
+            max_workers: Thread cap (default ingestion.aggregates.max_workers)
+            batch_size: Tasks submitted at a time (default ingestion.aggregates.batch_size)
+        """
+        self.ingester = ingester
+        agg_cfg = ingester.config["ingestion"].get("aggregates", {})
+        self.max_workers = int(max_workers or agg_cfg.get("max_workers", 16))
+        self.batch_size = int(batch_size or agg_cfg.get("batch_size", 500))
+
+        # Adjusted variants derived from the raw downloads (None = download both from Polygon)
+        self.adjust = None
+        if local_adjustment(ingester.config):
+            self.adjust = AdjustedBarsBuilder(ingester)
+            if not self.adjust.adjuster.has_actions:
+                logger.warning("Local adjustment enabled but no corporate actions on disk: downloading adjusted bars")
+                self.adjust = None
+
+    def bars_path(self, ticker: str, variant: str) -> Path:
+        return self.ingester.raw_dir / "market_data" / "bars" / variant / f"{ticker}.parquet"
+
+    def date_range(self, variant: str, to_date: str) -> Tuple[str, str]:
+        """(from, to) of a variant: the configured number of years up to to_date"""
+        years = self.ingester.config["ingestion"].get(VARIANTS[variant][3],
+                                                      self.ingester.config["ingestion"]["daily_bars_years"])
+        start = datetime.strptime(to_date, "%Y-%m-%d") - timedelta(days=int(years) * 365)
+        return start.strftime("%Y-%m-%d"), to_date
+
+    def incremental_range(self, ticker: str, variant: str, to_date: str,
+                          last_split: Optional[date] = None) -> Tuple[str, str]:
+        """
+        (from, to) of an incremental refresh: from the last stored date (re-requested, the last
+        bar may have been partial) or the full configured range if there is no file yet, or if
+        the variant is adjusted and `last_split` (the ticker's latest split) is on or after it
+        """
+        cov = self.ingester.bar_store(variant).coverage(ticker)
+        if cov is None:
+            return self.date_range(variant, to_date)
+        if VARIANTS[variant][1] and last_split is not None and last_split >= cov[1].date():
+            logger.info(f"{ticker} {variant}: split on {last_split} after the stored bars, re-requesting full range")
+            return self.date_range(variant, to_date)
+        return min(cov[1].strftime("%Y-%m-%d"), to_date), to_date
+
+    def last_splits(self) -> Dict[str, date]:
+        """Latest split ex-date per ticker, after fetching the splits published since the last save"""
+        try:
+            self.ingester.refresh_corporate_actions("splits")
+        except RequestFailed as e:
+            logger.error(f"splits refresh failed ({e}): incremental adjusted bars only see splits already on disk")
+        actions = BarAdjuster.from_store(self.ingester.raw_dir).actions
+        return dict(actions.group_by("symbol").agg(pl.col("ex_date").max()).iter_rows())
+
+    def fetch_one(self, ticker: str, variant: str, from_date: str, to_date: str,
+                  windows: Optional[Dict[Tuple[str, str], Optional[pl.DataFrame]]] = None) -> Dict:
+        """
+        Download every window of one (ticker, variant) and upsert the merged bars.
+
+        Args:
+            windows: Windows fetched by earlier attempts of the task (skipped); filled as windows
+                     arrive, so a parked task resumes at the window that failed
+
+        Raises:
+            RetryLater: transient failure / open circuit (the caller parks the task)
+            RequestFailed: a window got no usable answer (nothing is saved or recorded)
+        """
+        timespan, adjusted, window_days, _ = VARIANTS[variant]
+        windows = {} if windows is None else windows
+        plan = date_windows(from_date, to_date, window_days)
+        for f_date, t_date in plan:
+            if (f_date, t_date) not in windows:
+                windows[(f_date, t_date)] = self.ingester.download_aggregates(
+                    ticker, 1, timespan, f_date, t_date, adjusted=adjusted, park=True, strict=True)
+        frames = [windows[w] for w in plan if windows[w] is not None and windows[w].height > 0]
+        if not frames:
+            return {"rows": 0, "bytes": 0}
+
+        # Consecutive windows share their edge date
+        df = pl.concat(frames).unique(subset=["timestamp"], keep="first", maintain_order=True)
+        stats = self.ingester.save_aggregates(df, variant.removesuffix("_raw"), partition_by_date=False,
+                                              adjusted=adjusted)
+        if stats is None:
+            raise ValueError(f"{ticker} {variant}: DQ check failed, nothing saved")
+        return {"rows": stats["rows"], "bytes": stats["bytes"]}
+
+    def run(
+        self,
+        tickers: Sequence[str],
+        variants: Sequence[str] = tuple(VARIANTS),
+        to_date: Optional[str] = None,
+        resume: bool = True,
+        skip_existing: bool = False,
+        incremental: bool = False,
+    ) -> Dict:
+        """
+        Refresh `variants` for every ticker.
+
+        Args:
+            to_date: Last date (default: today UTC); also names the progress WAL
+            resume: Skip tasks already recorded in this refresh's WAL
+            skip_existing: Also skip tasks whose output file already exists (first-time backfill)
+            incremental: Only request what is missing after each file's last stored date (full
+                         range for adjusted variants of tickers split since then)
+
+        Returns:
+            Dict with done, skipped, empty, failed (list of "ticker:variant"), rows, requests
+        """
+        unknown = [v for v in variants if v not in VARIANTS]
+        if unknown:
+            raise ValueError(f"Unknown variants {unknown}; expected {list(VARIANTS)}")
+
+        to_date = to_date or datetime.utcnow().strftime("%Y-%m-%d")
+        derive: List[str] = []
+        if self.adjust is not None:
+            # --- OPTIMIZATION: One download per timespan, adjusted series computed locally ---
+            variants, derive = split_variants(variants)
+        ranges = {v: self.date_range(v, to_date) for v in variants}
+        last_split: Dict[str, date] = {}
+        if incremental and any(VARIANTS[v][1] for v in variants):
+            last_split = self.last_splits()
+        wal = ProgressWAL(self.ingester.base_dir / "logs" / "checkpoints" / f"aggregates_{to_date.replace('-', '')}.jsonl")
+
+        summary = {"done": 0, "skipped": 0, "empty": 0, "failed": [], "rows": 0}
+        tasks = []
+        for ticker in tickers:
+            for variant in variants:
+                if (resume and wal.get(ticker, variant) is not None) or \
+                   (skip_existing and self.bars_path(ticker, variant).exists()):
+                    summary["skipped"] += 1
+                else:
+                    tasks.append((ticker, variant))
+
+        logger.info(f"Aggregates refresh → {to_date}: {len(tasks):,} tasks ({len(tickers):,} tickers x "
+                    f"{', '.join(variants)}), {summary['skipped']:,} already done")
+
+        controller = ConcurrencyController.from_config(self.ingester.config, self.ingester.metrics,
+                                                       max_workers=self.max_workers)
+        retry_queue = self.ingester.retry_queue()
+        partial: Dict[Tuple[str, str], Dict] = {}  # windows already fetched by parked tasks
+        t0 = time.time()
+        requests_before = sum(s["requests"] for s in self.ingester.metrics.summary().values())
+
+        def work(task: Tuple[str, str]) -> Dict:
+            ticker, variant = task
+            windows = partial.setdefault(task, {})
+            kept = len(windows)
+            with controller.slot():
+                rng = self.incremental_range(ticker, variant, to_date, last_split.get(ticker)) if incremental \
+                    else ranges[variant]
+                try:
+                    res = self.fetch_one(ticker, variant, *rng, windows=windows)
+                except Exception:
+                    if len(windows) > kept:
+                        retry_queue.progress(task)  # got further than the last attempt: not stuck
+                    raise
+            partial.pop(task, None)
+            return res
+
+        def run_batch(batch: List[Tuple[str, str]]):
+            with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+                futs = {ex.submit(work, task): task for task in batch}
+                for fut in as_completed(futs):
+                    task = futs[fut]
+                    try:
+                        res = fut.result()
+                    except RetryLater as e:
+                        reason, url = e.reason, e.url
+                    except Exception as e:
+                        reason, url = f"error: {e}", None
+                    else:
+                        wal.record(task[0], task[1], res["rows"], res["bytes"], to_date=to_date)
+                        summary["done"] += 1
+                        summary["empty"] += res["rows"] == 0
+                        summary["rows"] += res["rows"]
+                        continue
+                    if not retry_queue.park(task, reason, url=url):
+                        logger.warning(f"{task[0]} {task[1]}: giving up after {self.ingester.max_parks} retries ({reason})")
+                        summary["failed"].append(f"{task[0]}:{task[1]}")
+                        partial.pop(task, None)
+
+        for i in range(0, len(tasks), self.batch_size):
+            run_batch(tasks[i:i + self.batch_size] + retry_queue.pop_due())
+            elapsed = time.time() - t0
+            logger.info(f"Aggregates progress: {min(i + self.batch_size, len(tasks)):,}/{len(tasks):,} "
+                        f"({summary['done'] / max(elapsed, 1e-9) * 60:.0f} tasks/min, concurrency {controller.limit}, "
+                        f"parked {len(retry_queue)}, failed {len(summary['failed'])})")
+
+        # Parked tasks left: only the main thread waits for them to come due
+        while len(retry_queue):
+            time.sleep(retry_queue.next_due_in() or 0.0)
+            run_batch(retry_queue.pop_due(self.batch_size))
+
+        wal.close()
+        if derive:
+            summary["failed"] += self.adjust.run(derive, symbols=list(tickers))["failed"]
+            self.adjust.close()
+        summary["requests"] = sum(s["requests"] for s in self.ingester.metrics.summary().values()) - requests_before
+        logger.info(f"Aggregates refresh complete in {(time.time() - t0) / 60:.1f} min: {summary['done']:,} written "
+                    f"({summary['empty']:,} without data), {summary['skipped']:,} skipped, "
+                    f"{len(summary['failed']):,} failed, {summary['requests']:,} requests")
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent 1d/1h aggregates refresh (adjusted + raw)")
+    parser.add_argument("--config", type=str, default=str(PROJECT_ROOT / "config" / "config.yaml"))
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--tickers", nargs="+", help="Tickers to refresh (default: small-cap universe)")
+    parser.add_argument("--letters", nargs="+", help="Limit the universe by first letter(s)")
+    parser.add_argument("--to-date", type=str, help="Last date YYYY-MM-DD (default: today UTC)")
+    parser.add_argument("--workers", type=int, help="Thread cap (default ingestion.aggregates.max_workers)")
+    parser.add_argument("--skip-existing", action="store_true", help="Skip tickers whose file already exists")
+    parser.add_argument("--incremental", action="store_true", help="Only fetch dates after each file's last bar")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore this refresh's progress WAL")
+    args = parser.parse_args()
+
+    from download_all import HistoricalDownloader
+
+    downloader = HistoricalDownloader(args.config)
+    tickers = args.tickers
+    if not tickers:
+        tickers = downloader.get_small_caps_universe(letters=args.letters)["ticker"].to_list()
+
+    fetcher = AggregatesFetcher(downloader.ingester, max_workers=args.workers)
+    summary = fetcher.run(tickers, args.variants, to_date=args.to_date, resume=not args.no_resume,
+                          skip_existing=args.skip_existing, incremental=args.incremental)
+
+    if summary["failed"]:
+        failed_file = downloader.ingester.base_dir / "logs" / f"failed_aggregates_{datetime.utcnow().strftime('%Y%m%d')}.txt"
+        failed_file.parent.mkdir(exist_ok=True)
+        failed_file.write_text("\n".join(summary["failed"]))
+        logger.warning(f"Failed aggregates ({len(summary['failed'])}): saved to {failed_file}")
+    downloader.ingester.metrics.log_summary()
+    if downloader.ingester.cache is not None:
+        downloader.ingester.cache.log_stats()
+
+
+if __name__ == "__main__":
+    main()
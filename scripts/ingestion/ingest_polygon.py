@@ -8,6 +8,7 @@ import sys
 import time
 import random
 import argparse
+import threading
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List, Any
@@ -18,21 +19,66 @@ import yaml
 from loguru import logger
 from dotenv import load_dotenv
 
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.utils.request_metrics import RequestMetrics, ConcurrencyController
+from scripts.utils.shared_rate_limiter import SharedRateLimiter
+from scripts.utils.response_cache import ResponseCache
+from scripts.utils.circuit_breaker import CircuitBreaker, RequestFailed, RetryLater, RetryQueue, classify
+from scripts.utils.partition_writer import PartitionWriter, write_parquet_atomic
+from scripts.utils.bar_store import BarStore
+from scripts.utils.coverage_index import CoverageIndex
+
 # Load environment variables from .env file
 load_dotenv()
 
 
+# Polygon aggregate fields → bar columns
+AGGS_SCHEMA = {"v": pl.Int64, "vw": pl.Float64, "o": pl.Float64, "c": pl.Float64,
+               "h": pl.Float64, "l": pl.Float64, "t": pl.Int64, "n": pl.Int32}
+AGGS_RENAME = {"v": "volume", "vw": "vwap", "o": "open", "c": "close",
+               "h": "high", "l": "low", "t": "timestamp", "n": "transactions"}
+
+
+def aggregates_frame(results: List[Dict[str, Any]], ticker: Optional[str] = None) -> pl.DataFrame:
+    """
+    Aggregate results → bars frame (UTC timestamp, Float32 prices, symbol, date).
+
+    Args:
+        ticker: Symbol of a per-ticker request; None for grouped daily rows (ticker in `T`)
+    """
+    schema = dict(AGGS_SCHEMA) if ticker is not None else {**AGGS_SCHEMA, "T": pl.Utf8}
+    df = pl.DataFrame(results, schema=schema, strict=False).rename(AGGS_RENAME)
+
+    df = df.with_columns(
+        pl.from_epoch(pl.col("timestamp"), time_unit="ms").dt.replace_time_zone("UTC").alias("timestamp")
+    )
+
+    df = df.with_columns(
+        pl.col(["open", "high", "low", "close", "vwap"]).cast(pl.Float32),
+    )
+
+    df = df.with_columns(
+        (pl.lit(ticker) if ticker is not None else pl.col("T")).alias("symbol"),
+        pl.col("timestamp").dt.date().alias("date"),
+    )
+    return df.drop("T", strict=False)
+
+
 class PolygonIngester:
     """Ingest data from Polygon.io API with resilience and validation"""
 
-    def __init__(self, config_path: str = "config/config.yaml"):
+    def __init__(self, config_path: str = "config/config.yaml", job: str = "ingest_polygon"):
+        self.job = job
         self.config = self._load_config(config_path)
         self.api_key = os.getenv("POLYGON_API_KEY") or self.config["polygon"]["api_key"]
 
         if not self.api_key:
             raise ValueError("POLYGON_API_KEY not found in environment or config")
 
-        self.base_url = self.config["polygon"]["base_url"].rstrip("/")
+        # POLYGON_BASE_URL points the ingester at a mirror / the offline mock (tools/bench)
+        self.base_url = (os.getenv("POLYGON_BASE_URL") or self.config["polygon"]["base_url"]).rstrip("/")
         self.rate_limit = int(self.config["polygon"]["rate_limit_per_minute"])
         self.timeout = int(self.config["polygon"]["timeout"])
 
@@ -40,6 +86,26 @@ class PolygonIngester:
         self.base_dir = Path(self.config["paths"]["base_dir"])
         self.raw_dir = self.base_dir / self.config["paths"]["raw"]
 
+        # per-endpoint latency / size / status histograms
+        self.metrics = RequestMetrics()
+
+        # on-disk cache of immutable responses (polygon.response_cache); None = always hit the API
+        self.cache = ResponseCache.from_config(self.config)
+
+        # per-endpoint circuit breaker shared by all worker threads (polygon.circuit_breaker)
+        self.breaker = CircuitBreaker.from_config(self.config)
+        self.max_parks = int(self.config["polygon"].get("circuit_breaker", {}).get("max_parks", 5))
+
+        # bulk partition writer (single-pass split, concurrent atomic writes)
+        self.writer = PartitionWriter.from_config(self.config)
+
+        # merge-on-write per-symbol bar files, one store per bars/ subdirectory (shared locks)
+        self.bar_stores: Dict[str, BarStore] = {}
+        self.bar_stores_lock = threading.Lock()
+
+        # (symbol, variant) date ranges on disk, appended by every bars write (gap planning)
+        self.coverage = CoverageIndex(self.raw_dir / "market_data" / "bars" / "_coverage")
+
         # logging + http session + ratelimit
         self._setup_logging()
         self._init_http_session()
@@ -73,24 +139,33 @@ class PolygonIngester:
             pool_connections=50, pool_maxsize=50, max_retries=0
         )
         self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)  # local mirror / offline mock (POLYGON_BASE_URL)
         self.session.headers.update({"Accept": "application/json"})
 
     def _init_rate_limiter(self):
+        # Cross-process bucket (polygon.shared_rate_limit) when other ingestion jobs share the quota
+        self.shared_limiter = SharedRateLimiter.from_config(self.config, self.job)
         self.tokens = self.rate_limit
         self.last_refill = time.time()
         self.tokens_per_second = max(self.rate_limit / 60.0, 0.1)
+        self.token_lock = threading.Lock()  # worker threads (details, bulk aggregates) share the bucket
 
     def _acquire_token(self):
-        now = time.time()
-        elapsed = now - self.last_refill
-        self.tokens = min(self.rate_limit, self.tokens + elapsed * self.tokens_per_second)
-        self.last_refill = now
-        if self.tokens < 1:
-            sleep_time = (1 - self.tokens) / self.tokens_per_second
-            logger.debug(f"Rate limit: sleeping {sleep_time:.2f}s")
-            time.sleep(sleep_time)
-            self.tokens = 1
-        self.tokens -= 1
+        if self.shared_limiter is not None:
+            self.shared_limiter.wait()
+            return
+        with self.token_lock:
+            now = time.time()
+            elapsed = now - self.last_refill
+            self.tokens = min(self.rate_limit, self.tokens + elapsed * self.tokens_per_second)
+            self.last_refill = now
+            if self.tokens < 1:
+                sleep_time = (1 - self.tokens) / self.tokens_per_second
+                logger.debug(f"Rate limit: sleeping {sleep_time:.2f}s")
+                time.sleep(sleep_time)
+                self.tokens = 1
+                self.last_refill = time.time()
+            self.tokens -= 1
 
     def _backoff(self, attempt: int) -> float:
         backoff = self.config["polygon"].get("backoff", {"base_seconds": 1, "max_seconds": 60})
@@ -100,14 +175,24 @@ class PolygonIngester:
         jitter = random.uniform(0, delay * 0.1)
         return delay + jitter
 
+    def retry_queue(self) -> RetryQueue:
+        """Parking queue for pool callers: polygon.backoff delays, capped at the breaker's open period"""
+        backoff = self.config["polygon"].get("backoff", {"base_seconds": 1, "max_seconds": 60})
+        return RetryQueue(max_parks=self.max_parks, base_s=backoff["base_seconds"],
+                          max_delay_s=backoff["max_seconds"], breaker=self.breaker)
+
     # ----------------------------- http ----------------------------------
 
-    def _make_request(self, endpoint: str, params: Optional[Dict] = None, attempt: int = 0) -> Optional[Dict]:
+    def _make_request(self, endpoint: str, params: Optional[Dict] = None, park: bool = False) -> Optional[Dict]:
         """
         endpoint: can be a path like '/v3/reference/tickers' or a full URL
-        """
-        self._acquire_token()
+        park: pool callers; raise RetryLater instead of sleeping in backoff or on an open
+              circuit, so the work item goes to a RetryQueue and the worker thread is freed
 
+        Failures are routed by class: 429 / 5xx / timeouts / network errors are retried
+        (max_retries, exponential backoff) and count towards the endpoint's circuit breaker;
+        other 4xx are permanent and return None at once.
+        """
         if endpoint.startswith("http"):
             # Full URL (pagination next_url) - check if apiKey already in URL
             url = endpoint
@@ -121,46 +206,68 @@ class PolygonIngester:
             if "apiKey=" not in endpoint:
                 qparams["apiKey"] = self.api_key
 
-        try:
-            resp = self.session.get(url, params=qparams, timeout=self.timeout)
-            if resp.status_code == 200:
-                return resp.json()
-
-            if resp.status_code == 429:
-                max_retries = int(self.config["ingestion"]["max_retries"])
-                if attempt < max_retries:
-                    sleep_time = self._backoff(attempt)
-                    logger.warning(f"429 rate limited. Retry {attempt+1}/{max_retries} in {sleep_time:.2f}s")
-                    time.sleep(sleep_time)
-                    return self._make_request(endpoint, params, attempt + 1)
-                logger.error(f"Max retries exceeded (429) for {endpoint}")
-                return None
+        # Historical responses never change: serve them from disk (no token, no request)
+        if self.cache is not None:
+            cached = self.cache.get(url, qparams)
+            if cached is not None:
+                return cached
 
-            if resp.status_code >= 500:
-                max_retries = int(self.config["ingestion"]["max_retries"])
-                if attempt < max_retries:
-                    sleep_time = self._backoff(attempt)
-                    logger.warning(f"Server {resp.status_code}. Retry {attempt+1}/{max_retries} in {sleep_time:.2f}s")
-                    time.sleep(sleep_time)
-                    return self._make_request(endpoint, params, attempt + 1)
-                logger.error(f"Server error persists for {endpoint}")
+        max_retries = int(self.config["ingestion"]["max_retries"])
+        attempt = 0
+        while True:
+            # Open circuit: nothing is sent to a failing endpoint until its probe is due
+            if self.breaker is not None:
+                wait_s = self.breaker.before_request(url)
+                if wait_s > 0:
+                    if park:
+                        raise RetryLater(url, "circuit_open")
+                    logger.debug(f"Circuit open for {endpoint}, waiting {wait_s:.1f}s")
+                    time.sleep(wait_s)
+                    continue
+
+            self._acquire_token()
+
+            resp, exc = None, None
+            t0 = time.perf_counter()
+            try:
+                resp = self.session.get(url, params=qparams, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                exc = e
+            self.metrics.record(url, time.perf_counter() - t0,
+                                len(resp.content) if resp is not None else 0,
+                                resp.status_code if resp is not None else 0)
+
+            failure = classify(resp.status_code if resp is not None else None, exc)
+            if self.breaker is not None:
+                self.breaker.record(url, failure)
+
+            if failure == "ok":
+                try:
+                    data = resp.json()
+                except ValueError as e:
+                    logger.error(f"Invalid JSON from {endpoint}: {e}")
+                    return None
+                if self.cache is not None:
+                    self.cache.put(url, qparams, data)
+                return data
+
+            if failure == "permanent":
+                logger.error(f"Request failed {resp.status_code}: {resp.text[:500]}")
                 return None
 
-            logger.error(f"Request failed {resp.status_code}: {resp.text[:500]}")
-            return None
-
-        except requests.exceptions.Timeout:
-            max_retries = int(self.config["ingestion"]["max_retries"])
-            if attempt < max_retries:
-                sleep_time = self._backoff(attempt)
-                logger.warning(f"Timeout. Retry {attempt+1}/{max_retries} in {sleep_time:.2f}s")
-                time.sleep(sleep_time)
-                return self._make_request(endpoint, params, attempt + 1)
-            logger.error(f"Timeout persists for {endpoint}")
-            return None
-        except Exception as e:
-            logger.error(f"Request exception: {e}")
-            return None
+            # Transient: 429 / 5xx / timeout / network
+            detail = f"{failure} ({resp.status_code})" if resp is not None else f"{failure} ({exc})"
+            sleep_time = self._backoff(attempt)
+            if failure == "rate_limit" and self.shared_limiter is not None:
+                self.shared_limiter.penalize(sleep_time)
+            if park:
+                raise RetryLater(url, failure)
+            if attempt >= max_retries:
+                logger.error(f"{detail} persists for {endpoint} after {max_retries} retries")
+                return None
+            logger.warning(f"{detail}. Retry {attempt+1}/{max_retries} in {sleep_time:.2f}s")
+            time.sleep(sleep_time)
+            attempt += 1
 
     # --------------------------- reference --------------------------------
 
@@ -237,6 +344,45 @@ class PolygonIngester:
         logger.info(f"Saved {len(df)} {action_type} to {out}")
         return df
 
+    def refresh_corporate_actions(self, action_type: str = "splits", lookback_days: int = 30) -> pl.DataFrame:
+        """
+        Top up the latest splits / dividends table with the actions published since it was saved.
+
+        Requests only `{date field}.gte = file date - lookback_days` (late or corrected actions)
+        and writes the merged table as today's file; with no table on disk, downloads everything.
+
+        Raises:
+            RequestFailed: a page got no usable answer (the table on disk is left as it was)
+        """
+        date_field = {"splits": "execution_date", "dividends": "ex_dividend_date"}[action_type]
+        files = sorted((self.raw_dir / "corporate_actions").glob(f"{action_type}_*.parquet"),
+                       key=lambda p: p.stat().st_mtime)
+        if not files:
+            return self.download_corporate_actions(action_type)
+
+        latest = files[-1]
+        since = (datetime.fromtimestamp(latest.stat().st_mtime) - timedelta(days=lookback_days)).strftime("%Y-%m-%d")
+        endpoint = f"/v3/reference/{action_type}"
+        params: Optional[Dict] = {f"{date_field}.gte": since, "limit": 1000}
+        results: List[Dict[str, Any]] = []
+        while True:
+            data = self._make_request(endpoint, params)
+            if not data or "results" not in data:
+                raise RequestFailed(endpoint, f"{action_type} refresh since {since}")
+            results.extend(data["results"])
+            endpoint, params = data.get("next_url"), None
+            if not endpoint:
+                break
+
+        old = pl.read_parquet(latest)
+        df = pl.concat([old, pl.DataFrame(results)], how="diagonal_relaxed") if results else old
+        df = df.unique(subset=["ticker", date_field], keep="last", maintain_order=True)
+        out = self.raw_dir / "corporate_actions" / f"{action_type}_{datetime.utcnow().strftime('%Y%m%d')}.parquet"
+        write_parquet_atomic(df, out)
+        logger.info(f"Refreshed {action_type} since {since}: {len(results)} fetched, "
+                    f"{df.height - old.height:+,} new → {out.name}")
+        return df
+
     # --------------------------- aggregates --------------------------------
 
     def download_aggregates(
@@ -247,11 +393,18 @@ class PolygonIngester:
         from_date: str,
         to_date: str,
         adjusted: bool = True,
+        park: bool = False,
+        strict: bool = False,
     ) -> Optional[pl.DataFrame]:
         """Download aggregate bars with pagination.
 
         Args:
             adjusted: If True, download split-adjusted prices. If False, download raw prices.
+            park: Raise RetryLater on transient failures instead of retrying in place
+                  (bulk fetchers park the ticker and move on)
+            strict: Raise RequestFailed when any page gets no usable answer (permanent 4xx,
+                    invalid JSON, non-OK status, retries exhausted) instead of returning the
+                    pages fetched so far; None then always means "answered, no bars"
         """
         endpoint = f"/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{from_date}/{to_date}"
         params = {"adjusted": str(adjusted).lower(), "sort": "asc", "limit": self.config["ingestion"]["page_limit"]}
@@ -263,11 +416,15 @@ class PolygonIngester:
         current_params = params
 
         while True:
-            data = self._make_request(current_endpoint, current_params)
+            data = self._make_request(current_endpoint, current_params, park=park)
             if not data:
+                if strict:
+                    raise RequestFailed(current_endpoint, f"no answer for {ticker} after {len(all_results)} bars")
                 break
             if data.get("status") != "OK":
                 logger.warning(f"Non-OK status for {ticker}: {data.get('status')}")
+                if strict:
+                    raise RequestFailed(current_endpoint, f"status {data.get('status')} for {ticker}")
                 break
 
             results = data.get("results", [])
@@ -286,35 +443,7 @@ class PolygonIngester:
             logger.warning(f"No data for {ticker}")
             return None
 
-        df = pl.DataFrame(
-            all_results,
-            schema={
-                "v": pl.Int64,
-                "vw": pl.Float64,
-                "o": pl.Float64,
-                "c": pl.Float64,
-                "h": pl.Float64,
-                "l": pl.Float64,
-                "t": pl.Int64,
-                "n": pl.Int32,
-            },
-        ).rename(
-            {"v": "volume", "vw": "vwap", "o": "open", "c": "close",
-             "h": "high", "l": "low", "t": "timestamp", "n": "transactions"}
-        )
-
-        df = df.with_columns(
-            pl.from_epoch(pl.col("timestamp"), time_unit="ms").dt.replace_time_zone("UTC").alias("timestamp")
-        )
-
-        df = df.with_columns(
-            pl.col(["open", "high", "low", "close", "vwap"]).cast(pl.Float32),
-        )
-
-        df = df.with_columns(
-            pl.lit(ticker).alias("symbol"),
-            pl.col("timestamp").dt.date().alias("date"),
-        )
+        df = aggregates_frame(all_results, ticker)
 
         logger.info(f"Downloaded {len(df)} bars for {ticker}")
         return df
@@ -348,43 +477,49 @@ class PolygonIngester:
 
         return True
 
+    def bar_store(self, variant: str) -> BarStore:
+        """BarStore of bars/{variant} (e.g. '1d', '1h_raw'), created once per ingester"""
+        with self.bar_stores_lock:
+            if variant not in self.bar_stores:
+                self.bar_stores[variant] = BarStore.from_config(
+                    self.config, self.raw_dir / "market_data" / "bars" / variant)
+            return self.bar_stores[variant]
+
     def save_aggregates(self, df: pl.DataFrame, timespan: str, partition_by_date: bool = True, adjusted: bool = True):
         """Save aggregates to partitioned parquet
 
         Args:
             df: DataFrame with aggregates
             timespan: e.g., '1d', '1m'
-            partition_by_date: If True, partition by symbol/date
+            partition_by_date: If True, partition by symbol/date. If False, upsert into the
+                               per-symbol files (existing bars outside df's range are kept)
             adjusted: If True, save to bars/{timespan}/. If False, save to bars/{timespan}_raw/
+
+        Returns:
+            Writer stats {files, rows, bytes}, or None if nothing was saved
         """
         if df is None or df.height == 0:
-            return
+            return None
         if not self._dq_check_aggregates(df):
             logger.error("Aborting save due to DQ failure")
-            return
+            return None
 
         # Choose path based on adjustment type
         suffix = str(timespan).lower() if adjusted else f"{str(timespan).lower()}_raw"
         base_path = self.raw_dir / "market_data" / "bars" / suffix
         base_path.mkdir(parents=True, exist_ok=True)
 
-        # (3) Ensure sorted before persist
-        df = df.sort(["symbol", "timestamp"])
-
+        # --- OPTIMIZATION: Sort once, split with partition_by, write partitions concurrently ---
         if partition_by_date:
-            for sym in df.get_column("symbol").unique().to_list():
-                sdf = df.filter(pl.col("symbol") == sym)
-                for d in sdf.get_column("date").unique().to_list():
-                    dstr = str(d)
-                    out = base_path / f"symbol={sym}" / f"date={dstr}.parquet"
-                    out.parent.mkdir(parents=True, exist_ok=True)
-                    sdf.filter(pl.col("date") == d).write_parquet(out, compression="zstd")
-            logger.info(f"Saved {df.height} bars partitioned by symbol/date into {base_path}")
+            stats = self.writer.write_partitioned(df, base_path, ["symbol", "date"],
+                                                  "symbol={symbol}/date={date}.parquet", sort_by=["timestamp"])
+            logger.info(f"Saved {df.height} bars partitioned by symbol/date into {base_path} ({stats['files']} files)")
         else:
-            sym = df.get_column("symbol")[0]
-            out = base_path / f"{sym}.parquet"
-            df.write_parquet(out, compression="zstd")
-            logger.info(f"Saved {df.height} bars to {out}")
+            # --- OPTIMIZATION: Merge-on-write per symbol (only overlapping row groups are merged/deduplicated) ---
+            stats = self.bar_store(suffix).upsert_many(df, max_workers=self.writer.max_workers)
+            logger.info(f"Saved {df.height} bars to {base_path} ({stats['files']} files)")
+        self.coverage.record_frame(suffix, df)
+        return stats
 
     # ====================== WEEK 4: SHORT INTEREST & VOLUME ======================
 
@@ -599,7 +734,8 @@ class PolygonIngester:
     def download_ticker_details(self, symbols: list[str]) -> pl.DataFrame:
         """
         /v3/reference/tickers/{ticker}
-        Hace requests por símbolo (no hay batch API). Concurrency control via rate limiter.
+        Hace requests por símbolo (no hay batch API). Concurrencia adaptativa (polygon.autotune)
+        con tope details_max_workers, además del rate limiter.
         """
         from concurrent.futures import ThreadPoolExecutor, as_completed
 
@@ -611,9 +747,14 @@ class PolygonIngester:
         base_out_dir = self.raw_dir / "reference" / "details"
         base_out_dir.mkdir(parents=True, exist_ok=True)
 
+        max_workers = int(self.config["reference_endpoints"].get("details_max_workers", 16))
+        batch_size = int(self.config["reference_endpoints"].get("details_batch_size", 200))
+        controller = ConcurrencyController.from_config(self.config, self.metrics, max_workers=max_workers)
+
         def fetch_one(sym: str) -> dict | None:
             endpoint = f"/v3/reference/tickers/{sym}"
-            data = self._make_request(endpoint)
+            with controller.slot():
+                data = self._make_request(endpoint, park=True)
             if data and "results" in data and data["results"]:
                 # Persistir también individualmente por si queremos quick-reads
                 out = base_out_dir / f"{sym}.parquet"
@@ -625,23 +766,34 @@ class PolygonIngester:
             return None
 
         records = []
-        max_workers = int(self.config["reference_endpoints"].get("details_max_workers", 8))
-        batch_size = int(self.config["reference_endpoints"].get("details_batch_size", 200))
+        # Fallos transitorios / circuito abierto: el símbolo se aparca y vuelve en un lote posterior
+        retry_queue = self.retry_queue()
 
-        # Procesamos en lotes para no abrir miles de futures a la vez
-        for i in range(0, len(symbols), batch_size):
-            batch = symbols[i:i + batch_size]
+        def run_batch(batch: list[str]):
             with ThreadPoolExecutor(max_workers=max_workers) as ex:
                 futs = {ex.submit(fetch_one, s): s for s in batch}
                 for fut in as_completed(futs):
+                    sym = futs[fut]
                     try:
                         res = fut.result()
                         if res:
                             records.append(res)
+                    except RetryLater as e:
+                        if not retry_queue.park(sym, e.reason, url=e.url):
+                            logger.warning(f"Details {sym}: giving up after {self.max_parks} retries ({e.reason})")
                     except Exception as e:
                         logger.warning(f"Details fetch error: {e}")
 
-            logger.info(f"Details progress: {min(i+batch_size, len(symbols))}/{len(symbols)}")
+        # Procesamos en lotes para no abrir miles de futures a la vez
+        for i in range(0, len(symbols), batch_size):
+            run_batch(symbols[i:i + batch_size] + retry_queue.pop_due())
+            logger.info(f"Details progress: {min(i+batch_size, len(symbols))}/{len(symbols)} "
+                        f"(concurrency {controller.limit}, last: {controller.last_action}, parked {len(retry_queue)})")
+
+        # Aparcados restantes: solo el hilo principal espera a que venzan
+        while len(retry_queue):
+            time.sleep(retry_queue.next_due_in() or 0.0)
+            run_batch(retry_queue.pop_due(batch_size))
 
         if not records:
             logger.warning("No ticker details retrieved")
@@ -711,6 +863,8 @@ def main():
                 timespan_label = timespan_label_map[args.timespan]
                 ingester.save_aggregates(df, timespan_label, partition_by_date=args.partition)
 
+        if ingester.cache is not None:
+            ingester.cache.log_stats()
         logger.info("=== Ingestion complete ===")
 
     except Exception as e:
@@ -16,13 +16,20 @@ Usage:
       --output processed/events/manifest_core_YYYYMMDD.parquet
 """
 
+import sys
 import polars as pl
 import argparse
 from pathlib import Path
 from datetime import datetime, timezone
+from typing import Optional
 import json
 import hashlib
 
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.utils.cost_model import CostModel
+
 
 def freeze_manifest(
     input_file: Path,
@@ -31,7 +38,8 @@ def freeze_manifest(
     normalization_method: str,
     profile_version: str,
     deduplication_applied: bool,
-    source_file: Path
+    source_file: Path,
+    cost_model: Optional[CostModel] = None
 ) -> dict:
     """
     Freeze manifest with complete metadata.
@@ -44,6 +52,7 @@ def freeze_manifest(
         profile_version: Profile version (e.g., 'core_v1')
         deduplication_applied: Whether deduplication was applied
         source_file: Original enriched file used
+        cost_model: Empirical cost model for the FASE 3.2 estimates (default: prior only)
 
     Returns:
         Dictionary with freeze metadata
@@ -120,21 +129,25 @@ def freeze_manifest(
     top20_pct = top20_count / original_count
     metadata["quality_metrics"]["top20_concentration"] = round(top20_pct * 100, 2)
 
-    # Storage/time estimates (from dry-run)
-    STORAGE_TRADES_P90_MB = 24.4  # MB per event
-    STORAGE_QUOTES_P90_MB = 11.7
-    TIME_P90_SEC = 18.0  # seconds per event
-
-    storage_p90_gb = original_count * (STORAGE_TRADES_P90_MB + STORAGE_QUOTES_P90_MB) / 1024
-    time_p90_hours = original_count * TIME_P90_SEC / 3600
-    time_p90_days = time_p90_hours / 24
+    # Storage/time estimates: empirical cost model (catalog history; dry-run prior without history)
+    if cost_model is None:
+        cost_model = CostModel.fit(pl.DataFrame())
+    projection = cost_model.projection(df)
+    storage = projection["storage_gb"]
+    time_h = projection["time_hours"]
 
     metadata["estimates_fase32"] = {
-        "storage_p50_gb": round(original_count * 11.4 / 1024, 1),
-        "storage_p90_gb": round(storage_p90_gb, 1),
-        "time_p50_hours": round(original_count * 12.0 / 3600, 1),
-        "time_p90_hours": round(time_p90_hours, 1),
-        "time_p90_days": round(time_p90_days, 2)
+        "storage_mean_gb": round(storage["total_mean"], 1),
+        "storage_p50_gb": round(storage["total_p50"], 1),
+        "storage_p90_gb": round(storage["total_p90"], 1),
+        "time_mean_hours": round(time_h["total_parallel_mean"], 1),
+        "time_p50_hours": round(time_h["total_parallel_p50"], 1),
+        "time_p90_hours": round(time_h["total_parallel_p90"], 1),
+        "time_p90_days": round(time_h["total_parallel_p90"] / 24, 2),
+        "cost_model": {
+            "history_events": projection["history_events"],
+            "lookup_levels": projection["levels"]
+        }
     }
 
     # Write manifest with metadata as custom attributes
@@ -174,8 +187,10 @@ def freeze_manifest(
     print(f"  Top20 concentration:   {metadata['quality_metrics']['top20_concentration']:.1f}%")
     print()
     print("FASE 3.2 Estimates:")
-    print(f"  Storage p90:  {metadata['estimates_fase32']['storage_p90_gb']} GB")
+    print(f"  Storage:      {metadata['estimates_fase32']['storage_mean_gb']} GB expected, "
+          f"{metadata['estimates_fase32']['storage_p90_gb']} GB p90")
     print(f"  Time p90:     {metadata['estimates_fase32']['time_p90_days']} days")
+    print(f"  Cost model:   {metadata['estimates_fase32']['cost_model']['history_events']:,} completed events of history")
     print("="*80)
 
     return metadata
@@ -218,6 +233,12 @@ def main():
         type=Path,
         help='Source enriched file (if not specified, auto-detects dedup file)'
     )
+    parser.add_argument(
+        '--event-windows',
+        type=Path,
+        help='event_windows tree whose catalog / cost model drives the estimates '
+             '(default: raw/market_data/event_windows)'
+    )
 
     args = parser.parse_args()
 
@@ -279,7 +300,8 @@ def main():
         normalization_method=args.normalization_method,
         profile_version=args.profile,
         deduplication_applied=deduplication_applied,
-        source_file=source_file
+        source_file=source_file,
+        cost_model=CostModel.for_root(args.event_windows or base_dir / "raw" / "market_data" / "event_windows")
     )
 
     print()
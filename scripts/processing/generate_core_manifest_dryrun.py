@@ -20,6 +20,11 @@ import hashlib
 from typing import Dict, Tuple, List
 import sys
 
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.utils.cost_model import CostModel
+
 # ============================================================================
 # CONFIGURATION (matches MANIFEST_CORE_SPEC.md)
 # ============================================================================
@@ -73,21 +78,8 @@ CORE_CONFIG = {
     "window_before_min": 3,
     "window_after_min": 7,
 
-    # Storage estimation (from pilot data - placeholder, will be calibrated)
-    "storage_per_event_mb": {
-        "trades_p50": 8.5,
-        "trades_p90": 25.0,
-        "quotes_p50": 3.2,
-        "quotes_p90": 12.0
-    },
-
-    # Time estimation (seconds per event)
-    "time_per_event_sec": {
-        "trades_p50": 12,
-        "trades_p90": 18,
-        "quotes_p50": 10,
-        "quotes_p90": 15
-    }
+    # Storage / time estimation: empirical cost model fitted on completed downloads
+    # (scripts/utils/cost_model.py; falls back to the pilot p50/p90 prior without history)
 }
 
 # Sanity check thresholds (from spec)
@@ -539,9 +531,11 @@ def apply_stage5_global_cap(df: pl.DataFrame) -> Tuple[pl.DataFrame, pl.DataFram
 
     return df_pass, df_fail
 
-def run_sanity_checks(df_manifest: pl.DataFrame) -> Dict:
+def run_sanity_checks(df_manifest: pl.DataFrame, projection: Dict) -> Dict:
     """
     Run 13 obligatory sanity checks from MANIFEST_CORE_SPEC.md
+
+    projection: CostModel.projection() of the manifest (storage / time checks)
     """
     print(f"\n[9/9] Running sanity checks...")
 
@@ -603,9 +597,7 @@ def run_sanity_checks(df_manifest: pl.DataFrame) -> Dict:
         }
 
     # 9-10. Storage estimation (p90)
-    total_storage_p90_gb = (total_events *
-                            (CORE_CONFIG['storage_per_event_mb']['trades_p90'] +
-                             CORE_CONFIG['storage_per_event_mb']['quotes_p90']) / 1024)
+    total_storage_p90_gb = projection['storage_gb']['total_p90']
     checks['storage_p90'] = {
         'value': f"{total_storage_p90_gb:.1f} GB",
         'threshold': f"< {SANITY_CHECKS['storage_p90_gb_max']} GB",
@@ -613,9 +605,7 @@ def run_sanity_checks(df_manifest: pl.DataFrame) -> Dict:
     }
 
     # 11. Time estimation (p90)
-    total_time_p90_days = (total_events *
-                          max(CORE_CONFIG['time_per_event_sec']['trades_p90'],
-                              CORE_CONFIG['time_per_event_sec']['quotes_p90']) / 86400)
+    total_time_p90_days = projection['time_hours']['total_parallel_p90'] / 24
     checks['time_p90'] = {
         'value': f"{total_time_p90_days:.2f} days",
         'threshold': f"< {SANITY_CHECKS['time_p90_days_max']} days",
@@ -643,7 +633,7 @@ def run_sanity_checks(df_manifest: pl.DataFrame) -> Dict:
     return {'checks': checks, 'summary': {'passed': passed, 'total': total_checks, 'status': overall_status}}
 
 def generate_summary_report(df_manifest: pl.DataFrame, df_discarded: pl.DataFrame,
-                           sanity_results: Dict, config_hash: str) -> Dict:
+                           sanity_results: Dict, config_hash: str, projection: Dict) -> Dict:
     """
     Generate comprehensive summary report.
     """
@@ -665,17 +655,9 @@ def generate_summary_report(df_manifest: pl.DataFrame, df_discarded: pl.DataFram
                    .sort('event_count', descending=True)
                    .head(20))
 
-    # Storage estimation
-    storage_p50_trades = total_events * CORE_CONFIG['storage_per_event_mb']['trades_p50'] / 1024
-    storage_p90_trades = total_events * CORE_CONFIG['storage_per_event_mb']['trades_p90'] / 1024
-    storage_p50_quotes = total_events * CORE_CONFIG['storage_per_event_mb']['quotes_p50'] / 1024
-    storage_p90_quotes = total_events * CORE_CONFIG['storage_per_event_mb']['quotes_p90'] / 1024
-
-    # Time estimation
-    time_p50_trades_hours = total_events * CORE_CONFIG['time_per_event_sec']['trades_p50'] / 3600
-    time_p90_trades_hours = total_events * CORE_CONFIG['time_per_event_sec']['trades_p90'] / 3600
-    time_p50_quotes_hours = total_events * CORE_CONFIG['time_per_event_sec']['quotes_p50'] / 3600
-    time_p90_quotes_hours = total_events * CORE_CONFIG['time_per_event_sec']['quotes_p90'] / 3600
+    # Storage / time estimation (cost model projection)
+    storage = projection['storage_gb']
+    time_h = projection['time_hours']
 
     # Descarte attribution
     descarte_stages = df_discarded.group_by('descarte_stage').agg(pl.count().alias('count')).sort('count', descending=True)
@@ -699,20 +681,26 @@ def generate_summary_report(df_manifest: pl.DataFrame, df_discarded: pl.DataFram
         'by_session': [row for row in session_dist.to_dicts()],
         'top_20_symbols': [row for row in top_symbols.to_dicts()],
         'storage_estimation_gb': {
-            'trades_p50': round(storage_p50_trades, 1),
-            'trades_p90': round(storage_p90_trades, 1),
-            'quotes_p50': round(storage_p50_quotes, 1),
-            'quotes_p90': round(storage_p90_quotes, 1),
-            'total_p50': round(storage_p50_trades + storage_p50_quotes, 1),
-            'total_p90': round(storage_p90_trades + storage_p90_quotes, 1)
+            'trades_p50': round(storage['trades_p50'], 1),
+            'trades_p90': round(storage['trades_p90'], 1),
+            'quotes_p50': round(storage['quotes_p50'], 1),
+            'quotes_p90': round(storage['quotes_p90'], 1),
+            'total_mean': round(storage['total_mean'], 1),
+            'total_p50': round(storage['total_p50'], 1),
+            'total_p90': round(storage['total_p90'], 1)
         },
         'time_estimation_hours': {
-            'trades_p50': round(time_p50_trades_hours, 1),
-            'trades_p90': round(time_p90_trades_hours, 1),
-            'quotes_p50': round(time_p50_quotes_hours, 1),
-            'quotes_p90': round(time_p90_quotes_hours, 1),
-            'total_parallel_p50': round(max(time_p50_trades_hours, time_p50_quotes_hours), 1),
-            'total_parallel_p90': round(max(time_p90_trades_hours, time_p90_quotes_hours), 1)
+            'trades_p50': round(time_h['trades_p50'], 1),
+            'trades_p90': round(time_h['trades_p90'], 1),
+            'quotes_p50': round(time_h['quotes_p50'], 1),
+            'quotes_p90': round(time_h['quotes_p90'], 1),
+            'total_parallel_mean': round(time_h['total_parallel_mean'], 1),
+            'total_parallel_p50': round(time_h['total_parallel_p50'], 1),
+            'total_parallel_p90': round(time_h['total_parallel_p90'], 1)
+        },
+        'cost_model': {
+            'history_events': projection['history_events'],
+            'lookup_levels': projection['levels']
         },
         'descarte_attribution': [row for row in descarte_stages.to_dicts()],
         'sanity_checks': sanity_results
@@ -767,12 +755,16 @@ def main():
     # df_discarded = pl.concat(df_discarded_list)
     df_discarded = df_fail5  # Use only last stage for now
 
+    # Storage / time projection from the empirical cost model (catalog of completed downloads)
+    cost_model = CostModel.for_root(base_dir / "raw" / "market_data" / "event_windows")
+    projection = cost_model.projection(df_manifest)
+
     # Sanity checks
-    sanity_results = run_sanity_checks(df_manifest)
+    sanity_results = run_sanity_checks(df_manifest, projection)
 
     # Generate report
     config_hash = compute_config_hash()
-    report = generate_summary_report(df_manifest, df_discarded, sanity_results, config_hash)
+    report = generate_summary_report(df_manifest, df_discarded, sanity_results, config_hash, projection)
 
     # Save outputs
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -803,7 +795,7 @@ def main():
     print(f"  Events selected: {report['manifest_summary']['total_events_selected']:,}")
     print(f"  Unique symbols: {report['manifest_summary']['unique_symbols']:,}")
     print(f"  Avg events/symbol: {report['manifest_summary']['avg_events_per_symbol']:.1f}")
-    print(f"\nStorage estimation (FASE 3.2):")
+    print(f"\nStorage estimation (FASE 3.2, cost model on {report['cost_model']['history_events']:,} completed events):")
     print(f"  Trades: {report['storage_estimation_gb']['trades_p50']:.1f} GB (p50) - {report['storage_estimation_gb']['trades_p90']:.1f} GB (p90)")
     print(f"  Quotes: {report['storage_estimation_gb']['quotes_p50']:.1f} GB (p50) - {report['storage_estimation_gb']['quotes_p90']:.1f} GB (p90)")
     print(f"  Total: {report['storage_estimation_gb']['total_p50']:.1f} GB (p50) - {report['storage_estimation_gb']['total_p90']:.1f} GB (p90)")
@@ -0,0 +1,241 @@
+"""
+Bar Adjustment Engine (splits / dividends)
+
+Adjusted bars computed locally from raw (unadjusted) bars and the corporate actions tables,
+so only the `*_raw` variants are downloaded and 1m gets an adjusted series without another
+download pass.
+
+- Actions: splits and dividends from raw/corporate_actions/{splits,dividends}_*.parquet
+  (ingest_polygon) and processed/reference/corporate_actions_*.parquet (download_actions.py),
+  normalized to (symbol, ex_date, kind, ratio, cash)
+- Factors: a split with ex-date E multiplies every price before E by split_from / split_to and
+  every volume by the inverse (Polygon `adjusted=true` convention). Optional dividend factor
+  1 - cash / close(last session before E) (total-return series). The factor of a bar is the
+  product of the factors of all actions after its session date: one reverse cumulative product
+  over the actions and one `join_asof` of the bars onto it, for any timeframe (the session date
+  of a bar is its US/Eastern date)
+- Incremental: `signature(symbol)` fingerprints the actions of a symbol and `changed_before`
+  gives the latest ex-date whose factor changed, so only bars before it need re-adjusting when
+  a new split arrives (see scripts/ingestion/build_adjusted_bars.py)
+
+Usage:
+    >>> adjuster = BarAdjuster.from_store(raw_dir, processed_dir)
+    >>> df_adj = adjuster.adjust(df_raw_1m)                   # multi-symbol frames are fine
+    >>> df_raw = adjuster.adjust(df_adj, invert=True)         # back to raw prices
+"""
+
+import glob
+import hashlib
+from pathlib import Path
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence
+
+import polars as pl
+from loguru import logger
+
+PRICE_COLS = ("open", "high", "low", "close", "vwap")
+
+ACTIONS_SCHEMA = {"symbol": pl.Utf8, "ex_date": pl.Date, "kind": pl.Utf8, "ratio": pl.Float64, "cash": pl.Float64}
+
+
+def _latest(pattern: str) -> Optional[Path]:
+    files = sorted(glob.glob(pattern), key=lambda p: Path(p).stat().st_mtime, reverse=True)
+    return Path(files[0]) if files else None
+
+
+def _to_date(col: str) -> pl.Expr:
+    return pl.col(col).cast(pl.Utf8).str.slice(0, 10).str.to_date("%Y-%m-%d", strict=False)
+
+
+def normalize_actions(splits: Optional[pl.DataFrame] = None, dividends: Optional[pl.DataFrame] = None,
+                      unified: Optional[pl.DataFrame] = None) -> pl.DataFrame:
+    """
+    Polygon splits / dividends tables and/or the download_actions.py unified table → actions.
+
+    Returns:
+        DataFrame(symbol, ex_date, kind, ratio, cash) with one row per (symbol, ex_date, kind)
+    """
+    frames = []
+    if splits is not None and splits.height > 0:
+        frames.append(splits.select(
+            pl.col("ticker").alias("symbol"), _to_date("execution_date").alias("ex_date"), pl.lit("split").alias("kind"),
+            (pl.col("split_from").cast(pl.Float64) / pl.col("split_to").cast(pl.Float64)).alias("ratio"),
+            pl.lit(None, dtype=pl.Float64).alias("cash"),
+        ))
+    if dividends is not None and dividends.height > 0:
+        frames.append(dividends.select(
+            pl.col("ticker").alias("symbol"), _to_date("ex_dividend_date").alias("ex_date"),
+            pl.lit("dividend").alias("kind"), pl.lit(None, dtype=pl.Float64).alias("ratio"),
+            pl.col("cash_amount").cast(pl.Float64).alias("cash"),
+        ))
+    if unified is not None and unified.height > 0:
+        frames.append(unified.select(
+            pl.col("symbol"),
+            pl.when(pl.col("type") == "split").then(_to_date("execution_date"))
+              .otherwise(_to_date("ex_dividend_date")).alias("ex_date"),
+            pl.col("type").alias("kind"),
+            (pl.col("split_from").cast(pl.Float64) / pl.col("split_to").cast(pl.Float64)).alias("ratio"),
+            pl.col("cash_amount").cast(pl.Float64).alias("cash"),
+        ))
+    if not frames:
+        return pl.DataFrame(schema=ACTIONS_SCHEMA)
+
+    df = pl.concat([f.cast(ACTIONS_SCHEMA) for f in frames])
+    valid = pl.when(pl.col("kind") == "split").then(pl.col("ratio").is_finite() & (pl.col("ratio") > 0)) \
+              .otherwise(pl.col("cash").is_not_null() & (pl.col("cash") > 0))
+    return (
+        df.filter(pl.col("ex_date").is_not_null() & valid)
+        .unique(subset=["symbol", "ex_date", "kind"], keep="first")
+        .sort("symbol", "ex_date", "kind")
+    )
+
+
+class BarAdjuster:
+    """Vectorized split (and optional dividend) adjustment of bar frames"""
+
+    def __init__(self, actions: pl.DataFrame, dividends: bool = False):
+        """
+        Args:
+            actions: normalize_actions() output
+            dividends: Also apply dividend factors (default: splits only, like Polygon adjusted=true)
+        """
+        self.dividends = dividends
+        kinds = ["split", "dividend"] if dividends else ["split"]
+        self.actions = actions.filter(pl.col("kind").is_in(kinds))
+        self._by_symbol: Dict[str, pl.DataFrame] = {
+            key[0]: part for key, part in self.actions.partition_by("symbol", as_dict=True).items()
+        } if self.actions.height else {}
+        self._split_factors: Optional[pl.DataFrame] = None
+
+    @classmethod
+    def from_store(cls, raw_dir: Path, processed_dir: Optional[Path] = None, dividends: bool = False) -> "BarAdjuster":
+        """Latest corporate actions tables on disk (ingest_polygon and download_actions.py outputs)"""
+        splits_path = _latest(str(Path(raw_dir) / "corporate_actions" / "splits_*.parquet"))
+        divs_path = _latest(str(Path(raw_dir) / "corporate_actions" / "dividends_*.parquet"))
+        unified_path = _latest(str(Path(processed_dir) / "reference" / "corporate_actions_*.parquet")) \
+            if processed_dir is not None else None
+
+        actions = normalize_actions(
+            pl.read_parquet(splits_path) if splits_path else None,
+            pl.read_parquet(divs_path) if divs_path else None,
+            pl.read_parquet(unified_path) if unified_path else None,
+        )
+        if splits_path is None and unified_path is None:
+            logger.warning("No corporate actions tables found: local adjustment has no splits to apply")
+        logger.info(f"Loaded {actions.height:,} corporate actions for {actions['symbol'].n_unique():,} symbols")
+        return cls(actions, dividends=dividends)
+
+    @property
+    def has_actions(self) -> bool:
+        return self.actions.height > 0
+
+    def symbol_actions(self, symbol: str) -> pl.DataFrame:
+        return self._by_symbol.get(symbol, self.actions.clear())
+
+    def signature(self, symbol: str) -> str:
+        """Fingerprint of the actions applied to a symbol (changes when a split/dividend arrives)"""
+        rows = self.symbol_actions(symbol).select("ex_date", "kind", "ratio", "cash").rows()
+        return hashlib.sha1(repr((self.dividends, rows)).encode()).hexdigest()[:16]
+
+    def action_list(self, symbol: str) -> List[List]:
+        """JSON-friendly [ex_date, kind, ratio, cash] rows (stored with derived files)"""
+        return [[d.isoformat(), k, r, c] for d, k, r, c in
+                self.symbol_actions(symbol).select("ex_date", "kind", "ratio", "cash").rows()]
+
+    def changed_before(self, symbol: str, previous: Sequence[Sequence]) -> Optional[date]:
+        """
+        Latest ex-date whose action differs from `previous` (action_list of the last derivation).
+
+        Bars on or after it keep their factor; None if nothing changed.
+        """
+        now = {tuple(a) for a in self.action_list(symbol)}
+        diff = now.symmetric_difference(tuple(a) for a in previous)
+        return max((date.fromisoformat(a[0]) for a in diff), default=None)
+
+    # ----------------------------- factors --------------------------------
+
+    def factor_table(self, closes: Optional[pl.DataFrame] = None) -> pl.DataFrame:
+        """
+        Cumulative factors per (symbol, ex_date).
+
+        Args:
+            closes: Raw daily closes (symbol, date, close) for dividend factors; dividends
+                    without a prior close are skipped
+
+        Returns:
+            DataFrame(symbol, last_day, price_factor, volume_factor): bars dated <= last_day
+            (and after the previous action) take these factors
+        """
+        acts = self.actions
+        if self.dividends and acts.filter(pl.col("kind") == "dividend").height:
+            div = acts.filter(pl.col("kind") == "dividend")
+            if closes is not None and closes.height:
+                prev = closes.select("symbol", pl.col("date").cast(pl.Date), pl.col("close").cast(pl.Float64)) \
+                    .sort("symbol", "date")
+                div = div.sort("symbol", "ex_date").join_asof(
+                    prev.with_columns((pl.col("date") + timedelta(days=1)).alias("ex_date")),
+                    on="ex_date", by="symbol", strategy="backward", check_sortedness=False,
+                ).with_columns((1.0 - pl.col("cash") / pl.col("close")).alias("ratio")) \
+                 .filter(pl.col("ratio").is_between(0.0, 1.0, closed="none"))
+            else:
+                div = div.clear()
+            acts = pl.concat([acts.filter(pl.col("kind") == "split"), div.select(acts.columns)])
+
+        per_day = (
+            acts.group_by("symbol", "ex_date")
+            .agg(pl.col("ratio").product().alias("price"),
+                 pl.col("ratio").filter(pl.col("kind") == "split").product().alias("split"))
+            .sort("symbol", "ex_date")
+        )
+        # Reverse cumulative product: a bar before several actions takes all of them
+        return per_day.select(
+            "symbol",
+            (pl.col("ex_date") - timedelta(days=1)).alias("last_day"),
+            pl.col("price").reverse().cum_prod().reverse().over("symbol").alias("price_factor"),
+            (1.0 / pl.col("split").reverse().cum_prod().reverse().over("symbol")).alias("volume_factor"),
+        )
+
+    def adjust(self, df: pl.DataFrame, symbol: Optional[str] = None, closes: Optional[pl.DataFrame] = None,
+               invert: bool = False) -> pl.DataFrame:
+        """
+        Apply the cumulative factors to a bars frame (any timeframe, one or many symbols).
+
+        Args:
+            df: Bars with timestamp (UTC) and price/volume columns; `symbol` column or `symbol` arg
+            closes: Raw daily closes for dividend factors (see factor_table)
+            invert: Divide instead of multiply (adjusted → raw)
+
+        Returns:
+            Same columns and dtypes, rows in the input order
+        """
+        if df is None or df.height == 0 or not self.has_actions:
+            return df
+        added = "symbol" not in df.columns
+        if added:
+            df = df.with_columns(pl.lit(symbol).alias("symbol"))
+
+        if closes is None:
+            # Closes only matter for dividends; without them the table is fixed, build it once
+            if self._split_factors is None:
+                self._split_factors = self.factor_table()
+            factors = self._split_factors
+        else:
+            factors = self.factor_table(closes)
+        factors = factors.filter(pl.col("symbol").is_in(df["symbol"].unique().implode()))
+        bars = df.with_row_index("_row").with_columns(
+            pl.col("timestamp").dt.convert_time_zone("America/New_York").dt.date().alias("_session")
+        ).sort("symbol", "_session")
+        bars = bars.join_asof(factors, left_on="_session", right_on="last_day", by="symbol", strategy="forward",
+                              check_sortedness=False) \
+            .with_columns(pl.col("price_factor").fill_null(1.0), pl.col("volume_factor").fill_null(1.0))
+
+        pf, vf = pl.col("price_factor"), pl.col("volume_factor")
+        if invert:
+            pf, vf = 1.0 / pf, 1.0 / vf
+        cols = [(pl.col(c) * pf).cast(df.schema[c]).alias(c) for c in PRICE_COLS if c in df.columns]
+        if "volume" in df.columns:
+            vol = pl.col("volume") * vf
+            cols.append((vol.round(0) if df.schema["volume"].is_integer() else vol).cast(df.schema["volume"]).alias("volume"))
+
+        out = bars.with_columns(cols).sort("_row").select(df.columns)
+        return out.drop("symbol") if added else out
@@ -0,0 +1,256 @@
+"""
+Per-Symbol Bar Store (merge-on-write)
+
+Upsert-capable storage for `bars/{timespan}/{symbol}.parquet` (1d, 1h, raw variants), so a
+new window or a daily top-up is merged into the symbol's history instead of replacing it.
+
+- Layout is unchanged (one Parquet file per symbol, sorted by timestamp): readers keep using
+  pl.read_parquet / scan_parquet
+- Upsert: the file's row-group statistics (timestamp min/max) decide which row groups overlap
+  the new range; only those are merged and deduplicated on timestamp (new rows win) and the
+  result is written as its own row group. Row groups outside the range skip the merge/sort
+  but are still read and re-encoded: Parquet has no in-place append, so every upsert rewrites
+  the whole file (cost ~ file size, not history x sort)
+- Compaction: once a file has more than `compact_row_groups` row groups (one per top-up), it is
+  rewritten as a single sorted row group
+- Atomic and concurrency-safe: every write goes through a temp file + os.replace, under a
+  per-symbol lock (threads) and a striped lock file in `<root>/_locks/` (processes)
+
+Config (ingestion.bar_store): compact_row_groups.
+
+Usage:
+    >>> store = BarStore(raw_dir / "market_data" / "bars" / "1d")
+    >>> store.upsert("AAPL", df_new)                  # merge a window / a day
+    >>> store.coverage("AAPL")                        # (first ts, last ts, rows) from the footer
+    >>> store.upsert_many(df_multi_symbol, max_workers=8)
+"""
+
+import os
+import sys
+import uuid
+import zlib
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from loguru import logger
+
+# Lock files per store (symbols hash onto them), bounds the number of files in _locks/
+LOCK_STRIPES = 64
+
+if sys.platform == "win32":
+    import msvcrt
+
+    def _flock(fh):
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+
+    def _funlock(fh):
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _flock(fh):
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+
+    def _funlock(fh):
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+class BarStore:
+    """Merge-on-write per-symbol bar files of one timespan directory (thread- and process-safe)"""
+
+    def __init__(self, root: Path, compact_row_groups: int = 32, compression: str = "zstd",
+                 ts_col: str = "timestamp"):
+        """
+        Args:
+            root: Timespan directory (e.g. raw/market_data/bars/1d)
+            compact_row_groups: Row groups a file may accumulate before it is compacted
+            compression: Parquet compression codec
+            ts_col: Timestamp column (dedupe key and sort order)
+        """
+        self.root = Path(root)
+        self.compact_row_groups = max(1, int(compact_row_groups))
+        self.compression = compression
+        self.ts_col = ts_col
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    @classmethod
+    def from_config(cls, cfg: Dict, root: Path) -> "BarStore":
+        """Store for `root` with ingestion.bar_store settings"""
+        bs = cfg.get("ingestion", {}).get("bar_store", {})
+        return cls(root, compact_row_groups=int(bs.get("compact_row_groups", 32)))
+
+    def path(self, symbol: str) -> Path:
+        return self.root / f"{symbol}.parquet"
+
+    @contextmanager
+    def _symbol_lock(self, symbol: str):
+        stripe = zlib.crc32(symbol.encode()) % LOCK_STRIPES
+        lock_path = self.root / "_locks" / f"{stripe:02d}.lock"
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._locks[stripe]:
+            with open(lock_path, "a+b") as fh:
+                if os.path.getsize(lock_path) == 0:
+                    fh.write(b"\0")
+                    fh.flush()
+                _flock(fh)
+                try:
+                    yield
+                finally:
+                    _funlock(fh)
+
+    # ----------------------------- footer ---------------------------------
+
+    def _row_group_ranges(self, pf: pq.ParquetFile) -> List[Tuple[Optional[int], Optional[int], int]]:
+        """(min, max, rows) of the timestamp column per row group (raw int64; None without stats)"""
+        idx = pf.schema_arrow.get_field_index(self.ts_col)
+        out = []
+        for i in range(pf.metadata.num_row_groups):
+            rg = pf.metadata.row_group(i)
+            stats = rg.column(idx).statistics if idx >= 0 else None
+            if stats is not None and stats.has_min_max:
+                out.append((stats.min_raw, stats.max_raw, rg.num_rows))
+            else:
+                out.append((None, None, rg.num_rows))
+        return out
+
+    def coverage(self, symbol: str) -> Optional[Tuple[datetime, datetime, int]]:
+        """(first timestamp, last timestamp, rows) from the footer only, None if no file"""
+        path = self.path(symbol)
+        if not path.exists():
+            return None
+        with pq.ParquetFile(path) as pf:
+            ranges = self._row_group_ranges(pf)
+            unit = pf.schema_arrow.field(self.ts_col).type.unit
+        if not ranges or any(lo is None for lo, _, _ in ranges):
+            df = pl.read_parquet(path, columns=[self.ts_col])
+            if df.height == 0:
+                return None
+            return df[self.ts_col].min(), df[self.ts_col].max(), df.height
+        scale = {"s": 1, "ms": 1_000, "us": 1_000_000, "ns": 1_000_000_000}[unit]
+        first = datetime.fromtimestamp(min(lo for lo, _, _ in ranges) / scale, tz=timezone.utc)
+        last = datetime.fromtimestamp(max(hi for _, hi, _ in ranges) / scale, tz=timezone.utc)
+        return first, last, sum(n for _, _, n in ranges)
+
+    # ----------------------------- writes ---------------------------------
+
+    def _write(self, path: Path, tables: List[pa.Table], schema: pa.Schema):
+        """Write `tables` (sorted, non-overlapping) as consecutive row groups, atomically"""
+        tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            with pq.ParquetWriter(tmp, schema, compression=self.compression) as writer:
+                for table in tables:
+                    if table.num_rows:
+                        writer.write_table(table, row_group_size=max(table.num_rows, 1))
+            os.replace(str(tmp), str(path))
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+    def _merge(self, old: Optional[pl.DataFrame], new: pl.DataFrame) -> pl.DataFrame:
+        df = new if old is None else pl.concat([old, new], how="diagonal_relaxed")
+        return df.unique(subset=[self.ts_col], keep="last").sort(self.ts_col)
+
+    def upsert(self, symbol: str, df: pl.DataFrame) -> Dict:
+        """
+        Merge bars of one symbol into its file (new rows replace stored rows with the same timestamp).
+
+        Returns:
+            Dict with upserted (input rows), rows (file total), bytes, row_groups,
+            merged (stored row groups deduplicated against the new rows) and compacted
+        """
+        if df is None or df.height == 0:
+            return {"upserted": 0, "rows": 0, "bytes": 0, "row_groups": 0, "merged": 0, "compacted": False}
+
+        path = self.path(symbol)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        new = self._merge(None, df)
+        with self._symbol_lock(symbol):
+            stats = self._upsert(path, new)
+        stats.update(upserted=df.height, bytes=path.stat().st_size)
+        return stats
+
+    def _upsert(self, path: Path, new: pl.DataFrame) -> Dict:
+        """Merge sorted, deduplicated `new` into `path` (caller holds the symbol lock)"""
+        if not path.exists():
+            table = new.to_arrow()
+            self._write(path, [table], table.schema)
+            return {"rows": new.height, "row_groups": 1, "merged": 0, "compacted": False}
+
+        with pq.ParquetFile(path) as pf:
+            schema = pf.schema_arrow
+            try:
+                if set(new.columns) != set(schema.names):
+                    raise KeyError(f"columns {sorted(set(new.columns) ^ set(schema.names))}")
+                new_table = new.to_arrow().select(schema.names).cast(schema)
+            except (KeyError, pa.ArrowInvalid, pa.ArrowNotImplementedError, ValueError):
+                new_table = None
+                old_groups = pf.metadata.num_row_groups
+            else:
+                bounds = pc.min_max(new_table.column(self.ts_col).cast(pa.int64()))
+                new_lo, new_hi = bounds["min"].as_py(), bounds["max"].as_py()
+
+                # Row groups overlapping [new_lo, new_hi] are merged; the others are re-written unchanged
+                kept: List[Tuple[int, pa.Table]] = []
+                overlap: List[pa.Table] = []
+                for i, (lo, hi, _) in enumerate(self._row_group_ranges(pf)):
+                    if lo is None or not (hi < new_lo or lo > new_hi):
+                        overlap.append(pf.read_row_group(i))
+                    else:
+                        kept.append((lo, pf.read_row_group(i)))
+
+        if new_table is None:
+            # Schema drift (new/renamed column, dtype change): full merge in Polars
+            merged = self._merge(pl.read_parquet(path), new)
+            table = merged.to_arrow()
+            self._write(path, [table], table.schema)
+            return {"rows": merged.height, "row_groups": 1, "merged": old_groups, "compacted": True}
+
+        merged = new_table
+        if overlap:
+            old = pl.from_arrow(pa.concat_tables(overlap))
+            merged = self._merge(old, new).to_arrow().select(schema.names).cast(schema)
+        merged_lo = pc.min(merged.column(self.ts_col).cast(pa.int64())).as_py()
+        tables = [t for _, t in sorted(kept + [(merged_lo, merged)], key=lambda p: p[0])]
+
+        compacted = len(tables) > self.compact_row_groups
+        if compacted:
+            tables = [pa.concat_tables(tables)]
+        self._write(path, tables, schema)
+        return {"rows": sum(t.num_rows for t in tables), "row_groups": len(tables),
+                "merged": len(overlap), "compacted": compacted}
+
+    def upsert_many(self, df: pl.DataFrame, max_workers: int = 8, symbol_col: str = "symbol") -> Dict:
+        """Split a multi-symbol frame once and upsert every symbol concurrently (PartitionWriter-style stats)"""
+        if df is None or df.height == 0:
+            return {"files": 0, "rows": 0, "bytes": 0, "compacted": 0}
+        parts = df.partition_by(symbol_col, maintain_order=True, as_dict=True)
+        items = [(key[0], part) for key, part in parts.items()]
+        if len(items) == 1 or max_workers <= 1:
+            results = [self.upsert(sym, part) for sym, part in items]
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as ex:
+                results = list(ex.map(lambda item: self.upsert(*item), items))
+        return {"files": len(items), "rows": sum(r["upserted"] for r in results),
+                "bytes": sum(r["bytes"] for r in results), "compacted": sum(r["compacted"] for r in results)}
+
+    def compact(self, symbol: str) -> bool:
+        """Rewrite a file as one sorted, deduplicated row group; False if there is no file"""
+        path = self.path(symbol)
+        with self._symbol_lock(symbol):
+            if not path.exists():
+                return False
+            schema = pq.read_schema(path)
+            df = self._merge(None, pl.read_parquet(path))
+            self._write(path, [df.to_arrow().select(schema.names).cast(schema)], schema)
+        logger.debug(f"Compacted {path}")
+        return True
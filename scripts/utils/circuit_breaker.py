@@ -0,0 +1,306 @@
+"""
+Circuit Breaker and Retry Queue
+
+Failure-class routing for Polygon requests, shared by every worker thread of a process, so a
+degraded API does not keep all workers in lockstep backoff loops.
+
+- classify(): ok / rate_limit (429) / server (5xx) / timeout / network / permanent (other 4xx)
+- CircuitBreaker: one circuit per endpoint (request_metrics.endpoint_key):
+  * closed: requests flow; transient failures (429, 5xx, timeout, network) are counted
+  * open: `failure_threshold` transient failures within `window_s` → no requests for `open_s`
+    (doubling on every failed probe up to `max_open_s`); callers park their work instead of waiting
+  * half-open: after `open_s` a single probe goes through; success closes the circuit,
+    a transient failure re-opens it (only the probe's own outcome counts, not requests
+    that were already in flight). Permanent failures (4xx) never trip it
+- RetryQueue: parked work items ordered by due time, with a cap on parks per item; the park
+  delay doubles with the item's park count (base_s * 2**n), capped at the endpoint's open period,
+  and never ends before the endpoint's circuit can be probed. Only the item's own failures
+  count (not parks on an open circuit), and the count restarts once the item makes progress
+  (progress(): a page or window kept since its last park)
+
+Config (polygon.circuit_breaker): enable, failure_threshold, window_s, open_s, max_open_s,
+max_parks.
+
+Usage:
+    >>> breaker = CircuitBreaker.from_config(cfg)
+    >>> wait_s = breaker.before_request(url)
+    >>> if wait_s > 0:
+    ...     raise RetryLater(url, "circuit_open")     # caller parks the work item
+    >>> breaker.record(url, classify(resp.status_code))
+
+    >>> queue = RetryQueue(max_parks=5, base_s=1.0, breaker=breaker)
+    >>> queue.park(item, reason=e.reason, url=e.url)
+    >>> queue.progress(item)                              # resumed and got further: fresh count
+    >>> items = queue.pop_due()
+"""
+
+import time
+import heapq
+import random
+import itertools
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, List, Optional
+
+import requests
+from loguru import logger
+
+from scripts.utils.request_metrics import endpoint_key
+
+# Failure classes that say nothing about the request itself (worth retrying later)
+TRANSIENT = frozenset({"rate_limit", "server", "timeout", "network"})
+
+
+def classify(status: Optional[int] = None, exc: Optional[BaseException] = None) -> str:
+    """HTTP status / exception → failure class ("ok" for 2xx)"""
+    if exc is not None:
+        if isinstance(exc, requests.exceptions.Timeout):
+            return "timeout"
+        return "network"
+    if status is None or status == 0:
+        return "network"
+    if 200 <= status < 300:
+        return "ok"
+    if status == 429:
+        return "rate_limit"
+    if status >= 500:
+        return "server"
+    return "permanent"
+
+
+class RetryLater(Exception):
+    """Raised instead of blocking: the work item should be parked (RetryQueue decides for how long)"""
+
+    def __init__(self, url: str, reason: str):
+        super().__init__(f"{reason}: {endpoint_key(url)}")
+        self.url = url
+        self.reason = reason
+
+
+class RequestFailed(Exception):
+    """Raised by strict callers when a request got no usable answer (permanent 4xx, bad JSON, retries exhausted)"""
+
+    def __init__(self, url: str, reason: str):
+        super().__init__(f"{reason}: {endpoint_key(url)}")
+        self.url = url
+        self.reason = reason
+
+
+class _Circuit:
+    """State of one endpoint"""
+
+    def __init__(self):
+        self.state = "closed"
+        self.failures: Deque[float] = deque()
+        self.opened_at = 0.0
+        self.open_s = 0.0
+        self.probe_in_flight = False
+        self.probe_thread: Optional[int] = None
+        self.trips = 0
+
+
+class CircuitBreaker:
+    """Per-endpoint circuit breaker shared by all worker threads (thread-safe)"""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        window_s: float = 30.0,
+        open_s: float = 10.0,
+        max_open_s: float = 300.0,
+    ):
+        """
+        Args:
+            failure_threshold: Transient failures within window_s that open the circuit
+            window_s: Sliding window for counting failures
+            open_s: First open period (doubles on each failed probe)
+            max_open_s: Cap on the open period
+        """
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.window_s = float(window_s)
+        self.base_open_s = float(open_s)
+        self.max_open_s = float(max_open_s)
+        self.lock = threading.Lock()
+        self._circuits: Dict[str, _Circuit] = {}
+
+    @classmethod
+    def from_config(cls, cfg: Dict) -> Optional["CircuitBreaker"]:
+        """Breaker from polygon.circuit_breaker (None if disabled)"""
+        cb = cfg.get("polygon", {}).get("circuit_breaker", {})
+        if not cb.get("enable", False):
+            return None
+        return cls(
+            failure_threshold=int(cb.get("failure_threshold", 5)),
+            window_s=float(cb.get("window_s", 30)),
+            open_s=float(cb.get("open_s", 10)),
+            max_open_s=float(cb.get("max_open_s", 300)),
+        )
+
+    def _circuit(self, url: str) -> tuple:
+        key = endpoint_key(url)
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = self._circuits[key] = _Circuit()
+        return key, circuit
+
+    def before_request(self, url: str) -> float:
+        """0 if the request may go now; otherwise seconds until the endpoint can be probed"""
+        now = time.time()
+        with self.lock:
+            key, c = self._circuit(url)
+            if c.state == "closed":
+                return 0.0
+            remaining = c.opened_at + c.open_s - now
+            if remaining > 0:
+                return remaining
+            if c.probe_in_flight:
+                return c.open_s  # someone else is probing: come back after the next period
+            c.state = "half_open"
+            c.probe_in_flight = True
+            c.probe_thread = threading.get_ident()
+            logger.info(f"Circuit {key}: half-open, probing")
+            return 0.0
+
+    def record(self, url: str, failure_class: str):
+        """Outcome of a request that was allowed by before_request"""
+        now = time.time()
+        with self.lock:
+            key, c = self._circuit(url)
+            transient = failure_class in TRANSIENT
+
+            if c.state == "half_open":
+                # Only the probe decides; requests let through before the circuit opened may
+                # still be finishing and say nothing about the endpoint now
+                if c.probe_thread != threading.get_ident():
+                    return
+                c.probe_in_flight, c.probe_thread = False, None
+                if transient:
+                    c.open_s = min(c.open_s * 2, self.max_open_s)
+                    c.state, c.opened_at = "open", now
+                    logger.warning(f"Circuit {key}: probe failed ({failure_class}), open {c.open_s:.0f}s")
+                else:
+                    c.state, c.open_s = "closed", 0.0
+                    c.failures.clear()
+                    logger.info(f"Circuit {key}: closed")
+                return
+
+            if not transient:
+                return
+            c.failures.append(now)
+            while c.failures and now - c.failures[0] > self.window_s:
+                c.failures.popleft()
+            if c.state == "closed" and len(c.failures) >= self.failure_threshold:
+                c.state, c.opened_at, c.open_s = "open", now, self.base_open_s
+                c.trips += 1
+                logger.warning(f"Circuit {key}: open {c.open_s:.0f}s ({len(c.failures)} transient "
+                               f"failures in {self.window_s:.0f}s, last: {failure_class})")
+
+    def open_s(self, url: str) -> float:
+        """Current open period of the endpoint (parking delay hint), base period if closed"""
+        with self.lock:
+            _, c = self._circuit(url)
+            return c.open_s or self.base_open_s
+
+    def retry_in(self, url: str) -> float:
+        """Seconds until the endpoint can be probed (0 if closed or due); unlike before_request, no state change"""
+        with self.lock:
+            _, c = self._circuit(url)
+            if c.state == "closed":
+                return 0.0
+            remaining = c.opened_at + c.open_s - time.time()
+            if remaining > 0:
+                return remaining
+            return c.open_s if c.probe_in_flight else 0.0
+
+    def states(self) -> Dict[str, Dict]:
+        with self.lock:
+            return {k: {"state": c.state, "recent_failures": len(c.failures), "trips": c.trips}
+                    for k, c in self._circuits.items()}
+
+
+class RetryQueue:
+    """Parked work items, released when due (thread-safe; items are retried a bounded number of times)"""
+
+    def __init__(
+        self,
+        max_parks: int = 5,
+        base_s: float = 1.0,
+        max_delay_s: float = 300.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        """
+        Args:
+            max_parks: Failed attempts of an item without progress before it is given up
+            base_s: First park delay (doubles with every park of the item)
+            max_delay_s: Cap on the delay without a breaker (with one: the endpoint's open period)
+            breaker: Circuit breaker of the parked requests (delay cap, wait for the probe)
+        """
+        self.max_parks = max_parks
+        self.base_s = float(base_s)
+        self.max_delay_s = float(max_delay_s)
+        self.breaker = breaker
+        self.lock = threading.Lock()
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._parks: Dict[Hashable, int] = {}
+        self.parked_total = 0
+        self.given_up = 0
+
+    def delay(self, parks: int, url: Optional[str] = None) -> float:
+        """Park delay after `parks` earlier parks of an item whose last request went to `url`"""
+        cap = self.breaker.open_s(url) if self.breaker is not None and url else self.max_delay_s
+        delay = min(self.base_s * (2 ** parks), cap)
+        delay += random.uniform(0, delay * 0.1)
+        if self.breaker is not None and url:
+            delay = max(delay, self.breaker.retry_in(url))
+        return delay
+
+    def park(self, item: Any, reason: str = "", key: Optional[Hashable] = None, url: Optional[str] = None) -> bool:
+        """
+        Park an item; the delay grows with its park count (see delay()).
+
+        Args:
+            url: Request that failed (RetryLater.url): caps the delay at its endpoint's open period
+
+        Returns:
+            False if the item already failed max_parks times without progress (caller records it as failed)
+        """
+        key = item if key is None else key
+        counted = reason != "circuit_open"  # the item sent nothing: not its failure
+        with self.lock:
+            n = self._parks.get(key, 0)
+            if counted and n >= self.max_parks:
+                self.given_up += 1
+                return False
+            if counted:
+                self._parks[key] = n + 1
+            delay_s = self.delay(n, url)
+            heapq.heappush(self._heap, (time.time() + max(delay_s, 0.0), next(self._seq), item, reason))
+            self.parked_total += 1
+        logger.debug(f"Parked {key} for {delay_s:.1f}s ({reason}, park {n + counted}/{self.max_parks})")
+        return True
+
+    def progress(self, key: Hashable):
+        """The item got further since its last park (page / window kept): its park count restarts"""
+        with self.lock:
+            self._parks.pop(key, None)
+
+    def pop_due(self, limit: Optional[int] = None) -> List[Any]:
+        """Items whose delay has elapsed (oldest due first), at most `limit`"""
+        now = time.time()
+        out = []
+        with self.lock:
+            while self._heap and self._heap[0][0] <= now and (limit is None or len(out) < limit):
+                out.append(heapq.heappop(self._heap)[2])
+        return out
+
+    def next_due_in(self) -> Optional[float]:
+        """Seconds until the next item is due (0 if one is due now, None if empty)"""
+        with self.lock:
+            if not self._heap:
+                return None
+            return max(self._heap[0][0] - time.time(), 0.0)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._heap)
@@ -0,0 +1,423 @@
+"""
+Empirical Download Cost Model
+
+Storage (MB on disk) and runtime (seconds) per event for the FASE 3.2 trades/quotes download,
+fitted on completed events of the event catalog instead of the fixed p50/p90 constants the
+manifest scripts used to carry.
+
+Model, per metric (trades_mb, quotes_mb, trades_s, quotes_s):
+
+    cost = rate_per_min(symbol, session, event_type) x window_min x (daily_volume / ref_volume) ** beta
+
+- rate_per_min: mean / p50 / p90 of the per-minute cost of completed events, looked up
+  hierarchically: (symbol, session, event_type) → (symbol, session) → symbol →
+  (session, event_type) → session → global; a group needs `min_events` events to be used
+- beta: global volume elasticity (log-log least squares on `dollar_volume_day`, clipped to
+  [0, 2]); rates are stored normalized to the median daily volume of the history
+- window_min: the requested window, `window_before_min + window_after_min` of the manifest
+  (what the downloader reads per row), else `window_s`, else the mean requested window of the
+  history. Rates are fitted per requested minute too, so the dynamic extensions of the
+  history are part of the rate instead of the window (catalog rows older than the
+  requested_* columns fall back to the window actually downloaded)
+- Without history the global row is the prior from the dry-run estimates (DEFAULT_PRIOR)
+
+The fitted table is small (one row per group) and lives next to the catalog
+(`<event_windows>/_cost_model.parquet`).
+
+Usage:
+    >>> model = CostModel.from_catalog(catalog)
+    >>> df = model.predict(df_manifest)        # expected_mb, expected_mb_p90, expected_s, ...
+    >>> model.projection(df_manifest)["storage_gb"]["total_p90"]
+
+    # Refit and inspect
+    python scripts/utils/cost_model.py --fit
+    python scripts/utils/cost_model.py --manifest processed/events/manifest_core_20251014.parquet
+"""
+
+import os
+import sys
+import argparse
+from pathlib import Path
+from typing import Dict, Optional
+
+import polars as pl
+from loguru import logger
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.utils.event_catalog import EventCatalog, DEFAULT_ROOT, catalog_path
+
+MODEL_NAME = "_cost_model.parquet"
+
+METRICS = ("trades_mb", "quotes_mb", "trades_s", "quotes_s")
+STATS = ("mean", "p50", "p90")
+
+# Lookup levels, most specific first (the global row is the last resort)
+LEVELS = (
+    ("symbol_session_type", ("symbol", "session", "event_type")),
+    ("symbol_session", ("symbol", "session")),
+    ("symbol", ("symbol",)),
+    ("session_type", ("session", "event_type")),
+    ("session", ("session",)),
+)
+KEY_COLUMNS = ("symbol", "session", "event_type")
+
+# Daily activity proxy (manifest / catalog column)
+VOLUME_COLUMN = "dollar_volume_day"
+
+# Core window of the downloader (3 min before + 7 min after)
+DEFAULT_WINDOW_S = 600
+
+# Per-event prior for a DEFAULT_WINDOW_S window (dry-run estimates: p50 / p90; mean ~ p50)
+DEFAULT_PRIOR = {
+    "trades_mb": (8.5, 24.4),
+    "quotes_mb": (3.2, 11.7),
+    "trades_s": (12.0, 18.0),
+    "quotes_s": (10.0, 15.0),
+}
+
+MIN_EVENTS = 5
+MAX_BETA = 2.0
+
+
+def model_path(root: Path = DEFAULT_ROOT) -> Path:
+    """Cost-model table location for an event_windows tree"""
+    return Path(root) / MODEL_NAME
+
+
+def _history_frame(history: pl.DataFrame) -> pl.DataFrame:
+    """Catalog rows → per-minute (of requested window) cost of each completed event"""
+    def _span(before: str, after: str) -> pl.Expr:
+        if before in history.columns and after in history.columns:
+            return pl.col(before) + pl.col(after)
+        return pl.lit(None, pl.Int64)
+
+    window_min = (
+        pl.coalesce([_span("requested_before_s", "requested_after_s"),
+                     _span("window_before_s", "window_after_s"), pl.lit(DEFAULT_WINDOW_S)])
+        .cast(pl.Float64).clip(lower_bound=1.0) / 60
+    )
+    return history.select([
+        "symbol", "session", "event_type",
+        pl.col("daily_volume").cast(pl.Float64),
+        (window_min * 60).alias("window_s"),
+        (pl.when(pl.col("trades_rows").is_not_null()).then(pl.col("trades_bytes") / 1024 / 1024)
+         / window_min).alias("trades_mb"),
+        (pl.when(pl.col("quotes_rows").is_not_null()).then(pl.col("quotes_bytes") / 1024 / 1024)
+         / window_min).alias("quotes_mb"),
+        (pl.col("trades_elapsed_s") / window_min).alias("trades_s"),
+        (pl.col("quotes_elapsed_s") / window_min).alias("quotes_s"),
+    ])
+
+
+def _elasticity(h: pl.DataFrame, metric: str, ref_volume: Optional[float], min_events: int) -> float:
+    """Least-squares slope of log(cost/min) on log(volume / ref), clipped to [0, MAX_BETA]"""
+    if ref_volume is None:
+        return 0.0
+    pts = h.filter((pl.col(metric) > 0) & (pl.col("daily_volume") > 0)).select([
+        (pl.col("daily_volume") / ref_volume).log().alias("x"),
+        pl.col(metric).log().alias("y"),
+    ])
+    if len(pts) < min_events:
+        return 0.0
+    var_x = pts["x"].var()
+    if not var_x:
+        return 0.0
+    cov = pts.select(pl.cov("x", "y")).item()
+    return min(max(cov / var_x, 0.0), MAX_BETA)
+
+
+class CostModel:
+    """Hierarchical per-minute cost table with a volume elasticity per metric"""
+
+    def __init__(self, table: pl.DataFrame):
+        """
+        Args:
+            table: Fitted table (fit() / load()): level, symbol, session, event_type, n,
+                   {metric}_{mean,p50,p90} per minute at ref_volume, {metric}_beta, ref_volume, window_s
+        """
+        self.table = table
+        glob = table.filter(pl.col("level") == "global").row(0, named=True)
+        self.ref_volume = glob["ref_volume"]
+        self.window_s = glob["window_s"] or DEFAULT_WINDOW_S
+        self.betas = {m: glob[f"{m}_beta"] or 0.0 for m in METRICS}
+        self.history_events = int(table.filter(pl.col("level") == "global")["n"][0])
+
+    # ----------------------------- fitting --------------------------------
+
+    @staticmethod
+    def _prior_row() -> Dict:
+        row = {"level": "global", "symbol": None, "session": None, "event_type": None, "n": 0,
+               "ref_volume": None, "window_s": float(DEFAULT_WINDOW_S)}
+        minutes = DEFAULT_WINDOW_S / 60
+        for m, (p50, p90) in DEFAULT_PRIOR.items():
+            row.update({f"{m}_mean": p50 / minutes, f"{m}_p50": p50 / minutes,
+                        f"{m}_p90": p90 / minutes, f"{m}_beta": 0.0})
+        return row
+
+    @classmethod
+    def fit(cls, history: pl.DataFrame, min_events: int = MIN_EVENTS) -> "CostModel":
+        """
+        Fit the table on completed catalog rows (EventCatalog.to_polars(catalog.complete_clause())).
+
+        Args:
+            history: Catalog rows with bytes, elapsed seconds, window and event context
+            min_events: Minimum events for a group (and for the global row, else the prior is used)
+        """
+        prior = cls._prior_row()
+        h = _history_frame(history) if len(history) else None
+        if h is None or len(h) < min_events:
+            return cls(cls._typed([pl.DataFrame([prior])]))
+
+        volumes = h["daily_volume"].drop_nulls()
+        volumes = volumes.filter(volumes > 0)
+        ref_volume = float(volumes.median()) if len(volumes) >= min_events else None
+        betas = {m: _elasticity(h, m, ref_volume, min_events) for m in METRICS}
+
+        # Normalize each event's rate to the reference volume
+        def _norm(m):
+            if not betas[m] or ref_volume is None:
+                return pl.col(m)
+            factor = (pl.col("daily_volume") / ref_volume).pow(betas[m])
+            return pl.when(pl.col("daily_volume") > 0).then(pl.col(m) / factor).otherwise(pl.col(m)).alias(m)
+
+        h = h.with_columns([_norm(m) for m in METRICS])
+        aggs = [pl.len().alias("n")]
+        for m in METRICS:
+            aggs += [pl.col(m).mean().alias(f"{m}_mean"), pl.col(m).median().alias(f"{m}_p50"),
+                     pl.col(m).quantile(0.9, interpolation="linear").alias(f"{m}_p90")]
+
+        parts = []
+        for name, keys in LEVELS:
+            grouped = (
+                h.filter(pl.all_horizontal([pl.col(k).is_not_null() for k in keys]))
+                .group_by(list(keys)).agg(aggs)
+                .filter(pl.col("n") >= min_events)
+            )
+            parts.append(grouped.with_columns(pl.lit(name).alias("level")))
+
+        glob = h.select(aggs).row(0, named=True)
+        for m in METRICS:
+            for s in STATS:
+                if glob[f"{m}_{s}"] is None:  # metric never recorded (e.g. catalogs without elapsed_s)
+                    glob[f"{m}_{s}"] = prior[f"{m}_{s}"]
+            glob[f"{m}_beta"] = betas[m]
+        glob.update({"level": "global", "ref_volume": ref_volume, "window_s": float(h["window_s"].mean())})
+        parts.append(pl.DataFrame([glob]))
+
+        return cls(cls._typed(parts))
+
+    @staticmethod
+    def _typed(parts) -> pl.DataFrame:
+        """Concatenate level tables into the fixed table schema"""
+        schema = {"level": pl.Utf8, **{k: pl.Utf8 for k in KEY_COLUMNS}, "n": pl.Int64}
+        schema.update({f"{m}_{s}": pl.Float64 for m in METRICS for s in STATS})
+        schema.update({f"{m}_beta": pl.Float64 for m in METRICS})
+        schema.update({"ref_volume": pl.Float64, "window_s": pl.Float64})
+        table = pl.concat(parts, how="diagonal_relaxed")
+        return table.select([
+            (pl.col(c) if c in table.columns else pl.lit(None)).cast(dtype).alias(c) for c, dtype in schema.items()
+        ])
+
+    @classmethod
+    def from_catalog(cls, catalog: EventCatalog, min_events: int = MIN_EVENTS) -> "CostModel":
+        """Fit on the completed events of a catalog"""
+        model = cls.fit(catalog.to_polars(catalog.complete_clause()), min_events=min_events)
+        logger.info(f"Cost model: {model.history_events:,} completed events, "
+                    f"{len(model.table) - 1:,} groups, prior={'yes' if model.history_events == 0 else 'no'}")
+        return model
+
+    @classmethod
+    def for_root(cls, root: Path = DEFAULT_ROOT, min_events: int = MIN_EVENTS) -> "CostModel":
+        """Saved table of an event_windows tree, else fitted on its catalog, else the prior"""
+        path = model_path(root)
+        if path.exists():
+            return cls.load(path)
+        if catalog_path(root).exists():
+            catalog = EventCatalog.for_root(root)
+            try:
+                return cls.from_catalog(catalog, min_events=min_events)
+            finally:
+                catalog.close()
+        return cls.fit(pl.DataFrame(), min_events=min_events)
+
+    # ----------------------------- persistence ----------------------------
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        self.table.write_parquet(tmp)
+        os.replace(str(tmp), str(path))
+
+    @classmethod
+    def load(cls, path: Path) -> "CostModel":
+        return cls(pl.read_parquet(path))
+
+    # ----------------------------- prediction -----------------------------
+
+    def predict(self, manifest: pl.DataFrame, detail: bool = False) -> pl.DataFrame:
+        """
+        Add expected costs to every manifest row.
+
+        Adds expected_mb (mean, trades + quotes), expected_mb_p90, expected_s (mean wall time,
+        kinds run in parallel), expected_s_p90, trades_share (p90 split, for the byte budget)
+        and cost_level (lookup level used). detail=True also adds expected_{metric}[_p50|_p90].
+
+        Args:
+            manifest: Rows with symbol, session, event_type (or `type`); optional
+                      dollar_volume_day and window_before_min / window_after_min (or window_s)
+        """
+        if "window_before_min" in manifest.columns and "window_after_min" in manifest.columns:
+            window_s = (pl.col("window_before_min") + pl.col("window_after_min")).cast(pl.Float64) * 60
+        elif "window_s" in manifest.columns:
+            window_s = pl.col("window_s").cast(pl.Float64)
+        else:
+            window_s = pl.lit(None, pl.Float64)
+        df = manifest.with_columns([
+            (pl.col("event_type") if "event_type" in manifest.columns
+             else pl.col("type") if "type" in manifest.columns else pl.lit(None, pl.Utf8))
+            .cast(pl.Utf8).alias("_event_type"),
+            (pl.col("session").cast(pl.Utf8) if "session" in manifest.columns
+             else pl.lit(None, pl.Utf8)).alias("_session"),
+            (pl.col(VOLUME_COLUMN).cast(pl.Float64) if VOLUME_COLUMN in manifest.columns
+             else pl.lit(None, pl.Float64)).alias("_volume"),
+            (window_s.fill_null(self.window_s) / 60).alias("_window_min"),
+        ])
+        key_map = {"symbol": "symbol", "session": "_session", "event_type": "_event_type"}
+        stat_cols = [f"{m}_{s}" for m in METRICS for s in STATS]
+
+        for i, (name, keys) in enumerate(LEVELS):
+            level = (
+                self.table.filter(pl.col("level") == name)
+                .select([pl.col(k).alias(key_map[k]) for k in keys]
+                        + [pl.col("n").alias(f"_n{i}")] + [pl.col(c).alias(f"_{c}{i}") for c in stat_cols])
+            )
+            df = df.join(level, on=[key_map[k] for k in keys], how="left")
+
+        glob = self.table.filter(pl.col("level") == "global").row(0, named=True)
+        out = []
+        for m in METRICS:
+            if self.betas[m] and self.ref_volume:
+                factor = pl.when(pl.col("_volume") > 0) \
+                    .then((pl.col("_volume") / self.ref_volume).pow(self.betas[m])).otherwise(1.0)
+            else:
+                factor = pl.lit(1.0)
+            for s in STATS:
+                rate = pl.coalesce([pl.col(f"_{m}_{s}{i}") for i in range(len(LEVELS))] + [pl.lit(glob[f"{m}_{s}"])])
+                suffix = "" if s == "mean" else f"_{s}"
+                out.append((rate * factor * pl.col("_window_min")).alias(f"expected_{m}{suffix}"))
+
+        level_name = pl.lit("global")
+        for i in reversed(range(len(LEVELS))):
+            level_name = pl.when(pl.col(f"_n{i}").is_not_null()).then(pl.lit(LEVELS[i][0])).otherwise(level_name)
+
+        df = df.with_columns(out + [level_name.alias("cost_level")]).with_columns([
+            (pl.col("expected_trades_mb") + pl.col("expected_quotes_mb")).alias("expected_mb"),
+            (pl.col("expected_trades_mb_p90") + pl.col("expected_quotes_mb_p90")).alias("expected_mb_p90"),
+            pl.max_horizontal("expected_trades_s", "expected_quotes_s").alias("expected_s"),
+            pl.max_horizontal("expected_trades_s_p90", "expected_quotes_s_p90").alias("expected_s_p90"),
+            (pl.col("expected_trades_mb_p90")
+             / (pl.col("expected_trades_mb_p90") + pl.col("expected_quotes_mb_p90"))).alias("trades_share"),
+        ])
+
+        temp = [c for c in df.columns if c.startswith("_") and c not in manifest.columns]
+        df = df.drop(temp)
+        if not detail:
+            df = df.drop([f"expected_{m}{'' if s == 'mean' else '_' + s}" for m in METRICS for s in STATS])
+        return df
+
+    def event_budgets(
+        self,
+        predicted: pl.DataFrame,
+        p90_factor: float,
+        max_budget_mb: Optional[float] = None,
+        min_budget_mb: Optional[float] = None,
+    ) -> pl.DataFrame:
+        """
+        Per-event byte budget: p90_factor x expected_mb_p90, clipped to [min_budget_mb, max_budget_mb].
+
+        Args:
+            predicted: Output of predict()
+        """
+        budget = (pl.col("expected_mb_p90") * p90_factor).clip(lower_bound=min_budget_mb, upper_bound=max_budget_mb)
+        return predicted.with_columns(budget.alias("budget_mb"))
+
+    def projection(self, manifest: pl.DataFrame) -> Dict:
+        """
+        Totals for a manifest (capacity planning).
+
+        Returns:
+            {"events", "storage_gb": {trades_*, quotes_*, total_* for mean/p50/p90},
+             "time_hours": {trades_*, quotes_*, total_parallel_*}, "levels": {cost_level: events}}
+            p50/p90 totals are sums of per-event quantiles (conservative for p90)
+        """
+        df = self.predict(manifest, detail=True)
+        sums = df.select([pl.col(c).sum() for c in df.columns if c.startswith("expected_")]).row(0, named=True)
+
+        storage, time_h = {}, {}
+        for s in STATS:
+            suffix = "" if s == "mean" else f"_{s}"
+            t_mb, q_mb = sums[f"expected_trades_mb{suffix}"], sums[f"expected_quotes_mb{suffix}"]
+            storage.update({f"trades_{s}": t_mb / 1024, f"quotes_{s}": q_mb / 1024, f"total_{s}": (t_mb + q_mb) / 1024})
+            t_s, q_s = sums[f"expected_trades_s{suffix}"], sums[f"expected_quotes_s{suffix}"]
+            # Kinds download in parallel: per-event max (mean / p90 columns), sum-level max for p50
+            parallel_s = sums.get(f"expected_s{suffix}", max(t_s, q_s))
+            time_h.update({f"trades_{s}": t_s / 3600, f"quotes_{s}": q_s / 3600,
+                           f"total_parallel_{s}": parallel_s / 3600})
+
+        levels = dict(df.group_by("cost_level").agg(pl.len()).iter_rows())
+        return {
+            "events": len(df),
+            "history_events": self.history_events,
+            "storage_gb": {k: round(v, 2) for k, v in storage.items()},
+            "time_hours": {k: round(v, 2) for k, v in time_h.items()},
+            "levels": levels,
+        }
+
+    def summary(self) -> pl.DataFrame:
+        """Groups per level and their median per-event cost for the default window"""
+        minutes = self.window_s / 60
+        return (
+            self.table.group_by("level")
+            .agg([pl.len().alias("groups"), pl.col("n").sum().alias("events")]
+                 + [(pl.col(f"{m}_mean") * minutes).median().round(2).alias(m) for m in METRICS])
+            .sort("groups")
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit / inspect the FASE 3.2 download cost model")
+    parser.add_argument("--root", type=str, default=str(DEFAULT_ROOT), help="event_windows directory")
+    parser.add_argument("--fit", action="store_true", help="Refit on the catalog and save the table")
+    parser.add_argument("--min-events", type=int, default=MIN_EVENTS, help="Minimum events per group")
+    parser.add_argument("--manifest", type=str, help="Print the projection for this manifest")
+    args = parser.parse_args()
+
+    root = Path(args.root)
+    if args.fit:
+        catalog = EventCatalog.for_root(root)
+        model = CostModel.from_catalog(catalog, min_events=args.min_events)
+        catalog.close()
+        model.save(model_path(root))
+        print(f"Saved: {model_path(root)}")
+    else:
+        model = CostModel.for_root(root, min_events=args.min_events)
+
+    print(f"History: {model.history_events:,} events | window {model.window_s / 60:.1f} min | "
+          f"ref volume {model.ref_volume or 0:,.0f}")
+    print("Volume elasticity: " + ", ".join(f"{m}={b:.2f}" for m, b in model.betas.items()))
+    print(model.summary())
+
+    if args.manifest:
+        p = model.projection(pl.read_parquet(args.manifest))
+        print(f"\nProjection for {p['events']:,} events ({args.manifest}):")
+        for s in STATS:
+            print(f"  Storage {s:>4}: {p['storage_gb'][f'total_{s}']:>8.1f} GB | "
+                  f"time {p['time_hours'][f'total_parallel_{s}']:>8.1f} h")
+        print(f"  Lookup levels: {p['levels']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+Bar Coverage Index + Gap Planner
+
+Which (symbol, timespan) date ranges are already on disk, kept by the writers instead of
+guessed from directory scans, and a planner that turns "I want [from, to]" into the minimal
+list of requests for the trading days that are actually missing.
+
+- Index: one append-only JSONL log per bars/ variant (raw/market_data/bars/_coverage/{variant}.jsonl),
+  one line per completed request or write: {"symbol", "from", "to", "rows", "ts"}. A request
+  that returned no rows (pre-listing, suspension) is still recorded, so it is not re-requested.
+  Lines are short single writes (O_APPEND), so several processes can append to the same log;
+  a torn trailing line is ignored on replay. In memory: merged date intervals per symbol
+- Calendar: weekdays minus market holidays; holidays come from the grouped daily progress log
+  (weekdays that returned no rows) and reference/holidays_upcoming.parquet (status closed)
+- Planner: desired trading days - covered days → runs of consecutive missing trading days →
+  (from, to) requests of at most `max_days` calendar days. Today is never marked covered
+  (coverage is clamped to yesterday ET), so a top-up re-requests the last, partial session
+
+Usage:
+    >>> index = CoverageIndex(raw_dir / "market_data" / "bars" / "_coverage")
+    >>> index.record("1m", "AAPL", "2024-01-01", "2024-01-31", rows=16000)
+    >>> planner = GapPlanner(index, TradingCalendar.from_store(raw_dir))
+    >>> planner.plan("1m", ["AAPL"], "2023-01-01", "2024-06-30", max_days=30)
+    [('AAPL', '2023-01-03', '2023-02-01'), ...]
+
+    # One-off migration of existing files into the index, then stats
+    python scripts/utils/coverage_index.py --variant 1m --bootstrap
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+from pathlib import Path
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import polars as pl
+from loguru import logger
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.utils.time_utils import ET
+
+DateLike = Union[str, date, datetime]
+Interval = Tuple[int, int]  # inclusive (first, last) date ordinals
+
+
+def _as_date(d: DateLike) -> date:
+    if isinstance(d, datetime):
+        return d.date()
+    if isinstance(d, date):
+        return d
+    return date.fromisoformat(str(d)[:10])
+
+
+def last_complete_day() -> date:
+    """Yesterday in US/Eastern: the last session whose bars can no longer change"""
+    return datetime.now(ET).date() - timedelta(days=1)
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Sort and merge overlapping / adjacent (consecutive-day) intervals"""
+    out: List[Interval] = []
+    for lo, hi in sorted(intervals):
+        if out and lo <= out[-1][1] + 1:
+            if hi > out[-1][1]:
+                out[-1] = (out[-1][0], hi)
+        else:
+            out.append((lo, hi))
+    return out
+
+
+class TradingCalendar:
+    """US equity sessions: weekdays minus known full-day closures"""
+
+    def __init__(self, holidays: Iterable[DateLike] = ()):
+        self.holidays: Set[date] = {_as_date(d) for d in holidays}
+
+    @classmethod
+    def from_store(cls, raw_dir: Path) -> "TradingCalendar":
+        """Holidays from the grouped daily progress log and reference/holidays_upcoming.parquet"""
+        holidays: Set[date] = set()
+
+        # Grouped daily records every weekday it requested; a closed market returns no rows
+        wal_file = Path(raw_dir) / "market_data" / "grouped_daily" / "_progress.jsonl"
+        if wal_file.exists():
+            rows: Dict[str, int] = {}
+            with open(wal_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                        rows[rec["event_id"]] = max(rows.get(rec["event_id"], 0), int(rec["rows"]))
+                    except (ValueError, KeyError):
+                        continue
+            holidays |= {date.fromisoformat(d) for d, n in rows.items() if n == 0}
+
+        upcoming = Path(raw_dir) / "reference" / "holidays_upcoming.parquet"
+        if upcoming.exists():
+            df = pl.read_parquet(upcoming)
+            if {"date", "status"} <= set(df.columns):
+                holidays |= {_as_date(d) for d in df.filter(pl.col("status") == "closed")["date"].to_list()}
+
+        return cls(holidays)
+
+    def is_session(self, d: date) -> bool:
+        return d.weekday() < 5 and d not in self.holidays
+
+    def sessions(self, start: DateLike, end: DateLike) -> List[date]:
+        """Trading days in [start, end]"""
+        out, d, end = [], _as_date(start), _as_date(end)
+        while d <= end:
+            if self.is_session(d):
+                out.append(d)
+            d += timedelta(days=1)
+        return out
+
+
+class CoverageIndex:
+    """Per-variant, per-symbol covered date ranges backed by append-only logs (thread-safe)"""
+
+    def __init__(self, root: Path):
+        """
+        Args:
+            root: Directory of the coverage logs (raw/market_data/bars/_coverage)
+        """
+        self.root = Path(root)
+        self.lock = threading.Lock()
+        self._cov: Dict[str, Dict[str, List[Interval]]] = {}
+        self._fh: Dict[str, object] = {}
+
+    def log_path(self, variant: str) -> Path:
+        return self.root / f"{variant}.jsonl"
+
+    # ----------------------------- replay ---------------------------------
+
+    def _load(self, variant: str) -> Dict[str, List[Interval]]:
+        """Replay a variant's log into merged intervals (caller holds the lock)"""
+        if variant in self._cov:
+            return self._cov[variant]
+
+        raw: Dict[str, List[Interval]] = {}
+        path = self.log_path(variant)
+        if path.exists():
+            with open(path, "rb") as f:
+                data = f.read()
+            bad = 0
+            # Only complete lines: a concurrent writer or a crash may leave a partial last line
+            for line in data[:data.rfind(b"\n") + 1].splitlines():
+                try:
+                    rec = json.loads(line)
+                    raw.setdefault(rec["symbol"], []).append(
+                        (date.fromisoformat(rec["from"]).toordinal(), date.fromisoformat(rec["to"]).toordinal()))
+                except (ValueError, KeyError):
+                    bad += 1
+            if bad:
+                logger.warning(f"Coverage {variant}: skipped {bad} unreadable records")
+
+        self._cov[variant] = {sym: merge_intervals(iv) for sym, iv in raw.items()}
+        return self._cov[variant]
+
+    def reload(self, variant: Optional[str] = None):
+        """Drop the in-memory view (pick up records appended by other processes)"""
+        with self.lock:
+            if variant is None:
+                self._cov.clear()
+            else:
+                self._cov.pop(variant, None)
+
+    # ----------------------------- writes ---------------------------------
+
+    def record(self, variant: str, symbol: str, start: DateLike, end: DateLike, rows: int = 0) -> bool:
+        """
+        Mark [start, end] of `symbol` as downloaded (clamped to the last complete day).
+
+        Returns:
+            False if nothing was recorded (range empty after clamping)
+        """
+        lo, hi = _as_date(start), min(_as_date(end), last_complete_day())
+        if hi < lo:
+            return False
+        line = json.dumps({"symbol": symbol, "from": lo.isoformat(), "to": hi.isoformat(), "rows": int(rows),
+                           "ts": datetime.now().isoformat(timespec="seconds")}, separators=(",", ":")) + "\n"
+
+        with self.lock:
+            cov = self._load(variant)
+            fh = self._fh.get(variant)
+            if fh is None:
+                self.root.mkdir(parents=True, exist_ok=True)
+                fh = self._fh[variant] = open(self.log_path(variant), "a", encoding="utf-8")
+            fh.write(line)
+            fh.flush()
+            cov[symbol] = merge_intervals(cov.get(symbol, []) + [(lo.toordinal(), hi.toordinal())])
+        return True
+
+    def record_frame(self, variant: str, df: pl.DataFrame, symbol_col: str = "symbol") -> int:
+        """Record the date span of every symbol in a bars frame (writers without a request range)"""
+        if df is None or df.height == 0 or symbol_col not in df.columns:
+            return 0
+        date_expr = pl.col("date") if "date" in df.columns else pl.col("timestamp").dt.date()
+        spans = df.group_by(symbol_col).agg(date_expr.min().alias("lo"), date_expr.max().alias("hi"),
+                                            pl.len().alias("rows"))
+        return sum(self.record(variant, row[symbol_col], row["lo"], row["hi"], row["rows"])
+                   for row in spans.iter_rows(named=True))
+
+    def compact(self, variant: str):
+        """Rewrite a variant's log as one line per merged interval"""
+        with self.lock:
+            cov = self._load(variant)
+            fh = self._fh.pop(variant, None)
+            if fh is not None:
+                fh.close()
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.log_path(variant).with_suffix(".jsonl.compact")
+            ts = datetime.now().isoformat(timespec="seconds")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for sym in sorted(cov):
+                    for lo, hi in cov[sym]:
+                        f.write(json.dumps({"symbol": sym, "from": date.fromordinal(lo).isoformat(),
+                                            "to": date.fromordinal(hi).isoformat(), "rows": 0, "ts": ts},
+                                           separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(str(tmp_path), str(self.log_path(variant)))
+
+    def bootstrap(self, variant: str, bars_dir: Path) -> int:
+        """
+        Index files written before the coverage log existed (one scan, then the log is the truth).
+
+        Layouts: symbol=SYM/date=YYYY-MM-DD.parquet (1m) and SYM.parquet (1d/1h).
+
+        Returns:
+            Symbols recorded
+        """
+        bars_dir = Path(bars_dir)
+        if not bars_dir.exists():
+            return 0
+        symbols = 0
+        for entry in sorted(bars_dir.iterdir()):
+            if entry.is_dir() and entry.name.startswith("symbol="):
+                days = sorted(date.fromisoformat(p.stem.removeprefix("date="))
+                              for p in entry.glob("date=*.parquet"))
+                for lo, hi in merge_intervals((d.toordinal(), d.toordinal()) for d in days):
+                    self.record(variant, entry.name.removeprefix("symbol="), date.fromordinal(lo), date.fromordinal(hi))
+                symbols += bool(days)
+            elif entry.suffix == ".parquet":
+                span = pl.scan_parquet(entry).select(pl.col("timestamp").dt.date().min().alias("lo"),
+                                                     pl.col("timestamp").dt.date().max().alias("hi"),
+                                                     pl.len().alias("rows")).collect().row(0)
+                if span[0] is not None:
+                    symbols += self.record(variant, entry.stem, span[0], span[1], span[2])
+        self.compact(variant)
+        logger.info(f"Coverage {variant}: bootstrapped {symbols:,} symbols from {bars_dir}")
+        return symbols
+
+    # ----------------------------- reads ----------------------------------
+
+    def intervals(self, variant: str, symbol: str) -> List[Tuple[date, date]]:
+        """Covered (first, last) date ranges of a symbol"""
+        with self.lock:
+            return [(date.fromordinal(lo), date.fromordinal(hi)) for lo, hi in self._load(variant).get(symbol, [])]
+
+    def symbols(self, variant: str) -> Set[str]:
+        """Symbols with any coverage"""
+        with self.lock:
+            return set(self._load(variant))
+
+    def has_log(self, variant: str) -> bool:
+        return self.log_path(variant).exists()
+
+    def close(self):
+        with self.lock:
+            for fh in self._fh.values():
+                fh.close()
+            self._fh.clear()
+
+
+class GapPlanner:
+    """Desired coverage - index coverage, on the trading calendar → minimal request ranges"""
+
+    def __init__(self, index: CoverageIndex, calendar: TradingCalendar):
+        self.index = index
+        self.calendar = calendar
+
+    def missing_sessions(self, variant: str, symbol: str, start: DateLike, end: DateLike) -> List[date]:
+        """Trading days in [start, end] (up to the last complete day) not covered for symbol"""
+        end = min(_as_date(end), last_complete_day())
+        covered = self.index.intervals(variant, symbol)
+        out, i = [], 0
+        for d in self.calendar.sessions(start, end):
+            while i < len(covered) and covered[i][1] < d:
+                i += 1
+            if i == len(covered) or d < covered[i][0]:
+                out.append(d)
+        return out
+
+    def plan_symbol(self, variant: str, symbol: str, start: DateLike, end: DateLike,
+                    max_days: int = 30) -> List[Tuple[str, str]]:
+        """
+        (from, to) requests covering the missing sessions of one symbol.
+
+        A run of consecutive missing sessions (weekends/holidays do not break it) becomes one
+        request, split so no request spans more than max_days calendar days.
+        """
+        missing = self.missing_sessions(variant, symbol, start, end)
+        if not missing:
+            return []
+        sessions = self.calendar.sessions(missing[0], missing[-1])
+        pos = {d: k for k, d in enumerate(sessions)}
+
+        out: List[Tuple[str, str]] = []
+        lo = prev = missing[0]
+        for d in missing[1:]:
+            if pos[d] != pos[prev] + 1 or (d - lo).days >= max_days:
+                out.append((lo.isoformat(), prev.isoformat()))
+                lo = d
+            prev = d
+        out.append((lo.isoformat(), prev.isoformat()))
+        return out
+
+    def plan(self, variant: str, symbols: Iterable[str], start: DateLike, end: DateLike,
+             max_days: int = 30) -> List[Tuple[str, str, str]]:
+        """(symbol, from, to) requests for every symbol's gaps in [start, end]"""
+        return [(sym, lo, hi) for sym in symbols for lo, hi in self.plan_symbol(variant, sym, start, end, max_days)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bar coverage index: bootstrap from disk, compact, stats")
+    parser.add_argument("--variant", required=True, help="bars/ subdirectory, e.g. 1m, 1d, 1h_raw")
+    parser.add_argument("--raw-dir", type=str, default=str(PROJECT_ROOT / "raw"))
+    parser.add_argument("--bootstrap", action="store_true", help="Index existing files (one directory scan)")
+    parser.add_argument("--compact", action="store_true", help="Rewrite the log as merged intervals")
+    args = parser.parse_args()
+
+    bars_root = Path(args.raw_dir) / "market_data" / "bars"
+    index = CoverageIndex(bars_root / "_coverage")
+    if args.bootstrap:
+        index.bootstrap(args.variant, bars_root / args.variant)
+    elif args.compact:
+        index.compact(args.variant)
+
+    symbols = index.symbols(args.variant)
+    ranges = sum(len(index.intervals(args.variant, s)) for s in symbols)
+    print(f"[INFO] Coverage {args.variant}: {len(symbols):,} symbols, {ranges:,} date ranges")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Download Scheduler
+
+Priority- and cost-aware ordering of the FASE 3.2 micro-data download queue.
+
+- Expected cost: CostModel.predict (cost_model.py: MB and seconds from symbol, session, event
+  type, window and daily volume) or, with the model disabled, the mean on-disk MB of
+  already-downloaded events, looked up hierarchically: (symbol, session) → symbol → session →
+  global median → DEFAULT_EVENT_MB
+- Priority: manifest `priority` column if present, else `score`, bucketed into tiers so an
+  interrupted run has the most valuable events on disk first
+- Interleaving: inside each tier events alternate large / small expected cost, so workers
+  blocked on long paginations overlap with quick events and the rate budget stays saturated
+  (expected seconds from the cost model, cost_model.py, when available)
+
+Usage:
+    >>> history = catalog.to_polars(catalog.complete_clause())
+    >>> df = expected_event_mb(df_manifest, history)
+    >>> df = schedule_events(df, tiers=10)
+"""
+
+from typing import Optional
+
+import polars as pl
+
+# p50 MB per event from the dry-run estimates (freeze_manifest_core.py), used without history
+DEFAULT_EVENT_MB = 11.4
+
+# Minimum completed events for a (symbol, session) / symbol / session mean to be trusted
+MIN_HISTORY_EVENTS = 3
+
+
+def expected_event_mb(
+    manifest: pl.DataFrame,
+    history: pl.DataFrame,
+    min_events: int = MIN_HISTORY_EVENTS,
+    default_mb: float = DEFAULT_EVENT_MB,
+) -> pl.DataFrame:
+    """
+    Add `expected_mb` (expected on-disk MB) to every manifest row.
+
+    Args:
+        manifest: Manifest with event_id, symbol, session
+        history: Catalog rows (event_id, symbol, trades_bytes, quotes_bytes) of completed events
+        min_events: Minimum history size per group
+        default_mb: Fallback when there is no history at all
+    """
+    if len(history) == 0:
+        return manifest.with_columns(pl.lit(default_mb).alias("expected_mb"))
+
+    # Session is not in the catalog: take it from the manifest (event IDs are shared)
+    hist = (
+        history.select([
+            "event_id",
+            "symbol",
+            ((pl.col("trades_bytes") + pl.col("quotes_bytes")) / 1024 / 1024).alias("mb"),
+        ])
+        .join(manifest.select(["event_id", "session"]), on="event_id", how="left")
+    )
+
+    def _level(keys, name):
+        return (
+            hist.group_by(keys)
+            .agg([pl.col("mb").mean().alias(name), pl.len().alias(f"{name}_n")])
+            .filter(pl.col(f"{name}_n") >= min_events)
+            .drop(f"{name}_n")
+        )
+
+    global_mb = hist.get_column("mb").median()
+
+    return (
+        manifest
+        .join(_level(["symbol", "session"], "mb_sym_sess"), on=["symbol", "session"], how="left")
+        .join(_level(["symbol"], "mb_sym"), on="symbol", how="left")
+        .join(_level(["session"], "mb_sess"), on="session", how="left")
+        .with_columns(
+            pl.coalesce([
+                pl.col("mb_sym_sess"), pl.col("mb_sym"), pl.col("mb_sess"),
+                pl.lit(global_mb if global_mb is not None else default_mb),
+            ]).alias("expected_mb")
+        )
+        .drop(["mb_sym_sess", "mb_sym", "mb_sess"])
+    )
+
+
+def schedule_events(
+    manifest: pl.DataFrame,
+    tiers: int = 10,
+    priority_col: Optional[str] = None,
+    cost_col: str = "expected_mb",
+) -> pl.DataFrame:
+    """
+    Order the manifest for download: priority tier (best first), then large/small interleaved.
+
+    Args:
+        manifest: Manifest with the cost column (see expected_event_mb / CostModel.predict)
+                  and a priority column
+        tiers: Number of priority buckets (1 = pure large/small interleaving)
+        priority_col: Priority column (default: `priority` if present, else `score`)
+        cost_col: Expected cost used for the large/small interleaving
+
+    Returns:
+        Manifest sorted in download order, with `tier` (0 = most valuable) and `sched_pos`
+    """
+    if len(manifest) == 0:
+        return manifest.with_columns([pl.lit(0).alias("tier"), pl.lit(0).alias("sched_pos")])
+
+    if priority_col is None:
+        priority_col = "priority" if "priority" in manifest.columns else "score"
+
+    n = pl.len().over("tier")
+    r = pl.col(cost_col).rank("ordinal").over("tier") - 1
+
+    return (
+        manifest
+        .sort(priority_col, descending=True, nulls_last=True)  # ties in cost → best first
+        .with_columns(
+            ((pl.col(priority_col).rank("ordinal", descending=True) - 1) * tiers // pl.len())
+            .alias("tier")
+        )
+        # Within a tier: largest, smallest, 2nd largest, 2nd smallest, ...
+        .with_columns(
+            pl.when(r >= n / 2)
+            .then(2 * (n - 1 - r))
+            .otherwise(2 * r + 1)
+            .alias("sched_pos")
+        )
+        .sort(["tier", "sched_pos"])
+    )
@@ -0,0 +1,470 @@
+"""
+Event-Window Catalog
+
+Single SQLite table describing every event window in raw/market_data/event_windows (FASE 3.2).
+
+The trades/quotes downloader updates one row per event transactionally as each kind is
+finalized, so status, verification and prefilter tools can query the catalog instead of
+walking hundreds of thousands of `symbol=*/event=*` directories.
+
+Table `event_windows`:
+    event_id     TEXT PK   canonical event ID (same as `event=<id>` directory)
+    symbol       TEXT
+    kinds        TEXT      kinds actually written, comma-separated ("quotes,trades")
+    trades_rows  INTEGER   NULL = not downloaded, 0 = window had no trades
+    quotes_rows  INTEGER
+    trades_bytes INTEGER
+    quotes_bytes INTEGER
+    status       TEXT      complete | partial | failed, as judged by the writer's expected kinds;
+                           readers check completeness against the kinds they need instead
+                           (complete_clause / completed_ids / summary / symbol_counts)
+    written_at   TEXT      ISO timestamp of the last update
+    trim_policy  TEXT      JSON {kind: policy} when the byte budget trimmed a kind (NULL = untrimmed)
+    tape_speed   REAL      core-window activity metrics (window_activity.py), symbol history
+    spread_bps   REAL        for the dynamic-extension percentile triggers
+    vol_spike    REAL
+    window_before_s  INTEGER  window actually downloaded around the event (after extension)
+    window_after_s   INTEGER
+    extended     TEXT      extension triggers that fired, comma-separated ('' = not extended)
+    trades_elapsed_s REAL  download wall time of each kind (cost model, cost_model.py)
+    quotes_elapsed_s REAL
+    session      TEXT      event context from the manifest (cost model groups / volume term)
+    event_type   TEXT
+    requested_before_s INTEGER  manifest window (window_before_min / window_after_min), before
+    requested_after_s  INTEGER    extension: the cost model's window feature
+    daily_volume REAL      dollar_volume_day of the event
+
+Usage:
+    # One-time bootstrap from an existing tree (the only full walk)
+    python scripts/utils/event_catalog.py --rebuild
+
+    # Summary
+    python scripts/utils/event_catalog.py --summary
+"""
+
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import polars as pl
+from loguru import logger
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+DEFAULT_ROOT = PROJECT_ROOT / "raw" / "market_data" / "event_windows"
+CATALOG_NAME = "_catalog.sqlite"
+
+KINDS = ("trades", "quotes")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS event_windows (
+    event_id     TEXT PRIMARY KEY,
+    symbol       TEXT NOT NULL,
+    kinds        TEXT NOT NULL DEFAULT '',
+    trades_rows  INTEGER,
+    quotes_rows  INTEGER,
+    trades_bytes INTEGER NOT NULL DEFAULT 0,
+    quotes_bytes INTEGER NOT NULL DEFAULT 0,
+    status       TEXT NOT NULL,
+    written_at   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_event_windows_symbol ON event_windows(symbol);
+CREATE INDEX IF NOT EXISTS idx_event_windows_status ON event_windows(status);
+"""
+
+# Columns added after the first release: (name, SQL type), applied with ALTER TABLE on open
+MIGRATIONS = [
+    ("trim_policy", "TEXT"),
+    ("tape_speed", "REAL"),
+    ("spread_bps", "REAL"),
+    ("vol_spike", "REAL"),
+    ("window_before_s", "INTEGER"),
+    ("window_after_s", "INTEGER"),
+    ("extended", "TEXT"),
+    ("trades_elapsed_s", "REAL"),
+    ("quotes_elapsed_s", "REAL"),
+    ("session", "TEXT"),
+    ("event_type", "TEXT"),
+    ("daily_volume", "REAL"),
+    ("requested_before_s", "INTEGER"),
+    ("requested_after_s", "INTEGER"),
+]
+
+
+def catalog_path(root: Path = DEFAULT_ROOT) -> Path:
+    """Catalog file location for an event_windows tree"""
+    return Path(root) / CATALOG_NAME
+
+
+class EventCatalog:
+    """Transactional event-window catalog (thread-safe, multi-process safe via SQLite locking)"""
+
+    def __init__(self, db_path: Path, expected_kinds: Iterable[str] = KINDS):
+        self.db_path = Path(db_path)
+        self.expected_kinds = tuple(expected_kinds)
+        self.lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.conn = sqlite3.connect(str(self.db_path), timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self.conn.commit()
+
+    def _migrate(self):
+        """Add columns missing from catalogs created by older versions"""
+        present = {r[1] for r in self.conn.execute("PRAGMA table_info(event_windows)")}
+        for name, sql_type in MIGRATIONS:
+            if name not in present:
+                self.conn.execute(f"ALTER TABLE event_windows ADD COLUMN {name} {sql_type}")
+
+    @classmethod
+    def for_root(cls, root: Path = DEFAULT_ROOT, **kwargs) -> "EventCatalog":
+        """Open the catalog that lives inside an event_windows tree"""
+        return cls(catalog_path(root), **kwargs)
+
+    # ----------------------------- writes ---------------------------------
+
+    def upsert_kind(
+        self,
+        event_id: str,
+        symbol: str,
+        kind: str,
+        rows: int,
+        nbytes: int = 0,
+        trim: Optional[dict] = None,
+        elapsed_s: Optional[float] = None,
+    ):
+        """
+        Record that `kind` of `event_id` was written (rows=0 → window empty, still present).
+
+        Status becomes 'complete' once every expected kind is present. `trim` is the byte-budget
+        trim policy applied to this kind, if any; `elapsed_s` its download wall time.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {KINDS}")
+
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT kinds, trim_policy FROM event_windows WHERE event_id = ?", (event_id,)
+            ).fetchone()
+            present = set(filter(None, row[0].split(","))) if row else set()
+            present.add(kind)
+            status = "complete" if all(k in present for k in self.expected_kinds) else "partial"
+
+            policies = json.loads(row[1]) if row and row[1] else {}
+            if trim:
+                policies[kind] = trim
+            else:
+                policies.pop(kind, None)
+            trim_json = json.dumps(policies, sort_keys=True) if policies else None
+
+            self.conn.execute(
+                f"""
+                INSERT INTO event_windows (event_id, symbol, kinds, {kind}_rows, {kind}_bytes, status, written_at,
+                                           trim_policy, {kind}_elapsed_s)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(event_id) DO UPDATE SET
+                    kinds = excluded.kinds,
+                    {kind}_rows = excluded.{kind}_rows,
+                    {kind}_bytes = excluded.{kind}_bytes,
+                    status = excluded.status,
+                    written_at = excluded.written_at,
+                    trim_policy = excluded.trim_policy,
+                    {kind}_elapsed_s = COALESCE(excluded.{kind}_elapsed_s, event_windows.{kind}_elapsed_s)
+                """,
+                (event_id, symbol, ",".join(sorted(present)), int(rows), int(nbytes), status, now, trim_json,
+                 float(elapsed_s) if elapsed_s is not None else None),
+            )
+
+    def mark_failed(self, event_id: str, symbol: str):
+        """Flag an event as failed (keeps any kinds already present)"""
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO event_windows (event_id, symbol, status, written_at)
+                VALUES (?, ?, 'failed', ?)
+                ON CONFLICT(event_id) DO UPDATE SET
+                    status = CASE WHEN event_windows.status = 'complete' THEN 'complete' ELSE 'failed' END,
+                    written_at = excluded.written_at
+                """,
+                (event_id, symbol, now),
+            )
+
+    def record_activity(self, event_id: str, symbol: str, metrics: dict, window: dict):
+        """
+        Store the core-window activity metrics and the final window of an event.
+
+        Args:
+            metrics: {"tape_speed", "spread_bps", "vol_spike"} (None = not measured)
+            window: {"before_s", "after_s", "triggers"}
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        params = (
+            event_id, symbol, now,
+            metrics.get("tape_speed"), metrics.get("spread_bps"), metrics.get("vol_spike"),
+            int(window["before_s"]), int(window["after_s"]), ",".join(window.get("triggers", [])),
+        )
+        with self.lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO event_windows (event_id, symbol, status, written_at, tape_speed, spread_bps,
+                                           vol_spike, window_before_s, window_after_s, extended)
+                VALUES (?, ?, 'partial', ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(event_id) DO UPDATE SET
+                    tape_speed = excluded.tape_speed,
+                    spread_bps = excluded.spread_bps,
+                    vol_spike = excluded.vol_spike,
+                    window_before_s = excluded.window_before_s,
+                    window_after_s = excluded.window_after_s,
+                    extended = excluded.extended
+                """,
+                params,
+            )
+
+    def record_context(
+        self,
+        event_id: str,
+        symbol: str,
+        session: Optional[str],
+        event_type: Optional[str],
+        daily_volume: Optional[float],
+        window: dict,
+        requested: Optional[dict] = None,
+    ):
+        """
+        Store the manifest context of an event and its final window (cost-model features).
+
+        Args:
+            window: {"before_s", "after_s"} actually downloaded
+            requested: {"before_s", "after_s"} of the manifest row (defaults to `window`)
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        requested = requested or window
+        params = (
+            event_id, symbol, now, session, event_type,
+            float(daily_volume) if daily_volume is not None else None,
+            int(window["before_s"]), int(window["after_s"]),
+            int(requested["before_s"]), int(requested["after_s"]),
+        )
+        with self.lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO event_windows (event_id, symbol, status, written_at, session, event_type,
+                                           daily_volume, window_before_s, window_after_s,
+                                           requested_before_s, requested_after_s)
+                VALUES (?, ?, 'partial', ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(event_id) DO UPDATE SET
+                    session = excluded.session,
+                    event_type = excluded.event_type,
+                    daily_volume = excluded.daily_volume,
+                    window_before_s = excluded.window_before_s,
+                    window_after_s = excluded.window_after_s,
+                    requested_before_s = excluded.requested_before_s,
+                    requested_after_s = excluded.requested_after_s
+                """,
+                params,
+            )
+
+    # ----------------------------- reads ----------------------------------
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM event_windows").fetchone()[0]
+
+    def complete_clause(self, kinds: Optional[Iterable[str]] = None) -> str:
+        """SQL condition: every kind in `kinds` written (default: expected kinds), whatever `status` says"""
+        kinds = tuple(kinds or self.expected_kinds)
+        unknown = [k for k in kinds if k not in KINDS]
+        if unknown:
+            raise ValueError(f"kinds must be in {KINDS}, got {unknown}")
+        return "(" + (" AND ".join(f"{k}_rows IS NOT NULL" for k in kinds) or "1") + ")"
+
+    def completed_ids(self, kinds: Optional[Iterable[str]] = None) -> Set[str]:
+        """Event IDs with every kind in `kinds` present (default: expected kinds)"""
+        where = self.complete_clause(kinds)
+        with self.lock:
+            cur = self.conn.execute(f"SELECT event_id FROM event_windows WHERE {where}")
+            return {r[0] for r in cur}
+
+    def completed_frame(self, kinds: Optional[Iterable[str]] = None) -> pl.DataFrame:
+        """completed_ids as a one-column DataFrame (anti-join prefilter of large manifests)"""
+        where = self.complete_clause(kinds)
+        with self.lock:
+            rows = self.conn.execute(f"SELECT event_id FROM event_windows WHERE {where}").fetchall()
+        return pl.DataFrame(rows, schema={"event_id": pl.Utf8}, orient="row")
+
+    def to_polars(self, where: str = "1", params: tuple = ()) -> pl.DataFrame:
+        """Catalog rows as a Polars DataFrame (optionally filtered with a SQL WHERE clause)"""
+        schema = {
+            "event_id": pl.Utf8, "symbol": pl.Utf8, "kinds": pl.Utf8,
+            "trades_rows": pl.Int64, "quotes_rows": pl.Int64,
+            "trades_bytes": pl.Int64, "quotes_bytes": pl.Int64,
+            "status": pl.Utf8, "written_at": pl.Utf8, "trim_policy": pl.Utf8,
+            "tape_speed": pl.Float64, "spread_bps": pl.Float64, "vol_spike": pl.Float64,
+            "window_before_s": pl.Int64, "window_after_s": pl.Int64, "extended": pl.Utf8,
+            "trades_elapsed_s": pl.Float64, "quotes_elapsed_s": pl.Float64,
+            "session": pl.Utf8, "event_type": pl.Utf8, "daily_volume": pl.Float64,
+            "requested_before_s": pl.Int64, "requested_after_s": pl.Int64,
+        }
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(schema)} FROM event_windows WHERE {where}", params
+            ).fetchall()
+        return pl.DataFrame(rows, schema=schema, orient="row")
+
+    def expected_rows(self) -> Dict[Tuple[str, str], int]:
+        """{(event_id, kind): rows} of every recorded kind (cross-check for footer validation)"""
+        with self.lock:
+            rows = self.conn.execute("SELECT event_id, trades_rows, quotes_rows FROM event_windows").fetchall()
+        out = {}
+        for event_id, trades_rows, quotes_rows in rows:
+            if trades_rows is not None:
+                out[(event_id, "trades")] = trades_rows
+            if quotes_rows is not None:
+                out[(event_id, "quotes")] = quotes_rows
+        return out
+
+    def extension(self, event_id: str) -> Optional[dict]:
+        """
+        Window decided by the dynamic extension of an earlier attempt (record_activity), so a
+        resume extends its missing kinds the same way; None if no decision was recorded.
+
+        Returns:
+            {"before_s", "after_s", "triggers"} (triggers empty = not extended)
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT window_before_s, window_after_s, extended FROM event_windows WHERE event_id = ?",
+                (event_id,),
+            ).fetchone()
+        if row is None or row[2] is None:
+            return None
+        return {"before_s": row[0], "after_s": row[1], "triggers": [t for t in row[2].split(",") if t]}
+
+    def symbol_activity(self, symbol: str) -> pl.DataFrame:
+        """Activity metrics of a symbol's previously downloaded events (dynamic-extension history)"""
+        schema = {"tape_speed": pl.Float64, "spread_bps": pl.Float64, "vol_spike": pl.Float64}
+        with self.lock:
+            rows = self.conn.execute(
+                """
+                SELECT tape_speed, spread_bps, vol_spike FROM event_windows
+                WHERE symbol = ? AND (tape_speed IS NOT NULL OR spread_bps IS NOT NULL)
+                """,
+                (symbol,),
+            ).fetchall()
+        return pl.DataFrame(rows, schema=schema, orient="row")
+
+    def summary(self, kinds: Optional[Iterable[str]] = None) -> dict:
+        """Aggregate counts and sizes (complete = every kind in `kinds` written, default: expected kinds)"""
+        done = self.complete_clause(kinds)
+        with self.lock:
+            r = self.conn.execute(
+                f"""
+                SELECT COUNT(*),
+                       COUNT(DISTINCT symbol),
+                       SUM(trades_rows IS NOT NULL),
+                       SUM(quotes_rows IS NOT NULL),
+                       SUM({done}),
+                       SUM(NOT {done} AND status != 'failed'),
+                       SUM(NOT {done} AND status = 'failed'),
+                       COALESCE(SUM(trades_bytes), 0),
+                       COALESCE(SUM(quotes_bytes), 0),
+                       SUM(trim_policy IS NOT NULL),
+                       SUM(COALESCE(extended, '') != ''),
+                       MAX(written_at)
+                FROM event_windows
+                """
+            ).fetchone()
+        keys = ["events", "symbols", "with_trades", "with_quotes", "complete", "partial",
+                "failed", "trades_bytes", "quotes_bytes", "trimmed", "extended", "last_written"]
+        out = dict(zip(keys, r))
+        for k in keys[:-1]:
+            out[k] = out[k] or 0
+        return out
+
+    def symbol_counts(self, kinds: Optional[Iterable[str]] = None) -> pl.DataFrame:
+        """Per-symbol event counts (events, complete, with_trades, with_quotes); complete as in summary()"""
+        kinds = tuple(kinds or self.expected_kinds)
+        return self.to_polars().group_by("symbol").agg([
+            pl.len().alias("events"),
+            pl.all_horizontal([pl.col(f"{k}_rows").is_not_null() for k in kinds]).sum().alias("complete"),
+            pl.col("trades_rows").is_not_null().sum().alias("with_trades"),
+            pl.col("quotes_rows").is_not_null().sum().alias("with_quotes"),
+        ]).sort("symbol")
+
+    # ----------------------------- bootstrap ------------------------------
+
+    def rebuild_from_disk(self, root: Path = DEFAULT_ROOT) -> int:
+        """
+        Populate the catalog from an existing tree (one full walk; row counts from parquet footers).
+        Files whose footer or sidecar checksum does not validate are left out (re-downloaded on resume).
+
+        Returns:
+            Number of event directories cataloged
+        """
+        from scripts.utils.parquet_validation import validate_parquet
+
+        root = Path(root)
+        if not root.exists():
+            return 0
+
+        n = 0
+        for symbol_dir in root.glob("symbol=*"):
+            if not symbol_dir.is_dir():
+                continue
+            symbol = symbol_dir.name.replace("symbol=", "")
+            for event_dir in symbol_dir.glob("event=*"):
+                event_id = event_dir.name.replace("event=", "")
+                for kind in KINDS:
+                    f = event_dir / f"{kind}.parquet"
+                    if not f.exists():
+                        continue
+                    check = validate_parquet(f)
+                    if not check["ok"]:
+                        logger.warning(f"Invalid file ({check['reason']}), skipping: {f}")
+                        continue
+                    self.upsert_kind(event_id, symbol, kind, check["rows"], f.stat().st_size)
+                n += 1
+                if n % 10000 == 0:
+                    logger.info(f"Catalog rebuild: {n:,} event directories")
+
+        logger.info(f"Catalog rebuilt from disk: {n:,} event directories ({self.db_path})")
+        return n
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event-window catalog maintenance")
+    parser.add_argument("--root", type=str, default=str(DEFAULT_ROOT), help="event_windows directory")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild catalog from disk (full walk)")
+    parser.add_argument("--summary", action="store_true", help="Print catalog summary")
+    args = parser.parse_args()
+
+    catalog = EventCatalog.for_root(Path(args.root))
+    if args.rebuild:
+        catalog.rebuild_from_disk(Path(args.root))
+
+    s = catalog.summary()
+    print(f"Catalog: {catalog.db_path}")
+    print(f"  Events: {s['events']:,} ({s['symbols']:,} symbols)")
+    print(f"  Complete: {s['complete']:,} | Partial: {s['partial']:,} | Failed: {s['failed']:,}")
+    print(f"  Trades: {s['trades_bytes']/1024**3:.2f} GB | Quotes: {s['quotes_bytes']/1024**3:.2f} GB")
+    print(f"  Trimmed by byte budget: {s['trimmed']:,} | Dynamically extended: {s['extended']:,}")
+    print(f"  Last written: {s['last_written']}")
+    catalog.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
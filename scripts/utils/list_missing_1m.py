@@ -1,20 +1,26 @@
 """
 List symbols that are missing 1-minute bar data.
 
-This script compares a universe file (e.g., top_2000_by_events) against
-available 1m bar data and creates a parquet file with symbols that need
-to be downloaded.
+This script compares a universe file (e.g., top_2000_by_events) against the
+1m coverage index (bars/_coverage/1m.jsonl, maintained by the writers) and
+creates a parquet file with symbols that need to be downloaded. With --from /
+--to, symbols with partial coverage (missing trading sessions in the range) are
+listed too, with the number of requests needed to fill their gaps.
 
 Usage:
     python scripts/utils/list_missing_1m.py \
         --universe processed/rankings/top_2000_by_events_20251009.parquet \
         --bars-dir raw/market_data/bars/1m \
         --out processed/reference/symbols_missing_1m.parquet
+
+    # Also partial coverage over a date range
+    python scripts/utils/list_missing_1m.py ... --from 2022-10-01 --to 2025-10-01
 """
 
 import argparse
 from pathlib import Path
 import polars as pl
+from datetime import date
 from typing import Set
 import sys
 
@@ -22,6 +28,8 @@ import sys
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 sys.path.insert(0, str(PROJECT_ROOT))
 
+from scripts.utils.coverage_index import CoverageIndex, GapPlanner, TradingCalendar
+
 
 def load_universe_symbols(universe_path: Path) -> Set[str]:
     """
@@ -41,34 +49,38 @@ def load_universe_symbols(universe_path: Path) -> Set[str]:
     return set(df["symbol"].to_list())
 
 
-def scan_1m_directory(bars_dir: Path) -> Set[str]:
+def load_coverage_index(bars_dir: Path) -> CoverageIndex:
     """
-    Scan the 1m bars directory and return set of symbols with data.
+    Coverage index of the 1m bars (bars/_coverage/ next to bars_dir, maintained by the writers).
 
-    Args:
-        bars_dir: Path to raw/market_data/bars/1m directory
+    Bootstrapped from bars_dir once if it does not exist yet.
+    """
+    index = CoverageIndex(bars_dir.parent / "_coverage")
+    if not index.has_log(bars_dir.name):
+        if not bars_dir.exists():
+            print(f"[WARNING] Directory not found: {bars_dir}")
+            return index
+        print(f"[INFO] No coverage index for {bars_dir.name}, bootstrapping from {bars_dir}")
+        index.bootstrap(bars_dir.name, bars_dir)
+    return index
+
+
+def find_gaps(index: CoverageIndex, variant: str, symbols: Set[str], from_date: str, to_date: str,
+              raw_dir: Path) -> pl.DataFrame:
+    """
+    Symbols with missing trading sessions in [from_date, to_date] and the requests to fill them.
 
     Returns:
-        Set of symbol strings that have at least one parquet file
+        DataFrame with symbol, missing_sessions, requests (only symbols with gaps)
     """
-    symbols = set()
-
-    if not bars_dir.exists():
-        print(f"[WARNING] Directory not found: {bars_dir}")
-        return symbols
-
-    # Scan for partitioned directories (format: symbol=SYMBOL/)
-    for symbol_dir in bars_dir.iterdir():
-        if symbol_dir.is_dir() and symbol_dir.name.startswith("symbol="):
-            # Extract symbol name
-            symbol = symbol_dir.name.replace("symbol=", "")
-
-            # Verify it has at least one parquet file
-            parquet_files = list(symbol_dir.glob("*.parquet"))
-            if parquet_files:
-                symbols.add(symbol)
-
-    return symbols
+    planner = GapPlanner(index, TradingCalendar.from_store(raw_dir))
+    rows = []
+    for symbol in sorted(symbols):
+        missing = planner.missing_sessions(variant, symbol, from_date, to_date)
+        if missing:
+            rows.append({"symbol": symbol, "missing_sessions": len(missing),
+                         "requests": len(planner.plan_symbol(variant, symbol, from_date, to_date))})
+    return pl.DataFrame(rows, schema={"symbol": pl.Utf8, "missing_sessions": pl.Int64, "requests": pl.Int64})
 
 
 def create_missing_symbol_list(missing_symbols: Set[str], output_path: Path) -> None:
@@ -117,6 +129,19 @@ def main():
         help="Output parquet file path (e.g., processed/reference/symbols_missing_1m.parquet)"
     )
 
+    parser.add_argument(
+        "--from",
+        dest="from_date",
+        type=str,
+        help="Start of the desired coverage YYYY-MM-DD (enables gap listing)"
+    )
+    parser.add_argument(
+        "--to",
+        dest="to_date",
+        type=str,
+        help="End of the desired coverage YYYY-MM-DD (default: today)"
+    )
+
     args = parser.parse_args()
 
     # Convert to absolute paths
@@ -128,14 +153,23 @@ def main():
     universe_symbols = load_universe_symbols(universe_path)
     print(f"   Universe size: {len(universe_symbols)} symbols")
 
-    print(f"\n[INFO] Scanning 1m bars directory: {bars_dir}")
-    available_symbols = scan_1m_directory(bars_dir)
+    print(f"\n[INFO] Reading 1m coverage index for: {bars_dir}")
+    index = load_coverage_index(bars_dir)
+    available_symbols = index.symbols(bars_dir.name)
     print(f"   Available symbols: {len(available_symbols)}")
 
     # Calculate missing
     missing_symbols = universe_symbols - available_symbols
     print(f"\n[INFO] Missing symbols: {len(missing_symbols)}")
 
+    if args.from_date:
+        to_date = args.to_date or date.today().isoformat()
+        gaps = find_gaps(index, bars_dir.name, universe_symbols & available_symbols, args.from_date, to_date,
+                         bars_dir.parents[2])
+        print(f"[INFO] Partially covered symbols ({args.from_date} -> {to_date}): {gaps.height} "
+              f"({gaps['missing_sessions'].sum()} sessions, {gaps['requests'].sum()} requests)")
+        missing_symbols |= set(gaps["symbol"].to_list())
+
     if not missing_symbols:
         print("[OK] All symbols in universe have 1m data available!")
         # Create empty file anyway for consistency
@@ -1,8 +1,8 @@
 """
 List symbols that have 1-minute bar data available.
 
-This script scans the bars/1m directory and creates a parquet file with
-symbols that have at least one file with 1m bar data.
+This script reads the 1m coverage index (bars/_coverage/1m.jsonl, maintained by
+the writers) and creates a parquet file with symbols that have 1m bar data.
 
 Usage:
     python scripts/utils/list_symbols_with_1m_data.py \
@@ -20,35 +20,31 @@ import sys
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 sys.path.insert(0, str(PROJECT_ROOT))
 
+from scripts.utils.coverage_index import CoverageIndex
 
-def scan_1m_directory(bars_dir: Path) -> Set[str]:
+
+def symbols_with_coverage(bars_dir: Path) -> Set[str]:
     """
-    Scan the 1m bars directory and return set of symbols with data.
+    Symbols with 1m bars according to the coverage index (no per-symbol directory scan).
+
+    The index lives in bars/_coverage/ next to bars_dir and is maintained by the writers; if it
+    does not exist yet it is bootstrapped from bars_dir once.
 
     Args:
         bars_dir: Path to raw/market_data/bars/1m directory
 
     Returns:
-        Set of symbol strings that have at least one parquet file
+        Set of symbol strings with at least one covered date range
     """
-    symbols = set()
-
     if not bars_dir.exists():
         print(f"[ERROR] Directory not found: {bars_dir}")
-        return symbols
-
-    # Scan for partitioned directories (format: symbol=SYMBOL/)
-    for symbol_dir in bars_dir.iterdir():
-        if symbol_dir.is_dir() and symbol_dir.name.startswith("symbol="):
-            # Extract symbol name
-            symbol = symbol_dir.name.replace("symbol=", "")
-
-            # Verify it has at least one parquet file
-            parquet_files = list(symbol_dir.glob("*.parquet"))
-            if parquet_files:
-                symbols.add(symbol)
+        return set()
 
-    return symbols
+    index = CoverageIndex(bars_dir.parent / "_coverage")
+    if not index.has_log(bars_dir.name):
+        print(f"[INFO] No coverage index for {bars_dir.name}, bootstrapping from {bars_dir}")
+        index.bootstrap(bars_dir.name, bars_dir)
+    return index.symbols(bars_dir.name)
 
 
 def create_symbol_list(symbols: Set[str], output_path: Path) -> None:
@@ -97,10 +93,10 @@ def main():
     bars_dir = PROJECT_ROOT / args.bars_dir
     output_path = PROJECT_ROOT / args.out
 
-    print(f"[INFO] Scanning 1m bars directory: {bars_dir}")
+    print(f"[INFO] Reading 1m coverage index for: {bars_dir}")
 
-    # Scan directory
-    symbols = scan_1m_directory(bars_dir)
+    # Coverage index (bootstrapped from the directory on first use)
+    symbols = symbols_with_coverage(bars_dir)
 
     if not symbols:
         print("[ERROR] No symbols with 1m data found")
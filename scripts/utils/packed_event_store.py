@@ -0,0 +1,324 @@
+"""
+Packed Event Store
+
+Packed per-(symbol, month) Parquet layout for event-window trades/quotes (FASE 3.2).
+
+The legacy layout writes one `symbol=S/event=ID/{trades,quotes}.parquet` pair per event, which
+grows to millions of small files (one footer each). The packed layout appends event windows
+into a few files per symbol and month instead:
+
+    {root}/{kind}/symbol={S}/month={YYYY-MM}/part-{id}.parquet   # one row group per event
+    {root}/_index.sqlite                                          # event_id → (file, row group)
+
+Every row carries an `event_id` column. Part files are written through a temp name and only
+become visible (and indexed) once closed, so a crash never leaves a truncated footer; events in
+a part that was still open are simply not indexed and get downloaded again. Parts are rotated
+after `max_events_per_part` events to bound that loss.
+
+Usage:
+    >>> store = PackedEventStore(Path("raw/market_data/event_windows/packed"))
+    >>> store.append("AAPL", event_id, event_ts_utc, "trades", df_trades)
+    >>> store.close()                                   # commits open parts
+    >>> df = store.read_event(event_id, "trades")       # single row-group read
+
+    # Pack an existing legacy tree
+    python scripts/utils/packed_event_store.py --pack-legacy
+"""
+
+import os
+import re
+import sys
+import uuid
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loguru import logger
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_LEGACY_ROOT = PROJECT_ROOT / "raw" / "market_data" / "event_windows"
+DEFAULT_ROOT = DEFAULT_LEGACY_ROOT / "packed"
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS packed_index (
+    event_id   TEXT NOT NULL,
+    kind       TEXT NOT NULL,
+    symbol     TEXT NOT NULL,
+    month      TEXT NOT NULL,
+    file       TEXT NOT NULL,
+    row_group  INTEGER NOT NULL,
+    rows       INTEGER NOT NULL,
+    bytes      INTEGER NOT NULL,
+    written_at TEXT NOT NULL,
+    PRIMARY KEY (event_id, kind)
+);
+CREATE INDEX IF NOT EXISTS idx_packed_symbol_month ON packed_index(symbol, month);
+"""
+
+# Canonical event ID: {symbol}_{event_type}_{YYYYMMDD_HHMMSS}_{hash8}
+_EVENT_DATE_RE = re.compile(r"_(\d{4})(\d{2})\d{2}_\d{6}_[0-9a-f]{8}$")
+
+
+def month_of_event_id(event_id: str) -> Optional[str]:
+    """YYYY-MM parsed from a canonical event ID (None if it does not match)"""
+    m = _EVENT_DATE_RE.search(event_id)
+    return f"{m.group(1)}-{m.group(2)}" if m else None
+
+
+class _OpenPart:
+    """One part file being written (temp path until committed)"""
+
+    def __init__(self, final_path: Path, schema: pa.Schema, compression: str):
+        self.final_path = final_path
+        self.tmp_path = final_path.with_suffix(final_path.suffix + f".tmp.{uuid.uuid4().hex[:8]}")
+        final_path.parent.mkdir(parents=True, exist_ok=True)
+        self.writer = pq.ParquetWriter(str(self.tmp_path), schema, compression=compression)
+        self.schema = schema
+        self.entries: List[Tuple[str, int, Optional[dict]]] = []  # (event_id, row_group, meta)
+
+    def write(self, event_id: str, table: pa.Table, meta: Optional[dict] = None):
+        self.writer.write_table(table, row_group_size=max(table.num_rows, 1))
+        self.entries.append((event_id, len(self.entries), meta))
+
+
+class PackedEventStore:
+    """Append-only packed store with an (event_id → file, row group) index (thread-safe)"""
+
+    def __init__(
+        self,
+        root: Path = DEFAULT_ROOT,
+        compression: str = "zstd",
+        max_events_per_part: int = 200,
+        max_open_parts: int = 64,
+        on_commit: Optional[Callable[[List[dict]], None]] = None,
+    ):
+        """
+        Args:
+            root: Store root directory
+            compression: Parquet compression codec
+            max_events_per_part: Rotate (commit) a part after this many events
+            max_open_parts: Max simultaneously open parts (least recently used is committed)
+            on_commit: Callback receiving the index entries of each committed part
+        """
+        self.root = Path(root)
+        self.compression = compression
+        self.max_events_per_part = max_events_per_part
+        self.max_open_parts = max_open_parts
+        self.on_commit = on_commit
+        self.lock = threading.RLock()
+        self._open: "OrderedDict[Tuple[str, str, str], _OpenPart]" = OrderedDict()
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.root / "_index.sqlite"), timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(INDEX_SCHEMA)
+        self.conn.commit()
+
+    # ----------------------------- writes ---------------------------------
+
+    def append(
+        self,
+        symbol: str,
+        event_id: str,
+        event_ts: datetime,
+        kind: str,
+        df: pl.DataFrame,
+        meta: Optional[dict] = None,
+    ):
+        """
+        Append one event window as a new row group of the (kind, symbol, month) part.
+
+        `meta` (e.g. the byte-budget trim policy) is not stored; it is handed back with the
+        event's index entry to on_commit.
+        """
+        if len(df) == 0:
+            return
+
+        month = event_ts.strftime("%Y-%m")
+        table = df.with_columns(pl.lit(event_id).alias("event_id")).to_arrow()
+        key = (kind, symbol, month)
+
+        with self.lock:
+            part = self._open.get(key)
+            if part is not None and not part.schema.equals(table.schema):
+                # Schema drift between events (e.g. a field missing from every page) → new part
+                self._commit(key)
+                part = None
+
+            if part is None:
+                part_name = f"part-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+                final_path = self.root / kind / f"symbol={symbol}" / f"month={month}" / part_name
+                part = _OpenPart(final_path, table.schema, self.compression)
+                self._open[key] = part
+                while len(self._open) > self.max_open_parts:
+                    self._commit(next(iter(self._open)))
+
+            part.write(event_id, table, meta)
+            self._open.move_to_end(key)
+
+            if len(part.entries) >= self.max_events_per_part:
+                self._commit(key)
+
+    def _commit(self, key: Tuple[str, str, str]):
+        """Close a part, publish it with an atomic rename and index its row groups"""
+        part = self._open.pop(key)
+        kind, symbol, month = key
+        part.writer.close()
+
+        os.replace(str(part.tmp_path), str(part.final_path))
+        meta = pq.read_metadata(part.final_path)
+        rel_file = part.final_path.relative_to(self.root).as_posix()
+        now = datetime.now().isoformat(timespec="seconds")
+
+        entries = []
+        for event_id, rg, event_meta in part.entries:
+            rg_meta = meta.row_group(rg)
+            nbytes = sum(rg_meta.column(i).total_compressed_size for i in range(rg_meta.num_columns))
+            entries.append({
+                "event_id": event_id, "kind": kind, "symbol": symbol, "month": month,
+                "file": rel_file, "row_group": rg, "rows": rg_meta.num_rows,
+                "bytes": nbytes, "written_at": now, "meta": event_meta,
+            })
+
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT OR REPLACE INTO packed_index
+                    (event_id, kind, symbol, month, file, row_group, rows, bytes, written_at)
+                VALUES (:event_id, :kind, :symbol, :month, :file, :row_group, :rows, :bytes, :written_at)
+                """,
+                entries,
+            )
+
+        logger.debug(f"Packed part committed: {rel_file} ({len(entries)} events)")
+        if self.on_commit is not None:
+            self.on_commit(entries)
+
+    def flush(self):
+        """Commit every open part"""
+        with self.lock:
+            for key in list(self._open):
+                self._commit(key)
+
+    def close(self):
+        """Commit open parts and close the index"""
+        self.flush()
+        with self.lock:
+            self.conn.close()
+
+    # ----------------------------- reads ----------------------------------
+
+    def locate(self, event_id: str, kind: str) -> Optional[dict]:
+        """Index entry for (event_id, kind), or None"""
+        with self.lock:
+            r = self.conn.execute(
+                "SELECT file, row_group, rows, bytes FROM packed_index WHERE event_id = ? AND kind = ?",
+                (event_id, kind),
+            ).fetchone()
+        if r is None:
+            return None
+        return {"file": r[0], "row_group": r[1], "rows": r[2], "bytes": r[3]}
+
+    def read_event(self, event_id: str, kind: str, columns: Optional[List[str]] = None) -> Optional[pl.DataFrame]:
+        """Return one event's tape with a single row-group read (None if not stored)"""
+        loc = self.locate(event_id, kind)
+        if loc is None:
+            return None
+        pf = pq.ParquetFile(str(self.root / loc["file"]))
+        return pl.from_arrow(pf.read_row_group(loc["row_group"], columns=columns))
+
+    def index(self, symbol: Optional[str] = None) -> pl.DataFrame:
+        """Index as a DataFrame (optionally for one symbol)"""
+        where, params = ("WHERE symbol = ?", (symbol,)) if symbol else ("", ())
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT event_id, kind, symbol, month, file, row_group, rows, bytes FROM packed_index {where}",
+                params,
+            ).fetchall()
+        return pl.DataFrame(
+            rows,
+            schema={
+                "event_id": pl.Utf8, "kind": pl.Utf8, "symbol": pl.Utf8, "month": pl.Utf8,
+                "file": pl.Utf8, "row_group": pl.Int64, "rows": pl.Int64, "bytes": pl.Int64,
+            },
+            orient="row",
+        )
+
+    # ----------------------------- migration ------------------------------
+
+    def pack_legacy_tree(self, legacy_root: Path = DEFAULT_LEGACY_ROOT, delete: bool = False) -> int:
+        """
+        Pack an existing `symbol=S/event=ID/{kind}.parquet` tree into this store.
+
+        Args:
+            legacy_root: Legacy event_windows directory
+            delete: Remove legacy files once their part is committed
+
+        Returns:
+            Number of event directories packed
+        """
+        packed = 0
+        done: List[Path] = []
+
+        for symbol_dir in sorted(Path(legacy_root).glob("symbol=*")):
+            symbol = symbol_dir.name.replace("symbol=", "")
+            for event_dir in sorted(symbol_dir.glob("event=*")):
+                event_id = event_dir.name.replace("event=", "")
+                month = month_of_event_id(event_id)
+                if month is None:
+                    logger.warning(f"Cannot parse month from event ID, skipping: {event_id}")
+                    continue
+                event_ts = datetime.strptime(month, "%Y-%m")
+
+                for kind in ("trades", "quotes"):
+                    f = event_dir / f"{kind}.parquet"
+                    if f.exists() and self.locate(event_id, kind) is None:
+                        self.append(symbol, event_id, event_ts, kind, pl.read_parquet(f))
+                        done.append(f)
+                packed += 1
+
+            # Commit per symbol so deleted legacy files are always already indexed
+            self.flush()
+            if delete:
+                for f in done:
+                    f.unlink(missing_ok=True)
+                    try:
+                        f.parent.rmdir()
+                    except OSError:
+                        pass
+            done.clear()
+            logger.info(f"Packed {symbol}: {packed:,} events so far")
+
+        return packed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Packed event-window store maintenance")
+    parser.add_argument("--root", type=str, default=str(DEFAULT_ROOT), help="Packed store root")
+    parser.add_argument("--pack-legacy", action="store_true", help="Pack the legacy symbol=/event= tree")
+    parser.add_argument("--legacy-root", type=str, default=str(DEFAULT_LEGACY_ROOT), help="Legacy tree root")
+    parser.add_argument("--delete-legacy", action="store_true", help="Delete legacy files after packing")
+    args = parser.parse_args()
+
+    store = PackedEventStore(Path(args.root))
+    if args.pack_legacy:
+        n = store.pack_legacy_tree(Path(args.legacy_root), delete=args.delete_legacy)
+        logger.info(f"Packed {n:,} legacy event directories into {store.root}")
+
+    idx = store.index()
+    print(f"Packed store: {store.root}")
+    print(f"  Indexed windows: {len(idx):,} ({idx['event_id'].n_unique() if len(idx) else 0:,} events)")
+    print(f"  Part files: {idx['file'].n_unique() if len(idx) else 0:,}")
+    print(f"  Size: {(idx['bytes'].sum() if len(idx) else 0)/1024**3:.2f} GB")
+    store.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
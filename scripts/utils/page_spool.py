@@ -0,0 +1,220 @@
+"""
+Page Spool (resumable pagination)
+
+Page-level persistence for long /v3/trades and /v3/quotes downloads, so a page that fails
+mid-pagination (or a killed process) does not restart the window from page one.
+
+After every page the downloader commits:
+- the rows kept since the previous commit, as an Arrow IPC segment
+- the next_url cursor (apiKey stripped), page count, downsampler and byte-budget state
+- the 1-second bars aggregated so far (if enabled)
+into `<output_dir>/_spool/<event_id>/<kind>_<part>/`. `state.json` is the commit point:
+it is replaced atomically after the segment files are written and lists the files that
+belong to the committed state (anything else in the directory is a leftover of a crash).
+
+The next attempt for the same request (same ticker, kind, range, limit and sampling) loads
+the committed segments and continues from the cursor; a different request discards the spool.
+The spool is removed once the kind has been persisted and recorded as complete.
+
+Usage:
+    >>> spool = PageSpool(output_dir / "_spool" / event_id / "quotes_core", request)
+    >>> state = spool.load()                    # None → start from page 1
+    >>> spool.commit(frames, pages=3, next_url=cursor, got_results=True)
+    >>> spool.discard()                         # after the file is written and recorded
+"""
+
+import os
+import json
+import shutil
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import polars as pl
+from loguru import logger
+
+STATE_FILE = "state.json"
+
+
+class PageSpool:
+    """Committed pages of one paginated (event, kind, part) download (one writer at a time)"""
+
+    def __init__(self, directory: Path, request: Dict, compression: str = "lz4"):
+        """
+        Args:
+            directory: Spool directory of this (event, kind, part)
+            request: Request signature; a spool written for a different signature is discarded
+            compression: Arrow IPC compression of the segments (lz4, zstd or uncompressed)
+        """
+        self.dir = Path(directory)
+        self.request = json.loads(json.dumps(request, default=str))
+        self.compression = compression
+        self._seq = 0
+        self._segments: List[str] = []
+        self._spooled = 0          # frames of the caller's list already in a segment
+        self._rewrite = False      # caller replaced its frames (budget trim): respool everything
+
+    # ----------------------------- files ----------------------------------
+
+    def _write_frame(self, df: pl.DataFrame, name: str) -> str:
+        tmp = self.dir / f"{name}.tmp"
+        df.write_ipc(tmp, compression=self.compression)
+        os.replace(str(tmp), str(self.dir / name))
+        return name
+
+    def _next_name(self, tag: str) -> str:
+        self._seq += 1
+        return f"{self._seq:06d}_{tag}.arrow"
+
+    def _cleanup(self, keep: List[str]):
+        keep = set(keep) | {STATE_FILE}
+        for f in self.dir.iterdir():
+            if f.name not in keep:
+                f.unlink(missing_ok=True)
+
+    # ----------------------------- public API -----------------------------
+
+    def load(self) -> Optional[Dict]:
+        """
+        Committed state of a previous attempt for the same request.
+
+        Returns:
+            None (start from page 1), or dict with pages, next_url, got_results, complete,
+            frames (kept rows, in order), sampler / sampler_frames, budget state and bars
+        """
+        try:
+            with open(self.dir / STATE_FILE) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError:
+            self.discard()
+            return None
+
+        if state.get("request") != self.request:
+            logger.info(f"Spool {self.dir.parent.name}/{self.dir.name}: request changed, starting over")
+            self.discard()
+            return None
+
+        try:
+            frames = [pl.read_ipc(self.dir / name) for name in state["segments"]]
+            sampler_frames = {k: pl.read_ipc(self.dir / name)
+                              for k, name in state.get("sampler_frames", {}).items()}
+            bars = pl.read_ipc(self.dir / state["bars"]) if state.get("bars") else None
+        except Exception as e:
+            logger.warning(f"Spool {self.dir}: unreadable segment ({e}), starting over")
+            self.discard()
+            return None
+
+        self._seq = state["seq"]
+        self._segments = list(state["segments"])
+        self._spooled = len(frames)
+        return {
+            "pages": state["pages"],
+            "next_url": state["next_url"],
+            "got_results": state["got_results"],
+            "complete": state["complete"],
+            "frames": frames,
+            "sampler": state.get("sampler"),
+            "sampler_frames": sampler_frames,
+            "budget": state.get("budget"),
+            "bars": bars,
+        }
+
+    def rewrite(self):
+        """The caller's frame list was replaced (re-sampled / trimmed): next commit respools it"""
+        self._rewrite = True
+
+    def commit(
+        self,
+        frames: List[pl.DataFrame],
+        pages: int,
+        next_url: Optional[str],
+        got_results: bool,
+        complete: bool = False,
+        sampler: Optional[Dict] = None,
+        sampler_frames: Optional[Dict[str, pl.DataFrame]] = None,
+        budget: Optional[Dict] = None,
+        bars: Optional[pl.DataFrame] = None,
+    ):
+        """
+        Persist the state after a page (the caller's full frame list; only new frames are written).
+
+        Args:
+            frames: Every kept frame so far (same list object across commits, or rewrite() first)
+            pages: Pages downloaded
+            next_url: Cursor of the next page (apiKey stripped), None when pagination finished
+            got_results: At least one page had results
+            complete: Pagination finished (frames are the final rows)
+            sampler, sampler_frames: Downsampler state (JSON part and its small frames)
+            budget: Byte-budget state
+            bars: Partial 1-second bars so far (rewritten on every commit; one row per second)
+        """
+        self.dir.mkdir(parents=True, exist_ok=True)
+        if self._rewrite:
+            segments, start = [], 0
+            self._rewrite = False
+        else:
+            segments, start = list(self._segments), self._spooled
+
+        for df in frames[start:]:
+            if len(df) > 0:
+                segments.append(self._write_frame(df, self._next_name("rows")))
+        written_sampler = {k: self._write_frame(df, self._next_name(k))
+                           for k, df in (sampler_frames or {}).items() if df is not None}
+        written_bars = self._write_frame(bars, self._next_name("bars")) if bars is not None else None
+
+        state = {
+            "request": self.request,
+            "pages": pages,
+            "next_url": next_url,
+            "got_results": got_results,
+            "complete": complete,
+            "seq": self._seq,
+            "segments": segments,
+            "sampler": sampler,
+            "sampler_frames": written_sampler,
+            "budget": budget,
+            "bars": written_bars,
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        tmp = self.dir / f"{STATE_FILE}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(str(tmp), str(self.dir / STATE_FILE))
+
+        self._cleanup(segments + list(written_sampler.values()) + ([written_bars] if written_bars else []))
+        self._segments = segments
+        self._spooled = len(frames)
+
+    def discard(self):
+        """Remove the spool (kind persisted and recorded, or request changed)"""
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self._seq, self._segments, self._spooled, self._rewrite = 0, [], 0, False
+        try:
+            self.dir.parent.rmdir()  # event directory, if this was its last part
+        except OSError:
+            pass
+
+
+def discard_kind(spool_root: Path, event_id: str, kind: str):
+    """Remove every part (core / extension ranges) spooled for one (event, kind)"""
+    event_dir = Path(spool_root) / event_id
+    for part_dir in event_dir.glob(f"{kind}_*"):
+        shutil.rmtree(part_dir, ignore_errors=True)
+    try:
+        event_dir.rmdir()
+    except OSError:
+        pass
+
+
+def spooled_pages(spool_root: Path, event_id: str) -> int:
+    """Pages committed for one event across its kinds and parts (0 if nothing is spooled)"""
+    pages = 0
+    for state_file in (Path(spool_root) / event_id).glob(f"*/{STATE_FILE}"):
+        try:
+            with open(state_file) as f:
+                pages += json.load(f)["pages"]
+        except (OSError, ValueError, KeyError):
+            continue
+    return pages
@@ -0,0 +1,258 @@
+"""
+Footer-Only Parquet Validation
+
+Completeness and integrity checks for downloaded Parquet files that read only the footer
+(a few KB per file) instead of the data pages, so resuming or auditing a 1 TB tree takes
+minutes instead of hours.
+
+Checks (quick mode, footer + sidecar only):
+- footer parses, file ends with PAR1 magic
+- row count, required columns, min/max timestamp from column statistics
+- sidecar `<file>.chk` written by the downloader right after the atomic rename:
+  size, rows and CRC32 of the footer bytes must match (catches truncated / replaced /
+  rewritten files), the file must be marked complete (pagination finished), and the
+  timestamp range must fall inside the recorded window
+Deep mode additionally recomputes the SHA-1 of the whole file against the sidecar.
+
+Files without a sidecar (written before sidecars existed) pass on footer checks alone and
+are reported with sidecar=False.
+
+Usage:
+    >>> write_sidecar(path, sha1=file_sha1(path), complete=True, window=window)
+    >>> check = validate_parquet(path, required_columns=("timestamp",))
+    >>> check["ok"], check["rows"], check["reason"]
+
+    # Whole event_windows tree (parallel, footer-only)
+    >>> df = validate_tree(root, expected_rows={(event_id, "trades"): 1234})
+"""
+
+import os
+import json
+import zlib
+import struct
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+import polars as pl
+
+SIDECAR_SUFFIX = ".chk"
+MAGIC = b"PAR1"
+
+# Statistics column used for the time range, in order of preference
+TS_COLUMNS = ("timestamp_ns", "timestamp")
+
+# Slack on the window check (exchange vs SIP clocks at the window edges)
+WINDOW_TOLERANCE_NS = 5_000_000_000
+
+
+def sidecar_path(path: Path) -> Path:
+    return Path(path).with_name(Path(path).name + SIDECAR_SUFFIX)
+
+
+def footer_crc(path: Path) -> Tuple[int, int]:
+    """(CRC32 of the Thrift footer, footer length) — reads only the file tail"""
+    with open(path, "rb") as f:
+        f.seek(-8, os.SEEK_END)
+        tail = f.read(8)
+        if tail[4:] != MAGIC:
+            raise ValueError("missing PAR1 magic (truncated file)")
+        footer_len = struct.unpack("<I", tail[:4])[0]
+        f.seek(-(8 + footer_len), os.SEEK_END)
+        return zlib.crc32(f.read(footer_len)), footer_len
+
+
+# Parquet timestamp unit → ns multiplier (raw INT64 statistics; plain Int64 columns are already ns)
+_NS_PER_UNIT = {"nanoseconds": 1, "microseconds": 1_000, "milliseconds": 1_000_000}
+
+
+def footer_info(path: Path) -> Dict:
+    """
+    Footer metadata of a Parquet file (no data pages read).
+
+    Returns:
+        Dict with rows, row_groups, columns, ts_min_ns, ts_max_ns (None if no statistics)
+    """
+    import pyarrow.parquet as pq
+
+    md = pq.read_metadata(path)
+    leaves = [md.schema.column(i).path for i in range(md.num_columns)]
+    info = {"rows": md.num_rows, "row_groups": md.num_row_groups,
+            "columns": md.schema.to_arrow_schema().names, "ts_min_ns": None, "ts_max_ns": None}
+
+    ts_col = next((c for c in TS_COLUMNS if c in leaves), None)
+    if ts_col is None or md.num_rows == 0:
+        return info
+
+    idx = leaves.index(ts_col)
+    column = md.schema.column(idx)
+    if column.physical_type != "INT64":
+        return info
+    logical = json.loads(column.logical_type.to_json())
+    scale = _NS_PER_UNIT.get(logical.get("timeUnit"), 1)
+
+    mins, maxs = [], []
+    for rg in range(md.num_row_groups):
+        stats = md.row_group(rg).column(idx).statistics
+        if stats is None or not stats.has_min_max:
+            return info  # partial statistics: range unknown
+        mins.append(stats.min_raw * scale)
+        maxs.append(stats.max_raw * scale)
+    info["ts_min_ns"], info["ts_max_ns"] = min(mins), max(maxs)
+    return info
+
+
+def write_sidecar(
+    path: Path,
+    sha1: Optional[str] = None,
+    complete: bool = True,
+    window: Optional[Dict] = None,
+) -> Dict:
+    """
+    Write `<file>.chk` for a just-finalized Parquet file (atomic).
+
+    Args:
+        path: Parquet file (already renamed into place)
+        sha1: Full-file SHA-1 (deep checks); None = footer checks only
+        complete: Pagination finished (False = partial download kept for inspection)
+        window: {"gte_ns", "lte_ns"} actually downloaded (range check)
+    """
+    path = Path(path)
+    crc, footer_len = footer_crc(path)
+    sidecar = {
+        "size": path.stat().st_size,
+        "rows": footer_info(path)["rows"],
+        "footer_crc32": crc,
+        "footer_len": footer_len,
+        "sha1": sha1,
+        "complete": bool(complete),
+        "window": {k: window[k] for k in ("gte_ns", "lte_ns") if k in window} if window else None,
+        "written_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    out = sidecar_path(path)
+    tmp = out.with_name(out.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(sidecar, f)
+    os.replace(str(tmp), str(out))
+    return sidecar
+
+
+def read_sidecar(path: Path) -> Optional[Dict]:
+    try:
+        with open(sidecar_path(path)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def validate_parquet(
+    path: Path,
+    expected_rows: Optional[int] = None,
+    required_columns: Iterable[str] = (),
+    deep: bool = False,
+) -> Dict:
+    """
+    Validate one Parquet file from its footer (+ sidecar).
+
+    Args:
+        path: Parquet file
+        expected_rows: Row count recorded elsewhere (catalog / WAL), None = not checked
+        required_columns: Columns that must be present
+        deep: Also recompute the full-file SHA-1 against the sidecar
+
+    Returns:
+        Dict with ok, reason (None if ok), rows, ts_min_ns, ts_max_ns, sidecar (bool)
+    """
+    path = Path(path)
+    result = {"path": str(path), "ok": False, "reason": None, "rows": None,
+              "ts_min_ns": None, "ts_max_ns": None, "sidecar": False}
+
+    try:
+        size = path.stat().st_size
+        crc, _ = footer_crc(path)
+        info = footer_info(path)
+    except FileNotFoundError:
+        result["reason"] = "missing"
+        return result
+    except Exception as e:
+        result["reason"] = f"corrupt footer: {e}"
+        return result
+
+    result.update(rows=info["rows"], ts_min_ns=info["ts_min_ns"], ts_max_ns=info["ts_max_ns"])
+
+    missing = [c for c in required_columns if c not in info["columns"]]
+    if missing:
+        result["reason"] = f"missing columns {missing}"
+        return result
+    if expected_rows is not None and info["rows"] != expected_rows:
+        result["reason"] = f"rows {info['rows']} != expected {expected_rows}"
+        return result
+
+    sidecar = read_sidecar(path)
+    if sidecar is not None:
+        result["sidecar"] = True
+        if not sidecar.get("complete", True):
+            result["reason"] = "incomplete download (sidecar)"
+            return result
+        if sidecar["size"] != size or sidecar["footer_crc32"] != crc or sidecar["rows"] != info["rows"]:
+            result["reason"] = "sidecar mismatch (file changed or truncated)"
+            return result
+
+        window = sidecar.get("window")
+        if window and info["ts_min_ns"] is not None:
+            if (info["ts_min_ns"] < window["gte_ns"] - WINDOW_TOLERANCE_NS
+                    or info["ts_max_ns"] > window["lte_ns"] + WINDOW_TOLERANCE_NS):
+                result["reason"] = "timestamps outside recorded window"
+                return result
+
+        if deep and sidecar.get("sha1"):
+            from scripts.utils.progress_wal import file_sha1
+            if file_sha1(path) != sidecar["sha1"]:
+                result["reason"] = "sha1 mismatch"
+                return result
+
+    result["ok"] = True
+    return result
+
+
+def validate_tree(
+    root: Path,
+    expected_rows: Optional[Dict[Tuple[str, str], int]] = None,
+    kinds: Iterable[str] = ("trades", "quotes"),
+    deep: bool = False,
+    workers: int = 16,
+) -> pl.DataFrame:
+    """
+    Validate every `symbol=*/event=*/{kind}.parquet` of an event_windows tree (footer-only).
+
+    Args:
+        root: event_windows directory
+        expected_rows: {(event_id, kind): rows} from the catalog (row counts cross-checked)
+        kinds: File kinds to check
+        deep: Full SHA-1 check (reads every byte; use for spot audits)
+        workers: Parallel footer reads (I/O bound)
+
+    Returns:
+        One row per file: symbol, event_id, kind, ok, reason, rows, ts_min_ns, ts_max_ns, sidecar
+    """
+    root = Path(root)
+    expected_rows = expected_rows or {}
+    targets = [
+        (f, f.parent.parent.name.replace("symbol=", ""), f.parent.name.replace("event=", ""), kind)
+        for kind in kinds
+        for f in root.glob(f"symbol=*/event=*/{kind}.parquet")
+    ]
+
+    def check(target):
+        f, symbol, event_id, kind = target
+        r = validate_parquet(f, expected_rows.get((event_id, kind)), deep=deep)
+        return {"symbol": symbol, "event_id": event_id, "kind": kind, **r}
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        rows = list(ex.map(check, targets))
+
+    schema = {"symbol": pl.Utf8, "event_id": pl.Utf8, "kind": pl.Utf8, "path": pl.Utf8, "ok": pl.Boolean,
+              "reason": pl.Utf8, "rows": pl.Int64, "ts_min_ns": pl.Int64, "ts_max_ns": pl.Int64,
+              "sidecar": pl.Boolean}
+    return pl.DataFrame(rows, schema=schema)
@@ -0,0 +1,118 @@
+"""
+Bulk Partition Writer
+
+Single-pass, concurrent Parquet writer for partitioned bar downloads (ingest_polygon
+save_aggregates, download_all, download_event_windows).
+
+- Split: the frame is sorted once and split with `partition_by` (one pass, no per-key filter
+  over the full frame), so cost scales with rows instead of symbols x dates x rows
+- Paths: a template over the partition keys, e.g. "symbol={symbol}/date={date}.parquet"
+- Write: partitions are written by a thread pool (Parquet encoding releases the GIL), each to
+  a temp name in the target directory and published with os.replace, so readers never see a
+  truncated file and a crash leaves at most a `.tmp` leftover
+
+Config (ingestion.write_workers): threads per bulk write (default 8).
+
+Usage:
+    >>> writer = PartitionWriter.from_config(cfg)
+    >>> writer.write_partitioned(df, base_path, ["symbol", "date"], "symbol={symbol}/date={date}.parquet",
+    ...                          sort_by=["timestamp"])
+    >>> writer.write_many([(path_a, df_a), (path_b, df_b)])
+"""
+
+import os
+import uuid
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import polars as pl
+from loguru import logger
+
+
+def write_parquet_atomic(df: pl.DataFrame, path: Path, compression: str = "zstd") -> int:
+    """Write through a temp file in the same directory and rename into place; returns bytes written"""
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        df.write_parquet(tmp, compression=compression)
+        os.replace(str(tmp), str(path))
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return path.stat().st_size
+
+
+class PartitionWriter:
+    """Writes many Parquet partitions concurrently with atomic renames (stateless, thread-safe)"""
+
+    def __init__(self, max_workers: int = 8, compression: str = "zstd"):
+        """
+        Args:
+            max_workers: Partitions written in parallel
+            compression: Parquet compression codec
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.compression = compression
+
+    @classmethod
+    def from_config(cls, cfg: Dict) -> "PartitionWriter":
+        """Writer from ingestion.write_workers"""
+        return cls(max_workers=int(cfg.get("ingestion", {}).get("write_workers", 8)))
+
+    def write_many(self, items: Iterable[Tuple[Path, pl.DataFrame]]) -> Dict:
+        """
+        Write (path, frame) pairs concurrently.
+
+        Returns:
+            Dict with files, rows, bytes written
+        """
+        items = [(Path(p), df) for p, df in items]
+        if not items:
+            return {"files": 0, "rows": 0, "bytes": 0}
+
+        for parent in {p.parent for p, _ in items}:
+            parent.mkdir(parents=True, exist_ok=True)
+
+        if len(items) == 1 or self.max_workers == 1:
+            sizes = [write_parquet_atomic(df, p, self.compression) for p, df in items]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as ex:
+                sizes = list(ex.map(lambda item: write_parquet_atomic(item[1], item[0], self.compression), items))
+
+        return {"files": len(items), "rows": sum(df.height for _, df in items), "bytes": sum(sizes)}
+
+    def write_partitioned(
+        self,
+        df: pl.DataFrame,
+        base_path: Path,
+        by: Sequence[str],
+        template: str,
+        sort_by: Optional[List[str]] = None,
+    ) -> Dict:
+        """
+        Split `df` by the `by` columns in one pass and write every partition.
+
+        Args:
+            df: Frame to write
+            base_path: Root directory of the partitioned dataset
+            by: Partition key columns
+            template: Relative path per partition, formatted with the key values
+                      (e.g. "symbol={symbol}/date={date}.parquet")
+            sort_by: Row order inside each partition (sorted once, before the split)
+
+        Returns:
+            Dict with files, rows, bytes written
+        """
+        if df is None or df.height == 0:
+            return {"files": 0, "rows": 0, "bytes": 0}
+
+        by = list(by)
+        df = df.sort(by + list(sort_by or []))
+        parts = df.partition_by(by, maintain_order=True, as_dict=True)
+
+        base_path = Path(base_path)
+        items = [(base_path / template.format(**dict(zip(by, key))), part) for key, part in parts.items()]
+        stats = self.write_many(items)
+        logger.debug(f"Wrote {stats['rows']:,} rows to {stats['files']:,} partitions under {base_path}")
+        return stats
@@ -0,0 +1,169 @@
+"""
+Progress Write-Ahead Log
+
+Append-only, fsync'd JSONL log of per-event, per-kind download completions (FASE 3.2).
+
+Each line is written the moment a trades/quotes file is finalized:
+    {"event_id": ..., "kind": "trades", "rows": 1234, "bytes": 56789,
+     "sha1": "...", "cursor": "...", "pages": 3, "ts": "2025-10-17T20:14:03"}
+
+On startup the log is replayed into memory without touching any data file, so a
+restart after a crash or reboot resumes exactly where the previous run stopped
+(at most the event in flight is redone). A torn last line from a crash mid-write
+is truncated on open.
+
+Usage:
+    >>> wal = ProgressWAL(Path("logs/checkpoints/fase3.2_all_wal.jsonl"))
+    >>> wal.is_complete(event_id, ["trades", "quotes"])
+    >>> wal.record(event_id, "trades", rows=1234, nbytes=56789, sha1=file_sha1(path))
+"""
+
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set
+
+from loguru import logger
+
+
+def file_sha1(path: Path, chunk_size: int = 1 << 20) -> str:
+    """Streaming SHA-1 of a file (hex)"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ProgressWAL:
+    """Per-event, per-kind completion log (thread-safe)"""
+
+    def __init__(self, wal_file: Path, fsync: bool = True):
+        self.wal_file = Path(wal_file)
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.records: Dict[str, Dict[str, dict]] = {}
+        self._fh = None
+        self._replay()
+
+    def _replay(self):
+        """Load all records into memory, truncating a torn trailing line"""
+        self.wal_file.parent.mkdir(parents=True, exist_ok=True)
+        if not self.wal_file.exists():
+            logger.info(f"No WAL found, starting fresh: {self.wal_file}")
+            return
+
+        with open(self.wal_file, "rb") as f:
+            raw = f.read()
+
+        # Crash mid-write leaves a line without '\n' → drop it
+        end = raw.rfind(b"\n") + 1
+        if end < len(raw):
+            logger.warning(f"WAL: truncating torn trailing record ({len(raw) - end} bytes)")
+            with open(self.wal_file, "r+b") as f:
+                f.truncate(end)
+            raw = raw[:end]
+
+        bad = 0
+        for line in raw.splitlines():
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+                self.records.setdefault(rec["event_id"], {})[rec["kind"]] = rec
+            except (ValueError, KeyError):
+                bad += 1
+
+        if bad:
+            logger.warning(f"WAL: skipped {bad} unreadable records")
+        logger.info(f"Replayed WAL: {len(self.records):,} events ({self.wal_file.name})")
+
+    def _handle(self):
+        if self._fh is None:
+            self._fh = open(self.wal_file, "a", encoding="utf-8")
+        return self._fh
+
+    def record(
+        self,
+        event_id: str,
+        kind: str,
+        rows: int,
+        nbytes: int = 0,
+        sha1: Optional[str] = None,
+        cursor: Optional[str] = None,
+        **extra
+    ) -> dict:
+        """
+        Durably record that `kind` ('trades'/'quotes') of `event_id` is complete.
+
+        Args:
+            rows: Rows written (0 = window had no data, nothing written but still complete)
+            nbytes: File size in bytes
+            sha1: File hash (hex)
+            cursor: Last pagination cursor followed (apiKey stripped)
+            **extra: Additional fields stored verbatim (e.g. pages, trim policy)
+        """
+        rec = {
+            "event_id": event_id,
+            "kind": kind,
+            "rows": int(rows),
+            "bytes": int(nbytes),
+            "sha1": sha1,
+            "cursor": cursor,
+            **extra,
+            "ts": datetime.now().isoformat(timespec="seconds"),
+        }
+        line = json.dumps(rec, separators=(",", ":"), default=str) + "\n"
+
+        with self.lock:
+            fh = self._handle()
+            fh.write(line)
+            fh.flush()
+            if self.fsync:
+                os.fsync(fh.fileno())
+            self.records.setdefault(event_id, {})[kind] = rec
+
+        return rec
+
+    def get(self, event_id: str, kind: str) -> Optional[dict]:
+        """Completion record for (event_id, kind), or None"""
+        with self.lock:
+            return self.records.get(event_id, {}).get(kind)
+
+    def is_complete(self, event_id: str, kinds: Iterable[str]) -> bool:
+        """True if every kind in `kinds` is recorded for event_id"""
+        with self.lock:
+            done = self.records.get(event_id, {})
+            return all(k in done for k in kinds)
+
+    def completed_events(self, kinds: Iterable[str]) -> Set[str]:
+        """Event IDs with every kind in `kinds` recorded"""
+        kinds = list(kinds)
+        with self.lock:
+            return {eid for eid, done in self.records.items() if all(k in done for k in kinds)}
+
+    def compact(self):
+        """Rewrite the log keeping only the latest record per (event_id, kind)"""
+        with self.lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+            tmp_path = self.wal_file.with_suffix(self.wal_file.suffix + ".compact")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for kinds in self.records.values():
+                    for rec in kinds.values():
+                        f.write(json.dumps(rec, separators=(",", ":"), default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(str(tmp_path), str(self.wal_file))
+
+    def close(self):
+        """Close the log file handle"""
+        with self.lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
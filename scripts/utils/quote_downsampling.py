@@ -0,0 +1,184 @@
+"""
+Quote Downsampling
+
+Vectorized NBBO downsampling for Polygon /v3/quotes tapes (FASE 3.2).
+
+Two reductions, both written as pure Polars expressions:
+- By-change-only: keep a quote only when bid/ask price or size differs from the previous quote
+- Hz bucketing: bucket SIP timestamps by integer division of `timestamp_ns` and keep the last
+  quote of each bucket
+
+`QuoteDownsampler` applies both page by page while paginating, carrying the small amount of
+state needed across page boundaries (previous quote, still-open bucket). Memory and CPU then
+scale with the kept rows instead of the raw rows of the window.
+
+Usage:
+    >>> sampler = QuoteDownsampler(max_rate_hz=5, by_change_only=True)
+    >>> kept = [sampler.push(page_df) for page_df in pages]
+    >>> kept.append(sampler.flush())
+    >>> df = pl.concat(kept, how="diagonal_relaxed")
+"""
+
+from typing import Dict, List, Optional
+
+import polars as pl
+
+# NBBO columns compared by the by-change-only filter (after renaming Polygon fields)
+NBBO_COLUMNS = ["bid_price", "ask_price", "bid_size", "ask_size"]
+
+
+def nbbo_change_mask(columns: List[str]) -> pl.Expr:
+    """
+    Boolean expression: True where any NBBO column differs from the previous row.
+
+    Null-aware (`ne_missing`), so the first row of a frame is always kept.
+    """
+    mask = pl.lit(False)
+    for col in columns:
+        mask = mask | pl.col(col).ne_missing(pl.col(col).shift(1))
+    return mask
+
+
+def bucket_last_mask(hz: float, ts_col: str = "timestamp_ns") -> pl.Expr:
+    """
+    Boolean expression: True for the last row of each 1/hz bucket.
+
+    Buckets are `timestamp_ns // bucket_ns`; rows must be sorted by timestamp (Polygon order=asc).
+    """
+    bucket_ns = max(int(1_000_000_000 / hz), 1)
+    bucket = pl.col(ts_col) // bucket_ns
+    return bucket.ne_missing(bucket.shift(-1))
+
+
+def filter_nbbo_changes(
+    df: pl.DataFrame,
+    previous: Optional[pl.DataFrame] = None,
+    columns: Optional[List[str]] = None,
+) -> pl.DataFrame:
+    """
+    Keep only quotes where the NBBO changed.
+
+    Args:
+        df: Quotes page (sorted by timestamp)
+        previous: Last quote of the previous page (1 row), so the first row of `df`
+                  is compared against it instead of being kept unconditionally
+        columns: NBBO columns to compare (default: NBBO_COLUMNS present in df)
+
+    Returns:
+        Filtered DataFrame (unchanged if fewer than 2 NBBO columns are present)
+    """
+    cols = [c for c in (columns or NBBO_COLUMNS) if c in df.columns]
+    if len(cols) < 2 or len(df) == 0:
+        return df
+
+    if previous is None or len(previous) == 0 or not all(c in previous.columns for c in cols):
+        return df.filter(nbbo_change_mask(cols))
+
+    # Prepend the previous quote, evaluate the mask, drop the prepended row
+    probe = pl.concat([previous.select(cols), df.select(cols)], how="vertical_relaxed")
+    mask = probe.select(nbbo_change_mask(cols).alias("keep")).to_series().slice(1)
+    return df.filter(mask)
+
+
+def downsample_hz(df: pl.DataFrame, hz: float, ts_col: str = "timestamp_ns") -> pl.DataFrame:
+    """Keep the last quote of each 1/hz bucket (whole-frame, non-streaming variant)"""
+    if len(df) == 0 or not hz or ts_col not in df.columns:
+        return df
+    return df.filter(bucket_last_mask(hz, ts_col))
+
+
+class QuoteDownsampler:
+    """
+    Streaming NBBO downsampler (one instance per quotes download).
+
+    State carried between pages:
+    - previous: last raw quote of the previous page (for by-change-only)
+    - pending: last kept quote of the still-open Hz bucket, which the next page may supersede
+    """
+
+    def __init__(
+        self,
+        max_rate_hz: Optional[float] = None,
+        by_change_only: bool = True,
+        ts_col: str = "timestamp_ns",
+    ):
+        self.max_rate_hz = max_rate_hz
+        self.by_change_only = by_change_only
+        self.ts_col = ts_col
+        self.rows_in = 0
+        self.rows_out = 0
+        self._previous: Optional[pl.DataFrame] = None
+        self._pending: Optional[pl.DataFrame] = None
+
+    def push(self, page: pl.DataFrame) -> pl.DataFrame:
+        """Downsample one page; returns the rows that are final (may be empty)"""
+        if len(page) == 0:
+            return page
+
+        self.rows_in += len(page)
+        df = page
+
+        if self.by_change_only:
+            df = filter_nbbo_changes(df, self._previous)
+            self._previous = page.tail(1)
+
+        if self.max_rate_hz and self.ts_col in df.columns:
+            if self._pending is not None:
+                df = pl.concat([self._pending, df], how="diagonal_relaxed")
+                self._pending = None
+            if len(df) == 0:
+                return df
+            df = df.filter(bucket_last_mask(self.max_rate_hz, self.ts_col))
+            # The last bucket may continue on the next page: hold its row back
+            self._pending = df.tail(1)
+            df = df.head(len(df) - 1)
+
+        self.rows_out += len(df)
+        return df
+
+    def coarsen(self, hz: float, emitted: pl.DataFrame) -> pl.DataFrame:
+        """
+        Switch to a coarser Hz mid-stream (byte budget), re-bucketing rows already emitted.
+
+        Args:
+            hz: New max rate
+            emitted: Concatenation of every frame returned by push() so far
+
+        Returns:
+            The emitted rows that remain final at the new rate
+        """
+        self.max_rate_hz = hz
+        df = emitted
+        if self._pending is not None:
+            df = pl.concat([df, self._pending], how="diagonal_relaxed") if len(df) else self._pending
+            self._pending = None
+        self.rows_out -= len(emitted)
+        if len(df) == 0 or self.ts_col not in df.columns:
+            return df
+
+        df = df.filter(bucket_last_mask(hz, self.ts_col))
+        self._pending = df.tail(1)
+        df = df.head(len(df) - 1)
+        self.rows_out += len(df)
+        return df
+
+    def get_state(self) -> tuple:
+        """(JSON-able counters/rate, {"previous", "pending"} frames) for a page spool"""
+        meta = {"max_rate_hz": self.max_rate_hz, "rows_in": self.rows_in, "rows_out": self.rows_out}
+        return meta, {"previous": self._previous, "pending": self._pending}
+
+    def set_state(self, meta: Dict, frames: Dict[str, pl.DataFrame]):
+        """Restore the state saved by get_state (resumed pagination)"""
+        self.max_rate_hz = meta.get("max_rate_hz", self.max_rate_hz)
+        self.rows_in = meta.get("rows_in", 0)
+        self.rows_out = meta.get("rows_out", 0)
+        self._previous = frames.get("previous")
+        self._pending = frames.get("pending")
+
+    def flush(self) -> pl.DataFrame:
+        """Release the held-back row of the last open bucket (call once after the last page)"""
+        if self._pending is None:
+            return pl.DataFrame()
+        df, self._pending = self._pending, None
+        self.rows_out += len(df)
+        return df
@@ -0,0 +1,332 @@
+"""
+Request Metrics and Adaptive Concurrency
+
+In-process HTTP metrics for the Polygon clients and an AIMD controller that tunes how many
+requests run concurrently, instead of hand-picked worker counts.
+
+- RequestMetrics: per-endpoint latency / payload-size histograms and status-code counts
+  (endpoint = URL path with tickers, dates and numbers collapsed, e.g. /v3/trades)
+- ConcurrencyController: gate around each request whose limit moves between min and max workers:
+  * multiplicative decrease when the window's error rate (429 / 5xx / network) or p95 latency
+    (vs. the best p95 seen) climbs
+  * additive increase while the gate is saturated and throughput keeps improving; an increase
+    that does not pay off is reverted (finds "6 beats 12" on its own, day by day)
+
+Config (polygon.autotune): enable, min_workers, max_workers, initial_workers, interval_s,
+min_requests, p95_factor, max_error_rate, decrease_factor.
+
+Usage:
+    >>> metrics = RequestMetrics()
+    >>> controller = ConcurrencyController.from_config(cfg, metrics)
+    >>> with controller.slot():
+    ...     t0 = time.perf_counter(); r = session.get(url)
+    >>> metrics.record(url, time.perf_counter() - t0, len(r.content), r.status_code)
+    >>> metrics.summary()          # per endpoint: count, p50/p95 ms, MB, statuses
+"""
+
+import re
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from loguru import logger
+
+# Histogram bucket upper bounds (last bucket is open)
+LATENCY_BUCKETS_MS = (25, 50, 100, 200, 400, 800, 1600, 3200, 6400, 12800, 30000)
+SIZE_BUCKETS_KB = (1, 4, 16, 64, 256, 1024, 4096, 16384, 65536)
+
+# Samples kept per controller window (p95 of the current window)
+MAX_WINDOW_SAMPLES = 5000
+
+_VARIABLE_SEGMENT = re.compile(r"^[0-9]|[A-Z]")
+
+
+def endpoint_key(url: str) -> str:
+    """URL → endpoint label: variable segments (tickers, dates, numbers) collapsed"""
+    path = urlsplit(url).path if "://" in url else url.split("?")[0]
+    parts = ["*" if _VARIABLE_SEGMENT.search(p) else p for p in path.strip("/").split("/")]
+    while parts and parts[-1] == "*":
+        parts.pop()
+    return "/" + "/".join(parts)
+
+
+def is_error_status(status: int) -> bool:
+    """Statuses that signal overload (0 = network error / timeout)"""
+    return status == 0 or status == 429 or status >= 500
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class _EndpointStats:
+    """Cumulative histograms of one endpoint"""
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.latency_sum = 0.0
+        self.latency_hist = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.size_hist = [0] * (len(SIZE_BUCKETS_KB) + 1)
+        self.status: Dict[int, int] = {}
+
+    def add(self, latency_ms: float, nbytes: int, status: int):
+        self.count += 1
+        self.bytes += nbytes
+        self.latency_sum += latency_ms
+        self.latency_hist[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        self.size_hist[bisect.bisect_left(SIZE_BUCKETS_KB, nbytes / 1024)] += 1
+        self.status[status] = self.status.get(status, 0) + 1
+
+    def latency_pctl(self, q: float) -> Optional[float]:
+        """Histogram percentile (bucket upper bound; open bucket reported as its lower bound)"""
+        if self.count == 0:
+            return None
+        target, seen = q * self.count, 0
+        for i, n in enumerate(self.latency_hist):
+            seen += n
+            if seen >= target:
+                return float(LATENCY_BUCKETS_MS[min(i, len(LATENCY_BUCKETS_MS) - 1)])
+        return float(LATENCY_BUCKETS_MS[-1])
+
+
+class RequestMetrics:
+    """Per-endpoint latency / size / status histograms (thread-safe)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints: Dict[str, _EndpointStats] = {}
+        self.started = time.time()
+        self._reset_window()
+
+    def _reset_window(self):
+        self.window_start = time.time()
+        self.window_latencies: List[float] = []
+        self.window_requests = 0
+        self.window_ok = 0
+        self.window_errors = 0
+
+    def record(self, url: str, latency_s: float, nbytes: int, status: int):
+        """
+        Record one HTTP attempt.
+
+        Args:
+            url: Request URL or path
+            latency_s: Wall time of the request
+            nbytes: Payload size (0 on network error)
+            status: HTTP status (0 = network error / timeout)
+        """
+        latency_ms = latency_s * 1000
+        key = endpoint_key(url)
+        with self.lock:
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = self.endpoints[key] = _EndpointStats()
+            stats.add(latency_ms, nbytes, status)
+
+            self.window_requests += 1
+            if status == 200:
+                self.window_ok += 1
+            elif is_error_status(status):
+                self.window_errors += 1
+            if len(self.window_latencies) < MAX_WINDOW_SAMPLES:
+                self.window_latencies.append(latency_ms)
+
+    def take_window(self) -> Dict:
+        """Stats since the previous call (requests, ok/s, error rate, p95 ms) and reset"""
+        with self.lock:
+            elapsed = max(time.time() - self.window_start, 1e-9)
+            latencies = sorted(self.window_latencies)
+            window = {
+                "seconds": elapsed,
+                "requests": self.window_requests,
+                "ok_per_s": self.window_ok / elapsed,
+                "error_rate": self.window_errors / self.window_requests if self.window_requests else 0.0,
+                "p95_ms": _percentile(latencies, 0.95),
+            }
+            self._reset_window()
+        return window
+
+    def summary(self) -> Dict[str, Dict]:
+        """Per-endpoint cumulative stats (JSON-serializable)"""
+        with self.lock:
+            return {
+                key: {
+                    "requests": s.count,
+                    "mean_ms": round(s.latency_sum / s.count, 1) if s.count else None,
+                    "p50_ms": s.latency_pctl(0.50),
+                    "p95_ms": s.latency_pctl(0.95),
+                    "p99_ms": s.latency_pctl(0.99),
+                    "mb": round(s.bytes / 1024 / 1024, 2),
+                    "status": {str(k): v for k, v in sorted(s.status.items())},
+                    "latency_hist_ms": dict(zip([*map(str, LATENCY_BUCKETS_MS), "inf"], s.latency_hist)),
+                    "size_hist_kb": dict(zip([*map(str, SIZE_BUCKETS_KB), "inf"], s.size_hist)),
+                }
+                for key, s in sorted(self.endpoints.items())
+            }
+
+    def log_summary(self, prefix: str = "  "):
+        """One line per endpoint (heartbeat / final summary)"""
+        for key, s in self.summary().items():
+            errors = sum(v for k, v in s["status"].items() if is_error_status(int(k)))
+            logger.info(f"{prefix}{key}: {s['requests']:,} req | p50 {s['p50_ms']:.0f}ms p95 {s['p95_ms']:.0f}ms | "
+                        f"{s['mb']:.1f} MB | errors {errors / s['requests'] * 100:.1f}% {s['status']}")
+
+
+class ConcurrencyController:
+    """AIMD limit on concurrent requests driven by RequestMetrics windows (thread-safe)"""
+
+    def __init__(
+        self,
+        metrics: RequestMetrics,
+        min_workers: int = 1,
+        max_workers: int = 16,
+        initial_workers: Optional[int] = None,
+        interval_s: float = 30,
+        min_requests: int = 20,
+        p95_factor: float = 2.0,
+        max_error_rate: float = 0.05,
+        decrease_factor: float = 0.7,
+        adaptive: bool = True,
+    ):
+        """
+        Args:
+            metrics: Source of the per-window latency / error stats
+            min_workers, max_workers: Bounds of the limit (and size of the caller's thread pool)
+            initial_workers: Starting limit (default: halfway)
+            interval_s: Seconds between adjustments
+            min_requests: Minimum requests in a window to act on it
+            p95_factor: Back off when window p95 > p95_factor x best p95 seen
+            max_error_rate: Back off when 429/5xx/network errors exceed this share
+            decrease_factor: Multiplicative decrease
+            adaptive: False = fixed limit (metrics still collected)
+        """
+        if not 1 <= min_workers <= max_workers:
+            raise ValueError("need 1 <= min_workers <= max_workers")
+        self.metrics = metrics
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.limit = initial_workers or max(min_workers, (min_workers + max_workers) // 2)
+        self.limit = min(max(self.limit, min_workers), max_workers)
+        self.interval_s = interval_s
+        self.min_requests = min_requests
+        self.p95_factor = p95_factor
+        self.max_error_rate = max_error_rate
+        self.decrease_factor = decrease_factor
+        self.adaptive = adaptive
+
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.last_adjust = time.time()
+        self.best_p95: Optional[float] = None
+        self.prev_ok_per_s: Optional[float] = None
+        self.last_action = "start"
+        self.adjustments = 0
+
+    @classmethod
+    def from_config(
+        cls,
+        cfg: Dict,
+        metrics: RequestMetrics,
+        fixed_workers: Optional[int] = None,
+        max_workers: Optional[int] = None,
+    ) -> "ConcurrencyController":
+        """
+        Controller from polygon.autotune.
+
+        Args:
+            fixed_workers: Explicit worker count (CLI) → fixed limit, no tuning
+            max_workers: Override of autotune.max_workers (e.g. details_max_workers)
+        """
+        tune = cfg.get("polygon", {}).get("autotune", {})
+        if fixed_workers is not None or not tune.get("enable", True):
+            n = fixed_workers or int(max_workers or tune.get("max_workers", 8))
+            return cls(metrics, min_workers=n, max_workers=n, adaptive=False)
+
+        upper = int(max_workers or tune.get("max_workers", 16))
+        lower = min(int(tune.get("min_workers", 1)), upper)
+        return cls(
+            metrics,
+            min_workers=lower,
+            max_workers=upper,
+            initial_workers=min(int(tune.get("initial_workers", 4)), upper),
+            interval_s=float(tune.get("interval_s", 30)),
+            min_requests=int(tune.get("min_requests", 20)),
+            p95_factor=float(tune.get("p95_factor", 2.0)),
+            max_error_rate=float(tune.get("max_error_rate", 0.05)),
+            decrease_factor=float(tune.get("decrease_factor", 0.7)),
+        )
+
+    @contextmanager
+    def slot(self):
+        """Hold one concurrency slot for the duration of a request"""
+        with self.cond:
+            while self.in_flight >= self.limit:
+                self.cond.wait()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.in_flight -= 1
+                if self.adaptive and time.time() - self.last_adjust >= self.interval_s:
+                    self._adjust()
+                self.cond.notify_all()
+
+    def _adjust(self):
+        """One AIMD step from the metrics window (called with self.cond held)"""
+        self.last_adjust = time.time()
+        window = self.metrics.take_window()
+        saturated = self.peak_in_flight >= self.limit
+        self.peak_in_flight = self.in_flight
+        if window["requests"] < self.min_requests:
+            return
+
+        p95 = window["p95_ms"]
+        if p95 is not None and window["error_rate"] == 0:
+            self.best_p95 = p95 if self.best_p95 is None else min(self.best_p95, p95)
+
+        old = self.limit
+        if window["error_rate"] > self.max_error_rate:
+            self.limit = max(self.min_workers, int(self.limit * self.decrease_factor))
+            self.last_action = f"decrease (errors {window['error_rate']:.1%})"
+        elif self.best_p95 and p95 is not None and p95 > self.p95_factor * self.best_p95:
+            self.limit = max(self.min_workers, int(self.limit * self.decrease_factor))
+            self.last_action = f"decrease (p95 {p95:.0f}ms vs best {self.best_p95:.0f}ms)"
+        elif (self.last_action.startswith("increase") and self.prev_ok_per_s is not None
+              and window["ok_per_s"] < self.prev_ok_per_s * 1.02):
+            # Last increase did not buy throughput (rate-limit or server bound) → step back
+            self.limit = max(self.min_workers, self.limit - 1)
+            self.last_action = f"revert ({window['ok_per_s']:.1f} ok/s vs {self.prev_ok_per_s:.1f})"
+        elif saturated and self.limit < self.max_workers:
+            self.limit += 1
+            self.last_action = f"increase ({window['ok_per_s']:.1f} ok/s)"
+        else:
+            self.last_action = "hold"
+
+        self.prev_ok_per_s = window["ok_per_s"]
+        if self.limit != old:
+            self.adjustments += 1
+            logger.info(f"Concurrency {old} → {self.limit}: {self.last_action} | p95 {p95 or 0:.0f}ms | "
+                        f"{window['requests']} req in {window['seconds']:.0f}s")
+
+    def state(self) -> Dict:
+        """Current limit and last decision (heartbeat / status file)"""
+        with self.cond:
+            return {
+                "limit": self.limit,
+                "min": self.min_workers,
+                "max": self.max_workers,
+                "in_flight": self.in_flight,
+                "adaptive": self.adaptive,
+                "last_action": self.last_action,
+                "adjustments": self.adjustments,
+                "best_p95_ms": self.best_p95,
+            }
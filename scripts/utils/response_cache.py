@@ -0,0 +1,258 @@
+"""
+On-Disk HTTP Response Cache
+
+Compressed cache for Polygon responses that can no longer change (historical aggregates,
+news of past days, reference data), so re-running a plan after a crash or a code fix costs
+almost no API calls.
+
+- Key: SHA-256 of the normalized request (host + path + sorted query params, apiKey removed;
+  the host keeps a mirror / the offline mock from sharing entries with the real API);
+  entry = `<dir>/<key[:2]>/<key>.json.gz` with the URL, fetch time, expiry and JSON body
+- Per-endpoint TTL rules (first fnmatch on the route, variable segments as `*`, and on the
+  optional `params` of the rule, e.g. adjusted=false):
+  * ttl_s = -1: immutable, cached forever, but ONLY when the request has an upper date bound
+    before today (US/Eastern); "today" and open-ended ranges (gte without lte) bypass the cache
+  * ttl_s > 0: cached for that many seconds (reference data that changes rarely)
+  * ttl_s = 0: never cached
+  Split-adjusted aggregates are not immutable (Polygon re-adjusts the history after every
+  split), so only adjusted=false is cached forever; adjusted=true (the default when the
+  param is absent) gets a finite TTL
+- Pagination: next_url only carries a cursor, so pages inherit the policy of the first page
+  (recorded when that page is stored or served from the cache)
+
+Config (polygon.response_cache): enable, dir (relative to paths.base_dir), default_ttl_s,
+rules: [{route, params (optional), ttl_s}, ...].
+
+Usage:
+    >>> cache = ResponseCache.from_config(cfg)
+    >>> data = cache.get(url, params)          # None on miss / expired / bypass
+    >>> if data is None:
+    ...     data = session.get(url, params=params).json()
+    ...     cache.put(url, params, data)
+"""
+
+import os
+import re
+import gzip
+import json
+import time
+import hashlib
+import threading
+from fnmatch import fnmatch
+from pathlib import Path
+from datetime import datetime, date, timezone
+from zoneinfo import ZoneInfo
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from loguru import logger
+
+ET = ZoneInfo("America/New_York")
+
+# Query params that are never part of the key
+IGNORED_PARAMS = {"apiKey"}
+
+# Params that bound a range from above / below (Polygon filter suffixes and aggs-style names)
+_UPPER_SUFFIXES = (".lte", ".lt")
+_LOWER_SUFFIXES = (".gte", ".gt")
+_UPPER_KEYS = {"to", "date"}
+_LOWER_KEYS = {"from"}
+
+_DATE_RE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})")
+_VARIABLE_SEGMENT = re.compile(r"^[0-9]|[A-Z]")
+
+
+def _as_date(value) -> Optional[date]:
+    """YYYY-MM-DD[...] or epoch ms / ns → ET date (None if not a date)"""
+    s = str(value)
+    m = _DATE_RE.match(s)
+    if m:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    if s.isdigit() and len(s) in (13, 19):
+        seconds = int(s) / (1e3 if len(s) == 13 else 1e9)
+        return datetime.fromtimestamp(seconds, tz=timezone.utc).astimezone(ET).date()
+    return None
+
+
+def route(path: str) -> str:
+    """Path with variable segments (tickers, dates, numbers) as `*`: /v3/reference/tickers/*"""
+    return "/" + "/".join("*" if _VARIABLE_SEGMENT.search(p) else p for p in path.strip("/").split("/"))
+
+
+def normalize(url: str, params: Optional[Dict] = None) -> Tuple[str, str, List[Tuple[str, str]]]:
+    """(host, path, sorted query params without apiKey) for a full URL or path + params"""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query += [(k, str(v)) for k, v in (params or {}).items() if v is not None]
+    return parts.netloc, parts.path, sorted((k, v) for k, v in query if k not in IGNORED_PARAMS)
+
+
+def _request_id(host: str, path: str, query: List[Tuple[str, str]]) -> str:
+    return host + path + ("?" + urlencode(query) if query else "")
+
+
+def upper_date_bound(path: str, query: List[Tuple[str, str]]) -> Tuple[Optional[date], bool]:
+    """
+    Latest date the request can return data for.
+
+    Returns:
+        (upper bound or None, open_ended): open_ended is True when a lower bound has no upper one
+    """
+    uppers, has_lower = [], False
+    for k, v in query:
+        d = _as_date(v)
+        if d is None:
+            continue
+        if k.endswith(_UPPER_SUFFIXES) or k in _UPPER_KEYS:
+            uppers.append(d)
+        elif k.endswith(_LOWER_SUFFIXES) or k in _LOWER_KEYS:
+            has_lower = True
+
+    # Dates in the path (aggs .../{from}/{to}, grouped .../{date}): the last one is the upper bound
+    path_dates = [d for d in (_as_date(p) for p in path.strip("/").split("/")) if d is not None]
+    if path_dates:
+        uppers.append(path_dates[-1])
+
+    if not uppers:
+        return None, has_lower
+    return max(uppers), False
+
+
+class ResponseCache:
+    """Gzip JSON response cache on disk with per-endpoint TTLs"""
+
+    def __init__(self, cache_dir: Path, rules: Optional[List[Dict]] = None, default_ttl_s: float = 0):
+        """
+        Args:
+            cache_dir: Cache root
+            rules: [{"route": fnmatch pattern, "params": {name: value} (optional),
+                    "ttl_s": -1 | 0 | seconds}], first match wins
+            default_ttl_s: TTL of routes no rule matches
+        """
+        self.cache_dir = Path(cache_dir)
+        self.rules = [(r["route"], {k: str(v).lower() for k, v in (r.get("params") or {}).items()},
+                       float(r["ttl_s"])) for r in (rules or [])]
+        self.default_ttl_s = float(default_ttl_s)
+        self.lock = threading.Lock()
+        # normalized next_url → expiry inherited from its first page (None = never expires)
+        self._inherited: Dict[str, Optional[float]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stored = 0
+
+    @classmethod
+    def from_config(cls, cfg: Dict) -> Optional["ResponseCache"]:
+        """Cache from polygon.response_cache (None if disabled)"""
+        cc = cfg.get("polygon", {}).get("response_cache", {})
+        if not cc.get("enable", False):
+            return None
+        cache_dir = Path(cc.get("dir", "raw/_http_cache"))
+        if not cache_dir.is_absolute():
+            cache_dir = Path(cfg.get("paths", {}).get("base_dir", ".")) / cache_dir
+        return cls(cache_dir, cc.get("rules", []), cc.get("default_ttl_s", 0))
+
+    # ----------------------------- policy ---------------------------------
+
+    def ttl_for(self, path: str, query: Optional[List[Tuple[str, str]]] = None) -> float:
+        r = route(path)
+        values = {k: v.lower() for k, v in (query or [])}
+        for pattern, params, ttl in self.rules:
+            if fnmatch(r, pattern) and all(values.get(k) == v for k, v in params.items()):
+                return ttl
+        return self.default_ttl_s
+
+    def _expiry(self, url: str, params: Optional[Dict]) -> Tuple[bool, Optional[float], str, str]:
+        """(cacheable, expires_at or None = never, key, normalized URL)"""
+        host, path, query = normalize(url, params)
+        norm = _request_id(host, path, query)
+        key = hashlib.sha256(norm.encode()).hexdigest()
+
+        with self.lock:
+            if norm in self._inherited:
+                return True, self._inherited[norm], key, norm
+
+        ttl = self.ttl_for(path, query)
+        if ttl == 0:
+            return False, None, key, norm
+        if ttl > 0:
+            return True, time.time() + ttl, key, norm
+
+        # Immutable class: only closed ranges that end before today
+        upper, open_ended = upper_date_bound(path, query)
+        if open_ended or upper is None or upper >= datetime.now(ET).date():
+            return False, None, key, norm
+        return True, None, key, norm
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json.gz"
+
+    def _inherit(self, data: Dict, expires_at: Optional[float]):
+        nxt = data.get("next_url") if isinstance(data, dict) else None
+        if nxt:
+            with self.lock:
+                self._inherited[_request_id(*normalize(nxt))] = expires_at
+
+    # ----------------------------- public API -----------------------------
+
+    def get(self, url: str, params: Optional[Dict] = None) -> Optional[Dict]:
+        """Cached JSON body, or None (miss, expired, or request not cacheable)"""
+        cacheable, policy_expiry, key, _ = self._expiry(url, params)
+        if not cacheable:
+            with self.lock:
+                self.bypassed += 1
+            return None
+
+        entry_path = self._entry_path(key)
+        try:
+            with gzip.open(entry_path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            entry = None
+        except (OSError, EOFError, json.JSONDecodeError):
+            logger.warning(f"Corrupt cache entry dropped: {entry_path}")
+            entry_path.unlink(missing_ok=True)
+            entry = None
+
+        expires_at = entry["expires_at"] if entry is not None else None
+        if entry is not None and expires_at is None and policy_expiry is not None:
+            # Stored as immutable under an older rule (e.g. adjusted aggs): age it with today's TTL
+            expires_at = entry.get("fetched_at", 0.0) + (policy_expiry - time.time())
+        if entry is None or (expires_at is not None and expires_at < time.time()):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        self._inherit(entry["body"], expires_at)
+        with self.lock:
+            self.hits += 1
+        return entry["body"]
+
+    def put(self, url: str, params: Optional[Dict], data: Dict) -> bool:
+        """Store a successful JSON response if its endpoint/range is cacheable"""
+        cacheable, expires_at, key, norm = self._expiry(url, params)
+        if not cacheable:
+            return False
+
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry_path.with_name(entry_path.name + f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump({"url": norm, "fetched_at": time.time(), "expires_at": expires_at, "body": data}, f)
+        os.replace(str(tmp), str(entry_path))
+
+        self._inherit(data, expires_at)
+        with self.lock:
+            self.stored += 1
+        return True
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "bypassed": self.bypassed,
+                    "stored": self.stored, "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
+
+    def log_stats(self):
+        s = self.stats()
+        logger.info(f"Response cache: {s['hits']:,} hits, {s['misses']:,} misses "
+                    f"({s['hit_rate']:.0%}), {s['bypassed']:,} bypassed, {s['stored']:,} stored")
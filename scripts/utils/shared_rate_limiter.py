@@ -0,0 +1,289 @@
+"""
+Cross-Process Rate Limiter
+
+One Polygon request quota shared by every ingestion process on the machine (ingest_polygon,
+download_all, the trades/quotes downloader, download_event_news, ...), instead of each
+process assuming it owns the whole 300 req/min and the sum triggering 429 storms.
+
+- Token bucket in a small JSON state file, updated under an OS file lock
+  (fcntl on Linux/macOS, msvcrt on Windows): refill rate = quota_per_minute x safety
+- Jobs register in the same file with a weight and a priority:
+  * a waiting job with higher priority goes first
+  * jobs of equal priority share the tokens in proportion to their weights
+    (weighted fair queuing on a per-job virtual time)
+- A 429 seen by any process pauses the whole bucket (penalize), so the others do not
+  keep hammering the API while it is throttling
+- Stale jobs (process gone / silent) drop out of the share automatically
+
+Config (polygon.shared_rate_limit): enable, quota_per_minute, safety, burst, state_file,
+jobs: {job_name: {weight, priority}}.
+
+Usage:
+    >>> limiter = SharedRateLimiter.from_config(cfg, job="trades_quotes")
+    >>> limiter.wait()            # before every request (same API as RateLimiter)
+    >>> limiter.penalize(5)       # after a 429: everyone backs off 5s
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from loguru import logger
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_STATE_FILE = PROJECT_ROOT / "logs" / "ratelimit" / "polygon_bucket.json"
+
+# A job that has not touched the bucket for this long no longer takes part in the share
+STALE_JOB_S = 30.0
+
+# A waiting job that has not polled for this long is not counted as waiting (it polls every <= MAX_POLL_S)
+WAITING_STALE_S = 2.0
+
+# Longest single sleep while waiting (re-checks priorities / newly freed tokens)
+MAX_POLL_S = 0.5
+
+if sys.platform == "win32":
+    import msvcrt
+
+    def _lock(fh):
+        while True:
+            try:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                time.sleep(0.005)
+
+    def _unlock(fh):
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock(fh):
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(fh):
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+class SharedRateLimiter:
+    """File-locked token bucket shared across processes, with per-job weights and priorities"""
+
+    def __init__(
+        self,
+        job: str,
+        quota_per_minute: float = 300,
+        safety: float = 0.95,
+        burst: float = 5,
+        weight: float = 1.0,
+        priority: int = 0,
+        state_file: Path = DEFAULT_STATE_FILE,
+        min_interval_s: float = 0.0,
+    ):
+        """
+        Args:
+            job: Job name (one entry per process in the shared state)
+            quota_per_minute: Account quota shared by all processes
+            safety: Fraction of the quota actually used (headroom for clock skew / other clients)
+            burst: Bucket capacity (tokens)
+            weight: Share among waiting jobs of the same priority
+            priority: Higher goes first while waiting
+            state_file: Shared bucket state (same path for every process)
+            min_interval_s: Optional per-process spacing on top of the shared bucket
+        """
+        self.job_id = f"{job}:{os.getpid()}"
+        self.job = job
+        self.rate_per_s = quota_per_minute * safety / 60.0
+        self.burst = max(1.0, burst)
+        self.weight = max(weight, 1e-6)
+        self.priority = priority
+        self.state_file = Path(state_file)
+        self.min_interval_s = min_interval_s
+        self.lock = threading.Lock()  # threads of this process queue here, processes on the file lock
+        self.last_request_time = 0.0
+        self.waits = 0
+        self.waited_s = 0.0
+
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock_path = self.state_file.with_name(self.state_file.name + ".lock")
+        self._lock_fh = open(self._lock_path, "a+b")
+        if os.path.getsize(self._lock_path) == 0:
+            self._lock_fh.write(b"\0")
+            self._lock_fh.flush()
+
+        logger.info(f"Shared rate limiter: job={job} weight={weight:g} priority={priority} "
+                    f"quota={quota_per_minute * safety:.0f}/min ({self.state_file})")
+
+    @classmethod
+    def from_config(cls, cfg: Dict, job: str, min_interval_s: float = 0.0) -> Optional["SharedRateLimiter"]:
+        """Limiter from polygon.shared_rate_limit (None if disabled → keep the in-process limiter)"""
+        polygon = cfg.get("polygon", {})
+        shared = polygon.get("shared_rate_limit", {})
+        if not shared.get("enable", False):
+            return None
+
+        job_cfg = shared.get("jobs", {}).get(job, {})
+        state_file = Path(shared.get("state_file", DEFAULT_STATE_FILE))
+        if not state_file.is_absolute():
+            state_file = PROJECT_ROOT / state_file
+        return cls(
+            job,
+            quota_per_minute=float(shared.get("quota_per_minute", polygon.get("rate_limit_per_minute", 300))),
+            safety=float(shared.get("safety", 0.95)),
+            burst=float(shared.get("burst", 5)),
+            weight=float(job_cfg.get("weight", 1.0)),
+            priority=int(job_cfg.get("priority", 0)),
+            state_file=state_file,
+            min_interval_s=min_interval_s,
+        )
+
+    # ----------------------------- shared state ---------------------------
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"tokens": self.burst, "refilled_at": time.time(), "paused_until": 0.0, "jobs": {}}
+
+    def _save(self, state: Dict):
+        tmp = self.state_file.with_name(self.state_file.name + f".{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(str(tmp), str(self.state_file))
+
+    def _with_state(self, fn):
+        """Run fn(state, now) under the cross-process lock and persist the state"""
+        _lock(self._lock_fh)
+        try:
+            state = self._load()
+            now = time.time()
+            elapsed = max(0.0, now - state["refilled_at"])
+            state["tokens"] = min(self.burst, state["tokens"] + elapsed * self.rate_per_s)
+            state["refilled_at"] = now
+            jobs = state["jobs"]
+            for job_id in [j for j, v in jobs.items() if now - v["seen"] > STALE_JOB_S]:
+                del jobs[job_id]
+            result = fn(state, now)
+            self._save(state)
+            return result
+        finally:
+            _unlock(self._lock_fh)
+
+    def _try_take(self, state: Dict, now: float) -> float:
+        """Take a token if this job is next in line; returns 0 or the seconds to sleep"""
+        jobs = state["jobs"]
+        me = jobs.get(self.job_id)
+        if me is None:
+            # Newcomers start at the current minimum virtual time (no credit for the past)
+            vmin = min((j["vtime"] for j in jobs.values()), default=0.0)
+            me = jobs[self.job_id] = {"weight": self.weight, "priority": self.priority, "vtime": vmin,
+                                      "waiting": None, "seen": now, "granted": 0}
+        waiting = [j for j in jobs.values()
+                   if j["waiting"] is not None and now - j["seen"] < WAITING_STALE_S and j is not me]
+        if me["waiting"] is None:
+            # Back from idle: no credit for the time it did not compete
+            me["waiting"] = now
+            me["vtime"] = max(me["vtime"], min((j["vtime"] for j in waiting), default=me["vtime"]))
+        me["seen"] = now
+        waiting.append(me)
+
+        if now < state.get("paused_until", 0.0):
+            return min(state["paused_until"] - now, MAX_POLL_S)
+
+        top_priority = max(j["priority"] for j in waiting)
+        if me["priority"] < top_priority:
+            return MAX_POLL_S / 5
+        peers = [j for j in waiting if j["priority"] == top_priority]
+        if me["vtime"] > min(j["vtime"] for j in peers) + 1.0 / me["weight"]:
+            return MAX_POLL_S / 5
+
+        if state["tokens"] < 1.0:
+            return min((1.0 - state["tokens"]) / self.rate_per_s, MAX_POLL_S)
+
+        state["tokens"] -= 1.0
+        me["vtime"] += 1.0 / me["weight"]
+        me["waiting"] = None
+        me["granted"] += 1
+        return 0.0
+
+    # ----------------------------- public API -----------------------------
+
+    def wait(self):
+        """Block until this process may send one request (drop-in for RateLimiter.wait)"""
+        with self.lock:
+            if self.min_interval_s > 0:
+                gap = self.min_interval_s - (time.time() - self.last_request_time)
+                if gap > 0:
+                    time.sleep(gap)
+
+            t0 = time.time()
+            while True:
+                sleep_s = self._with_state(self._try_take)
+                if sleep_s <= 0:
+                    break
+                time.sleep(sleep_s)
+
+            waited = time.time() - t0
+            if waited > 0.001:
+                self.waits += 1
+                self.waited_s += waited
+            self.last_request_time = time.time()
+
+    def penalize(self, seconds: float):
+        """Pause the whole bucket (all processes) after a 429"""
+        def _pause(state, now):
+            state["paused_until"] = max(state.get("paused_until", 0.0), now + seconds)
+            state["tokens"] = 0.0
+        self._with_state(_pause)
+        logger.warning(f"Shared rate limiter paused {seconds:.1f}s for all jobs (429 seen by {self.job})")
+
+    def snapshot(self) -> Dict:
+        """Shared bucket state (tokens, pause, registered jobs)"""
+        return self._with_state(lambda state, now: json.loads(json.dumps(state)))
+
+    def close(self):
+        """Leave the share (other jobs get this job's tokens immediately)"""
+        def _leave(state, now):
+            state["jobs"].pop(self.job_id, None)
+        try:
+            self._with_state(_leave)
+        finally:
+            self._lock_fh.close()
+
+
+def main():
+    """Print the shared bucket state (which jobs are drawing from the quota)"""
+    import argparse
+    import yaml
+
+    parser = argparse.ArgumentParser(description="Inspect the shared Polygon rate-limit bucket")
+    parser.add_argument("--config", type=str, default=str(PROJECT_ROOT / "config" / "config.yaml"))
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    limiter = SharedRateLimiter.from_config(cfg, job="inspect")
+    if limiter is None:
+        print("polygon.shared_rate_limit is disabled")
+        return
+    state = limiter.snapshot()
+    limiter.close()
+
+    now = time.time()
+    print(f"State: {limiter.state_file}")
+    print(f"  Tokens: {state['tokens']:.2f} | paused: {max(0.0, state.get('paused_until', 0) - now):.1f}s")
+    for job_id, j in sorted(state["jobs"].items()):
+        if job_id == limiter.job_id:
+            continue
+        print(f"  {job_id:<32} prio {j['priority']} weight {j['weight']:g} granted {j['granted']:,} "
+              f"{'waiting' if j['waiting'] else 'idle'} (seen {now - j['seen']:.0f}s ago)")
+
+
+if __name__ == "__main__":
+    main()
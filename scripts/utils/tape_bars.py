@@ -0,0 +1,177 @@
+"""
+Tape Bars (1-second)
+
+Per-event 1-second bars materialized while the trades/quotes window is paginated (FASE 3.2),
+so feature extraction, validation sampling and tape-speed work read a few thousand rows per
+event instead of re-aggregating millions of raw prints.
+
+- trades → OHLC, volume, trade count and VWAP per second
+- quotes → last NBBO of the second (bid/ask price and size), spread and quote count
+
+Bars are computed on every decoded page (before quote downsampling, so counts and the last
+NBBO are exact) with `group_by_dynamic` on `timestamp_ns`, then merged: a second split across
+two pages (or two window ranges) yields two partial bars that `merge_bars` combines into one.
+Bars are labelled by the start of their second (`timestamp_ns`, `timestamp`).
+
+Config: processing.micro_download.bars_1s.enable. Files are written next to the raw tape as
+`{kind}_1s.parquet` (packed layout: kind `{kind}_1s`).
+
+Usage:
+    >>> bars = SecondBars("trades")
+    >>> for page_df in pages:
+    ...     bars.push(page_df)                  # per page, while streaming
+    >>> df_1s = bars.result(gte_ns, lte_ns)
+
+    >>> df_1s = finalize_bars("trades", [second_bars("trades", df_trades)])   # stored tape (backfill)
+"""
+
+from typing import Dict, List, Optional
+
+import polars as pl
+
+SECOND_NS = 1_000_000_000
+
+# Columns each kind needs in the decoded pages
+BAR_INPUTS = {
+    "trades": ("timestamp_ns", "price", "size"),
+    "quotes": ("timestamp_ns", "bid_price", "ask_price", "bid_size", "ask_size"),
+}
+
+# Partial bars kept before they are merged (bounds memory on very long windows)
+MAX_PARTS = 64
+
+
+def _aggregations(kind: str) -> List[pl.Expr]:
+    """Raw prints/quotes of one second → one bar"""
+    if kind == "trades":
+        size = pl.col("size").cast(pl.Int64)
+        return [
+            pl.col("price").first().alias("open"),
+            pl.col("price").max().alias("high"),
+            pl.col("price").min().alias("low"),
+            pl.col("price").last().alias("close"),
+            size.sum().alias("volume"),
+            pl.len().cast(pl.UInt32).alias("trades"),
+            ((pl.col("price").cast(pl.Float64) * size).sum() / size.sum()).alias("vwap"),
+        ]
+    return [
+        pl.col("bid_price").last(),
+        pl.col("ask_price").last(),
+        pl.col("bid_size").last(),
+        pl.col("ask_size").last(),
+        pl.len().cast(pl.UInt32).alias("quotes"),
+    ]
+
+
+def _merges(kind: str) -> List[pl.Expr]:
+    """Partial bars of the same second (in time order) → one bar"""
+    if kind == "trades":
+        return [
+            pl.col("open").first(),
+            pl.col("high").max(),
+            pl.col("low").min(),
+            pl.col("close").last(),
+            pl.col("volume").sum(),
+            pl.col("trades").sum(),
+            ((pl.col("vwap") * pl.col("volume")).sum() / pl.col("volume").sum()).alias("vwap"),
+        ]
+    return [
+        pl.col("bid_price").last(),
+        pl.col("ask_price").last(),
+        pl.col("bid_size").last(),
+        pl.col("ask_size").last(),
+        pl.col("quotes").sum(),
+    ]
+
+
+def _finish(kind: str, df: pl.DataFrame) -> pl.DataFrame:
+    """Add the derived columns (timestamp, spread) of final bars"""
+    cols = [pl.from_epoch(pl.col("timestamp_ns"), time_unit="ns").alias("timestamp")]
+    if kind == "quotes":
+        cols.append((pl.col("ask_price") - pl.col("bid_price")).alias("spread"))
+    return df.with_columns(cols)
+
+
+def second_bars(kind: str, df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Partial 1-second bars of a tape slice (rows sorted by timestamp_ns, Polygon order=asc).
+
+    Returns:
+        One row per second with at least one print/quote (empty if the slice lacks the columns)
+    """
+    if kind not in BAR_INPUTS:
+        raise ValueError(f"kind must be one of {tuple(BAR_INPUTS)}")
+    if len(df) == 0 or not set(BAR_INPUTS[kind]) <= set(df.columns):
+        return pl.DataFrame()
+    return (
+        df.select(BAR_INPUTS[kind])
+        .set_sorted("timestamp_ns")
+        .group_by_dynamic("timestamp_ns", every=f"{SECOND_NS}i")
+        .agg(_aggregations(kind))
+    )
+
+
+def merge_bars(kind: str, frames: List[Optional[pl.DataFrame]]) -> pl.DataFrame:
+    """Combine partial bars (in time order) so every second appears once"""
+    frames = [f for f in frames if f is not None and len(f) > 0]
+    if not frames:
+        return pl.DataFrame()
+    df = pl.concat([f.drop("timestamp", "spread", strict=False) for f in frames], how="vertical_relaxed")
+    if df["timestamp_ns"].is_unique().all():
+        return df
+    return df.group_by("timestamp_ns", maintain_order=True).agg(_merges(kind))
+
+
+class SecondBars:
+    """1-second bars of one (event, kind, range) download, fed page by page"""
+
+    def __init__(self, kind: str):
+        if kind not in BAR_INPUTS:
+            raise ValueError(f"kind must be one of {tuple(BAR_INPUTS)}")
+        self.kind = kind
+        self._parts: List[pl.DataFrame] = []
+
+    def push(self, page_df: pl.DataFrame):
+        """Aggregate one decoded page (before downsampling)"""
+        part = second_bars(self.kind, page_df)
+        if len(part) > 0:
+            self._parts.append(part)
+        if len(self._parts) > MAX_PARTS:
+            self._parts = [merge_bars(self.kind, self._parts)]
+
+    def result(self, gte_ns: Optional[int] = None, lte_ns: Optional[int] = None) -> pl.DataFrame:
+        """
+        Final bars, restricted to the seconds that overlap [gte_ns, lte_ns] (window after budget
+        narrowing / truncation; edge seconds may hold prints just outside it)
+        """
+        df = merge_bars(self.kind, self._parts)
+        if len(df) == 0:
+            return df
+        if gte_ns is not None:
+            df = df.filter(pl.col("timestamp_ns") > gte_ns - SECOND_NS)
+        if lte_ns is not None:
+            df = df.filter(pl.col("timestamp_ns") <= lte_ns)
+        return _finish(self.kind, df)
+
+    # ----------------------------- spool state ----------------------------
+
+    def get_state(self) -> Optional[pl.DataFrame]:
+        """Partial bars so far, merged (stored in the page spool with each commit)"""
+        if not self._parts:
+            return None
+        self._parts = [merge_bars(self.kind, self._parts)]
+        return self._parts[0]
+
+    def set_state(self, df: Optional[pl.DataFrame]):
+        self._parts = [df] if df is not None and len(df) > 0 else []
+
+
+def finalize_bars(kind: str, frames: List[Optional[pl.DataFrame]]) -> pl.DataFrame:
+    """Merge the final bars of several window ranges (core + extensions) into one frame"""
+    df = merge_bars(kind, frames)
+    return _finish(kind, df) if len(df) > 0 else df
+
+
+def bars_enabled(cfg: Dict) -> bool:
+    """processing.micro_download.bars_1s.enable"""
+    return bool(cfg.get("processing", {}).get("micro_download", {}).get("bars_1s", {}).get("enable", False))
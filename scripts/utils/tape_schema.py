@@ -0,0 +1,104 @@
+"""
+Tape Schema Projection
+
+Column projection and dtype narrowing for Polygon /v3/trades and /v3/quotes pages (FASE 3.2).
+
+Applied to every page as it is decoded, so dropped fields never reach the concatenated
+window and kept fields are stored with compact types:
+- prices → Float32, sizes → UInt32, exchange / tape IDs → UInt8
+- trade/quote condition codes → List(UInt8), quote indicators → List(UInt16)
+- timestamps stay Int64 ns (`timestamp` is the derived Datetime)
+
+Columns to keep come from processing.micro_download.{trades,quotes}.columns_keep. A few
+columns are always carried in memory because the downloader needs them (timestamp_ns for
+windows/budgets, NBBO for by-change downsampling, price/size for activity metrics and 1s bars); `finalize()`
+drops the ones not in columns_keep before the tape is written.
+
+Usage:
+    >>> proj = TapeProjection.from_config(cfg, "trades")
+    >>> page_df = proj.project(page_df)     # per page
+    >>> df = proj.finalize(df)              # before writing
+"""
+
+from typing import Dict, Iterable, Optional
+
+import polars as pl
+
+# Local column name (after renaming Polygon fields) → stored dtype
+TAPE_DTYPES: Dict[str, Dict[str, pl.DataType]] = {
+    "trades": {
+        "timestamp_ns": pl.Int64,
+        "exchange_timestamp_ns": pl.Int64,
+        "trf_timestamp": pl.Int64,
+        "price": pl.Float32,
+        "size": pl.UInt32,
+        "exchange": pl.UInt8,
+        "conditions": pl.List(pl.UInt8),
+        "sequence_number": pl.Int64,
+        "tape": pl.UInt8,
+        "trf_id": pl.UInt8,
+        "correction": pl.UInt8,
+    },
+    "quotes": {
+        "timestamp_ns": pl.Int64,
+        "exchange_timestamp_ns": pl.Int64,
+        "ask_price": pl.Float32,
+        "bid_price": pl.Float32,
+        "ask_size": pl.UInt32,
+        "bid_size": pl.UInt32,
+        "ask_exchange": pl.UInt8,
+        "bid_exchange": pl.UInt8,
+        "conditions": pl.List(pl.UInt8),
+        "indicators": pl.List(pl.UInt16),
+        "sequence_number": pl.Int64,
+        "tape": pl.UInt8,
+    },
+}
+
+# Columns the downloader itself reads while paginating (kept in memory even if not persisted)
+REQUIRED_COLUMNS = {
+    "trades": ("timestamp_ns", "price", "size"),
+    "quotes": ("timestamp_ns", "bid_price", "ask_price", "bid_size", "ask_size"),
+}
+
+
+class TapeProjection:
+    """Per-kind column projection + dtype narrowing (stateless, shared across threads)"""
+
+    def __init__(self, kind: str, columns_keep: Optional[Iterable[str]] = None):
+        """
+        Args:
+            kind: "trades" or "quotes"
+            columns_keep: Columns to persist (None = keep every field, only narrow dtypes)
+        """
+        if kind not in TAPE_DTYPES:
+            raise ValueError(f"kind must be one of {tuple(TAPE_DTYPES)}")
+        self.kind = kind
+        self.dtypes = TAPE_DTYPES[kind]
+        self.keep = list(columns_keep) if columns_keep else None
+        self.required = REQUIRED_COLUMNS[kind]
+
+    @classmethod
+    def from_config(cls, cfg: Dict, kind: str) -> "TapeProjection":
+        """Projection from processing.micro_download.<kind>.columns_keep"""
+        kind_cfg = cfg.get("processing", {}).get("micro_download", {}).get(kind, {})
+        return cls(kind, kind_cfg.get("columns_keep"))
+
+    def project(self, df: pl.DataFrame) -> pl.DataFrame:
+        """Select kept + required columns and cast them to their compact dtypes (one page)"""
+        if self.keep is not None:
+            wanted = list(dict.fromkeys([*self.keep, *self.required]))
+            df = df.select([c for c in wanted if c in df.columns])
+
+        casts = [
+            pl.col(c).cast(dtype, strict=False)
+            for c, dtype in self.dtypes.items()
+            if c in df.columns and df.schema[c] != dtype
+        ]
+        return df.with_columns(casts) if casts else df
+
+    def finalize(self, df: pl.DataFrame) -> pl.DataFrame:
+        """Drop in-memory-only columns before the tape is persisted"""
+        if self.keep is None or len(df.columns) == 0:
+            return df
+        return df.select([c for c in df.columns if c in self.keep])
@@ -0,0 +1,500 @@
+"""
+Point-in-Time Universe Snapshots
+
+Date-partitioned universe membership (symbol, date, market cap, float, status) built once from
+what is already on disk and topped up with each new session, so any stage can ask for the
+"universe as of date D" with one small file read, and use the market cap of that date instead
+of today's (names that were small caps then and grew, or were delisted since, stay in).
+
+- Layout: processed/reference/universe/date=YYYY-MM-DD.parquet, one file per trading session
+  with a raw close in the grouped daily store (raw/market_data/grouped_daily/1d_raw), plus
+  _tickers.parquet (active + delisted ticker tables combined, rebuilt only when a newer
+  tickers_* file appears) and a progress log (_progress.jsonl)
+- Members: tickers passing the static universe filters (type CS, no OTC / ETFs, optional ADRs)
+  that traded on the date; status is the lifecycle on that date (delisted only on or after
+  the ticker's delisted_utc, so a name delisted since was active while it traded)
+- Market cap: raw close of the date × shares outstanding of the date. Shares and float come from
+  the latest short interest report published on or before the date (raw/short_interest) and
+  otherwise from today's ticker details; either is carried to the date through the splits in
+  between (same factors as scripts/utils/bar_adjustment.py), so reverse splits do not inflate it
+- Incremental: a date is built once; each record keeps a fingerprint of the reference inputs
+  (tickers, details, short interest, splits, filters). Newer inputs only rebuild old dates on
+  `refresh=True`
+- Queries resolve a date to the latest snapshot on or before it, at most max_snapshot_age_days
+  old (a long gap means the store was not topped up, not a holiday); older ones are ignored
+  with a warning
+
+Config (ingestion.universe_snapshots): max_si_age_days, max_snapshot_age_days, chunk_dates.
+Thresholds from universe.
+
+Usage:
+    >>> snaps = UniverseSnapshots.from_config(cfg, base_dir)
+    >>> snaps.update()                                         # new sessions only
+    >>> snaps.as_of("2023-06-30", market_cap_max=2e9)         # members on (or before) that date
+    >>> snaps.scan("2021-01-01", "2025-10-17")                # LazyFrame for (symbol, date) joins
+
+    # Build / top up from the command line
+    python scripts/utils/universe_snapshots.py
+    python scripts/utils/universe_snapshots.py --refresh --from 2021-01-01
+"""
+
+import sys
+import glob
+import bisect
+import hashlib
+import argparse
+from pathlib import Path
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import polars as pl
+from loguru import logger
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.utils.bar_adjustment import BarAdjuster
+from scripts.utils.partition_writer import write_parquet_atomic
+from scripts.utils.progress_wal import ProgressWAL
+from scripts.utils.time_utils import ET
+
+DateLike = Union[str, date, datetime]
+
+SNAPSHOT_SCHEMA = {
+    "symbol": pl.Utf8, "date": pl.Date, "close": pl.Float64, "shares": pl.Float64, "float": pl.Float64,
+    "market_cap": pl.Float64, "status": pl.Utf8, "shares_source": pl.Utf8,
+}
+
+# Bumped when the build logic changes: dates built by an older version count as stale
+SNAPSHOT_VERSION = 2
+
+
+def _as_date(d: DateLike) -> date:
+    if isinstance(d, datetime):
+        return d.date()
+    return d if isinstance(d, date) else date.fromisoformat(str(d)[:10])
+
+
+def _date_expr(col: str) -> pl.Expr:
+    return pl.col(col).cast(pl.Utf8).str.slice(0, 10).str.to_date("%Y-%m-%d", strict=False)
+
+
+def _latest(pattern: str) -> Optional[Path]:
+    files = sorted(glob.glob(pattern), key=lambda p: Path(p).stat().st_mtime, reverse=True)
+    return Path(files[0]) if files else None
+
+
+def _fingerprint(paths: Sequence[Optional[Path]], extra=None) -> str:
+    """Names, sizes and mtimes of the input files (no data read)"""
+    parts = [(p.name, p.stat().st_size, int(p.stat().st_mtime)) for p in paths if p is not None and p.exists()]
+    return hashlib.sha1(repr((parts, extra)).encode()).hexdigest()[:16]
+
+
+def static_filter(df: pl.DataFrame, universe_cfg: Dict) -> pl.DataFrame:
+    """Type / market filters of the small-cap universe (config `universe`) on a tickers table"""
+    out = df.filter(pl.col("type") == "CS")
+    if universe_cfg.get("exclude_etfs", True):
+        out = out.filter(pl.col("type") != "ETF")
+    if universe_cfg.get("exclude_otc", True) and "market" in out.columns:
+        out = out.filter(pl.col("market") != "otc")
+    if universe_cfg.get("exclude_adrs", False) and "name" in out.columns:
+        out = out.filter(~pl.col("name").str.contains("ADR", literal=True))
+    return out
+
+
+def combine_tickers(df_active: pl.DataFrame, df_delisted: pl.DataFrame) -> pl.DataFrame:
+    """Active + delisted tickers tables in one frame (delisted_utc null for active names)"""
+    if "delisted_utc" not in df_active.columns:
+        df_active = df_active.with_columns(pl.lit(None).cast(pl.Utf8).alias("delisted_utc"))
+    return pl.concat([df_active, df_delisted], how="diagonal_relaxed")
+
+
+class UniverseSnapshots:
+    """Per-date universe membership with point-in-time market cap (incremental, on-disk inputs only)"""
+
+    def __init__(self, root: Path, raw_dir: Path, processed_dir: Optional[Path] = None,
+                 universe_cfg: Optional[Dict] = None, max_si_age_days: int = 120, chunk_dates: int = 64,
+                 max_snapshot_age_days: Optional[int] = 5):
+        """
+        Args:
+            root: Output directory (processed/reference/universe)
+            raw_dir: raw/ (tickers, details, short interest, grouped daily, splits)
+            processed_dir: processed/ (download_actions.py corporate actions table, optional)
+            universe_cfg: config `universe` section (static filters)
+            max_si_age_days: Short interest reports older than this fall back to ticker details
+            chunk_dates: Dates computed per pass (bounds memory on the first build)
+            max_snapshot_age_days: Oldest snapshot a query date may resolve to (calendar days,
+                                   covers weekends + holidays); None = no limit
+        """
+        self.root = Path(root)
+        self.raw_dir = Path(raw_dir)
+        self.processed_dir = Path(processed_dir) if processed_dir is not None else None
+        self.universe_cfg = universe_cfg or {}
+        self.max_si_age_days = int(max_si_age_days)
+        self.chunk_dates = max(1, int(chunk_dates))
+        self.max_snapshot_age_days = int(max_snapshot_age_days) if max_snapshot_age_days is not None else None
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.wal = ProgressWAL(self.root / "_progress.jsonl")
+
+    @classmethod
+    def from_config(cls, cfg: Dict, base_dir: Path) -> "UniverseSnapshots":
+        """Snapshots under processed/reference/universe with ingestion.universe_snapshots settings"""
+        us = cfg.get("ingestion", {}).get("universe_snapshots", {})
+        processed = Path(base_dir) / cfg["paths"]["processed"]
+        return cls(processed / "reference" / "universe", Path(base_dir) / cfg["paths"]["raw"], processed,
+                   universe_cfg=cfg.get("universe", {}),
+                   max_si_age_days=int(us.get("max_si_age_days", 120)),
+                   chunk_dates=int(us.get("chunk_dates", 64)),
+                   max_snapshot_age_days=us.get("max_snapshot_age_days", 5))
+
+    def date_path(self, d: date) -> Path:
+        return self.root / f"date={d.isoformat()}.parquet"
+
+    def dates(self) -> List[date]:
+        """Dates with a snapshot, sorted"""
+        with self.wal.lock:
+            keys = [k for k, kinds in self.wal.records.items() if "membership" in kinds]
+        return sorted(date.fromisoformat(k) for k in keys)
+
+    # ----------------------------- inputs ---------------------------------
+
+    def _ticker_files(self) -> Tuple[Optional[Path], Optional[Path]]:
+        ref = self.raw_dir / "reference"
+        return _latest(str(ref / "tickers_active_*.parquet")), _latest(str(ref / "tickers_delisted_*.parquet"))
+
+    def tickers(self) -> pl.DataFrame:
+        """
+        Combined active + delisted tickers table (all columns), cached in _tickers.parquet.
+
+        Re-read from raw/reference only when a newer tickers_* file is on disk.
+        """
+        active, delisted = self._ticker_files()
+        if active is None or delisted is None:
+            raise FileNotFoundError(f"No tickers_active_* / tickers_delisted_* files in {self.raw_dir / 'reference'}")
+        sig = _fingerprint([active, delisted])
+        cache = self.root / "_tickers.parquet"
+        rec = self.wal.get("_tickers", "reference")
+        if rec is not None and rec.get("signature") == sig and cache.exists():
+            return pl.read_parquet(cache)
+
+        df = combine_tickers(pl.read_parquet(active), pl.read_parquet(delisted))
+        nbytes = write_parquet_atomic(df, cache)
+        self.wal.record("_tickers", "reference", df.height, nbytes, signature=sig,
+                        sources=[active.name, delisted.name])
+        logger.info(f"Tickers table rebuilt from {active.name} + {delisted.name}: {df.height:,} rows")
+        return df
+
+    def _sources(self) -> List[Optional[Path]]:
+        """Every file the membership of a date depends on (besides its grouped daily file)"""
+        raw = self.raw_dir
+        paths = [*self._ticker_files(), raw / "reference" / "ticker_details_all.parquet",
+                 _latest(str(raw / "corporate_actions" / "splits_*.parquet"))]
+        if self.processed_dir is not None:
+            paths.append(_latest(str(self.processed_dir / "reference" / "corporate_actions_*.parquet")))
+        paths += [Path(p) for p in sorted(glob.glob(str(raw / "short_interest" / "*.parquet")))]
+        return paths
+
+    def signature(self) -> str:
+        """Fingerprint of the reference inputs and static filters (changes → dates can be refreshed)"""
+        filters = {k: self.universe_cfg.get(k) for k in ("exclude_etfs", "exclude_otc", "exclude_adrs")}
+        return _fingerprint(self._sources(), (filters, self.max_si_age_days, SNAPSHOT_VERSION))
+
+    def _members(self) -> pl.DataFrame:
+        """
+        (symbol, delisted) of the tickers passing the static filters; delisted = delisted_utc date
+        (null while active). Active wins on reused symbols, else the latest delisting.
+        """
+        df = static_filter(self.tickers(), self.universe_cfg)
+        delisted = _date_expr("delisted_utc") if "delisted_utc" in df.columns else pl.lit(None, pl.Date)
+        return (
+            df.select(pl.col("ticker").alias("symbol"),
+                      pl.when(pl.col("active").cast(pl.Boolean)).then(None).otherwise(delisted).alias("delisted"))
+            .sort("symbol", "delisted", nulls_last=False, descending=[False, True])
+            .unique(subset=["symbol"], keep="first")
+        )
+
+    def _details_shares(self) -> pl.DataFrame:
+        """(symbol, details_shares, details_date) from ticker_details_all.parquet (today's counts)"""
+        path = self.raw_dir / "reference" / "ticker_details_all.parquet"
+        schema = {"symbol": pl.Utf8, "details_shares": pl.Float64, "details_date": pl.Date}
+        if not path.exists():
+            return pl.DataFrame(schema=schema)
+        df = pl.read_parquet(path)
+        cols = [c for c in ("share_class_shares_outstanding", "weighted_shares_outstanding") if c in df.columns]
+        if not cols:
+            return pl.DataFrame(schema=schema)
+        asof = datetime.fromtimestamp(path.stat().st_mtime, tz=ET).date()
+        return df.select(
+            pl.col("ticker").alias("symbol"),
+            pl.coalesce([pl.col(c).cast(pl.Float64) for c in cols]).alias("details_shares"),
+            pl.lit(asof).alias("details_date"),
+        ).filter(pl.col("details_shares") > 0).unique(subset=["symbol"], keep="last")
+
+    def _short_interest(self) -> pl.DataFrame:
+        """(symbol, avail, settled, si_shares, si_float): one row per report, keyed by publish date"""
+        schema = {"symbol": pl.Utf8, "avail": pl.Date, "settled": pl.Date, "si_shares": pl.Float64,
+                  "si_float": pl.Float64}
+        files = sorted(glob.glob(str(self.raw_dir / "short_interest" / "*.parquet")))
+        if not files:
+            return pl.DataFrame(schema=schema)
+        df = pl.concat([pl.read_parquet(f) for f in files], how="diagonal_relaxed")
+        for col in ("settlement_date", "publish_date", "float", "outstanding_shares"):
+            if col not in df.columns:
+                df = df.with_columns(pl.lit(None).alias(col))
+        return (
+            df.select(
+                pl.col("ticker").alias("symbol"),
+                pl.coalesce([_date_expr("publish_date"), _date_expr("settlement_date")]).alias("avail"),
+                _date_expr("settlement_date").alias("settled"),
+                pl.col("outstanding_shares").cast(pl.Float64, strict=False).alias("si_shares"),
+                pl.col("float").cast(pl.Float64, strict=False).alias("si_float"),
+            )
+            .filter(pl.col("avail").is_not_null() & pl.col("settled").is_not_null()
+                    & (pl.col("si_shares").is_not_null() | pl.col("si_float").is_not_null()))
+            .unique(subset=["symbol", "settled"], keep="last")
+            .sort("symbol", "avail")
+            .cast(schema)
+        )
+
+    # ----------------------------- build ----------------------------------
+
+    def _grouped_dates(self, start: Optional[date], end: Optional[date]) -> List[Tuple[date, Path]]:
+        gd = self.raw_dir / "market_data" / "grouped_daily" / "1d_raw"
+        out = []
+        for p in sorted(gd.glob("date=*.parquet")):
+            d = date.fromisoformat(p.stem.removeprefix("date="))
+            if (start is None or d >= start) and (end is None or d <= end):
+                out.append((d, p))
+        return out
+
+    @staticmethod
+    def _split_factor(df: pl.DataFrame, factors: pl.DataFrame, on: str, alias: str) -> pl.DataFrame:
+        """Cumulative split price factor of the session `on` (1.0 after the last split)"""
+        return (
+            df.sort("symbol", on)
+            .join_asof(factors.select("symbol", "last_day", "price_factor"), left_on=on, right_on="last_day",
+                       by="symbol", strategy="forward", check_sortedness=False)
+            .with_columns(pl.col("price_factor").fill_null(1.0).alias(alias))
+            .drop("last_day", "price_factor")
+        )
+
+    def build_frame(self, bars: pl.DataFrame, members: pl.DataFrame, details: pl.DataFrame,
+                    short_interest: pl.DataFrame, factors: pl.DataFrame) -> pl.DataFrame:
+        """
+        Raw daily closes (symbol, date, close) → membership rows (SNAPSHOT_SCHEMA).
+
+        Shares of a date: latest short interest report published by then (unless older than
+        max_si_age_days), else today's ticker details; scaled by F(date) / F(reference date),
+        F = cumulative split factor.
+        """
+        df = bars.join(members, on="symbol", how="inner").join(details, on="symbol", how="left")
+        df = df.sort("symbol", "date").join_asof(
+            short_interest, left_on="date", right_on="avail", by="symbol", strategy="backward",
+            check_sortedness=False,
+        )
+        fresh_si = pl.col("si_shares").is_not_null() & ((pl.col("date") - pl.col("avail")).dt.total_days()
+                                                        <= self.max_si_age_days)
+        df = df.with_columns(
+            pl.when(fresh_si).then(pl.col("si_shares")).otherwise(pl.col("details_shares")).alias("_shares"),
+            pl.when(fresh_si).then(pl.col("si_float")).otherwise(None).alias("_float"),
+            pl.when(fresh_si).then(pl.col("settled")).otherwise(pl.col("details_date")).alias("_ref"),
+            pl.when(fresh_si).then(pl.lit("short_interest"))
+              .when(pl.col("details_shares").is_not_null()).then(pl.lit("details"))
+              .otherwise(None).alias("shares_source"),
+        )
+        df = self._split_factor(df, factors, "date", "_f_date")
+        df = self._split_factor(df.with_columns(pl.col("_ref").fill_null(pl.col("date"))), factors, "_ref", "_f_ref")
+        scale = pl.col("_f_date") / pl.col("_f_ref")
+        status = pl.when(pl.col("delisted").is_not_null() & (pl.col("date") >= pl.col("delisted"))) \
+            .then(pl.lit("delisted")).otherwise(pl.lit("active"))
+        return (
+            df.with_columns((pl.col("_shares") * scale).alias("shares"), (pl.col("_float") * scale).alias("float"),
+                            status.alias("status"))
+            .with_columns((pl.col("close") * pl.col("shares")).alias("market_cap"))
+            .select(list(SNAPSHOT_SCHEMA))
+            .cast(SNAPSHOT_SCHEMA)
+            .sort("date", "symbol")
+        )
+
+    def update(self, start: Optional[DateLike] = None, end: Optional[DateLike] = None,
+               refresh: bool = False) -> Dict:
+        """
+        Build the snapshots of grouped daily sessions in [start, end] that have none yet.
+
+        Args:
+            refresh: Also rebuild dates built from older reference inputs (new short interest,
+                     details, tickers or splits)
+
+        Returns:
+            Dict with dates built, rows, stale (dates left on older inputs)
+        """
+        start = _as_date(start) if start is not None else None
+        end = _as_date(end) if end is not None else None
+        sig = self.signature()
+        todo, stale = [], 0
+        for d, path in self._grouped_dates(start, end):
+            rec = self.wal.get(d.isoformat(), "membership")
+            if rec is None or (refresh and rec.get("signature") != sig):
+                todo.append((d, path))
+            elif rec.get("signature") != sig:
+                stale += 1
+        if stale:
+            logger.info(f"Universe snapshots: {stale:,} dates built from older reference data (refresh to rebuild)")
+        if not todo:
+            return {"dates": 0, "rows": 0, "stale": stale}
+
+        members = self._members()
+        details = self._details_shares()
+        short_interest = self._short_interest()
+        factors = BarAdjuster.from_store(self.raw_dir, self.processed_dir).factor_table()
+        logger.info(f"Universe snapshots: building {len(todo):,} dates ({members.height:,} eligible tickers, "
+                    f"{short_interest.height:,} short interest reports)")
+
+        rows = 0
+        for i in range(0, len(todo), self.chunk_dates):
+            chunk = todo[i:i + self.chunk_dates]
+            bars = pl.concat([
+                pl.read_parquet(p, columns=["symbol", "close"]).with_columns(pl.lit(d).alias("date"))
+                for d, p in chunk
+            ]).with_columns(pl.col("close").cast(pl.Float64))
+            snap = self.build_frame(bars, members, details, short_interest, factors)
+            parts = {key[0]: part for key, part in snap.partition_by("date", as_dict=True).items()}
+            for d, _ in chunk:
+                part = parts.get(d, snap.clear())
+                nbytes = write_parquet_atomic(part, self.date_path(d))
+                self.wal.record(d.isoformat(), "membership", part.height, nbytes, signature=sig)
+                rows += part.height
+            logger.info(f"Universe snapshots: {min(i + self.chunk_dates, len(todo)):,}/{len(todo):,} dates")
+        return {"dates": len(todo), "rows": rows, "stale": 0 if refresh else stale}
+
+    # ----------------------------- queries --------------------------------
+
+    def snapshot_date(self, d: DateLike, max_age_days: Optional[int] = None) -> Optional[date]:
+        """
+        Latest snapshot date on or before `d` (weekends / holidays resolve to the prior session).
+
+        None if there is none, or if it is more than `max_age_days` older than `d`.
+        """
+        dates = self.dates()
+        i = bisect.bisect_right(dates, _as_date(d))
+        if not i:
+            return None
+        snap = dates[i - 1]
+        if max_age_days is not None and (_as_date(d) - snap).days > max_age_days:
+            return None
+        return snap
+
+    @staticmethod
+    def _thresholds(lf, market_cap_max: Optional[float], float_max: Optional[float], keep_unknown: bool):
+        for col, cap in (("market_cap", market_cap_max), ("float", float_max)):
+            if cap is not None:
+                cond = pl.col(col) < cap
+                lf = lf.filter(cond | pl.col(col).is_null() if keep_unknown else cond)
+        return lf
+
+    def as_of(self, d: DateLike, market_cap_max: Optional[float] = None, float_max: Optional[float] = None,
+              keep_unknown: bool = True, symbols: Optional[Sequence[str]] = None) -> pl.DataFrame:
+        """
+        Universe members as of date `d` (one snapshot file).
+
+        Args:
+            market_cap_max / float_max: Exclusive thresholds (None: no filter)
+            keep_unknown: Keep members without shares data (conservative, may be small caps)
+            symbols: Restrict to these symbols
+
+        Returns:
+            SNAPSHOT_SCHEMA frame (empty if no snapshot on or before `d`, or only one older
+            than max_snapshot_age_days)
+        """
+        snap = self.snapshot_date(d, self.max_snapshot_age_days)
+        if snap is None:
+            latest = self.snapshot_date(d)
+            if latest is None:
+                logger.warning(f"No universe snapshot on or before {_as_date(d)}")
+            else:
+                logger.warning(f"Universe snapshot for {_as_date(d)} is {latest} ({(_as_date(d) - latest).days} days "
+                               f"old > {self.max_snapshot_age_days}): run update()")
+            return pl.DataFrame(schema=SNAPSHOT_SCHEMA)
+        lf = pl.scan_parquet(self.date_path(snap))
+        if symbols is not None:
+            lf = lf.filter(pl.col("symbol").is_in(list(symbols)))
+        return self._thresholds(lf, market_cap_max, float_max, keep_unknown).collect()
+
+    def scan(self, start: Optional[DateLike] = None, end: Optional[DateLike] = None) -> pl.LazyFrame:
+        """Snapshots in [start, end] as one LazyFrame (only the files in range are opened)"""
+        dates = self.dates()
+        lo = _as_date(start) if start is not None else None
+        hi = _as_date(end) if end is not None else None
+        paths = [self.date_path(d) for d in dates if (lo is None or d >= lo) and (hi is None or d <= hi)]
+        if not paths:
+            return pl.LazyFrame(schema=SNAPSHOT_SCHEMA)
+        return pl.scan_parquet(paths)
+
+    def members_since(self, start: DateLike, end: Optional[DateLike] = None, market_cap_max: Optional[float] = None,
+                      float_max: Optional[float] = None, keep_unknown: bool = True) -> pl.Series:
+        """Symbols that were members (below the thresholds) on at least one session in [start, end]"""
+        lf = self._thresholds(self.scan(start, end), market_cap_max, float_max, keep_unknown)
+        return lf.select(pl.col("symbol").unique().sort()).collect()["symbol"]
+
+    def membership(self, df: pl.DataFrame, date_col: str = "date", market_cap_max: Optional[float] = None,
+                   float_max: Optional[float] = None, keep_unknown: bool = True, how: str = "inner") -> pl.DataFrame:
+        """
+        Rows of `df` (symbol + date column) whose symbol was a member on that date.
+
+        Each row is matched to the latest snapshot on or before its date (at most
+        max_snapshot_age_days old); rows before the first snapshot, past a stale one or with a
+        symbol missing from it are dropped (how="left": kept with nulls). Adds market_cap,
+        float, status.
+        """
+        dates = self.dates()
+        if not dates or df.height == 0:
+            return (df if how == "left" else df.clear()).with_columns(
+                pl.lit(None, dtype=pl.Float64).alias("market_cap"), pl.lit(None, dtype=pl.Float64).alias("float"),
+                pl.lit(None, dtype=pl.Utf8).alias("status"))
+        lo, hi = df[date_col].min(), df[date_col].max()
+        snaps = self._thresholds(
+            self.scan(self.snapshot_date(lo) or dates[0], hi).select("symbol", "date", "market_cap", "float", "status"),
+            market_cap_max, float_max, keep_unknown,
+        ).collect()
+        sessions = pl.DataFrame({"_snap": dates}).sort("_snap")
+        keyed = df.with_row_index("_row").with_columns(pl.col(date_col).cast(pl.Date).alias("_d")).sort("_d")
+        keyed = keyed.join_asof(sessions, left_on="_d", right_on="_snap", strategy="backward")
+        if self.max_snapshot_age_days is not None:
+            too_old = (pl.col("_d") - pl.col("_snap")).dt.total_days() > self.max_snapshot_age_days
+            stale = keyed.select(too_old.sum()).item()
+            if stale:
+                logger.warning(f"Universe membership: {stale:,} rows more than {self.max_snapshot_age_days} days "
+                               f"after their latest snapshot ({dates[-1]} is the last): left unmatched")
+                keyed = keyed.with_columns(pl.when(too_old).then(None).otherwise(pl.col("_snap")).alias("_snap"))
+        return (
+            keyed.join(snaps, left_on=["symbol", "_snap"], right_on=["symbol", "date"], how=how,
+                       suffix="_universe")
+            .sort("_row").drop("_row", "_d", "_snap")
+        )
+
+    def close(self):
+        self.wal.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Point-in-time universe snapshots (membership + market cap per date)")
+    parser.add_argument("--config", type=str, default=str(PROJECT_ROOT / "config" / "config.yaml"))
+    parser.add_argument("--from", dest="from_date", type=str, help="First date YYYY-MM-DD (default: all grouped dates)")
+    parser.add_argument("--to", dest="to_date", type=str, help="Last date YYYY-MM-DD")
+    parser.add_argument("--refresh", action="store_true", help="Rebuild dates built from older reference data")
+    args = parser.parse_args()
+
+    import yaml
+    with open(args.config) as f:
+        cfg = yaml.safe_load(f)
+    snaps = UniverseSnapshots.from_config(cfg, Path(cfg["paths"]["base_dir"]))
+    summary = snaps.update(args.from_date, args.to_date, refresh=args.refresh)
+    dates = snaps.dates()
+    snaps.close()
+    span = f"{dates[0]} → {dates[-1]}" if dates else "none"
+    print(f"[INFO] Universe snapshots: {summary['dates']:,} dates built ({summary['rows']:,} rows), "
+          f"{len(dates):,} on disk ({span}), {summary['stale']:,} stale")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Event-Window Activity Metrics
+
+Cheap, vectorized tape-activity metrics computed on the core window of an event, and the
+dynamic-extension policy that decides whether the window is worth extending (FASE 3.2).
+
+Metrics (one Polars pass each):
+- tape_speed:  trade prints per minute over the core window
+- spread_bps:  median relative NBBO spread, (ask - bid) / mid * 1e4
+- vol_spike:   max minute volume / median minute volume of the core window
+
+Triggers (processing.intraday_events.dynamic_extension.triggers, any one fires):
+- tape_speed_pctl / nbbo_spread_pctl: metric above that percentile of the symbol's history
+  (metrics of its previously downloaded events, from the event catalog); absolute fallbacks
+  are used until the symbol has `min_history_events` events
+- vol_spike_x: minute-volume spike multiple
+
+Usage:
+    >>> policy = ExtensionPolicy.from_config(cfg)
+    >>> metrics = window_activity(trades_df, quotes_df, gte_ns, lte_ns)
+    >>> fired = policy.triggers_fired(metrics, catalog.symbol_activity(symbol))
+"""
+
+from typing import Dict, List, Optional
+
+import polars as pl
+
+METRICS = ("tape_speed", "spread_bps", "vol_spike")
+
+NS_PER_MIN = 60_000_000_000
+
+
+def window_activity(
+    trades: Optional[pl.DataFrame],
+    quotes: Optional[pl.DataFrame],
+    gte_ns: int,
+    lte_ns: int,
+) -> Dict[str, Optional[float]]:
+    """
+    Activity metrics of one window (None for a metric whose tape was not fetched or is empty).
+
+    Args:
+        trades: Trades (timestamp_ns, size)
+        quotes: Quotes (bid_price, ask_price)
+        gte_ns, lte_ns: Window bounds (UTC ns)
+    """
+    metrics: Dict[str, Optional[float]] = {m: None for m in METRICS}
+    minutes = max((lte_ns - gte_ns) / NS_PER_MIN, 1e-9)
+
+    if trades is not None and "timestamp_ns" in trades.columns:
+        metrics["tape_speed"] = len(trades) / minutes
+
+        if len(trades) > 0 and "size" in trades.columns:
+            per_min = (
+                trades.group_by((pl.col("timestamp_ns") // NS_PER_MIN).alias("minute"))
+                .agg(pl.col("size").sum().alias("volume"))
+                .get_column("volume")
+            )
+            if len(per_min) >= 3 and per_min.median() > 0:
+                metrics["vol_spike"] = float(per_min.max() / per_min.median())
+
+    if quotes is not None and len(quotes) > 0 and {"bid_price", "ask_price"} <= set(quotes.columns):
+        mid = (pl.col("ask_price") + pl.col("bid_price")) / 2
+        spread = (
+            quotes.filter((pl.col("bid_price") > 0) & (pl.col("ask_price") >= pl.col("bid_price")))
+            .select(((pl.col("ask_price") - pl.col("bid_price")) / mid * 1e4).median())
+            .item()
+        )
+        metrics["spread_bps"] = float(spread) if spread is not None else None
+
+    return metrics
+
+
+class ExtensionPolicy:
+    """Dynamic window-extension triggers (from processing.intraday_events.dynamic_extension)"""
+
+    def __init__(
+        self,
+        before_minutes: float,
+        after_minutes: float,
+        tape_speed_pctl: Optional[float] = None,
+        nbbo_spread_pctl: Optional[float] = None,
+        vol_spike_x: Optional[float] = None,
+        min_history_events: int = 20,
+        fallback_tape_speed: Optional[float] = None,
+        fallback_spread_bps: Optional[float] = None,
+    ):
+        self.before_minutes = before_minutes
+        self.after_minutes = after_minutes
+        self.tape_speed_pctl = tape_speed_pctl
+        self.nbbo_spread_pctl = nbbo_spread_pctl
+        self.vol_spike_x = vol_spike_x
+        self.min_history_events = min_history_events
+        self.fallback_tape_speed = fallback_tape_speed
+        self.fallback_spread_bps = fallback_spread_bps
+
+    @classmethod
+    def from_config(cls, cfg: Dict) -> Optional["ExtensionPolicy"]:
+        """Build the policy from config.yaml (None if dynamic extension is disabled)"""
+        ext = cfg.get("processing", {}).get("intraday_events", {}).get("dynamic_extension", {})
+        if not ext.get("enable", False):
+            return None
+
+        triggers = ext.get("triggers", {})
+        fallback = ext.get("fallback", {})
+        return cls(
+            before_minutes=float(ext.get("extend_to_before_minutes", 10)),
+            after_minutes=float(ext.get("extend_to_after_minutes", 20)),
+            tape_speed_pctl=triggers.get("tape_speed_pctl"),
+            nbbo_spread_pctl=triggers.get("nbbo_spread_pctl"),
+            vol_spike_x=triggers.get("vol_spike_x"),
+            min_history_events=int(ext.get("min_history_events", 20)),
+            fallback_tape_speed=fallback.get("tape_speed_per_min"),
+            fallback_spread_bps=fallback.get("spread_bps"),
+        )
+
+    def _threshold(
+        self,
+        history: Optional[pl.DataFrame],
+        metric: str,
+        pctl: Optional[float],
+        fallback: Optional[float],
+    ) -> Optional[float]:
+        """Symbol percentile of `metric` if enough history, else the absolute fallback"""
+        if pctl is None:
+            return None
+        if history is not None and metric in history.columns:
+            values = history.get_column(metric).drop_nulls()
+            if len(values) >= self.min_history_events:
+                return float(values.quantile(pctl / 100, interpolation="linear"))
+        return fallback
+
+    def triggers_fired(
+        self,
+        metrics: Dict[str, Optional[float]],
+        history: Optional[pl.DataFrame] = None,
+    ) -> List[str]:
+        """
+        Names of the triggers that fire for these metrics.
+
+        Args:
+            metrics: Output of window_activity()
+            history: Symbol's past metrics (columns tape_speed, spread_bps, vol_spike)
+        """
+        fired = []
+
+        thr = self._threshold(history, "tape_speed", self.tape_speed_pctl, self.fallback_tape_speed)
+        if thr is not None and metrics.get("tape_speed") is not None and metrics["tape_speed"] > thr:
+            fired.append("tape_speed")
+
+        thr = self._threshold(history, "spread_bps", self.nbbo_spread_pctl, self.fallback_spread_bps)
+        if thr is not None and metrics.get("spread_bps") is not None and metrics["spread_bps"] > thr:
+            fired.append("nbbo_spread")
+
+        if self.vol_spike_x is not None and metrics.get("vol_spike") is not None:
+            if metrics["vol_spike"] > self.vol_spike_x:
+                fired.append("vol_spike")
+
+        return fired
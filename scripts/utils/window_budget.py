@@ -0,0 +1,219 @@
+"""
+Event-Window Byte Budget
+
+Per-event size budget for the trades/quotes downloader (FASE 3.2).
+
+Pathological windows (halts, meme days) produce tapes 10-100x the p90 size used for the
+storage estimates in freeze_manifest_core.py. `WindowBudget` tracks the estimated bytes of
+the rows kept so far, projects the final size from the fraction of the window already
+paginated, and, when the projection exceeds the budget, proposes the next trim step:
+
+1. Quotes only: switch to a coarser Hz (budget.quotes_hz_steps, e.g. 5 → 2 → 1)
+2. Narrow the window around the event timestamp (x narrow_factor per step, down to
+   min_half_window_s on each side); pages past the new end are never fetched
+3. Hard cap: stop paginating at the current position
+
+The applied steps are returned by `policy()` and recorded in the WAL/catalog metadata.
+
+Usage:
+    >>> budget = WindowBudget.from_config(cfg, "quotes", gte_ns, lte_ns, event_ns, kinds=2)
+    >>> budget.observe(page_df.estimated_size(), last_ts_ns)
+    >>> if budget.over(): ...
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+# p90 split of an event's bytes between kinds (freeze_manifest_core.py: 24.4 MB trades, 11.7 MB quotes)
+DEFAULT_TRADES_SHARE = 0.68
+
+# Don't project from the first sliver of a window (a single dense page would dominate)
+MIN_COVERED_FRACTION = 0.05
+
+
+class WindowBudget:
+    """Byte budget and trim planner for one (event, kind) download (not thread-safe; one per kind)"""
+
+    def __init__(
+        self,
+        budget_mb: float,
+        gte_ns: int,
+        lte_ns: int,
+        event_ns: int,
+        disk_ratio: float = 0.3,
+        quotes_hz_steps: Sequence[float] = (),
+        narrow_factor: float = 0.5,
+        min_half_window_s: float = 60,
+    ):
+        """
+        Args:
+            budget_mb: On-disk budget for this kind (MB)
+            gte_ns, lte_ns: Requested window (UTC ns)
+            event_ns: Event timestamp (UTC ns), the window is narrowed around it
+            disk_ratio: Expected on-disk (zstd parquet) / in-memory size ratio
+            quotes_hz_steps: Hz levels tried in order before narrowing (empty = never coarsen)
+            narrow_factor: Window half-widths are multiplied by this per narrowing step
+            min_half_window_s: Narrowing floor on each side of the event
+        """
+        if not 0 < narrow_factor < 1:
+            raise ValueError(f"narrow_factor must be in (0, 1), got {narrow_factor}")
+
+        self.budget_mb = float(budget_mb)
+        self.gte_ns = int(gte_ns)
+        self.lte_ns = int(lte_ns)
+        self.event_ns = int(event_ns)
+        self.disk_ratio = disk_ratio
+        self.quotes_hz_steps = sorted((float(h) for h in quotes_hz_steps), reverse=True)
+        self.narrow_factor = narrow_factor
+        self.min_half_window_ns = int(min_half_window_s * 1_000_000_000)
+
+        self.held_bytes = 0
+        self.cursor_ns = self.gte_ns
+        self.quotes_hz: Optional[float] = None
+        self.truncated_at_ns: Optional[int] = None
+        self.steps: List[str] = []
+        self._requested = (self.gte_ns, self.lte_ns)
+
+    @classmethod
+    def from_config(
+        cls,
+        cfg: Dict,
+        kind: str,
+        gte_ns: int,
+        lte_ns: int,
+        event_ns: int,
+        budget_mb: Optional[float] = None,
+        kinds: int = 2,
+        trades_share: Optional[float] = None,
+    ) -> Optional["WindowBudget"]:
+        """
+        Build the budget for one kind from processing.micro_download (None if no budget is set).
+
+        Args:
+            budget_mb: Per-event budget override (default: micro_download.budget_mb)
+            kinds: Number of kinds downloaded for the event (1 → the kind gets the whole budget)
+            trades_share: Per-event trades/quotes split (cost model), default budget.trades_share
+        """
+        micro = cfg.get("processing", {}).get("micro_download", {})
+        total = budget_mb if budget_mb is not None else micro.get("budget_mb")
+        if not total:
+            return None
+
+        opts = micro.get("budget", {})
+        if trades_share is None:
+            trades_share = float(opts.get("trades_share", DEFAULT_TRADES_SHARE))
+        if kinds > 1:
+            share = trades_share if kind == "trades" else 1.0 - trades_share
+        else:
+            share = 1.0
+
+        return cls(
+            budget_mb=float(total) * share,
+            gte_ns=gte_ns,
+            lte_ns=lte_ns,
+            event_ns=event_ns,
+            disk_ratio=float(opts.get("disk_ratio", 0.3)),
+            quotes_hz_steps=opts.get("quotes_hz_steps", [5, 2, 1]) if kind == "quotes" else (),
+            narrow_factor=float(opts.get("narrow_factor", 0.5)),
+            min_half_window_s=float(opts.get("min_half_window_s", 60)),
+        )
+
+    # ----------------------------- tracking -------------------------------
+
+    def observe(self, nbytes: int, cursor_ns: Optional[int] = None):
+        """Add the in-memory bytes of newly kept rows; advance the pagination cursor"""
+        self.held_bytes += int(nbytes)
+        if cursor_ns is not None:
+            self.cursor_ns = max(self.cursor_ns, int(cursor_ns))
+
+    def reset_held(self, nbytes: int):
+        """Replace the held byte count (after kept rows were re-sampled or trimmed)"""
+        self.held_bytes = int(nbytes)
+
+    @property
+    def held_mb(self) -> float:
+        return self.held_bytes * self.disk_ratio / 1024 / 1024
+
+    @property
+    def covered_fraction(self) -> float:
+        span = max(self.lte_ns - self.gte_ns, 1)
+        return min(max((self.cursor_ns - self.gte_ns) / span, 0.0), 1.0)
+
+    @property
+    def projected_mb(self) -> float:
+        """Estimated on-disk size of the whole (current) window"""
+        return self.held_mb / max(self.covered_fraction, MIN_COVERED_FRACTION)
+
+    def over(self) -> bool:
+        """True if the projection (or what is already held) exceeds the budget"""
+        if self.truncated_at_ns is not None:
+            return False
+        return self.held_mb > self.budget_mb or (
+            self.covered_fraction >= MIN_COVERED_FRACTION and self.projected_mb > self.budget_mb
+        )
+
+    # ----------------------------- trim steps -----------------------------
+
+    def next_hz(self, current_hz: Optional[float]) -> Optional[float]:
+        """Next coarser quotes Hz, or None if already at the coarsest step"""
+        for hz in self.quotes_hz_steps:
+            if current_hz is None or hz < current_hz:
+                return hz
+        return None
+
+    def coarsen(self, hz: float):
+        self.quotes_hz = hz
+        self.steps.append(f"hz={hz:g}")
+
+    def can_narrow(self) -> bool:
+        before = self.event_ns - self.gte_ns
+        after = self.lte_ns - self.event_ns
+        return before > self.min_half_window_ns or after > self.min_half_window_ns
+
+    def narrow(self) -> tuple:
+        """Shrink both half-widths around the event; returns the new (gte_ns, lte_ns)"""
+        before = self.event_ns - self.gte_ns
+        after = self.lte_ns - self.event_ns
+        before = max(int(before * self.narrow_factor), min(before, self.min_half_window_ns))
+        after = max(int(after * self.narrow_factor), min(after, self.min_half_window_ns))
+        self.gte_ns = self.event_ns - before
+        self.lte_ns = self.event_ns + after
+        self.steps.append(f"narrow=-{before / 1e9:.0f}s/+{after / 1e9:.0f}s")
+        return self.gte_ns, self.lte_ns
+
+    def truncate(self, at_ns: int):
+        """Hard cap: nothing after `at_ns` is downloaded"""
+        self.truncated_at_ns = int(at_ns)
+        self.steps.append("truncate")
+
+    # ----------------------------- resume ---------------------------------
+
+    _STATE_FIELDS = ("held_bytes", "cursor_ns", "gte_ns", "lte_ns", "quotes_hz", "truncated_at_ns", "steps")
+
+    def get_state(self) -> Dict:
+        """Mutable tracking / trim state (page spool)"""
+        return {k: getattr(self, k) for k in self._STATE_FIELDS}
+
+    def set_state(self, state: Dict):
+        """Restore get_state() output (resumed pagination)"""
+        for k in self._STATE_FIELDS:
+            if k in state:
+                setattr(self, k, list(state[k]) if k == "steps" else state[k])
+
+    # ----------------------------- metadata -------------------------------
+
+    @property
+    def trimmed(self) -> bool:
+        return bool(self.steps)
+
+    def policy(self) -> Dict:
+        """Final trim policy (recorded with the completion)"""
+        end_ns = self.lte_ns if self.truncated_at_ns is None else min(self.lte_ns, self.truncated_at_ns)
+        return {
+            "budget_mb": round(self.budget_mb, 2),
+            "projected_mb": round(self.projected_mb, 2),
+            "steps": list(self.steps),
+            "quotes_hz": self.quotes_hz,
+            "requested_ns": list(self._requested),
+            "kept_ns": [self.gte_ns, end_ns],
+            "truncated": self.truncated_at_ns is not None,
+        }
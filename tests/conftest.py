@@ -0,0 +1,27 @@
+"""Shared fixtures: project root on sys.path, a PolygonIngester on a temp base_dir (no network)"""
+
+import sys
+from pathlib import Path
+
+import pytest
+import yaml
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "scripts" / "ingestion"))
+
+
+@pytest.fixture
+def ingester(tmp_path, monkeypatch):
+    """PolygonIngester writing under tmp_path (shared limiter / response cache off)"""
+    from ingest_polygon import PolygonIngester
+
+    cfg = yaml.safe_load((PROJECT_ROOT / "config" / "config.yaml").read_text(encoding="utf-8"))
+    cfg["paths"]["base_dir"] = str(tmp_path)
+    cfg["polygon"]["shared_rate_limit"]["enable"] = False
+    cfg["polygon"]["response_cache"]["enable"] = False
+    cfg["logging"]["level"] = "WARNING"
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump(cfg), encoding="utf-8")
+    monkeypatch.setenv("POLYGON_API_KEY", "test")
+    return PolygonIngester(str(path), job="tests")
@@ -0,0 +1,87 @@
+"""AdjustedBarsBuilder: full / skipped / incremental / readjust modes against a full derivation"""
+
+from datetime import datetime, timedelta, timezone
+
+import polars as pl
+import pytest
+
+from build_adjusted_bars import AdjustedBarsBuilder
+from scripts.utils.bar_adjustment import BarAdjuster, normalize_actions
+
+T0 = datetime(2023, 5, 1, 20, 0, tzinfo=timezone.utc)
+
+
+def raw_bars(start_day: int, days: int) -> pl.DataFrame:
+    ts = [T0 + timedelta(days=start_day + i) for i in range(days)]
+    return pl.DataFrame({
+        "timestamp": pl.Series(ts, dtype=pl.Datetime("ms", "UTC")),
+        "open": pl.Series([1.0 + i for i in range(days)], dtype=pl.Float32),
+        "high": pl.Series([2.0 + i for i in range(days)], dtype=pl.Float32),
+        "low": pl.Series([0.5 + i for i in range(days)], dtype=pl.Float32),
+        "close": pl.Series([1.5 + i for i in range(days)], dtype=pl.Float32),
+        "vwap": pl.Series([1.2 + i for i in range(days)], dtype=pl.Float32),
+        "volume": pl.Series([1000] * days, dtype=pl.Int64),
+        "transactions": pl.Series([10] * days, dtype=pl.Int32),
+        "symbol": ["AAA"] * days,
+    }).with_columns(pl.col("timestamp").dt.date().alias("date"))
+
+
+def adjuster(*rows) -> BarAdjuster:
+    return BarAdjuster(normalize_actions(pl.DataFrame(
+        list(rows), schema=["ticker", "execution_date", "split_from", "split_to"], orient="row")))
+
+
+@pytest.fixture
+def store_raw(ingester):
+    def write(df):
+        ingester.bar_store("1d_raw").upsert("AAA", df)
+    return write
+
+
+def derived(ingester) -> pl.DataFrame:
+    return pl.read_parquet(ingester.raw_dir / "market_data" / "bars" / "1d" / "AAA.parquet")
+
+
+def expected(adj: BarAdjuster, ingester) -> pl.DataFrame:
+    raw = pl.read_parquet(ingester.raw_dir / "market_data" / "bars" / "1d_raw" / "AAA.parquet")
+    return adj.adjust(raw).select(derived(ingester).columns)
+
+
+def test_modes_match_a_full_derivation(ingester, store_raw):
+    store_raw(raw_bars(0, 20))
+    adj = adjuster(("AAA", "2023-05-10", 1, 2))
+    builder = AdjustedBarsBuilder(ingester, adjuster=adj)
+    assert builder.derive("AAA", "1d")["mode"] == "full"
+    assert builder.derive("AAA", "1d")["mode"] == "skipped"
+
+    store_raw(raw_bars(20, 5))
+    res = builder.derive("AAA", "1d")
+    assert res["mode"] == "incremental" and res["rows"] <= 6
+    assert derived(ingester).equals(expected(adj, ingester))
+    builder.close()
+
+
+def test_new_split_readjusts_only_earlier_bars(ingester, store_raw):
+    store_raw(raw_bars(0, 40))
+    builder = AdjustedBarsBuilder(ingester, adjuster=adjuster(("AAA", "2023-05-10", 1, 2)))
+    builder.derive("AAA", "1d")
+    builder.close()
+
+    adj = adjuster(("AAA", "2023-05-10", 1, 2), ("AAA", "2023-05-25", 10, 1))
+    builder = AdjustedBarsBuilder(ingester, adjuster=adj)
+    res = builder.derive("AAA", "1d")
+    assert res["mode"] == "readjust"
+    assert 0 < res["rows"] < 40
+    assert derived(ingester).equals(expected(adj, ingester))
+    builder.close()
+
+
+def test_backfilled_raw_rows_force_a_full_derivation(ingester, store_raw):
+    store_raw(raw_bars(10, 10))
+    adj = adjuster(("AAA", "2023-05-25", 1, 2))
+    builder = AdjustedBarsBuilder(ingester, adjuster=adj)
+    builder.derive("AAA", "1d")
+    store_raw(raw_bars(0, 10))
+    assert builder.derive("AAA", "1d")["mode"] == "full"
+    assert derived(ingester).equals(expected(adj, ingester))
+    builder.close()
@@ -0,0 +1,66 @@
+"""BarAdjuster: split factors, session dates, inversion, changed_before"""
+
+from datetime import date, datetime, timezone
+
+import polars as pl
+import pytest
+
+from scripts.utils.bar_adjustment import BarAdjuster, normalize_actions
+
+
+def splits(*rows):
+    """(ticker, execution_date, split_from, split_to) → Polygon splits table"""
+    return pl.DataFrame(rows, schema=["ticker", "execution_date", "split_from", "split_to"], orient="row")
+
+
+def bars(*stamps, symbol="AAA", close=1.0, volume=1000):
+    ts = [datetime.fromisoformat(s).replace(tzinfo=timezone.utc) for s in stamps]
+    return pl.DataFrame({
+        "symbol": [symbol] * len(ts),
+        "timestamp": pl.Series(ts, dtype=pl.Datetime("ms", "UTC")),
+        "close": pl.Series([close] * len(ts), dtype=pl.Float32),
+        "volume": pl.Series([volume] * len(ts), dtype=pl.Int64),
+    })
+
+
+def test_reverse_split_scales_prices_before_ex_date_only():
+    adj = BarAdjuster(normalize_actions(splits(("AAA", "2023-06-01", 10, 1))))
+    out = adj.adjust(bars("2023-05-31T14:30:00", "2023-06-01T14:30:00"))
+    assert out["close"].to_list() == [10.0, 1.0]
+    assert out["volume"].to_list() == [100, 1000]
+    assert out.schema == bars("2023-05-31T14:30:00").schema
+
+
+def test_et_evening_bar_takes_its_eastern_session_date():
+    # 2023-06-01 00:30 UTC is 2023-05-31 20:30 ET: still before the 2023-06-01 split
+    adj = BarAdjuster(normalize_actions(splits(("AAA", "2023-06-01", 1, 2))))
+    out = adj.adjust(bars("2023-06-01T00:30:00", "2023-06-01T13:30:00"))
+    assert out["close"].to_list() == [0.5, 1.0]
+    assert out["volume"].to_list() == [2000, 1000]
+
+
+def test_factors_compound_and_keep_input_order():
+    adj = BarAdjuster(normalize_actions(splits(("AAA", "2023-03-01", 1, 2), ("AAA", "2023-06-01", 1, 3),
+                                               ("BBB", "2023-06-01", 10, 1))))
+    df = pl.concat([bars("2023-07-03T14:30:00", "2023-01-03T14:30:00", "2023-04-03T14:30:00"),
+                    bars("2023-01-03T14:30:00", symbol="BBB")])
+    out = adj.adjust(df)
+    assert out["symbol"].to_list() == ["AAA", "AAA", "AAA", "BBB"]
+    assert out["close"].to_list() == pytest.approx([1.0, 1 / 6, 1 / 3, 10.0])
+
+
+def test_symbol_argument_and_invert_roundtrip():
+    adj = BarAdjuster(normalize_actions(splits(("AAA", "2023-06-01", 1, 4))))
+    raw = bars("2023-05-01T14:30:00", "2023-07-03T14:30:00", volume=400).drop("symbol")
+    out = adj.adjust(raw, symbol="AAA")
+    assert "symbol" not in out.columns
+    assert out["close"].to_list() == [0.25, 1.0]
+    assert adj.adjust(out, symbol="AAA", invert=True).equals(raw)
+
+
+def test_changed_before_gives_latest_changed_ex_date():
+    old = BarAdjuster(normalize_actions(splits(("AAA", "2022-01-03", 1, 2))))
+    new = BarAdjuster(normalize_actions(splits(("AAA", "2022-01-03", 1, 2), ("AAA", "2023-06-01", 10, 1))))
+    assert new.changed_before("AAA", old.action_list("AAA")) == date(2023, 6, 1)
+    assert new.changed_before("AAA", new.action_list("AAA")) is None
+    assert new.signature("AAA") != old.signature("AAA")
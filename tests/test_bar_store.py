@@ -0,0 +1,65 @@
+"""BarStore: row-group upserts, dedupe (new rows win), compaction, schema drift"""
+
+from datetime import datetime, timedelta, timezone
+
+import polars as pl
+import pyarrow.parquet as pq
+
+from scripts.utils.bar_store import BarStore
+
+T0 = datetime(2024, 1, 2, 14, 30, tzinfo=timezone.utc)
+
+
+def day_bars(start_day: int, days: int, close: float = 1.0) -> pl.DataFrame:
+    ts = [T0 + timedelta(days=start_day + i) for i in range(days)]
+    return pl.DataFrame({
+        "timestamp": pl.Series(ts, dtype=pl.Datetime("ms", "UTC")),
+        "close": [close] * days,
+        "symbol": ["AAA"] * days,
+    })
+
+
+def row_groups(store: BarStore) -> int:
+    return pq.ParquetFile(store.path("AAA")).metadata.num_row_groups
+
+
+def test_append_adds_a_row_group_and_keeps_history(tmp_path):
+    store = BarStore(tmp_path)
+    store.upsert("AAA", day_bars(0, 10))
+    stats = store.upsert("AAA", day_bars(10, 5))
+    assert stats["merged"] == 0 and stats["rows"] == 15
+    assert row_groups(store) == 2
+    df = pl.read_parquet(store.path("AAA"))
+    assert df.height == 15 and df["timestamp"].is_sorted()
+
+
+def test_overlap_dedupes_on_timestamp_new_rows_win(tmp_path):
+    store = BarStore(tmp_path)
+    store.upsert("AAA", day_bars(0, 10))
+    store.upsert("AAA", day_bars(10, 5))
+    stats = store.upsert("AAA", day_bars(12, 5, close=2.0))
+    assert stats["merged"] == 1
+    df = pl.read_parquet(store.path("AAA"))
+    assert df.height == 17 and df["timestamp"].is_unique().all() and df["timestamp"].is_sorted()
+    assert df.filter(pl.col("timestamp") >= T0 + timedelta(days=12))["close"].to_list() == [2.0] * 5
+    assert df.filter(pl.col("timestamp") < T0 + timedelta(days=12))["close"].to_list() == [1.0] * 12
+
+
+def test_compaction_after_too_many_row_groups(tmp_path):
+    store = BarStore(tmp_path, compact_row_groups=3)
+    for i in range(3):
+        store.upsert("AAA", day_bars(i, 1))
+    assert row_groups(store) == 3
+    stats = store.upsert("AAA", day_bars(3, 1))
+    assert stats["compacted"] and row_groups(store) == 1
+    first, last, rows = store.coverage("AAA")
+    assert (first, last, rows) == (T0, T0 + timedelta(days=3), 4)
+
+
+def test_schema_drift_falls_back_to_full_merge(tmp_path):
+    store = BarStore(tmp_path)
+    store.upsert("AAA", day_bars(0, 3))
+    stats = store.upsert("AAA", day_bars(3, 2).with_columns(pl.lit(7).alias("transactions")))
+    assert stats["compacted"]
+    df = pl.read_parquet(store.path("AAA"))
+    assert df.height == 5 and "transactions" in df.columns
@@ -0,0 +1,38 @@
+"""RetryQueue: park delays grow with the item's park count, bounded by the endpoint's circuit"""
+
+import pytest
+
+from scripts.utils.circuit_breaker import CircuitBreaker, RetryQueue
+
+URL = "https://api.polygon.io/v3/trades/AAA"
+
+
+def test_delay_doubles_per_park_up_to_the_open_period():
+    queue = RetryQueue(max_parks=10, base_s=1.0, breaker=CircuitBreaker(open_s=10.0))
+    delays = [queue.delay(n, URL) for n in range(6)]
+    for n, d in enumerate(delays[:4]):
+        assert 2 ** n <= d <= 2 ** n * 1.1
+    assert all(10.0 <= d <= 11.0 for d in delays[4:])
+
+
+def test_delay_waits_for_the_probe():
+    breaker = CircuitBreaker(failure_threshold=1, open_s=30.0)
+    breaker.record(URL, "rate_limit")
+    queue = RetryQueue(base_s=0.1, breaker=breaker)
+    assert queue.delay(0, URL) == pytest.approx(30.0, abs=0.5)
+
+
+def test_give_up_after_max_parks():
+    queue = RetryQueue(max_parks=2, base_s=0.0)
+    assert queue.park("a", "rate_limit") and queue.park("a", "rate_limit")
+    assert not queue.park("a", "rate_limit")
+    assert queue.given_up == 1 and len(queue) == 2
+
+
+def test_progress_restarts_the_count_and_open_circuit_parks_are_free():
+    queue = RetryQueue(max_parks=1, base_s=0.0)
+    assert queue.park("a", "server")
+    queue.progress("a")
+    assert queue.park("a", "server")
+    assert queue.park("a", "circuit_open")
+    assert not queue.park("a", "server")
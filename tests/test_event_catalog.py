@@ -0,0 +1,44 @@
+"""EventCatalog: completeness is judged against the reader's kinds, not the writer's"""
+
+import pytest
+
+from scripts.utils.event_catalog import EventCatalog
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    writer = EventCatalog(tmp_path / "_catalog.sqlite", expected_kinds=("trades",))
+    writer.upsert_kind("E1", "AAA", "trades", 10, 100)
+    writer.upsert_kind("E2", "AAA", "trades", 0, 0)
+    writer.upsert_kind("E2", "AAA", "quotes", 5, 50)
+    writer.close()
+    reader = EventCatalog(tmp_path / "_catalog.sqlite")
+    yield reader
+    reader.close()
+
+
+def test_reader_kinds_decide_completeness(catalog):
+    assert catalog.to_polars("status = 'complete'").height == 2   # writer's view (trades only)
+    assert catalog.completed_ids() == {"E2"}
+    assert catalog.completed_ids(["trades"]) == {"E1", "E2"}
+    assert catalog.to_polars(catalog.complete_clause())["event_id"].to_list() == ["E2"]
+
+
+def test_summary_and_symbol_counts(catalog):
+    s = catalog.summary()
+    assert (s["complete"], s["partial"], s["failed"]) == (1, 1, 0)
+    assert catalog.summary(["trades"])["complete"] == 2
+    assert catalog.symbol_counts()["complete"].to_list() == [1]
+
+
+def test_unknown_kind_rejected(catalog):
+    with pytest.raises(ValueError):
+        catalog.complete_clause(["bars"])
+
+
+def test_extension_decision_is_recorded_once(catalog):
+    assert catalog.extension("E1") is None
+    catalog.record_activity("E1", "AAA", {"vol_spike": 4.0}, {"before_s": 1800, "after_s": 3600, "triggers": ["vol_spike"]})
+    catalog.record_activity("E2", "AAA", {}, {"before_s": 600, "after_s": 1200, "triggers": []})
+    assert catalog.extension("E1") == {"before_s": 1800, "after_s": 3600, "triggers": ["vol_spike"]}
+    assert catalog.extension("E2")["triggers"] == []
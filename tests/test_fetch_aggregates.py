@@ -0,0 +1,50 @@
+"""AggregatesFetcher.incremental_range: adjusted variants re-request everything after a split"""
+
+from datetime import date
+
+import pytest
+
+from fetch_aggregates import AggregatesFetcher, date_windows
+from scripts.utils.circuit_breaker import RetryLater
+from test_adjusted_bars import raw_bars
+
+
+@pytest.fixture
+def fetcher(ingester):
+    ingester.config["ingestion"]["adjustment"]["local"] = False  # adjusted variants come from Polygon
+    for variant in ("1d", "1d_raw"):
+        ingester.bar_store(variant).upsert("AAA", raw_bars(0, 10))  # 2023-05-01 .. 2023-05-10
+    return AggregatesFetcher(ingester)
+
+
+def test_incremental_from_last_stored_date(fetcher):
+    assert fetcher.incremental_range("AAA", "1d", "2023-06-01", date(2023, 4, 1)) == ("2023-05-10", "2023-06-01")
+
+
+def test_split_after_last_bar_requests_full_range(fetcher):
+    full = fetcher.date_range("1d", "2023-06-01")
+    assert fetcher.incremental_range("AAA", "1d", "2023-06-01", date(2023, 5, 10)) == full
+    assert fetcher.incremental_range("AAA", "1d", "2023-06-01", date(2023, 5, 20)) == full
+
+
+def test_raw_variant_ignores_splits(fetcher):
+    assert fetcher.incremental_range("AAA", "1d_raw", "2023-06-01", date(2023, 5, 20)) == ("2023-05-10", "2023-06-01")
+
+
+def test_parked_task_resumes_at_the_failed_window(fetcher, monkeypatch):
+    calls = []
+
+    def download(ticker, mult, timespan, f_date, t_date, **kw):
+        calls.append(f_date)
+        if len(calls) == 2:
+            raise RetryLater("https://api.polygon.io/v2/aggs", "rate_limit")
+        return None
+
+    monkeypatch.setattr(fetcher.ingester, "download_aggregates", download)
+    plan = date_windows("2022-01-01", "2023-06-01", 365)
+    windows = {}
+    with pytest.raises(RetryLater):
+        fetcher.fetch_one("AAA", "1d_raw", "2022-01-01", "2023-06-01", windows=windows)
+    assert list(windows) == plan[:1]
+    assert fetcher.fetch_one("AAA", "1d_raw", "2022-01-01", "2023-06-01", windows=windows) == {"rows": 0, "bytes": 0}
+    assert calls == [plan[0][0], plan[1][0], plan[1][0]]
@@ -0,0 +1,49 @@
+"""UniverseSnapshots: per-date lifecycle status and the snapshot age limit of queries"""
+
+from datetime import date
+
+import polars as pl
+import pytest
+
+from scripts.utils.universe_snapshots import UniverseSnapshots
+
+SESSIONS = [date(2023, 6, 1), date(2023, 6, 2), date(2023, 6, 5)]
+
+
+@pytest.fixture
+def snaps(tmp_path):
+    ref = tmp_path / "raw" / "reference"
+    ref.mkdir(parents=True)
+    pl.DataFrame({"ticker": ["AAA"], "active": [True], "type": ["CS"], "market": ["stocks"]}) \
+        .write_parquet(ref / "tickers_active_20231001.parquet")
+    pl.DataFrame({"ticker": ["OLD"], "active": [False], "type": ["CS"], "market": ["stocks"],
+                  "delisted_utc": ["2023-06-02T00:00:00Z"]}).write_parquet(ref / "tickers_delisted_20231001.parquet")
+
+    gd = tmp_path / "raw" / "market_data" / "grouped_daily" / "1d_raw"
+    gd.mkdir(parents=True)
+    for d in SESSIONS:
+        pl.DataFrame({"symbol": ["AAA", "OLD"], "close": [10.0, 2.0]}).write_parquet(gd / f"date={d}.parquet")
+
+    s = UniverseSnapshots(tmp_path / "processed" / "reference" / "universe", tmp_path / "raw",
+                          max_snapshot_age_days=5)
+    s.update()
+    yield s
+    s.close()
+
+
+def test_status_is_point_in_time(snaps):
+    old = snaps.scan().filter(pl.col("symbol") == "OLD").collect().sort("date")
+    assert old["status"].to_list() == ["active", "delisted", "delisted"]
+    assert set(snaps.scan().filter(pl.col("symbol") == "AAA").collect()["status"]) == {"active"}
+
+
+def test_as_of_ignores_stale_snapshot(snaps):
+    assert snaps.as_of("2023-06-10").height == 2          # 5 days after 06-05
+    assert snaps.as_of("2023-06-11").height == 0          # 6 days: store not topped up
+
+
+def test_membership_leaves_stale_rows_unmatched(snaps):
+    ev = pl.DataFrame({"symbol": ["AAA", "AAA"], "date": [date(2023, 6, 3), date(2023, 7, 1)]})
+    out = snaps.membership(ev, how="left")
+    assert out["status"].to_list() == ["active", None]
+    assert snaps.membership(ev).height == 1
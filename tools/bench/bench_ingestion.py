@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+End-to-End Ingestion Benchmark (offline)
+
+Runs the real ingestion code in-process against the mock Polygon server
+(tools/bench/mock_polygon_server.py) and reports throughput, so concurrency / rate-limit /
+retry / storage changes can be measured repeatably without network or quota.
+
+Targets:
+- events:  FASE 3.2 trades+quotes event windows (PolygonTradesQuotesDownloader), worker sweep
+- aggs:    1m / 1h / 1d aggregates (PolygonIngester.download_aggregates + save_aggregates)
+- details: ticker details (PolygonIngester.download_ticker_details)
+- news:    event news (download_event_news.fetch_news)
+- resume:  resume correctness: clean reference run vs. (faulty run + resume run), compared
+           row by row (catalog rows and stored tapes must be identical)
+
+Everything is written under a temp directory (WAL, catalog, parquet, logs); the repo and
+config.yaml are not touched.
+
+Usage:
+    python tools/bench/bench_ingestion.py
+    python tools/bench/bench_ingestion.py --targets events --events 40 --workers 1 4 8 auto --latency-ms 50
+    python tools/bench/bench_ingestion.py --targets resume --p5xx 0.2
+    python tools/bench/bench_ingestion.py --json bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+import yaml
+import polars as pl
+from loguru import logger
+
+root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(root))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_polygon_server import MockPolygonServer
+from scripts.utils.circuit_breaker import CircuitBreaker, RetryLater, RetryQueue
+
+TARGETS = ("events", "aggs", "details", "news", "resume")
+
+
+def _quiet_logs():
+    """Downloaders log per page; keep only warnings so timings are not I/O bound on the console"""
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+
+def _bench_config(tmp: Path, args) -> Path:
+    """config.yaml copy pointing base_dir at the temp dir (rate limits / extension per CLI)"""
+    with open(root / "config" / "config.yaml", "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    cfg["paths"]["base_dir"] = str(tmp)
+    cfg["polygon"]["rate_limit_per_minute"] = args.client_rate_per_min
+    cfg["polygon"]["backoff"] = {"base_seconds": 0.05, "max_seconds": 0.5}
+    cfg["ingestion"]["max_retries"] = args.retries
+    # Breaker on: a failed attempt parks the item, --retries bounds its attempts (max_parks)
+    cfg["polygon"].setdefault("circuit_breaker", {}).update(open_s=0.5, max_open_s=5, max_parks=args.retries)
+    # Measure the API path in isolation: no shared quota with real jobs, no response cache
+    cfg["polygon"].setdefault("shared_rate_limit", {})["enable"] = False
+    cfg["polygon"].setdefault("response_cache", {})["enable"] = False
+    ext = cfg.setdefault("processing", {}).setdefault("intraday_events", {}).setdefault("dynamic_extension", {})
+    ext["enable"] = bool(args.extension)
+    out = tmp / "config.yaml"
+    with open(out, "w", encoding="utf-8") as f:
+        yaml.safe_dump(cfg, f, allow_unicode=True)
+    return out
+
+
+def _synthetic_manifest(n: int, universe: List[str]) -> List[Dict]:
+    """n events on weekdays of 2024, spread across symbols and sessions"""
+    events, day = [], datetime(2024, 3, 4, tzinfo=timezone.utc)
+    sessions = (("PM", 12), ("RTH", 15), ("AH", 21))
+    for i in range(n):
+        d = day + timedelta(days=(i // len(sessions)) % 60)
+        while d.weekday() >= 5:
+            d += timedelta(days=1)
+        session, hour = sessions[i % len(sessions)]
+        events.append({
+            "symbol": universe[(i * 7) % len(universe)],
+            "timestamp": d.replace(hour=hour, minute=(i * 11) % 60),
+            "event_type": ("volume_spike", "vwap_break", "opening_range_break")[i % 3],
+            "session": session,
+            "score": 1.0 - i / max(n, 1),
+        })
+    return events
+
+
+def _measure(server: MockPolygonServer, fn) -> Dict:
+    """Run fn() and return its result plus server-side request/byte/status counters"""
+    server.mock.reset_stats()
+    t0 = time.time()
+    result = fn()
+    elapsed = time.time() - t0
+    s = server.stats()
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "requests": s["requests"],
+        "req_per_s": round(s["requests"] / elapsed, 1) if elapsed else 0.0,
+        "mb_wire": round(s["bytes"] / 1024 / 1024, 2),
+        "mb_per_s_wire": round(s["bytes"] / 1024 / 1024 / elapsed, 2) if elapsed else 0.0,
+        "by_status": s["by_status"],
+        **(result or {}),
+    }
+
+
+# ----------------------------- targets -----------------------------------
+
+def _event_downloader(config_path: Path, workdir: Path, args, workers="auto"):
+    """Downloader wired like main(): shared rate limiter, concurrency controller, WAL and catalog"""
+    from scripts.ingestion.download_trades_quotes_intraday_v2 import PolygonTradesQuotesDownloader, RateLimiter
+    from scripts.utils.progress_wal import ProgressWAL
+    from scripts.utils.event_catalog import EventCatalog
+    from scripts.utils.request_metrics import ConcurrencyController
+
+    out_dir = workdir / "event_windows"
+    dl = PolygonTradesQuotesDownloader(config_path=config_path, quotes_hz=args.quotes_hz)
+    dl.rate_limiter = RateLimiter(60.0 / args.client_rate_per_min)
+    dl.retry_max_attempts = args.retries
+    dl.retry_delay_base = 0.05
+    dl.concurrency = ConcurrencyController.from_config(
+        dl.cfg, dl.metrics, fixed_workers=None if workers == "auto" else int(workers))
+    if workers == "auto":
+        dl.concurrency.interval_s = args.autotune_interval_s
+    dl.wal = ProgressWAL(workdir / "wal.jsonl", fsync=False)
+    dl.catalog = EventCatalog.for_root(out_dir)
+    if dl.page_spool:
+        dl.spool_root = out_dir / "_spool"
+    return dl, out_dir
+
+
+def _run_events(dl, out_dir: Path, events: List[Dict], resume: bool = False) -> Dict:
+    """Download all events like main() (worker pool + retry queue); returns success/failure counts and stored MB"""
+    from scripts.ingestion.download_trades_quotes_intraday_v2 import run_events
+
+    def one(event):
+        _, ev = event
+        try:
+            return dl.download_event_window(ev, out_dir, resume=resume, rate_limiter=dl.rate_limiter)
+        except RetryLater:
+            raise
+        except Exception as e:
+            logger.warning(f"{ev['symbol']} failed: {e}")
+            return {"success": False}
+
+    results = []
+    retry_queue = RetryQueue(max_parks=dl.max_parks, base_s=dl.retry_delay_base, breaker=dl.breaker)
+    run_events(dl, enumerate(events), one, lambda event, r: results.append(r or {"success": False}),
+               retry_queue, dl.concurrency.max_workers)
+    stored = sum(p.stat().st_size for p in out_dir.rglob("*.parquet")) / 1024 / 1024 if out_dir.exists() else 0.0
+    return {
+        "events": len(events),
+        "ok": sum(1 for r in results if r.get("success")),
+        "failed": sum(1 for r in results if not r.get("success")),
+        "parked": retry_queue.parked_total,
+        "mb_stored": round(stored, 2),
+        "concurrency": dl.concurrency.limit,
+        "p95_ms": {k: v["p95_ms"] for k, v in dl.metrics.summary().items()},
+    }
+
+
+def bench_events(server, config_path: Path, tmp: Path, args) -> List[Dict]:
+    events = _synthetic_manifest(args.events, server.mock.universe)
+    rows = []
+    for workers in args.workers:
+        workdir = tmp / f"events_w{workers}"
+        dl, out_dir = _event_downloader(config_path, workdir, args, workers)
+        try:
+            r = _measure(server, lambda: _run_events(dl, out_dir, events))
+        finally:
+            dl.close()
+            dl.wal.close()
+            dl.catalog.close()
+        r["events_per_s"] = round(r["events"] / r["elapsed_s"], 2) if r["elapsed_s"] else 0.0
+        rows.append({"target": "events", "workers": workers, **r})
+    return rows
+
+
+def bench_aggs(server, config_path: Path, tmp: Path, args) -> List[Dict]:
+    from scripts.ingestion.ingest_polygon import PolygonIngester
+
+    ing = PolygonIngester(str(config_path))
+    _quiet_logs()
+    symbols = server.mock.universe[:args.symbols]
+    rows = []
+    for mult, timespan, label, frm, to in ((1, "day", "1d", "2023-01-01", "2024-12-31"),
+                                           (1, "hour", "1h", "2024-01-01", "2024-03-31"),
+                                           (1, "minute", "1m", "2024-03-01", "2024-03-08")):
+        def run():
+            bars = 0
+            for sym in symbols:
+                df = ing.download_aggregates(sym, mult, timespan, frm, to)
+                if df is not None:
+                    ing.save_aggregates(df, label)
+                    bars += len(df)
+            return {"symbols": len(symbols), "bars": bars}
+        rows.append({"target": f"aggs_{timespan}", **_measure(server, run)})
+    return rows
+
+
+def bench_details(server, config_path: Path, tmp: Path, args) -> List[Dict]:
+    from scripts.ingestion.ingest_polygon import PolygonIngester
+
+    ing = PolygonIngester(str(config_path))
+    _quiet_logs()
+    symbols = server.mock.universe[:args.symbols * 4]
+    r = _measure(server, lambda: {"symbols": len(symbols), "rows": len(ing.download_ticker_details(symbols))})
+    return [{"target": "details", **r}]
+
+
+def bench_news(server, config_path: Path, tmp: Path, args) -> List[Dict]:
+    from scripts.ingestion import download_event_news as news
+
+    news.SLEEP = 0  # the script paces itself; the mock does not need it
+    news.PER_PAGE = 2  # force pagination
+    events = _synthetic_manifest(args.symbols, server.mock.universe)
+
+    def run():
+        n = 0
+        for ev in events:
+            ts = ev["timestamp"].replace(tzinfo=None)
+            df = news.fetch_news(ev["symbol"], ts - timedelta(days=3), ts + timedelta(days=3))
+            n += 0 if df is None else len(df)
+        return {"symbols": len(events), "articles": n}
+
+    return [{"target": "news", **_measure(server, run)}]
+
+
+def _snapshot(dl, out_dir: Path) -> Dict[str, Dict]:
+    """Catalog rows + tape contents per event (what a resumed run must reproduce exactly)"""
+    cat = dl.catalog.to_polars().select(["event_id", "status", "trades_rows", "quotes_rows"]).sort("event_id")
+    tapes = {}
+    for f in sorted(out_dir.rglob("*.parquet")):
+        df = pl.read_parquet(f)
+        tapes[str(f.relative_to(out_dir))] = df.hash_rows().sum() if len(df) else 0
+    return {"catalog": cat, "tapes": tapes}
+
+
+def bench_resume(server, config_path: Path, tmp: Path, args) -> List[Dict]:
+    events = _synthetic_manifest(args.events, server.mock.universe)
+    faults = dict(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, p429=args.p429,
+                  rate_limit_per_min=args.rate_limit_per_min)
+
+    # Reference: clean run
+    server.mock.set_faults(**faults)
+    workers = args.workers[-1]
+    dl, out_dir = _event_downloader(config_path, tmp / "resume_ref", args, workers)
+    ref = _measure(server, lambda: _run_events(dl, out_dir, events))
+    expected = _snapshot(dl, out_dir)
+    dl.close(); dl.wal.close(); dl.catalog.close()
+
+    # Faulty run (heavy 5xx, few retries) then a resume run with faults off, same WAL/catalog/tree
+    server.mock.set_faults(**{**faults, "p5xx": max(args.p5xx, 0.3)})
+    dl, out_dir = _event_downloader(config_path, tmp / "resume_run", args, workers)
+    dl.retry_max_attempts = dl.max_parks = 2
+    faulty = _measure(server, lambda: _run_events(dl, out_dir, events))
+    server.mock.set_faults(**faults)
+    dl.retry_max_attempts = dl.max_parks = args.retries
+    if dl.breaker is not None:
+        dl.breaker = CircuitBreaker.from_config(dl.cfg)  # a resume is a new process: circuits start closed
+    resumed = _measure(server, lambda: _run_events(dl, out_dir, events, resume=True))
+    got = _snapshot(dl, out_dir)
+    dl.close(); dl.wal.close(); dl.catalog.close()
+
+    identical = expected["catalog"].equals(got["catalog"]) and expected["tapes"] == got["tapes"]
+    return [
+        {"target": "resume_reference", **ref},
+        {"target": "resume_faulty", **faulty},
+        {"target": "resume_resumed", **resumed, "identical_to_reference": identical},
+    ]
+
+
+BENCHES = {"events": bench_events, "aggs": bench_aggs, "details": bench_details,
+           "news": bench_news, "resume": bench_resume}
+
+
+def _print_rows(rows: List[Dict]):
+    print(f"\n{'target':<18} {'wk':>3} {'elapsed':>8} {'req':>6} {'req/s':>7} {'MB wire':>8} {'MB/s':>6}  status / result")
+    print("-" * 100)
+    for r in rows:
+        extra = {k: v for k, v in r.items() if k not in
+                 ("target", "workers", "elapsed_s", "requests", "req_per_s", "mb_wire", "mb_per_s_wire", "by_status")}
+        print(f"{r['target']:<18} {r.get('workers', ''):>3} {r['elapsed_s']:>7.2f}s {r['requests']:>6} "
+              f"{r['req_per_s']:>7.1f} {r['mb_wire']:>8.2f} {r['mb_per_s_wire']:>6.2f}  {r['by_status']} {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end ingestion benchmark (mock Polygon)")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=["events", "aggs", "details", "news"])
+    parser.add_argument("--events", type=int, default=12, help="Synthetic events for events/resume")
+    parser.add_argument("--workers", nargs="+", default=["1", "4", "auto"],
+                        help="Worker counts to sweep (events); auto = adaptive concurrency")
+    parser.add_argument("--autotune-interval-s", type=float, default=2,
+                        help="Controller window for --workers auto (short: benchmark runs are short)")
+    parser.add_argument("--symbols", type=int, default=10, help="Symbols for aggs/news (details uses 4x)")
+    parser.add_argument("--quotes-hz", type=float, help="Quotes downsampling Hz (default: all quotes)")
+    parser.add_argument("--extension", action="store_true", help="Enable dynamic window extension")
+    parser.add_argument("--client-rate-per-min", type=int, default=60000, help="Client-side rate limit")
+    parser.add_argument("--retries", type=int, default=5, help="Client retry attempts")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Mock latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="Mock latency jitter")
+    parser.add_argument("--p429", type=float, default=0.0, help="Mock random 429 probability")
+    parser.add_argument("--p5xx", type=float, default=0.0, help="Mock random 503 probability")
+    parser.add_argument("--rate-limit-per-min", type=int, help="Mock server-side request limit")
+    parser.add_argument("--tape-rate", type=float, default=20, help="Mock prints/quotes per second")
+    parser.add_argument("--keep", action="store_true", help="Keep the temp directory")
+    parser.add_argument("--json", type=str, help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_ingestion_"))
+    server = MockPolygonServer(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, p429=args.p429, p5xx=args.p5xx,
+        rate_limit_per_min=args.rate_limit_per_min, tape_rate=args.tape_rate,
+    ).start()
+    os.environ["POLYGON_BASE_URL"] = server.base_url
+    os.environ["POLYGON_API_KEY"] = "bench"
+    _quiet_logs()
+
+    print(f"Mock Polygon: {server.base_url} | workdir: {tmp}")
+    rows: List[Dict] = []
+    try:
+        config_path = _bench_config(tmp, args)
+        for target in args.targets:
+            rows.extend(BENCHES[target](server, config_path, tmp, args))
+    finally:
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    _print_rows(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": rows}, f, indent=2, default=str)
+        print(f"\nResults written to {args.json}")
+
+    if any(r.get("identical_to_reference") is False for r in rows):
+        print("\nRESUME CHECK FAILED: resumed output differs from the clean reference run")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+Mock Polygon.io Server (offline)
+
+Deterministic synthetic Polygon REST API for testing and benchmarking the ingestion code
+without touching api.polygon.io (or our paid quota).
+
+Endpoints (same paths, params and JSON shapes the downloaders use):
+- /v2/aggs/ticker/{T}/range/{mult}/{minute|hour|day}/{from}/{to}     aggregates
+- /v2/aggs/grouped/locale/us/market/stocks/{date}                      grouped daily
+- /v3/trades/{T}, /v3/quotes/{T}                                       tick tapes
+- /v2/reference/news                                                   news
+- /v3/reference/tickers, /v3/reference/tickers/{T}                     tickers, details
+- /v3/reference/splits, /v3/reference/dividends                        corporate actions
+- /v3/reference/exchanges, /v3/reference/conditions,
+  /v3/reference/tickers/types, /v1/marketstatus/upcoming               small static tables
+
+Every list endpoint paginates with `next_url` (without apiKey, like Polygon). Data depends only
+on (ticker, date/second), so repeated downloads are byte-identical (resume checks).
+
+Faults (all optional): fixed + jittered latency, random 429 / 5xx, and a server-side
+requests-per-minute limit answered with 429. Control endpoints: GET /_stats, GET /_reset.
+
+Usage:
+    # Standalone
+    python tools/bench/mock_polygon_server.py --port 8765 --latency-ms 40 --p429 0.02
+
+    # Point any downloader at it
+    POLYGON_BASE_URL=http://127.0.0.1:8765 POLYGON_API_KEY=test \
+        python scripts/ingestion/download_trades_quotes_intraday_v2.py --manifest ...
+
+    # In-process (benchmarks)
+    >>> with MockPolygonServer(latency_ms=20).start() as mock:
+    ...     os.environ["POLYGON_BASE_URL"] = mock.base_url
+"""
+
+import json
+import gzip
+import math
+import time
+import zlib
+import random
+import argparse
+import threading
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+NS = 1_000_000_000
+MS_PER_DAY = 86_400_000
+
+
+def _seed(*parts) -> int:
+    """Stable seed from any key parts (same across processes, unlike hash())"""
+    return zlib.crc32("|".join(map(str, parts)).encode())
+
+
+def _ticker_name(i: int) -> str:
+    """Synthetic ticker for universe index i: AAA, AAB, ..."""
+    letters = ""
+    for _ in range(3):
+        i, r = divmod(i, 26)
+        letters = chr(65 + r) + letters
+    return letters
+
+
+def _parse_day(value: str) -> date:
+    """Polygon accepts YYYY-MM-DD or a ms timestamp for aggregate ranges"""
+    if value.isdigit():
+        return datetime.fromtimestamp(int(value) / 1000, tz=timezone.utc).date()
+    return date.fromisoformat(value)
+
+
+def _weekdays(start: date, end: date):
+    d = start
+    while d <= end:
+        if d.weekday() < 5:
+            yield d
+        d += timedelta(days=1)
+
+
+class MockPolygon:
+    """Synthetic data + fault model (shared by all handler threads)"""
+
+    def __init__(
+        self,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        p429: float = 0.0,
+        p5xx: float = 0.0,
+        rate_limit_per_min: Optional[int] = None,
+        tape_rate: float = 20,
+        universe: int = 200,
+        seed: int = 42,
+    ):
+        """
+        Args:
+            latency_ms / jitter_ms: Added response latency (uniform jitter on top)
+            p429 / p5xx: Probability of a random 429 / 503 per request
+            rate_limit_per_min: Server-side request limit (token bucket), None = unlimited
+            tape_rate: Mean trades (and quotes) per second per ticker (scaled per ticker)
+            universe: Number of synthetic tickers (reference lists, grouped daily)
+            seed: Fault RNG seed (data never depends on it)
+        """
+        self.universe = [_ticker_name(i) for i in range(universe)]
+        self.tape_rate = tape_rate
+        self.lock = threading.Lock()
+        self.set_faults(latency_ms, jitter_ms, p429, p5xx, rate_limit_per_min, seed)
+        self.reset_stats()
+
+    def set_faults(
+        self,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        p429: float = 0.0,
+        p5xx: float = 0.0,
+        rate_limit_per_min: Optional[int] = None,
+        seed: int = 42,
+    ):
+        """Change the fault model (e.g. faults off for a resume pass)"""
+        with self.lock:
+            self.latency_ms = latency_ms
+            self.jitter_ms = jitter_ms
+            self.p429 = p429
+            self.p5xx = p5xx
+            self.rate_limit_per_min = rate_limit_per_min
+            self.rng = random.Random(seed)
+            self.tokens = float(rate_limit_per_min or 0)
+            self.last_refill = time.time()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {"requests": 0, "bytes": 0, "by_status": {}, "by_endpoint": {}, "started": time.time()}
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            out = json.loads(json.dumps(self.stats))
+        out["elapsed_s"] = time.time() - out.pop("started")
+        return out
+
+    def record(self, endpoint: str, status: int, nbytes: int):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += nbytes
+            self.stats["by_status"][str(status)] = self.stats["by_status"].get(str(status), 0) + 1
+            self.stats["by_endpoint"][endpoint] = self.stats["by_endpoint"].get(endpoint, 0) + 1
+
+    def fault(self) -> Tuple[float, Optional[int]]:
+        """(latency seconds, forced status or None) for the next request"""
+        with self.lock:
+            latency = (self.latency_ms + self.rng.uniform(0, self.jitter_ms)) / 1000
+            if self.rate_limit_per_min:
+                now = time.time()
+                rate = self.rate_limit_per_min / 60.0
+                self.tokens = min(self.rate_limit_per_min, self.tokens + (now - self.last_refill) * rate)
+                self.last_refill = now
+                if self.tokens < 1:
+                    return latency, 429
+                self.tokens -= 1
+            roll = self.rng.random()
+            if roll < self.p429:
+                return latency, 429
+            if roll < self.p429 + self.p5xx:
+                return latency, 503
+        return latency, None
+
+    # ----------------------------- synthetic data -------------------------
+
+    @staticmethod
+    def _base_price(ticker: str) -> float:
+        return 1.0 + (_seed(ticker, "px") % 2000) / 100  # $1 - $21 (small caps)
+
+    def _mid(self, ticker: str, ts_s: float) -> float:
+        base = self._base_price(ticker)
+        phase = _seed(ticker, "phase") % 1000
+        return round(base * (1 + 0.08 * math.sin((ts_s + phase) / 900) + 0.02 * math.sin(ts_s / 37)), 4)
+
+    def aggregates(self, ticker: str, mult: int, timespan: str, start: date, end: date) -> List[Dict]:
+        bars = []
+        for d in _weekdays(start, end):
+            day_ms = int(datetime(d.year, d.month, d.day, tzinfo=timezone.utc).timestamp() * 1000)
+            if timespan == "day":
+                starts = [day_ms + 5 * 3_600_000]  # midnight ET
+                span_ms = MS_PER_DAY
+            elif timespan == "hour":
+                starts = [day_ms + h * 3_600_000 for h in range(13, 20, mult)]
+                span_ms = 3_600_000 * mult
+            else:
+                starts = [day_ms + (13 * 60 + 30 + m) * 60_000 for m in range(0, 390, mult)]
+                span_ms = 60_000 * mult
+            for t in starts:
+                rng = random.Random(_seed(ticker, timespan, mult, t))
+                o = self._mid(ticker, t / 1000)
+                c = self._mid(ticker, (t + span_ms) / 1000)
+                h = round(max(o, c) * (1 + rng.uniform(0, 0.02)), 4)
+                low = round(min(o, c) * (1 - rng.uniform(0, 0.02)), 4)
+                v = rng.randint(1_000, 500_000)
+                bars.append({"v": v, "vw": round((o + c + h + low) / 4, 4), "o": o, "c": c, "h": h,
+                             "l": low, "t": t, "n": max(1, v // 200)})
+        return bars
+
+    def grouped_daily(self, d: date) -> List[Dict]:
+        if d.weekday() >= 5:
+            return []
+        rows = []
+        for ticker in self.universe:
+            bar = self.aggregates(ticker, 1, "day", d, d)[0]
+            rows.append({"T": ticker, **bar})
+        return rows
+
+    def tape(self, kind: str, ticker: str, start_ns: int, end_ns: int, limit: int) -> Tuple[List[Dict], Optional[int]]:
+        """Rows in [start_ns, end_ns] (at most `limit`) and the next cursor (None = done)"""
+        activity = 0.2 + 1.8 * (_seed(ticker, "activity") % 100) / 100
+        mean = max(self.tape_rate * activity, 0.01)
+        rows: List[Dict] = []
+        sec = start_ns // NS
+        while sec * NS <= end_ns:
+            rng = random.Random(_seed(ticker, kind, sec))
+            n = rng.randint(0, int(2 * mean))
+            offsets = sorted({rng.randrange(NS) for _ in range(n)})
+            mid = self._mid(ticker, sec)
+            for off in offsets:
+                ts = sec * NS + off
+                if ts < start_ns or ts > end_ns:
+                    continue
+                if len(rows) >= limit:
+                    return rows, rows[-1]["sip_timestamp"] + 1
+                spread = round(max(0.01, mid * 0.002 * rng.randint(1, 5)), 2)
+                base = {"sip_timestamp": ts, "participant_timestamp": ts - rng.randint(1_000, 500_000),
+                        "sequence_number": _seed(ticker, ts) % 10_000_000, "tape": 3}
+                if kind == "trades":
+                    rows.append({**base, "price": round(mid + rng.choice((-1, 1)) * spread / 2, 4),
+                                 "size": rng.choice((100, 100, 200, 500, 1000, 37)),
+                                 "exchange": rng.choice((4, 11, 12, 19)),
+                                 "conditions": rng.choice(([], [12], [37], [12, 37])),
+                                 "id": str(_seed(ticker, "id", ts))})
+                else:
+                    rows.append({**base, "bid_price": round(mid - spread / 2, 2), "ask_price": round(mid + spread / 2, 2),
+                                 "bid_size": rng.randint(1, 20), "ask_size": rng.randint(1, 20),
+                                 "bid_exchange": rng.choice((11, 12)), "ask_exchange": rng.choice((11, 12)),
+                                 "conditions": [1], "indicators": rng.choice(([], [604]))})
+            sec += 1
+        return rows, None
+
+    def news(self, ticker: str, gte: datetime, lte: datetime) -> List[Dict]:
+        out = []
+        d = gte.date()
+        while d <= lte.date():
+            for k in range(_seed(ticker, d) % 3):
+                published = datetime(d.year, d.month, d.day, 12 + 3 * k, tzinfo=timezone.utc)
+                if gte <= published <= lte:
+                    sentiment = ("positive", "neutral", "negative")[_seed(ticker, d, k) % 3]
+                    out.append({
+                        "id": f"{ticker}-{d.isoformat()}-{k}",
+                        "published_utc": published.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                        "title": f"{ticker} synthetic headline {k}", "description": "Synthetic article",
+                        "publisher": {"name": "Mock Wire"}, "source": "mock",
+                        "article_url": f"https://example.invalid/{ticker}/{d.isoformat()}/{k}",
+                        "amp_url": None, "tickers": [ticker],
+                        "insights": [{"ticker": ticker, "sentiment": sentiment}],
+                    })
+            d += timedelta(days=1)
+        return out
+
+    def ticker_row(self, ticker: str) -> Dict:
+        i = _seed(ticker, "ref")
+        return {"ticker": ticker, "name": f"{ticker} Synthetic Corp", "market": "stocks", "locale": "us",
+                "primary_exchange": ("XNAS", "XNYS", "XASE")[i % 3], "type": "CS", "active": i % 10 != 0,
+                "currency_name": "usd", "cik": f"{i % 10_000_000:010d}", "last_updated_utc": "2024-01-02T00:00:00Z"}
+
+    def details(self, ticker: str) -> Dict:
+        i = _seed(ticker, "details")
+        shares = 5_000_000 + i % 200_000_000
+        return {**self.ticker_row(ticker), "market_cap": round(shares * self._base_price(ticker), 2),
+                "share_class_shares_outstanding": shares, "weighted_shares_outstanding": shares,
+                "sic_code": str(1000 + i % 8000), "list_date": "2010-01-04", "total_employees": i % 5000}
+
+    def splits(self, ticker: Optional[str]) -> List[Dict]:
+        tickers = [ticker] if ticker else self.universe
+        return [{"ticker": t, "execution_date": "2023-06-01", "split_from": 10, "split_to": 1,
+                 "id": f"S{_seed(t, 'split')}"} for t in tickers if _seed(t, "split") % 7 == 0]
+
+    def dividends(self, ticker: Optional[str]) -> List[Dict]:
+        tickers = [ticker] if ticker else self.universe
+        out = []
+        for t in tickers:
+            if _seed(t, "div") % 11 == 0:
+                for q in ("2023-03-15", "2023-06-15", "2023-09-15", "2023-12-15"):
+                    out.append({"ticker": t, "ex_dividend_date": q, "pay_date": q, "cash_amount": 0.05,
+                                "dividend_type": "CD", "frequency": 4, "id": f"D{_seed(t, q)}"})
+        return out
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockPolygon/1.0"
+
+    def log_message(self, format, *args):
+        pass  # keep benchmarks quiet
+
+    # ----------------------------- plumbing -------------------------------
+
+    def _send(self, status: int, payload: Dict, endpoint: str):
+        body = json.dumps(payload).encode()
+        headers = {"Content-Type": "application/json"}
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=1)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if not endpoint.startswith("_"):
+            self.server.mock.record(endpoint, status, len(body))
+
+    def _next_url(self, path: str, params: Dict, **updates) -> str:
+        query = {k: v for k, v in params.items() if k != "apiKey"}
+        query.update({k: str(v) for k, v in updates.items()})
+        return f"{self.server.base_url}{path}?{urlencode(query)}"
+
+    def _page(self, path: str, params: Dict, rows: List[Dict], default_limit: int) -> Dict:
+        """Offset pagination over a fully materialized result list"""
+        limit = int(params.get("limit", default_limit))
+        offset = int(params.get("cursor", 0))
+        page = rows[offset:offset + limit]
+        payload = {"status": "OK", "results": page, "resultsCount": len(page), "count": len(page)}
+        if offset + limit < len(rows):
+            payload["next_url"] = self._next_url(path, params, cursor=offset + limit)
+        return payload
+
+    # ----------------------------- routing --------------------------------
+
+    def do_GET(self):
+        mock: MockPolygon = self.server.mock
+        parts = urlsplit(self.path)
+        path = parts.path.rstrip("/")
+        params = dict(parse_qsl(parts.query, keep_blank_values=True))
+        seg = path.strip("/").split("/")
+
+        if path == "/_stats":
+            return self._send(200, mock.snapshot(), "_stats")
+        if path == "/_reset":
+            mock.reset_stats()
+            return self._send(200, {"status": "OK"}, "_reset")
+
+        endpoint = "/".join(seg[:3]) if len(seg) >= 3 else path
+        latency, forced = mock.fault()
+        if latency > 0:
+            time.sleep(latency)
+        if not params.get("apiKey"):
+            return self._send(401, {"status": "ERROR", "error": "API Key was not provided"}, endpoint)
+        if forced == 429:
+            return self._send(429, {"status": "ERROR", "error": "You've exceeded the maximum requests"}, endpoint)
+        if forced:
+            return self._send(forced, {"status": "ERROR", "error": "Service unavailable"}, endpoint)
+
+        try:
+            payload = self._route(mock, path, seg, params)
+        except (ValueError, IndexError) as e:
+            return self._send(400, {"status": "ERROR", "error": str(e)}, endpoint)
+        if payload is None:
+            return self._send(404, {"status": "NOT_FOUND", "error": f"Unknown path {path}"}, endpoint)
+        return self._send(200, payload, endpoint)
+
+    def _route(self, mock: MockPolygon, path: str, seg: List[str], params: Dict) -> Optional[Dict]:
+        if seg[:3] == ["v2", "aggs", "ticker"] and len(seg) == 9:
+            ticker, mult, timespan, frm, to = seg[3], int(seg[5]), seg[6], seg[7], seg[8]
+            bars = mock.aggregates(ticker, mult, timespan, _parse_day(frm), _parse_day(to))
+            payload = self._page(path, params, bars, 5000)
+            payload.update({"ticker": ticker, "adjusted": params.get("adjusted", "true") == "true"})
+            return payload
+
+        if seg[:6] == ["v2", "aggs", "grouped", "locale", "us", "market"] and len(seg) == 8:
+            rows = mock.grouped_daily(date.fromisoformat(seg[7]))
+            return {"status": "OK", "results": rows, "resultsCount": len(rows), "adjusted": True}
+
+        if seg[0] == "v3" and seg[1] in ("trades", "quotes") and len(seg) == 3:
+            limit = min(int(params.get("limit", 1000)), 50000)
+            start = int(params.get("cursor") or params.get("timestamp.gte", 0))
+            end = int(params.get("timestamp.lte", start + 3600 * NS))
+            rows, cursor = mock.tape(seg[1], seg[2], start, end, limit)
+            payload = {"status": "OK", "results": rows}
+            if cursor is not None:
+                payload["next_url"] = self._next_url(path, params, cursor=cursor)
+            return payload
+
+        if path == "/v2/reference/news":
+            gte = datetime.fromisoformat(params.get("published_utc.gte", "2000-01-01T00:00:00Z").replace("Z", "+00:00"))
+            lte = datetime.fromisoformat(params.get("published_utc.lte", "2100-01-01T00:00:00Z").replace("Z", "+00:00"))
+            ticker = params.get("ticker", mock.universe[0])
+            return self._page(path, params, mock.news(ticker, gte, lte), 10)
+
+        if path == "/v3/reference/tickers":
+            active = params.get("active", "true") == "true"
+            rows = [r for r in map(mock.ticker_row, mock.universe) if r["active"] == active]
+            return self._page(path, params, rows, 100)
+
+        if path == "/v3/reference/tickers/types":
+            return {"status": "OK", "results": [{"code": "CS", "description": "Common Stock"},
+                                                 {"code": "ADRC", "description": "ADR Common"},
+                                                 {"code": "ETF", "description": "Exchange Traded Fund"}]}
+
+        if seg[:3] == ["v3", "reference", "tickers"] and len(seg) == 4:
+            return {"status": "OK", "results": mock.details(seg[3])}
+
+        if path == "/v3/reference/splits":
+            return self._page(path, params, mock.splits(params.get("ticker")), 10)
+
+        if path == "/v3/reference/dividends":
+            return self._page(path, params, mock.dividends(params.get("ticker")), 10)
+
+        if path == "/v3/reference/exchanges":
+            return {"status": "OK", "results": [{"id": i, "mic": m, "name": m} for i, m in
+                                                 ((4, "XNAS"), (11, "XNYS"), (12, "XASE"), (19, "FINR"))]}
+
+        if path == "/v3/reference/conditions":
+            return self._page(path, params, [{"id": i, "name": f"Condition {i}", "asset_class": "stocks",
+                                              "data_types": [params.get("data_type", "trade")]}
+                                             for i in range(1, 60)], 1000)
+
+        if path == "/v1/marketstatus/upcoming":
+            return [{"date": "2025-12-25", "exchange": "NASDAQ", "name": "Christmas", "status": "closed"}]
+
+        return None
+
+
+class MockPolygonServer:
+    """ThreadingHTTPServer running MockPolygon in a background thread"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **mock_kwargs):
+        """
+        Args:
+            host / port: Bind address (port 0 = pick a free port)
+            **mock_kwargs: MockPolygon arguments (latency_ms, p429, rate_limit_per_min, ...)
+        """
+        self.mock = MockPolygon(**mock_kwargs)
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self.mock
+        self.httpd.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return self.httpd.base_url
+
+    def start(self) -> "MockPolygonServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self) -> Dict:
+        return self.mock.snapshot()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline mock Polygon.io server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Fixed latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Uniform extra latency")
+    parser.add_argument("--p429", type=float, default=0.0, help="Probability of a random 429")
+    parser.add_argument("--p5xx", type=float, default=0.0, help="Probability of a random 503")
+    parser.add_argument("--rate-limit-per-min", type=int, help="Server-side request limit (429 when exceeded)")
+    parser.add_argument("--tape-rate", type=float, default=20, help="Mean prints/quotes per second per ticker")
+    parser.add_argument("--universe", type=int, default=200, help="Synthetic tickers")
+    parser.add_argument("--seed", type=int, default=42, help="Fault RNG seed")
+    args = parser.parse_args()
+
+    server = MockPolygonServer(
+        args.host, args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, p429=args.p429,
+        p5xx=args.p5xx, rate_limit_per_min=args.rate_limit_per_min, tape_rate=args.tape_rate,
+        universe=args.universe, seed=args.seed,
+    )
+    print(f"Mock Polygon listening on {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,15 @@
 """
 Check how many symbols are 100% complete
 """
+import sys
 from pathlib import Path
 import polars as pl
 
 root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(root))
+
+from scripts.utils.event_catalog import EventCatalog
+
 manifest_path = root / "processed" / "events" / "manifest_core_5y_20251017.parquet"
 event_windows = root / "raw" / "market_data" / "event_windows"
 
@@ -26,26 +31,14 @@ manifest_events = df.group_by('symbol').agg(
     pl.count().alias('events_in_manifest')
 ).sort('symbol')
 
-print("Contando eventos completados en disco...")
-# Count completed events on disk (both trades and quotes files exist)
-completed = []
-for symbol_dir in sorted(event_windows.glob("symbol=*")):
-    symbol = symbol_dir.name.replace("symbol=", "")
-
-    # Count events with both files
-    events_complete = 0
-    for event_dir in symbol_dir.glob("event=*"):
-        trades_file = event_dir / "trades.parquet"
-        quotes_file = event_dir / "quotes.parquet"
-        if trades_file.exists() and quotes_file.exists():
-            events_complete += 1
-
-    completed.append({
-        'symbol': symbol,
-        'events_complete': events_complete
-    })
-
-disk_events = pl.DataFrame(completed)
+print("Contando eventos completados (catalogo)...")
+# Completed events per symbol from the event-window catalog (both trades and quotes present)
+catalog = EventCatalog.for_root(event_windows)
+if len(catalog) == 0:
+    print("Catalogo vacio, reconstruyendo desde disco (una sola vez)...")
+    catalog.rebuild_from_disk(event_windows)
+disk_events = catalog.symbol_counts().select(['symbol', pl.col('complete').alias('events_complete')])
+catalog.close()
 
 # Join to compare
 comparison = manifest_events.join(disk_events, on='symbol', how='left').fill_null(0)
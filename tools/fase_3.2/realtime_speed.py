@@ -14,7 +14,7 @@ print()
 
 # Count initial files
 parquet_files = list(event_windows.rglob("*.parquet"))
-parquet_files = [f for f in parquet_files if '.tmp' not in f.name]
+parquet_files = [f for f in parquet_files if f.name in ('trades.parquet', 'quotes.parquet')]
 start_count = len(parquet_files)
 start_time = time.time()
 
@@ -26,7 +26,7 @@ time.sleep(60)
 
 # Count final files
 parquet_files2 = list(event_windows.rglob("*.parquet"))
-parquet_files2 = [f for f in parquet_files2 if '.tmp' not in f.name]
+parquet_files2 = [f for f in parquet_files2 if f.name in ('trades.parquet', 'quotes.parquet')]
 end_count = len(parquet_files2)
 elapsed = time.time() - start_time
 
@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 """
 Reconcile checkpoint with actual progress on disk.
-Scans raw data directory and updates checkpoint to reflect reality.
+Reads the event-window catalog and updates checkpoint to reflect reality.
 """
+import sys
 from pathlib import Path
 import json
 from datetime import datetime
 
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from scripts.utils.event_catalog import EventCatalog
+
 ROOT = Path(r"D:\04_TRADING_SMALLCAPS")
 run_date = datetime.now().strftime("%Y%m%d")
 run_id = f"events_intraday_{run_date}"
@@ -17,38 +24,20 @@ print("=" * 60)
 print("CHECKPOINT RECONCILIATION")
 print("=" * 60)
 
-# Scan raw data for completed events
-completed_events = set()
+# Completed events/symbols from the event-window catalog (BOTH trades and quotes present)
 raw_root = ROOT / "raw" / "market_data" / "event_windows"
-
-if raw_root.exists():
-    for event_dir in raw_root.rglob("event=*"):
-        if event_dir.is_dir():
-            trades = event_dir / "trades.parquet"
-            quotes = event_dir / "quotes.parquet"
-
-            # Only count as complete if BOTH files exist (no .tmp)
-            if trades.exists() and quotes.exists():
-                event_id = event_dir.name.replace("event=", "")
-                completed_events.add(event_id)
-
-print(f"Discovered {len(completed_events)} completed events on disk")
-
-# Also scan for symbol-level completion
-completed_symbols = set()
-for symbol_dir in raw_root.glob("symbol=*"):
-    if symbol_dir.is_dir():
-        # Count events with both parquet files
-        complete_in_symbol = 0
-        for event_dir in symbol_dir.glob("event=*"):
-            trades = event_dir / "trades.parquet"
-            quotes = event_dir / "quotes.parquet"
-            if trades.exists() and quotes.exists():
-                complete_in_symbol += 1
-
-        if complete_in_symbol > 0:
-            symbol = symbol_dir.name.replace("symbol=", "")
-            completed_symbols.add(symbol)
+catalog = EventCatalog.for_root(raw_root)
+if len(catalog) == 0 and raw_root.exists():
+    print("Catalog empty, rebuilding from disk (one-time full scan)...")
+    catalog.rebuild_from_disk(raw_root)
+
+completed_events = catalog.completed_ids(["trades", "quotes"])
+print(f"Discovered {len(completed_events)} completed events in catalog")
+
+completed_symbols = set(
+    catalog.symbol_counts().filter(pl.col("complete") > 0)["symbol"].to_list()
+)
+catalog.close()
 
 print(f"Symbols with at least 1 completed event: {len(completed_symbols)}")
 
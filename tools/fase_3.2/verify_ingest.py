@@ -2,12 +2,22 @@
 """
 Verify ingestion progress by comparing checkpoint vs actual raw data on disk.
 Shows symbols completed, symbols with raw data, and symbols in progress.
+
+--validate checks every event-window file from its Parquet footer + .chk sidecar only
+(rows vs catalog, footer checksum, timestamp range); --deep also re-hashes every file.
 """
 from pathlib import Path
+import sys
 import json
 import argparse
 from datetime import datetime
-from collections import defaultdict
+
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from scripts.utils.event_catalog import EventCatalog
+from scripts.utils.parquet_validation import validate_tree
 
 def main():
     ap = argparse.ArgumentParser(description="Verify ingestion progress")
@@ -19,6 +29,10 @@ def main():
                     help="Checkpoint directory")
     ap.add_argument("--sample", type=int, default=10,
                     help="Number of in-progress symbols to show")
+    ap.add_argument("--validate", action="store_true",
+                    help="Footer-only integrity check of every event-window file (rows vs catalog, sidecar checksum)")
+    ap.add_argument("--deep", action="store_true",
+                    help="With --validate: also recompute full-file SHA-1 (reads all data)")
     args = ap.parse_args()
 
     root = Path(__file__).resolve().parents[2]
@@ -49,48 +63,51 @@ def main():
     print(f"Symbols completed: {total_completed}")
     print()
 
-    # Scan raw data on disk (event_windows structure)
+    # Event-window catalog (maintained by the downloader; no tree walk)
     event_windows_dir = root / "raw" / "market_data" / "event_windows"
     if not event_windows_dir.exists():
         print(f"WARNING: Event windows directory not found: {event_windows_dir}")
         return 0
 
-    print(f"Scanning raw data in: {event_windows_dir}")
+    catalog = EventCatalog.for_root(event_windows_dir)
+    if len(catalog) == 0:
+        print("WARNING: Event catalog is empty, bootstrapping from disk (one-time full scan)...")
+        catalog.rebuild_from_disk(event_windows_dir)
+
+    print(f"Reading event catalog: {catalog.db_path}")
     print()
 
     # Count events per symbol (complete = both trades + quotes)
-    symbol_files = defaultdict(int)
-    symbol_events_complete = defaultdict(int)
-    symbol_events_partial = defaultdict(int)
-    completed_events = set()
-
-    # Scan event_windows structure: symbol=XXX/event=YYY/
-    for symbol_dir in event_windows_dir.glob("symbol=*"):
-        if not symbol_dir.is_dir():
-            continue
-
-        # Extract symbol name from "symbol=XXX"
-        symbol = symbol_dir.name.replace("symbol=", "")
-
-        for event_dir in symbol_dir.glob("event=*"):
-            if not event_dir.is_dir():
-                continue
-
-            # Extract event ID from "event=YYY"
-            event_id = event_dir.name.replace("event=", "")
-
-            trades = event_dir / "trades.parquet"
-            quotes = event_dir / "quotes.parquet"
-
-            if trades.exists() and quotes.exists():
-                # Complete event (both files)
-                symbol_events_complete[symbol] += 1
-                symbol_files[symbol] += 2
-                completed_events.add(event_id)
-            elif trades.exists() or quotes.exists():
-                # Partial event (one file only)
-                symbol_events_partial[symbol] += 1
-                symbol_files[symbol] += 1
+    per_symbol = catalog.symbol_counts()
+    expected_rows = catalog.expected_rows() if args.validate else None
+    catalog.close()
+
+    if args.validate:
+        t0 = datetime.now()
+        checks = validate_tree(event_windows_dir, expected_rows=expected_rows, deep=args.deep)
+        bad = checks.filter(~pl.col("ok"))
+        elapsed = (datetime.now() - t0).total_seconds()
+        print("=" * 60)
+        print(f"FILE VALIDATION ({'footer + sha1' if args.deep else 'footer-only'}, {elapsed:.1f}s)")
+        print("=" * 60)
+        print()
+        print(f"  Files checked: {len(checks):,}")
+        print(f"  Valid: {len(checks) - len(bad):,} (without sidecar: {checks.filter(~pl.col('sidecar')).height:,})")
+        print(f"  Invalid: {len(bad):,}")
+        if len(bad):
+            for row in bad.group_by("reason").len().sort("len", descending=True).iter_rows(named=True):
+                print(f"    {row['len']:>7,}  {row['reason']}")
+            for row in bad.head(args.sample).iter_rows(named=True):
+                print(f"    {row['event_id']} {row['kind']}: {row['reason']}")
+        print()
+
+    symbol_files = {
+        r["symbol"]: r["with_trades"] + r["with_quotes"] for r in per_symbol.iter_rows(named=True)
+    }
+    symbol_events_complete = {r["symbol"]: r["complete"] for r in per_symbol.iter_rows(named=True)}
+    symbol_events_partial = {
+        r["symbol"]: r["events"] - r["complete"] for r in per_symbol.iter_rows(named=True)
+    }
 
     have = set(symbol_files.keys())
     total_complete_events = sum(symbol_events_complete.values())
@@ -160,7 +177,6 @@ def main():
 
     if manifest_path:
         try:
-            import polars as pl
             man = pl.read_parquet(manifest_path)
             total_events = man.height
             pct_complete = (total_complete_events / total_events) * 100
@@ -187,8 +203,6 @@ def main():
                 print(f"    (assuming ~{events_per_min} events/min)")
                 print()
 
-        except ImportError:
-            pass
         except Exception as e:
             print(f"WARNING: Could not read manifest: {e}")
             print()
@@ -196,5 +210,4 @@ def main():
     return 0
 
 if __name__ == "__main__":
-    import sys
     sys.exit(main())
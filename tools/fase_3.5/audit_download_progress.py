@@ -14,6 +14,20 @@ print("AUDITORIA DESCARGA - MANIFEST FILTRADO")
 print("=" * 70)
 print()
 
+# Live status written by the FASE 3.2 downloader heartbeat (cost-weighted ETA, no log parsing)
+import json
+for status_file in sorted((root / "logs" / "checkpoints").glob("fase3.2_*_status.json")):
+    with open(status_file) as f:
+        status = json.load(f)
+    print(f"{status_file.name} (actualizado {status['updated_at']})")
+    print(f"  Progreso: {status['done']:,} / {status['total_events']:,} "
+          f"(OK {status['success']:,} | fallidos {status['failed']:,} | saltados {status['skipped']:,})")
+    if status.get("expected_total_mb"):
+        print(f"  Trabajo esperado: {status['expected_done_mb']:,.0f} / {status['expected_total_mb']:,.0f} MB")
+    print(f"  Velocidad: {status['events_per_hour']:.1f} evt/h | {status['mb_per_s']:.2f} MB/s")
+    print(f"  ETA: {status['eta_hours']:.1f} horas ({status['eta_at']})")
+    print()
+
 # Read log file
 with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
     lines = f.readlines()
@@ -1,13 +1,18 @@
 #!/usr/bin/env python3
 """
 Create filtered manifest with only small-caps (market_cap < $2B)
-Filters existing manifest to include only symbols meeting market cap threshold
+Filters existing manifest to include only events whose symbol met the market cap threshold
+on the event date (point-in-time universe snapshots, scripts/utils/universe_snapshots.py).
+Events outside the snapshots fall back to the current market cap from ticker details.
 """
 import polars as pl
 from pathlib import Path
 import sys
 
 root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(root))
+
+from scripts.utils.universe_snapshots import UniverseSnapshots
 
 print("=" * 70)
 print("CREACIÓN DE MANIFEST FILTRADO POR MARKET CAP")
@@ -25,24 +30,48 @@ print(f"  Total eventos: {len(df_manifest):,}")
 print(f"  Total símbolos únicos: {df_manifest['symbol'].n_unique():,}")
 print()
 
-# Read ticker details (has market_cap)
+# Fecha de sesión de cada evento
+if "date" in df_manifest.columns:
+    event_date = pl.col("date").cast(pl.Date)
+elif df_manifest.schema["timestamp"] == pl.Datetime and df_manifest.schema["timestamp"].time_zone:
+    event_date = pl.col("timestamp").dt.convert_time_zone("America/New_York").dt.date()
+else:
+    event_date = pl.col("timestamp").dt.date()
+df_events = df_manifest.with_row_index("_event").with_columns(event_date.alias("_event_date"))
+
+# Market cap del día del evento (snapshots por fecha)
+universe_dir = root / "processed" / "reference" / "universe"
+if (universe_dir / "_progress.jsonl").exists():
+    print(f"Leyendo snapshots de universo: {universe_dir.relative_to(root)}")
+    snaps = UniverseSnapshots(universe_dir, root / "raw", root / "processed")
+    df_events = snaps.membership(df_events, "_event_date", how="left").rename({"market_cap": "market_cap_pit"})
+    df_events = df_events.select("_event", "symbol", "_event_date", "market_cap_pit")
+    snaps.close()
+else:
+    print("Sin snapshots de universo: se usa solo el market cap actual")
+    df_events = df_events.select("_event", "symbol", "_event_date", pl.lit(None, dtype=pl.Float64).alias("market_cap_pit"))
+
+# Read ticker details (has market_cap) - fallback para eventos sin snapshot
 ticker_details_path = root / "raw" / "reference" / "ticker_details_all.parquet"
 print(f"Leyendo ticker details: {ticker_details_path.name}")
 df_tickers = pl.read_parquet(ticker_details_path)
 print(f"  Total tickers: {len(df_tickers):,}")
 print()
 
-# Get unique symbols from manifest
-manifest_symbols = df_manifest.select("symbol").unique()
-
-# Join to get market caps
-symbols_with_mcap = manifest_symbols.join(
-    df_tickers.select(["ticker", "market_cap"]),
+# Join to get market caps (histórico si existe, si no el actual)
+events_with_mcap = df_events.join(
+    df_tickers.select(["ticker", "market_cap"]).unique(subset=["ticker"], keep="last"),
     left_on="symbol",
     right_on="ticker",
     how="left"
+).with_columns(
+    pl.col("market_cap_pit").is_not_null().alias("point_in_time"),
+    pl.coalesce(["market_cap_pit", "market_cap"]).alias("market_cap"),
 )
 
+# Por símbolo: market cap mínimo entre sus eventos (para el reporte)
+symbols_with_mcap = events_with_mcap.group_by("symbol").agg(pl.col("market_cap").min())
+
 print("=" * 70)
 print("ANÁLISIS MARKET CAP")
 print("=" * 70)
@@ -67,14 +96,21 @@ print(f"Simbolos < $2B (dentro del target):   {symbols_within_threshold:,} ({sym
 print(f"Simbolos >= $2B (fuera del target):   {symbols_above_threshold:,} ({symbols_above_threshold/total_symbols*100:.1f}%)")
 print()
 
-# Get list of symbols to keep (< $2B or missing data)
-# We keep symbols with missing data to be conservative (might be delisted small-caps)
-symbols_to_keep = symbols_with_mcap.filter(
+events_pit = events_with_mcap.filter(pl.col("point_in_time")).height
+print(f"Eventos con market cap del día:       {events_pit:,} ({events_pit/len(events_with_mcap)*100:.1f}%)")
+print(f"Eventos con market cap actual:        {len(events_with_mcap) - events_pit:,}")
+print()
+
+# Events to keep (< $2B on the event date, or missing data)
+# We keep events with missing data to be conservative (might be delisted small-caps)
+events_to_keep = events_with_mcap.filter(
     pl.col("market_cap").is_null() | (pl.col("market_cap") < MARKET_CAP_THRESHOLD)
-)["symbol"].to_list()
+)
+symbols_to_keep = events_to_keep["symbol"].unique().to_list()
 
+# Símbolos sin ningún evento dentro del threshold
 symbols_to_exclude = symbols_with_mcap.filter(
-    pl.col("market_cap") >= MARKET_CAP_THRESHOLD
+    ~pl.col("symbol").is_in(symbols_to_keep)
 )["symbol"].to_list()
 
 print(f"Símbolos a MANTENER: {len(symbols_to_keep):,}")
@@ -84,7 +120,7 @@ print()
 # Show symbols being excluded
 if len(symbols_to_exclude) > 0:
     symbols_excluded_with_mcap = symbols_with_mcap.filter(
-        pl.col("market_cap") >= MARKET_CAP_THRESHOLD
+        pl.col("symbol").is_in(symbols_to_exclude)
     ).sort("market_cap", descending=True)
 
     print("=" * 70)
@@ -113,7 +149,9 @@ print("FILTRANDO MANIFEST")
 print("=" * 70)
 print()
 
-df_filtered = df_manifest.filter(pl.col("symbol").is_in(symbols_to_keep))
+df_filtered = df_manifest.with_row_index("_event").filter(
+    pl.col("_event").is_in(events_to_keep["_event"].implode())
+).drop("_event")
 
 events_original = len(df_manifest)
 events_filtered = len(df_filtered)
@@ -142,7 +180,7 @@ print()
 print(f"Manifest filtrado:     {output_path.name}")
 print(f"  - Eventos:           {events_filtered:,}")
 print(f"  - Símbolos:          {len(symbols_to_keep):,}")
-print(f"  - Threshold:         < $2B market cap")
+print(f"  - Threshold:         < $2B market cap (a la fecha del evento)")
 print()
 print(f"Reducción:             {events_removed:,} eventos ({events_removed/events_original*100:.1f}%)")
 print(f"Ahorro tiempo estimado: ~{events_removed/119/60:.1f} horas")